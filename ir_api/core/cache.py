@@ -0,0 +1,191 @@
+"""
+In process caching
+"""
+
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Generic, TypeVar, Optional, Callable, Hashable, Tuple, FrozenSet, Dict
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    """
+    Running totals of the lookups of a cache, and of the entries removed before they were replaced
+    """
+
+    hits: int = 0
+    misses: int = 0
+    # Entries removed as they expired, or to make room for a newer entry
+    evictions: int = 0
+    # Entries removed as the data they were read from changed
+    invalidations: int = 0
+
+
+class TTLCache(Generic[K, V]):
+    """
+    A bounded cache where each entry expires a fixed time after it was set. When full, the least recently set entry
+    is evicted. This is not thread safe, it is intended to be used from the event loop.
+    """
+
+    def __init__(self, ttl: float, max_size: int = 1024, clock: Callable[[], float] = time.monotonic) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._entries: OrderedDict[K, Tuple[float, V]] = OrderedDict()
+        self.stats = CacheStats()
+
+    def get(self, key: K) -> Optional[V]:
+        """
+        Get the value for the key, if it is cached and has not expired
+        :param key: The key
+        :return: The value, or None when missing or expired
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        expires, value = entry
+        if expires <= self._clock():
+            del self._entries[key]
+            self.stats.evictions += 1
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return value
+
+    def set(self, key: K, value: V) -> None:
+        """
+        Cache the value for the key, for the ttl of the cache
+        :param key: The key
+        :param value: The value
+        :return: None
+        """
+        if self.ttl <= 0:
+            return
+        self._entries.pop(key, None)
+        while len(self._entries) >= self.max_size:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+        self._entries[key] = (self._clock() + self.ttl, value)
+
+    def remove_where(self, predicate: Callable[[V], bool]) -> int:
+        """
+        Remove the entries whose values match the predicate, as an invalidation
+        :param predicate: Whether to remove the entry of a value
+        :return: The number of entries removed
+        """
+        keys = [key for key, (_, value) in self._entries.items() if predicate(value)]
+        for key in keys:
+            del self._entries[key]
+        self.stats.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self) -> None:
+        """
+        Remove all entries
+        :return: None
+        """
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ResultCache(Generic[K, V]):  # pylint: disable=too-many-instance-attributes
+    """
+    A TTLCache of query results, where each result is stored with the names of the tables its query read, so that the
+    results read from a table can be invalidated when the table is written.
+
+    The cache is only used while it is listening, i.e. while writes are being notified, and only stores the results
+    read from notified tables. A result is only stored if no invalidation happened while it was queried, which would
+    otherwise store a result read before the write. A result read from a replica may predate a write invalidated
+    before it was queried, so is only stored if none of its tables were invalidated within the replica's staleness.
+    The ttl bounds how stale a result can be if a notification is lost without the listener noticing.
+    """
+
+    def __init__(self, ttl: float, max_size: int = 1024, clock: Callable[[], float] = time.monotonic) -> None:
+        self._entries: TTLCache[K, Tuple[FrozenSet[str], V]] = TTLCache(ttl, max_size, clock)
+        self._clock = clock
+        # When each table was last invalidated, and when the whole cache was last cleared
+        self._invalidated_at: Dict[str, float] = {}
+        self._cleared_at = float("-inf")
+        self.stats = self._entries.stats
+        self.listening = False
+        # The tables whose writes are notified
+        self.notified_tables: FrozenSet[str] = frozenset()
+        # Incremented by every invalidation, so that a query can tell whether an invalidation happened while it ran
+        self.generation = 0
+
+    @property
+    def enabled(self) -> bool:
+        """
+        :return: Whether results are read from and stored in the cache
+        """
+        return self.listening and self._entries.ttl > 0
+
+    def get(self, key: K) -> Optional[V]:
+        """
+        Get the result for the key, if it is cached, has not expired and the cache is enabled
+        :param key: The key
+        :return: The result, or None
+        """
+        if not self.enabled:
+            return None
+        entry = self._entries.get(key)
+        return None if entry is None else entry[1]
+
+    def set(self, key: K, value: V, tables: FrozenSet[str], generation: int, staleness: float = 0.0) -> None:
+        """
+        Cache the result for the key, unless a table it read is not notified, or an invalidation has happened since the
+        query started, or within the staleness of the data it was read from
+        :param key: The key
+        :param value: The result
+        :param tables: The names of the tables the query read
+        :param generation: The generation of the cache when the query started
+        :param staleness: The most seconds the data read may be behind the primary, 0 when read from the primary
+        :return: None
+        """
+        if not self.enabled or generation != self.generation or not tables <= self.notified_tables:
+            return
+        if staleness > 0 and self._invalidated_within(tables, staleness):
+            return
+        self._entries.set(key, (tables, value))
+
+    def _invalidated_within(self, tables: FrozenSet[str], seconds: float) -> bool:
+        """
+        :param tables: The names of the tables
+        :param seconds: The period
+        :return: Whether any of the tables were invalidated within the last seconds
+        """
+        since = self._clock() - seconds
+        if self._cleared_at > since:
+            return True
+        return any(self._invalidated_at.get(table, float("-inf")) > since for table in tables)
+
+    def invalidate(self, table: str) -> int:
+        """
+        Remove the results read from the table
+        :param table: The name of the table that was written
+        :return: The number of results removed
+        """
+        self.generation += 1
+        self._invalidated_at[table] = self._clock()
+        return self._entries.remove_where(lambda entry: table in entry[0])
+
+    def clear(self) -> None:
+        """
+        Remove all results, e.g. when writes may have been missed
+        :return: None
+        """
+        self.generation += 1
+        self._cleared_at = self._clock()
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
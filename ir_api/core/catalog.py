@@ -0,0 +1,94 @@
+"""
+In process catalog of the instruments, so that queries for an instrument filter by its id rather than joining the
+instruments table
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, Optional
+
+from ir_api.core.model import Instrument
+from ir_api.core.repositories import AsyncRepo
+from ir_api.core.specifications.instrument import InstrumentSpecification
+
+logger = logging.getLogger(__name__)
+
+INSTRUMENT_CATALOG_TTL = float(os.environ.get("INSTRUMENT_CATALOG_TTL", "300"))
+INSTRUMENT_CATALOG_MISS_INTERVAL = float(os.environ.get("INSTRUMENT_CATALOG_MISS_INTERVAL", "5"))
+
+
+class InstrumentCatalog:
+    """
+    The id of each instrument by name. There are few instruments and they are rarely added, so the whole table is
+    held and reloaded when it is older than the ttl, or when a name is missing and it is older than the miss interval.
+    Unknown names are then answered without a query, and a new instrument is found within the miss interval. Concurrent
+    reloads are coalesced into one query. This is intended to be used from the event loop.
+    """
+
+    def __init__(
+        self,
+        repo: AsyncRepo[Instrument],
+        ttl: float,
+        miss_interval: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._repo = repo
+        self.ttl = ttl
+        self.miss_interval = miss_interval
+        self._clock = clock
+        self._ids: Dict[str, int] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def id_for(self, instrument: str) -> Optional[int]:
+        """
+        Get the id of the instrument with the given name, reloading the catalog if it is due
+        :param instrument: The instrument name
+        :return: The id, or None when there is no instrument with the name
+        """
+        if self._due(instrument):
+            async with self._lock:
+                # Another request may have reloaded the catalog while this one waited for the lock
+                if self._due(instrument):
+                    await self.refresh()
+        return self._ids.get(instrument)
+
+    async def refresh(self) -> None:
+        """
+        Reload the catalog from the database
+        :return: None
+        """
+        rows = await self._repo.find_fields(InstrumentSpecification().names())
+        self._ids = {row["instrument_name"]: row["id"] for row in rows}
+        self._loaded_at = self._clock()
+        logger.info("Loaded %s instruments into the catalog", len(self._ids))
+
+    def clear(self) -> None:
+        """
+        Empty the catalog, so that it is reloaded on the next lookup
+        :return: None
+        """
+        self._ids = {}
+        self._loaded_at = None
+
+    def _due(self, instrument: str) -> bool:
+        """
+        :param instrument: The instrument name being looked up
+        :return: Whether the catalog should be reloaded before looking up the name
+        """
+        if self._loaded_at is None:
+            return True
+        age = self._clock() - self._loaded_at
+        return age >= self.ttl or (instrument not in self._ids and age >= self.miss_interval)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+INSTRUMENT_CATALOG = InstrumentCatalog(
+    AsyncRepo(), ttl=INSTRUMENT_CATALOG_TTL, miss_interval=INSTRUMENT_CATALOG_MISS_INTERVAL
+)
@@ -0,0 +1,240 @@
+"""
+Negotiated compression of the responses, with zstd, brotli or gzip, as the client accepts. The reduction listings embed
+the script text and inputs of each reduction, so are large and compress well.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import zlib
+from typing import Any, Optional, Set, Tuple
+
+import brotli  # type: ignore
+import zstandard
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ir_api.core.cache import TTLCache
+
+# Responses smaller than this many bytes are not compressed, as the saving is outweighed by the cost
+COMPRESSION_MINIMUM_SIZE = int(os.environ.get("COMPRESSION_MINIMUM_SIZE", "1024"))
+# The level of each encoding. Higher compresses smaller, at a greater CPU cost per response
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "4"))
+ZSTD_LEVEL = int(os.environ.get("ZSTD_LEVEL", "3"))
+# The encodings in the order they are preferred, when the client accepts several
+ENCODINGS = ("zstd", "br", "gzip")
+
+# The compressed bodies of the responses marked with cache_compressed, by the digest of the body and encoding
+COMPRESSED_CACHE_TTL = float(os.environ.get("COMPRESSED_CACHE_TTL", "3600"))
+COMPRESSED_CACHE_SIZE = int(os.environ.get("COMPRESSED_CACHE_SIZE", "256"))
+COMPRESSED_CACHE: TTLCache[Tuple[bytes, str], bytes] = TTLCache(COMPRESSED_CACHE_TTL, COMPRESSED_CACHE_SIZE)
+
+_CACHE_STATE = "cache_compressed"
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """
+    Choose the preferred encoding of those the Accept-Encoding header accepts, ignoring their q values other than 0,
+    which refuses an encoding
+    :param accept_encoding: The Accept-Encoding header
+    :return: The encoding, or None for no compression
+    """
+    accepted: Set[str] = set()
+    refused: Set[str] = set()
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip()
+        quality = params.strip().removeprefix("q=")
+        try:
+            (refused if params and float(quality) == 0 else accepted).add(coding)
+        except ValueError:
+            continue
+    for encoding in ENCODINGS:
+        if encoding not in refused and (encoding in accepted or "*" in accepted):
+            return encoding
+    return None
+
+
+class Compressor:
+    """
+    Compresses a body of one or more chunks with an encoding. Each chunk but the last is flushed, so that a streamed
+    response can be decoded as it arrives.
+    """
+
+    def __init__(self, encoding: str) -> None:
+        self._encoding = encoding
+        self._compressor: Any
+        if encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        elif encoding == "gzip":
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        else:
+            raise ValueError(f"Unknown encoding: {encoding}")
+
+    def chunk(self, data: bytes) -> bytes:
+        """
+        Compress a chunk, and flush it
+        :param data: The chunk
+        :return: The compressed chunk
+        """
+        if self._encoding == "zstd":
+            return bytes(self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK))
+        if self._encoding == "br":
+            return bytes(self._compressor.process(data) + self._compressor.flush())
+        return bytes(self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    def finish(self, data: bytes = b"") -> bytes:
+        """
+        Compress the last chunk, and end the body
+        :param data: The last chunk
+        :return: The compressed chunk
+        """
+        if self._encoding == "br":
+            return bytes(self._compressor.process(data) + self._compressor.finish())
+        return bytes(self._compressor.compress(data) + self._compressor.flush())
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """
+    Compress a whole body
+    :param body: The body
+    :param encoding: The encoding
+    :return: The compressed body
+    """
+    return Compressor(encoding).finish(body)
+
+
+def cache_compressed(request: Request) -> None:
+    """
+    Mark the response to the request as one whose body is likely to be sent again, e.g. a script, so that each body is
+    compressed once for each encoding, and the compressed body reused. The compressed body is keyed by a digest of the
+    body itself, so a changed body is never answered with the compressed body of another.
+    :param request: The request
+    :return: None
+    """
+    setattr(request.state, _CACHE_STATE, True)
+
+
+class CompressionMiddleware:
+    """
+    Compresses each response of at least minimum_size bytes, and each streamed response, with the preferred encoding
+    the client accepts. Responses already encoded, and responses without a body, are sent as they are. When an encoding
+    is accepted, the ETag of the response is made weak, as a compressed body is not the body the strong ETag was
+    computed for. A weak ETag still matches If-None-Match.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MINIMUM_SIZE) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressingResponder(self.app, encoding, self.minimum_size)(scope, receive, send)
+
+
+class _CompressingResponder:
+    """
+    Compresses the body of the response to one request, holding back the start of the response until the first chunk
+    of the body shows whether it is worth compressing
+    """
+
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int) -> None:
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.scope: Scope = {}
+        self.send: Send
+        self.start: Optional[Message] = None
+        self.compressor: Optional[Compressor] = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.scope = scope
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message) -> None:
+        """
+        Send a message of the response, compressing its body
+        :param message: The ASGI message
+        :return: None
+        """
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+        if self.start is not None:
+            start, self.start = self.start, None
+            await self._send_first(start, message)
+            return
+        if self.compressor is None:
+            await self.send(message)
+            return
+        body = message.get("body", b"")
+        if message.get("more_body", False):
+            await self.send({"type": "http.response.body", "body": self.compressor.chunk(body), "more_body": True})
+        else:
+            await self.send({"type": "http.response.body", "body": self.compressor.finish(body)})
+
+    async def _send_first(self, start: Message, message: Message) -> None:
+        """
+        Send the start of the response and the first chunk of its body, compressed unless it is not worth it
+        :param start: The start message
+        :param message: The first body message
+        :return: None
+        """
+        headers = MutableHeaders(raw=start["headers"])
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if "content-encoding" in headers:
+            await self.send(start)
+            await self.send(message)
+            return
+        # Whether the body is compressed depends on its size, which a 304 does not have, so the ETag of every response
+        # that may have been compressed is weak, for a 304 to give the same ETag as the 200
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag is not None and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+        if start["status"] in (204, 304) or (not more_body and len(body) < self.minimum_size):
+            await self.send(start)
+            await self.send(message)
+            return
+        headers["Content-Encoding"] = self.encoding
+        if more_body:
+            del headers["Content-Length"]
+            self.compressor = Compressor(self.encoding)
+            await self.send(start)
+            await self.send({"type": "http.response.body", "body": self.compressor.chunk(body), "more_body": True})
+            return
+        compressed = self._compress_whole(body)
+        headers["Content-Length"] = str(len(compressed))
+        await self.send(start)
+        await self.send({"type": "http.response.body", "body": compressed})
+
+    def _compress_whole(self, body: bytes) -> bytes:
+        """
+        Compress a whole body, or reuse the compressed body of a response marked with cache_compressed
+        :param body: The body
+        :return: The compressed body
+        """
+        if not self.scope.get("state", {}).get(_CACHE_STATE, False):
+            return compress(body, self.encoding)
+        key = (hashlib.blake2b(body, digest_size=16).digest(), self.encoding)
+        compressed = COMPRESSED_CACHE.get(key)
+        if compressed is None:
+            compressed = compress(body, self.encoding)
+            COMPRESSED_CACHE.set(key, compressed)
+        return compressed
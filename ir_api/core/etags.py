@@ -0,0 +1,134 @@
+"""
+Strong entity tags of the responses, for conditional requests. The tags of reductions and runs are computed from the
+row versions of the rows each response is built from, so that whether a client's copy is current can be checked
+before the response is serialized, and for a single reduction before it is loaded. The tags of scripts are computed
+from where they were read, their commit sha, their body unless it was fetched at the sha, and the inputs of the
+transforms applied.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import Any, Literal, Mapping, Optional, Tuple
+
+from ir_api.core.model import Reduction, Run
+
+# Where a script was read from: the remote repository, or the local copy written when it was last fetched
+ScriptSource = Literal["github", "local"]
+
+
+def make_etag(*parts: Any) -> str:
+    """
+    Hash the parts of a representation's version into a strong entity tag
+    :param parts: The parts, of which the repr is hashed
+    :return: The quoted entity tag
+    """
+    return f'"{hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=16).hexdigest()}"'
+
+
+def body_etag(body: bytes) -> str:
+    """
+    Hash a response body into a strong entity tag, for the responses that are not built from entities with row
+    versions
+    :param body: The response body
+    :return: The quoted entity tag
+    """
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Check whether an If-None-Match header matches the entity tag, by the weak comparison RFC 9110 specifies for
+    If-None-Match
+    :param if_none_match: The If-None-Match header, if given
+    :param etag: The entity tag of the current representation
+    :return: True when the client's copy is current
+    """
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def run_version(run: Run) -> str:
+    """
+    The version of a run's response: the run's row version, and that of its instrument, which gives its name.
+    reduction_versions selects the same text for each run in postgres.
+    :param run: The run, with its instrument loaded
+    :return: The version
+    """
+    return f"{run.id}:{run.row_version}:{run.instrument.row_version}"
+
+
+def reduction_version(reduction: Reduction, include_runs: bool) -> Tuple[Any, ...]:
+    """
+    The version of a reduction's response: the reduction's row version, its script's, and optionally its runs'
+    :param reduction: The reduction, with its script, and runs when included, loaded
+    :param include_runs: Whether the response nests the runs
+    :return: The version
+    """
+    script_version = reduction.script.row_version if reduction.script is not None else None
+    if not include_runs:
+        return reduction.id, reduction.row_version, script_version
+    return reduction.id, reduction.row_version, script_version, tuple(run_version(run) for run in reduction.runs)
+
+
+def reduction_etag(reduction: Reduction) -> str:
+    """
+    The entity tag of a reduction with its runs
+    :param reduction: The reduction, with its script and runs loaded
+    :return: The quoted entity tag
+    """
+    return make_etag("reduction", reduction_version(reduction, include_runs=True))
+
+
+def reduction_etag_from_versions(versions: Mapping[str, Any]) -> str:
+    """
+    The entity tag of a reduction with its runs, from the versions selected by ReductionSpecification.versions, which
+    equals reduction_etag of the loaded reduction
+    :param versions: The selected versions
+    :return: The quoted entity tag
+    """
+    version = (versions["id"], versions["row_version"], versions["script_row_version"], tuple(versions["runs"] or ()))
+    return make_etag("reduction", version)
+
+
+def _token_fingerprint() -> str:
+    """
+    A fingerprint of the GitHub API token, which the mantid transform writes into the scripts it transforms, so that
+    the tags of transformed scripts change with the token, without the token being recoverable from them
+    :return: The fingerprint
+    """
+    return hashlib.sha256(os.environ.get("GITHUB_API_TOKEN", "").encode("utf-8")).hexdigest()[:16]
+
+
+def script_etag(
+    instrument: str,
+    sha: str,
+    is_latest: bool,
+    source: ScriptSource,
+    reduction: Optional[Reduction] = None,
+    body: Optional[str] = None,
+) -> str:
+    """
+    The entity tag of a script, from where it was read, its commit sha, its body when the sha does not identify it and,
+    when transformed for a reduction, the transforms' inputs, including the GitHub API token
+    :param instrument: The instrument of the script
+    :param sha: The commit sha of the script
+    :param is_latest: Whether the script is the latest
+    :param source: Where the script was read from, as the local copy may differ from the script at its sha
+    :param reduction: The reduction the script is transformed for, if any
+    :param body: The body of the script before it was transformed, unless it was fetched at its sha, in which case the
+        sha identifies it. The latest script is fetched from main alongside the sha, so may be of another commit.
+    :return: The quoted entity tag
+    """
+    digest = None if body is None else hashlib.blake2b(body.encode("utf-8"), digest_size=16).hexdigest()
+    if reduction is None:
+        return make_etag("script", instrument.upper(), sha, is_latest, source, digest)
+    inputs = json.dumps(reduction.reduction_inputs, sort_keys=True, default=str)
+    return make_etag(
+        "script", instrument.upper(), sha, is_latest, source, digest, reduction.id, inputs, _token_fingerprint()
+    )
@@ -31,3 +31,15 @@ class UnsafePathError(Exception):
     """
     A path was given that is potentially unsafe and could lead to directory traversal
     """
+
+
+class InvalidCursorError(Exception):
+    """
+    A pagination cursor was given that is malformed, or was taken from a differently ordered query
+    """
+
+
+class InvalidFieldsError(Exception):
+    """
+    Fields were requested that are not fields of the requested resource
+    """
@@ -7,9 +7,26 @@ from __future__ import annotations
 
 import enum
 from datetime import datetime
-from typing import Optional, List
-
-from sqlalchemy import Table, Column, ForeignKey, String, DateTime, Enum, Integer, inspect
+from typing import Any, Optional, List
+
+from sqlalchemy import (
+    Table,
+    Column,
+    ForeignKey,
+    String,
+    DateTime,
+    Enum,
+    Integer,
+    Index,
+    inspect,
+    DDL,
+    event,
+    Connection,
+    BigInteger,
+    Dialect,
+    FetchedValue,
+    TypeDecorator,
+)
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship, DeclarativeBase
 
@@ -25,13 +42,35 @@ class ReductionState(enum.Enum):
     NOT_STARTED = "NOT_STARTED"
 
 
+class RowVersion(TypeDecorator[int]):  # pylint: disable=abstract-method,too-many-ancestors
+    """
+    The postgres xmin system column, the id of the transaction that last inserted or updated the row. Every table has
+    it, so tracking changes needs no column of its own nor a trigger to maintain it. asyncpg reads the xid as an int,
+    and psycopg2 as a string, so it is read as an int either way. It is only read, and is not comparable with integers
+    in SQL.
+    """
+
+    impl = BigInteger
+    cache_ok = True
+
+    def process_result_value(self, value: Any, dialect: Dialect) -> Optional[int]:
+        return None if value is None else int(value)
+
+
 class Base(DeclarativeBase):
     """
-    Base class for SQLAlchemy ORM models. It includes a primary key `id` attribute, and defines equality as deep
-    equality.
+    Base class for SQLAlchemy ORM models. It includes a primary key `id` attribute, and the `row_version` of each row,
+    and defines equality as deep equality.
+
+    Relationships are not loaded implicitly, and raise when accessed without being loaded. Each specification declares
+    the relationships its query loads, and how.
     """
 
     id: Mapped[int] = mapped_column(primary_key=True)
+    # Fetched on insert, and expired on update, as postgres sets it
+    row_version: Mapped[int] = mapped_column(
+        "xmin", RowVersion(), system=True, server_default=FetchedValue(), server_onupdate=FetchedValue()
+    )
 
     def __eq__(self, other: object) -> bool:
         """
@@ -42,17 +81,23 @@ class Base(DeclarativeBase):
         """
         if not isinstance(other, Base):
             return False
-        # Ignores due to inspect returning Any, includes None, by default
-        return {attr.key: getattr(self, attr.key) for attr in inspect(self).mapper.column_attrs} == {
-            attr.key: getattr(other, attr.key) for attr in inspect(other).mapper.column_attrs
+        # Ignores due to inspect returning Any, includes None, by default. The row version is the row's, not a value.
+        return {
+            attr.key: getattr(self, attr.key) for attr in inspect(self).mapper.column_attrs if attr.key != "row_version"
+        } == {
+            attr.key: getattr(other, attr.key)
+            for attr in inspect(other).mapper.column_attrs
+            if attr.key != "row_version"
         }
 
 
+# Both sides of the junction are indexed, as reductions are filtered through their runs, and runs are loaded for
+# reductions
 run_reduction_junction_table = Table(
     "runs_reductions",
     Base.metadata,
-    Column("run_id", ForeignKey("runs.id")),
-    Column("reduction_id", ForeignKey("reductions.id")),
+    Column("run_id", ForeignKey("runs.id"), index=True),
+    Column("reduction_id", ForeignKey("reductions.id"), index=True),
 )
 
 
@@ -82,9 +127,9 @@ class Reduction(Base):
     reduction_inputs: Mapped[JSONB] = mapped_column(JSONB)
     reduction_outputs: Mapped[Optional[str]] = mapped_column(String())
     script_id: Mapped[Optional[int]] = mapped_column(ForeignKey("scripts.id"))
-    script: Mapped[Optional["Script"]] = relationship("Script", lazy="joined")
+    script: Mapped[Optional["Script"]] = relationship("Script", lazy="raise")
     runs: Mapped[List[Run]] = relationship(
-        secondary=run_reduction_junction_table, back_populates="reductions", lazy="subquery"
+        secondary=run_reduction_junction_table, back_populates="reductions", lazy="raise", order_by="Run.id"
     )
 
     def __repr__(self) -> str:
@@ -101,7 +146,7 @@ class Instrument(Base):
     """
 
     __tablename__ = "instruments"
-    instrument_name: Mapped[str] = mapped_column(String())
+    instrument_name: Mapped[str] = mapped_column(String(), index=True)
 
     def __repr__(self) -> str:
         return f"Instrument(id={self.id}, instrument_name={self.instrument_name})"
@@ -113,8 +158,10 @@ class Run(Base):
     """
 
     __tablename__ = "runs"
+    # Runs are listed by instrument, by default ordered by run_start, which the composite index serves without a sort
+    __table_args__ = (Index("ix_runs_instrument_id_run_start", "instrument_id", "run_start"),)
     filename: Mapped[str] = mapped_column(String())
-    experiment_number: Mapped[int] = mapped_column(Integer())
+    experiment_number: Mapped[int] = mapped_column(Integer(), index=True)
     title: Mapped[str] = mapped_column(String())
     users: Mapped[str] = mapped_column(String())
     run_start: Mapped[datetime] = mapped_column(DateTime)
@@ -122,9 +169,9 @@ class Run(Base):
     good_frames: Mapped[int] = mapped_column(Integer())
     raw_frames: Mapped[int] = mapped_column(Integer())
     instrument_id: Mapped[int] = mapped_column(ForeignKey("instruments.id"))
-    instrument: Mapped[Instrument] = relationship("Instrument", lazy="subquery")
+    instrument: Mapped[Instrument] = relationship("Instrument", lazy="raise")
     reductions: Mapped[List[Reduction]] = relationship(
-        secondary=run_reduction_junction_table, back_populates="runs", lazy="subquery"
+        secondary=run_reduction_junction_table, back_populates="runs", lazy="raise"
     )
 
     def __repr__(self) -> str:
@@ -133,3 +180,43 @@ class Run(Base):
             f"title={self.title}, users={self.users}, run_start={self.run_start}, run_end={self.run_end}, "
             f"good_frames={self.good_frames}, raw_frames={self.raw_frames}, instrument_id={self.instrument_id})"
         )
+
+
+# Every write to a table notifies this channel with the name of the table, so that the results cached from the table
+# can be invalidated. The triggers are statement level, so a write of many rows notifies once.
+WRITE_NOTIFY_CHANNEL = "table_writes"
+WRITE_NOTIFY_TRIGGER = "notify_table_write"
+
+_WRITE_NOTIFY_FUNCTION = DDL(  # type: ignore
+    f"""CREATE OR REPLACE FUNCTION {WRITE_NOTIFY_TRIGGER}() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('{WRITE_NOTIFY_CHANNEL}', TG_TABLE_NAME);
+    RETURN NULL;
+END
+$$"""
+)
+_WRITE_NOTIFY_TRIGGER = [
+    DDL(f"DROP TRIGGER IF EXISTS {WRITE_NOTIFY_TRIGGER} ON %(table)s"),  # type: ignore
+    DDL(  # type: ignore
+        f"CREATE TRIGGER {WRITE_NOTIFY_TRIGGER} AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %(table)s "
+        f"FOR EACH STATEMENT EXECUTE FUNCTION {WRITE_NOTIFY_TRIGGER}()"
+    ),
+]
+
+event.listen(Base.metadata, "before_create", _WRITE_NOTIFY_FUNCTION)
+for _table in Base.metadata.tables.values():
+    for _ddl in _WRITE_NOTIFY_TRIGGER:
+        event.listen(_table, "after_create", _ddl)
+
+
+def install_write_notify_triggers(connection: Connection) -> None:
+    """
+    Create the write notify triggers of every table in an existing database, replacing any already installed. A new
+    database has them created by create_all.
+    :param connection: The connection to create them on, which is committed by the caller
+    :return: None
+    """
+    connection.execute(_WRITE_NOTIFY_FUNCTION)
+    for table in Base.metadata.tables.values():
+        for ddl in _WRITE_NOTIFY_TRIGGER:
+            connection.execute(ddl.against(table))
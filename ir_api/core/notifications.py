@@ -0,0 +1,131 @@
+"""
+Listens for the notifications of writes to the tables, sent by the triggers the model declares, and invalidates the
+results cached from the tables that were written.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, FrozenSet, Optional
+
+import asyncpg  # type: ignore
+
+from ir_api.core.cache import ResultCache
+from ir_api.core.model import WRITE_NOTIFY_CHANNEL, WRITE_NOTIFY_TRIGGER
+from ir_api.core.repositories import ASYNC_ENGINE, RESULT_CACHE
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks that the listening connection is alive, and between attempts to reconnect
+RESULT_CACHE_CHECK_INTERVAL = float(os.environ.get("RESULT_CACHE_CHECK_INTERVAL", "5"))
+
+_NOTIFIED_TABLES_QUERY = """
+SELECT pg_class.relname FROM pg_trigger JOIN pg_class ON pg_class.oid = pg_trigger.tgrelid
+WHERE pg_trigger.tgname = $1 AND pg_trigger.tgenabled <> 'D'
+"""
+
+
+async def connect() -> Any:
+    """
+    Open a connection to listen on, outside of the pool, as it is held for as long as the API runs
+    :return: The asyncpg connection
+    """
+    return await asyncpg.connect(**ASYNC_ENGINE.url.translate_connect_args(username="user"))
+
+
+class WriteListener:
+    """
+    Holds a connection listening for writes, and invalidates the cached results of each table written. The cache is
+    only used while the connection is listening. When the connection is lost, the cache is cleared and stops being
+    used until the listener has reconnected, as writes will have been missed. The connection is checked every
+    check_interval seconds, as a dropped connection is not always noticed until it is used.
+    """
+
+    def __init__(
+        self, cache: ResultCache[Any, Any], connect_: Callable[[], Awaitable[Any]], check_interval: float
+    ) -> None:
+        self._cache = cache
+        self._connect = connect_
+        self._check_interval = check_interval
+        self._last_problem: Optional[str] = None
+
+    async def run(self) -> None:
+        """
+        Listen, reconnecting whenever the connection is lost, until cancelled
+        :return: None
+        """
+        while True:
+            try:
+                await self._listen()
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as exc:
+                self._report(f"Stopped listening for table writes: {exc!r}")
+            await asyncio.sleep(self._check_interval)
+
+    async def _listen(self) -> None:
+        """
+        Connect, listen, and check the connection until it fails. Returns when no table has a write notify trigger.
+        :return: None
+        """
+        connection = await self._connect()
+        try:
+            tables = await self._notified_tables(connection)
+            if not tables:
+                self._report("No tables notify their writes, results are not cached: run utils.install_notify_triggers")
+                return
+            await connection.add_listener(WRITE_NOTIFY_CHANNEL, self._notified)
+            self._start(tables)
+            while True:
+                await asyncio.sleep(self._check_interval)
+                checked = await asyncio.wait_for(self._notified_tables(connection), self._check_interval)
+                if checked != tables:
+                    # The triggers have changed, the results of a table no longer notified may already be stale
+                    tables = checked
+                    self._start(tables)
+        finally:
+            self._cache.listening = False
+            self._cache.clear()
+            connection.terminate()
+
+    def _start(self, tables: FrozenSet[str]) -> None:
+        """
+        Start using the cache for the results of the notified tables. Writes may have been missed before listening, so
+        the cache is cleared.
+        :param tables: The names of the tables that notify their writes
+        :return: None
+        """
+        self._cache.clear()
+        self._cache.notified_tables = tables
+        self._cache.listening = True
+        self._report(None)
+        logger.info("Caching results of the tables %s, invalidated on write", ", ".join(sorted(tables)))
+
+    @staticmethod
+    async def _notified_tables(connection: Any) -> FrozenSet[str]:
+        """
+        :param connection: The connection
+        :return: The names of the tables with an enabled write notify trigger
+        """
+        return frozenset(row[0] for row in await connection.fetch(_NOTIFIED_TABLES_QUERY, WRITE_NOTIFY_TRIGGER))
+
+    def _notified(self, _connection: Any, _pid: int, _channel: str, table: str) -> None:
+        """
+        Invalidate the cached results of the table that was written
+        :param table: The name of the table, the payload of the notification
+        :return: None
+        """
+        self._cache.invalidate(table)
+
+    def _report(self, problem: Optional[str]) -> None:
+        """
+        Log a problem once, rather than on every attempt to reconnect
+        :param problem: The problem, or None when resolved
+        :return: None
+        """
+        if problem is not None and problem != self._last_problem:
+            logger.warning(problem)
+        self._last_problem = problem
+
+
+WRITE_LISTENER = WriteListener(RESULT_CACHE, connect, RESULT_CACHE_CHECK_INTERVAL)
@@ -0,0 +1,100 @@
+"""
+Connection pool configuration and instrumentation. The pool is configured from the environment, and records how long
+connections take to check out so that the pool can be sized against the number of uvicorn workers.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Type
+
+from sqlalchemy import PoolProxiedConnection
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, Pool
+
+# A pooled async engine must not be shared between event loops. Pooling can be disabled where that is unavoidable,
+# such as in tests, where each test client request may run on a new loop
+DB_POOL_ENABLED = os.environ.get("DB_POOL_ENABLED", "true").lower() in ("true", "1", "yes")
+# Each uvicorn worker holds its own pool, so the connections opened against postgres are at most
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("true", "1", "yes")
+
+
+def pool_options(poolclass: Type[Pool]) -> Dict[str, Any]:
+    """
+    The keyword arguments for create_engine / create_async_engine that configure the pool
+    :param poolclass: The queue pool class to use when pooling is enabled
+    :return: dict of pool options
+    """
+    if not DB_POOL_ENABLED:
+        return {"poolclass": NullPool}
+    return {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+@dataclass
+class CheckoutStats:
+    """
+    Running totals of connection checkouts from the pool
+    """
+
+    checkouts: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    timeouts: int = 0
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """
+    An AsyncAdaptedQueuePool that records the time taken to check out each connection. This includes waiting for a
+    connection to be returned when the pool is saturated, opening new overflow connections, and the pre-ping.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.stats = CheckoutStats()
+        self._stats_lock = threading.Lock()
+
+    def connect(self) -> PoolProxiedConnection:
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.stats.timeouts += 1
+            raise
+        wait = time.perf_counter() - start
+        with self._stats_lock:
+            self.stats.checkouts += 1
+            self.stats.total_wait += wait
+            self.stats.max_wait = max(self.stats.max_wait, wait)
+        return connection
+
+    @property
+    def capacity(self) -> int:
+        """
+        The maximum number of connections the pool can have checked out at once
+        :return: pool size plus max overflow
+        """
+        return self.size() + max(self._max_overflow, 0)
+
+    @property
+    def saturation(self) -> float:
+        """
+        The fraction of the pool capacity currently checked out
+        :return: float between 0 and 1
+        """
+        return self.checkedout() / self.capacity if self.capacity else 0.0
@@ -0,0 +1,231 @@
+"""
+Routing of the API's queries to read replicas of the database. The API only reads, so every query may be answered by a
+replica, leaving the primary to the ingest. Each replica is checked every DB_REPLICA_CHECK_INTERVAL seconds, and is
+only routed to while it answers and its replication lag is at most DB_REPLICA_MAX_LAG seconds. Queries are routed to
+the primary when no replica is available, so the API is unaffected by the loss of every replica.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+# The replicas as comma separated hosts, each optionally with a port, e.g. "replica-1,replica-2:5433". None by default
+DB_REPLICA_HOSTS = [host.strip() for host in os.environ.get("DB_REPLICA_HOSTS", "").split(",") if host.strip()]
+# "round_robin" routes to each available replica in turn, "least_loaded" to the replica with the fewest open sessions
+DB_REPLICA_SELECTION = os.environ.get("DB_REPLICA_SELECTION", "round_robin")
+DB_REPLICA_MAX_LAG = float(os.environ.get("DB_REPLICA_MAX_LAG", "5"))
+DB_REPLICA_CHECK_INTERVAL = float(os.environ.get("DB_REPLICA_CHECK_INTERVAL", "5"))
+
+SELECTIONS = ("round_robin", "least_loaded")
+
+# The seconds the replica is behind the primary. A replica that has replayed all it has received is not behind, however
+# long ago the last write was, and a server that is not replicating, such as a local stand-in, is never behind
+_LAG_QUERY = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+# The key of AsyncSession.info that names the replica a session reads from
+REPLICA_INFO_KEY = "replica"
+
+
+class Replica:
+    """
+    A read replica, with the result of its last check and the sessions open on it. A replica is unavailable until it
+    has been checked.
+    """
+
+    def __init__(self, name: str, engine: AsyncEngine) -> None:
+        self.name = name
+        self.sessionmaker = async_sessionmaker(engine, info={REPLICA_INFO_KEY: name})
+        self.healthy = False
+        # Seconds behind the primary at the last check, None when unknown
+        self.lag: Optional[float] = None
+        self.open_sessions = 0
+        self.sessions = 0
+        self._last_problem: Optional[str] = None
+
+    async def check(self, timeout: float) -> None:
+        """
+        Check the replica answers, and measure its replication lag. Any failure of the check, including an error the
+        driver does not wrap or a lag that is not a number, marks the replica unhealthy rather than ending the checks.
+        :param timeout: Seconds to wait for the replica to answer
+        :return: None
+        """
+        try:
+            lag = await asyncio.wait_for(self._query_lag(), timeout)
+            lag = float(lag) if lag is not None else None
+        except (SQLAlchemyError, OSError, TimeoutError) as exc:
+            self.unhealthy(f"Not routing to replica {self.name}, it could not be checked: {exc!r}")
+            return
+        except Exception as exc:  # pylint:disable=broad-exception-caught
+            logger.exception("Unexpected error checking replica %s", self.name)
+            self.unhealthy(f"Not routing to replica {self.name}, its check failed: {exc!r}")
+            return
+        self.healthy = True
+        self.lag = lag
+        self._report(None)
+
+    async def _query_lag(self) -> Optional[float]:
+        """
+        :return: The seconds the replica is behind the primary, None when it has replayed nothing
+        """
+        async with self.sessionmaker() as session:
+            result = await session.execute(_LAG_QUERY)
+            lag: Optional[float] = result.scalar_one()
+            return lag
+
+    def unhealthy(self, problem: str) -> None:
+        """
+        Stop routing to the replica until it next passes a check
+        :param problem: Why the replica is unhealthy, logged once
+        :return: None
+        """
+        self.healthy = False
+        self.lag = None
+        self._report(problem)
+
+    def available(self, max_lag: float) -> bool:
+        """
+        :param max_lag: The most seconds a replica routed to may be behind the primary
+        :return: Whether queries may be routed to the replica
+        """
+        return self.healthy and self.lag is not None and self.lag <= max_lag
+
+    def _report(self, problem: Optional[str]) -> None:
+        """
+        Log a problem once, rather than on every check
+        :param problem: The problem, or None when resolved
+        :return: None
+        """
+        if problem is not None and problem != self._last_problem:
+            logger.warning(problem)
+        if problem is None and self._last_problem is not None:
+            logger.info("Routing to replica %s", self.name)
+        self._last_problem = problem
+
+
+class ReplicaRouter:
+    """
+    Opens the session of each query on an available replica, chosen by the selection, or on the primary when none is
+    available. The connection of a replica's session is opened before it is returned, so a replica that fails to
+    connect is marked unhealthy, and the query routed to the primary instead.
+    """
+
+    def __init__(
+        self,
+        primary: async_sessionmaker[AsyncSession],
+        replicas: Sequence[Replica] = (),
+        selection: str = "round_robin",
+        max_lag: float = 5.0,
+        check_interval: float = 5.0,
+    ) -> None:
+        if selection not in SELECTIONS:
+            raise ValueError(f"Unknown replica selection: {selection}. Must be one of: {', '.join(SELECTIONS)}")
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.selection = selection
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.primary_sessions = 0
+        self._turn = itertools.count()
+
+    @property
+    def staleness(self) -> float:
+        """
+        The most seconds a replica routed to may be behind the primary: the lag allowed at its last check, and the lag
+        it may have gained before the next
+        :return: seconds
+        """
+        return self.max_lag + self.check_interval
+
+    def available(self) -> List[Replica]:
+        """
+        :return: The replicas queries may be routed to
+        """
+        return [replica for replica in self.replicas if replica.available(self.max_lag)]
+
+    def choose(self) -> Optional[Replica]:
+        """
+        Choose the replica to route a query to. Ties between the least loaded replicas are taken in turn.
+        :return: The replica, or None to route to the primary
+        """
+        available = self.available()
+        if not available:
+            return None
+        if self.selection == "least_loaded":
+            fewest = min(replica.open_sessions for replica in available)
+            available = [replica for replica in available if replica.open_sessions == fewest]
+        return available[next(self._turn) % len(available)]
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[AsyncSession]:
+        """
+        Open a session on the chosen replica, or on the primary
+        :return: The session, closed on exit
+        """
+        replica = self.choose()
+        if replica is not None:
+            session = replica.sessionmaker()
+            try:
+                await session.connection()
+            except (SQLAlchemyError, OSError) as exc:
+                await session.close()
+                replica.unhealthy(f"Not routing to replica {replica.name}, it could not be connected to: {exc!r}")
+                replica = None
+        if replica is None:
+            self.primary_sessions += 1
+            async with self.primary() as session:
+                yield session
+            return
+        replica.sessions += 1
+        replica.open_sessions += 1
+        try:
+            async with session:
+                yield session
+        finally:
+            replica.open_sessions -= 1
+
+    @staticmethod
+    def reads_replica(session: AsyncSession) -> bool:
+        """
+        :param session: A session opened by the router
+        :return: Whether the session reads from a replica, which may be behind the primary
+        """
+        return REPLICA_INFO_KEY in session.info
+
+    async def check(self) -> None:
+        """
+        Check every replica at once
+        :return: None
+        """
+        await asyncio.gather(*(replica.check(self.check_interval) for replica in self.replicas))
+
+    async def run(self) -> None:
+        """
+        Check the replicas every check_interval seconds following the check made at startup, until cancelled. Should
+        the checks fail as a whole, every replica is marked unhealthy until the next, so that the queries are not routed
+        by the results of a check that has stopped.
+        :return: None
+        """
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.check()
+            except Exception as exc:  # pylint:disable=broad-exception-caught
+                logger.exception("Could not check the replicas")
+                for replica in self.replicas:
+                    replica.unhealthy(
+                        f"Not routing to replica {replica.name}, the replicas could not be checked: {exc!r}"
+                    )
@@ -1,20 +1,36 @@
 """
-Provides a generic repository class for performing database operations.
+Provides generic repository classes for performing database operations.
 """
 
 import logging
 import os
-from typing import Generic, TypeVar, Sequence, Optional
+import json
+from dataclasses import dataclass
+from typing import Generic, TypeVar, Sequence, Optional, Hashable, Tuple, Dict, Any, AsyncIterator, Callable
 
-from sqlalchemy import select, func, create_engine, NullPool
+from sqlalchemy import Result, Select, create_engine
 from sqlalchemy.exc import NoResultFound, MultipleResultsFound
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 
+from ir_api.core.cache import TTLCache, ResultCache
 from ir_api.core.exceptions import NonUniqueRecordError
 from ir_api.core.model import Base
+from ir_api.core.pool import pool_options, InstrumentedAsyncQueuePool
+from ir_api.core.replicas import (
+    DB_REPLICA_CHECK_INTERVAL,
+    DB_REPLICA_HOSTS,
+    DB_REPLICA_MAX_LAG,
+    DB_REPLICA_SELECTION,
+    Replica,
+    ReplicaRouter,
+)
 from ir_api.core.specifications.base import Specification
+from ir_api.core.statements import DB_STATEMENT_CACHE_SIZE, StatementCacheRecorder
 
 T = TypeVar("T", bound=Base)
+I = TypeVar("I")
 
 logger = logging.getLogger(__name__)
 
@@ -24,11 +40,70 @@ DB_IP = os.environ.get("DB_IP", "localhost")
 
 ENGINE = create_engine(
     f"postgresql+psycopg2://{DB_USERNAME}:{DB_PASSWORD}@{DB_IP}:5432/interactive-reduction",
-    poolclass=NullPool,
+    **pool_options(QueuePool),
+    query_cache_size=DB_STATEMENT_CACHE_SIZE,
 )
 
 SESSION = sessionmaker(ENGINE)
 
+ASYNC_ENGINE = create_async_engine(
+    f"postgresql+asyncpg://{DB_USERNAME}:{DB_PASSWORD}@{DB_IP}:5432/interactive-reduction",
+    **pool_options(InstrumentedAsyncQueuePool),
+    query_cache_size=DB_STATEMENT_CACHE_SIZE,
+)
+
+ASYNC_SESSION = async_sessionmaker(ASYNC_ENGINE)
+
+
+def replica_engine(host: str) -> AsyncEngine:
+    """
+    Create the engine of a read replica, pooled as the primary's is
+    :param host: The host of the replica, optionally with a port
+    :return: The engine
+    """
+    address = host if ":" in host else f"{host}:5432"
+    return create_async_engine(
+        f"postgresql+asyncpg://{DB_USERNAME}:{DB_PASSWORD}@{address}/interactive-reduction",
+        **pool_options(InstrumentedAsyncQueuePool),
+        query_cache_size=DB_STATEMENT_CACHE_SIZE,
+    )
+
+
+# The AsyncRepo reads from the replicas, when any are configured and available, and otherwise from the primary
+READ_ROUTER = ReplicaRouter(
+    ASYNC_SESSION,
+    [Replica(host, replica_engine(host)) for host in DB_REPLICA_HOSTS],
+    selection=DB_REPLICA_SELECTION,
+    max_lag=DB_REPLICA_MAX_LAG,
+    check_interval=DB_REPLICA_CHECK_INTERVAL,
+)
+
+STATEMENT_CACHE = StatementCacheRecorder(ASYNC_ENGINE.sync_engine)
+
+COUNT_CACHE_TTL = float(os.environ.get("COUNT_CACHE_TTL", "10"))
+COUNT_CACHE: TTLCache[Tuple[Hashable, ...], int] = TTLCache(ttl=COUNT_CACHE_TTL)
+
+# The results of the find methods, used while the writes to the tables they read are being notified
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", "60"))
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE: ResultCache[Tuple[Hashable, ...], Sequence[Any]] = ResultCache(
+    ttl=RESULT_CACHE_TTL, max_size=RESULT_CACHE_SIZE
+)
+
+# The number of rows fetched from the server-side cursor at a time when streaming
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", "1000"))
+
+
+@dataclass
+class Page(Generic[I]):
+    """
+    A page of entities, or of the fields of entities, with the cursor to seek to the following page. The cursor is
+    None when there is no following page, or the query was not limited.
+    """
+
+    items: Sequence[I]
+    next_cursor: Optional[str] = None
+
 
 class Repo(Generic[T]):
     """
@@ -37,6 +112,9 @@ class Repo(Generic[T]):
     This class provides methods to find one or multiple entities based on a specification,
     and to count entities matching a specification. It is designed to work with any entity
     that inherits from the base model class.
+
+    Queries are executed synchronously, so this should not be used from within the event loop. The API uses the
+    AsyncRepo, this is retained for scripts and tooling.
     """
 
     def __init__(self) -> None:
@@ -82,8 +160,231 @@ class Repo(Generic[T]):
         :return: The count of entities of type T that match the specification.
         """
         with self._session() as session:
-            # pylint: disable = not-callable
-            # mypy does not like these, but they are valid.
-            result = session.execute(select(func.count()).select_from(spec.value))  # type: ignore
-            # pylint: enable = not-callable
-            return result.scalar() if result else 0  # type: ignore
+            return session.execute(spec.count_value).scalar_one()
+
+
+class AsyncRepo(Generic[T]):
+    """
+    The asynchronous counterpart of Repo. Queries are awaited on an asyncpg connection, so a slow query does not
+    block the event loop, and other requests are served while it runs. Each query's session is opened by READ_ROUTER,
+    on a read replica when one is available.
+    """
+
+    def __init__(self) -> None:
+        self._session = READ_ROUTER.session
+
+    async def find(self, spec: Specification[T]) -> Sequence[T]:
+        """
+        Finds entities matching the given specification.
+
+        :param spec: A specification defining the query criteria.
+        :return: A sequence of entities of type T that match the specification.
+        """
+        if spec.matches_none:
+            return []
+        return await self._find_cached(spec)
+
+    async def _find_cached(self, spec: Specification[T]) -> Sequence[T]:
+        """
+        Find the entities matching the specification, from the result cache when it holds them. The entities are
+        detached from their session, and shared between the requests they are returned to, so must not be modified.
+        :param spec: A specification defining the query criteria.
+        :return: A sequence of entities of type T that match the specification.
+        """
+        return await self._execute_cached(spec.cache_key, spec, spec.value, lambda result: result.scalars().all())
+
+    async def _execute_cached(
+        self,
+        key: Tuple[Hashable, ...],
+        spec: Specification[T],
+        statement: Select[Any],
+        read: Callable[[Result[Any]], Sequence[Any]],
+    ) -> Sequence[Any]:
+        """
+        Execute a statement of the specification, or return its rows from the result cache when it holds them
+        :param key: The key of the statement's rows in the cache
+        :param spec: The specification the statement is built from, which gives the tables it reads
+        :param statement: The statement
+        :param read: Reads the rows from the result of the statement
+        :return: The rows
+        """
+        cached = RESULT_CACHE.get(key)
+        if cached is not None:
+            return cached
+        generation = RESULT_CACHE.generation
+        async with self._session() as session:
+            result = await session.execute(statement)
+            rows = read(result)
+            staleness = READ_ROUTER.staleness if READ_ROUTER.reads_replica(session) else 0.0
+        RESULT_CACHE.set(key, rows, spec.tables, generation, staleness)
+        return rows
+
+    @staticmethod
+    def _page_key(kind: str, spec: Specification[T]) -> Tuple[Hashable, ...]:
+        """
+        The key of a page's rows in the result cache. The rows of a page are selected with the order column, and id,
+        after the entity or fields, so are keyed apart from those of find and find_fields.
+        :param kind: What the rows of the page are
+        :param spec: A specification defining the query criteria.
+        :return: The key
+        """
+        return kind, *spec.cache_key, spec.cursor, spec.limit
+
+    async def find_page(self, spec: Specification[T]) -> Page[T]:
+        """
+        Finds entities matching the given specification, along with the cursor to the following page.
+
+        The specification's order column is selected alongside the entities, as the column may belong to a joined model
+        rather than the entity itself. The rows are cached with the order values, so the cursor of a cached page is
+        built as it is for a page queried.
+
+        :param spec: A specification defining the query criteria.
+        :return: A page of the entities of type T that match the specification.
+        """
+        if spec.matches_none:
+            return Page([])
+        if spec.order_column is None:
+            return Page(await self.find(spec))
+        statement = spec.value.add_columns(spec.order_column)
+        rows = await self._execute_cached(self._page_key("page", spec), spec, statement, lambda result: result.all())
+        items = [row[0] for row in rows]
+        if not spec.limit or len(rows) < spec.limit:
+            return Page(items)
+        last_entity, last_value = rows[-1]
+        return Page(items, spec.next_cursor(last_value, last_entity.id))
+
+    async def find_fields(self, spec: Specification[T]) -> Sequence[Dict[str, Any]]:
+        """
+        Finds the projected fields of the entities matching the given specification, without building the entities.
+        Each call is returned its own dicts, so they may be modified, though the rows they are built from are cached.
+
+        :param spec: A specification defining the query criteria, with the fields projected.
+        :return: A sequence of dicts of field name to value.
+        """
+        if spec.matches_none:
+            return []
+        key = ("fields", *spec.cache_key)
+        rows = await self._execute_cached(key, spec, spec.value, lambda result: result.mappings().all())
+        return [dict(row) for row in rows]
+
+    async def find_fields_page(self, spec: Specification[T]) -> Page[Dict[str, Any]]:
+        """
+        Finds the projected fields of the entities matching the given specification, along with the cursor to the
+        following page. The order column and id are selected after the fields for the cursor, whether or not they
+        were requested.
+
+        :param spec: A specification defining the query criteria, with the fields projected.
+        :return: A page of dicts of field name to value.
+        """
+        if spec.matches_none:
+            return Page([])
+        if spec.order_column is None:
+            return Page(await self.find_fields(spec))
+        statement = spec.value.add_columns(spec.order_column, spec.model.id)
+        key = self._page_key("fields_page", spec)
+        rows = await self._execute_cached(key, spec, statement, lambda result: result.all())
+        field_count = len(spec.fields)
+        items = [dict(zip(spec.fields, row[:field_count])) for row in rows]
+        if not spec.limit or len(rows) < spec.limit:
+            return Page(items)
+        last_value, last_id = rows[-1][field_count:]
+        return Page(items, spec.next_cursor(last_value, last_id))
+
+    async def stream(self, spec: Specification[T]) -> AsyncIterator[T]:
+        """
+        Streams the entities matching the given specification from a server-side cursor, fetching STREAM_BATCH_SIZE
+        rows at a time. Relationships the specification loads with selectin are loaded per batch. The session is held
+        open until the stream is exhausted or closed.
+
+        :param spec: A specification defining the query criteria.
+        :return: An async iterator of the entities of type T that match the specification.
+        """
+        if spec.matches_none:
+            return
+        async with self._session() as session:
+            result = await session.stream_scalars(spec.value.execution_options(yield_per=STREAM_BATCH_SIZE))
+            async for entity in result:
+                yield entity
+
+    async def stream_fields(self, spec: Specification[T]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streams the projected fields of the entities matching the given specification from a server-side cursor,
+        fetching STREAM_BATCH_SIZE rows at a time.
+
+        :param spec: A specification defining the query criteria, with the fields projected.
+        :return: An async iterator of dicts of field name to value.
+        """
+        if spec.matches_none:
+            return
+        async with self._session() as session:
+            result = await session.stream(spec.value.execution_options(yield_per=STREAM_BATCH_SIZE))
+            async for row in result.mappings():
+                yield dict(row)
+
+    async def find_one(self, spec: Specification[T]) -> Optional[T]:
+        """
+        Finds a single entity matching the given specification.
+
+        If no entities are found, None is returned. If multiple entities are found,
+        a NonUniqueRecordError is raised.
+
+        :param spec: A specification defining the query criteria.
+        :return: An entity of type T that matches the specification, or None if no entities are found.
+        :raises NonUniqueRecordError: If more than one entity matches the specification.
+        """
+        if spec.matches_none:
+            return None
+        entities = await self._find_cached(spec)
+        if not entities:
+            logger.error("No result found for %s", spec.value)
+            return None
+        if len(entities) > 1:
+            logger.error("Non unique record found for %s", spec.value)
+            raise NonUniqueRecordError()
+        return entities[0]
+
+    async def count(self, spec: Specification[T]) -> int:
+        """
+        Counts the number of entities matching the given specification. Counts are cached for COUNT_CACHE_TTL seconds.
+
+        :param spec: A specification defining the query criteria.
+        :return: The count of entities of type T that match the specification.
+        """
+        if spec.matches_none:
+            return 0
+        key = (False, *spec.cache_key)
+        cached = COUNT_CACHE.get(key)
+        if cached is not None:
+            return cached
+        async with self._session() as session:
+            result = await session.execute(spec.count_value)
+            count = result.scalar_one()
+        COUNT_CACHE.set(key, count)
+        return count
+
+    async def estimate_count(self, spec: Specification[T]) -> int:
+        """
+        Estimates the number of entities matching the given specification from the query planner's row estimate. The
+        planner estimates from the table statistics, pg_class.reltuples and the column statistics, so the cost does
+        not grow with the table. The accuracy depends on how recently the tables were analyzed.
+
+        :param spec: A specification defining the query criteria.
+        :return: The estimated count of entities of type T that match the specification.
+        """
+        if spec.matches_none:
+            return 0
+        key = (True, *spec.cache_key)
+        cached = COUNT_CACHE.get(key)
+        if cached is not None:
+            return cached
+        # Rendered with literal values, as a utility statement such as EXPLAIN cannot take bound parameters
+        query = spec.filter_value.compile(dialect=ASYNC_ENGINE.dialect, compile_kwargs={"literal_binds": True})
+        async with self._session() as session:
+            connection = await session.connection()
+            result = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {query}")
+            plan = result.scalar_one()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        count = int(plan[0]["Plan"]["Plan Rows"])
+        COUNT_CACHE.set(key, count)
+        return count
@@ -4,12 +4,81 @@ responses module contains api response definitions
 
 from __future__ import annotations
 
+import json
+from collections.abc import AsyncGenerator
 from datetime import datetime
-from typing import Optional, Any, List
+from typing import Optional, Any, List, Dict, Mapping, AsyncIterable, Callable
 
+import orjson
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
+from sqlalchemy import Pool
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.types import Receive, Scope, Send
 
+from ir_api.core.cache import ResultCache
 from ir_api.core.model import ReductionState, Reduction, Run
+from ir_api.core.pool import InstrumentedAsyncQueuePool
+from ir_api.core.replicas import ReplicaRouter
+from ir_api.core.specifications.instrument import state_count_field
+from ir_api.core.statements import StatementCacheRecorder
+
+
+def encode_json(content: Any) -> bytes:
+    """
+    Encode content built as plain dicts, rather than pydantic models, with orjson. The output matches FastAPI's
+    encoding of the equivalent response models: compact separators, unescaped unicode, datetimes in ISO 8601 and enums
+    by value. The exception is floats in exponent notation, which are written as 1e-7 rather than 1e-07. Content orjson
+    cannot encode, such as integers beyond 64 bits in the reduction inputs, falls back to FastAPI's encoder.
+    :param content: The content to encode
+    :return: The JSON
+    """
+    try:
+        return orjson.dumps(content)
+    except orjson.JSONEncodeError:
+        return json.dumps(
+            jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+        ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    A JSON response encoded with encode_json, for list responses that are built as plain dicts rather than pydantic
+    models.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return encode_json(content)
+
+
+class NDJSONResponse(StreamingResponse):
+    """
+    A newline delimited JSON response, streamed a line per item as the items are iterated, so that the whole response
+    is never held in memory. Each item is encoded to a line with the given encode, by default encode_json. The items are
+    closed when the response ends, however it ends, so that a stream the client disconnects from releases its session
+    and cursor then, rather than when it is garbage collected.
+    """
+
+    media_type = "application/x-ndjson"
+
+    def __init__(self, items: AsyncIterable[Any], encode: Callable[[Any], bytes] = encode_json) -> None:
+        self._stream = self._lines(items, encode)
+        super().__init__(self._stream, media_type=self.media_type)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self._stream.aclose()
+
+    @staticmethod
+    async def _lines(items: AsyncIterable[Any], encode: Callable[[Any], bytes]) -> AsyncGenerator[bytes, None]:
+        try:
+            async for item in items:
+                yield encode(item) + b"\n"
+        finally:
+            if isinstance(items, AsyncGenerator):
+                await items.aclose()
 
 
 class CountResponse(BaseModel):
@@ -18,6 +87,181 @@ class CountResponse(BaseModel):
     count: int
 
 
+class InstrumentSummaryResponse(BaseModel):
+    """
+    InstrumentSummaryResponse shows the totals of an instrument, with the count of its reductions in each state
+    """
+
+    instrument_name: str
+    run_count: int
+    reduction_count: int
+    reduction_states: Dict[ReductionState, int]
+
+    @staticmethod
+    def from_summary(fields: Mapping[str, Any]) -> InstrumentSummaryResponse:
+        """
+        Given the fields selected by InstrumentSpecification.summary, return an InstrumentSummaryResponse
+        :param fields: The summary fields of the instrument
+        :return: The InstrumentSummaryResponse object
+        """
+        return InstrumentSummaryResponse(
+            instrument_name=fields["instrument_name"],
+            run_count=fields["run_count"],
+            reduction_count=fields["reduction_count"],
+            reduction_states={state: fields[state_count_field(state)] for state in ReductionState},
+        )
+
+
+class PoolResponse(BaseModel):
+    """
+    PoolResponse shows the utilisation of the database connection pool, used to size the pool against the worker count
+    """
+
+    pooled: bool
+    size: int = 0
+    capacity: int = 0
+    checked_out: int = 0
+    overflow: int = 0
+    saturation: float = 0.0
+    checkouts: int = 0
+    mean_checkout_wait_ms: float = 0.0
+    max_checkout_wait_ms: float = 0.0
+    checkout_timeouts: int = 0
+
+    @staticmethod
+    def from_pool(pool: Pool) -> PoolResponse:
+        """
+        Given the connection pool of an engine, return a PoolResponse
+        :param pool: The pool
+        :return: The PoolResponse object
+        """
+        if not isinstance(pool, InstrumentedAsyncQueuePool):
+            return PoolResponse(pooled=False)
+        stats = pool.stats
+        return PoolResponse(
+            pooled=True,
+            size=pool.size(),
+            capacity=pool.capacity,
+            checked_out=pool.checkedout(),
+            overflow=max(pool.overflow(), 0),
+            saturation=pool.saturation,
+            checkouts=stats.checkouts,
+            mean_checkout_wait_ms=stats.total_wait / stats.checkouts * 1000 if stats.checkouts else 0.0,
+            max_checkout_wait_ms=stats.max_wait * 1000,
+            checkout_timeouts=stats.timeouts,
+        )
+
+
+class ResultCacheResponse(BaseModel):
+    """
+    ResultCacheResponse shows the use of the result cache, and whether it is listening for the writes that invalidate it
+    """
+
+    listening: bool
+    notified_tables: List[str]
+    entries: int
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+
+    @staticmethod
+    def from_cache(cache: ResultCache[Any, Any]) -> ResultCacheResponse:
+        """
+        Given the result cache, return a ResultCacheResponse
+        :param cache: The cache
+        :return: The ResultCacheResponse object
+        """
+        return ResultCacheResponse(
+            listening=cache.listening,
+            notified_tables=sorted(cache.notified_tables),
+            entries=len(cache),
+            hits=cache.stats.hits,
+            misses=cache.stats.misses,
+            evictions=cache.stats.evictions,
+            invalidations=cache.stats.invalidations,
+        )
+
+
+class ReplicaResponse(BaseModel):
+    """
+    ReplicaResponse shows the result of the last check of a read replica, and the sessions routed to it
+    """
+
+    name: str
+    healthy: bool
+    available: bool
+    lag_seconds: Optional[float]
+    open_sessions: int
+    sessions: int
+
+
+class ReplicasResponse(BaseModel):
+    """
+    ReplicasResponse shows how queries are routed between the read replicas and the primary
+    """
+
+    selection: str
+    max_lag_seconds: float
+    primary_sessions: int
+    replicas: List[ReplicaResponse]
+
+    @staticmethod
+    def from_router(router: ReplicaRouter) -> ReplicasResponse:
+        """
+        Given the router of the queries, return a ReplicasResponse
+        :param router: The router
+        :return: The ReplicasResponse object
+        """
+        return ReplicasResponse(
+            selection=router.selection,
+            max_lag_seconds=router.max_lag,
+            primary_sessions=router.primary_sessions,
+            replicas=[
+                ReplicaResponse(
+                    name=replica.name,
+                    healthy=replica.healthy,
+                    available=replica.available(router.max_lag),
+                    lag_seconds=replica.lag,
+                    open_sessions=replica.open_sessions,
+                    sessions=replica.sessions,
+                )
+                for replica in router.replicas
+            ],
+        )
+
+
+class StatementCacheResponse(BaseModel):
+    """
+    StatementCacheResponse shows how often the compiled form of each statement was reused from the compiled statement
+    cache, rather than compiled again
+    """
+
+    entries: int
+    capacity: int
+    hits: int
+    misses: int
+    uncached: int
+    hit_rate: float
+
+    @staticmethod
+    def from_recorder(recorder: StatementCacheRecorder) -> StatementCacheResponse:
+        """
+        Given the recorder of an engine's compiled statement cache, return a StatementCacheResponse
+        :param recorder: The recorder
+        :return: The StatementCacheResponse object
+        """
+        stats = recorder.stats
+        return StatementCacheResponse(
+            entries=recorder.entries,
+            capacity=recorder.capacity,
+            hits=stats.hits,
+            misses=stats.misses,
+            uncached=stats.uncached,
+            hit_rate=stats.hit_rate,
+        )
+
+
 class ScriptResponse(BaseModel):
     """
     ScriptResponse returns from the API a script value
@@ -70,6 +314,26 @@ class RunResponse(BaseModel):
             instrument_name=run.instrument.instrument_name,
         )
 
+    @staticmethod
+    def dict_from_run(run: Run) -> Dict[str, Any]:
+        """
+        Given a run return a dict in the shape of the RunResponse, without building or validating the model. For
+        encoding large lists with FastJSONResponse.
+        :param run: The run to convert
+        :return: dict of the RunResponse fields
+        """
+        return {
+            "filename": run.filename,
+            "experiment_number": run.experiment_number,
+            "title": run.title,
+            "users": run.users,
+            "run_start": run.run_start,
+            "run_end": run.run_end,
+            "good_frames": run.good_frames,
+            "raw_frames": run.raw_frames,
+            "instrument_name": run.instrument.instrument_name,
+        }
+
 
 class ReductionResponse(BaseModel):
     """
@@ -104,6 +368,39 @@ class ReductionResponse(BaseModel):
             id=reduction.id,
         )
 
+    @staticmethod
+    def dict_from_reduction(reduction: Reduction) -> Dict[str, Any]:
+        """
+        Given a reduction return a dict in the shape of the ReductionResponse, without building or validating the
+        model. For encoding large lists with FastJSONResponse.
+        :param reduction: The Reduction to convert
+        :return: dict of the ReductionResponse fields
+        """
+        return {
+            "id": reduction.id,
+            "reduction_start": reduction.reduction_start,
+            "reduction_end": reduction.reduction_end,
+            "reduction_state": reduction.reduction_state,
+            "reduction_status_message": reduction.reduction_status_message,
+            "reduction_inputs": reduction.reduction_inputs,
+            "reduction_outputs": reduction.reduction_outputs,
+            "script": {"value": reduction.script.script} if reduction.script else None,
+        }
+
+    @staticmethod
+    def fields_from_projection(fields: Mapping[str, Any]) -> Dict[str, Any]:
+        """
+        Given the projected fields of a reduction, return them in the shape of a ReductionResponse, with the script
+        nested as a ScriptResponse
+        :param fields: The projected fields of the reduction
+        :return: dict of the fields
+        """
+        response = dict(fields)
+        if "script" in response:
+            script = response["script"]
+            response["script"] = {"value": script} if script is not None else None
+        return response
+
 
 class ReductionWithRunsResponse(ReductionResponse):
     """
@@ -131,3 +428,25 @@ class ReductionWithRunsResponse(ReductionResponse):
             id=reduction.id,
             runs=[RunResponse.from_run(run) for run in reduction.runs],
         )
+
+    @staticmethod
+    def dict_from_reduction(reduction: Reduction) -> Dict[str, Any]:
+        """
+        Given a Reduction return a dict in the shape of the ReductionWithRunsResponse, without building or validating
+        the model. For encoding large lists with FastJSONResponse.
+        :param reduction: The Reduction to convert
+        :return: dict of the ReductionWithRunsResponse fields
+        """
+        response = ReductionResponse.dict_from_reduction(reduction)
+        response["runs"] = [RunResponse.dict_from_run(run) for run in reduction.runs]
+        return response
+
+
+class ReductionBatchResponse(BaseModel):
+    """
+    ReductionBatchResponse contains the reductions found for a batch of ids, with their runs, and the ids that were
+    not found
+    """
+
+    reductions: List[ReductionWithRunsResponse]
+    missing_ids: List[int]
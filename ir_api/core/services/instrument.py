@@ -0,0 +1,29 @@
+"""
+Service Layer for instruments
+"""
+
+import os
+from typing import Sequence, Dict, Any
+
+from ir_api.core.cache import TTLCache
+from ir_api.core.model import Instrument
+from ir_api.core.repositories import AsyncRepo
+from ir_api.core.specifications.instrument import InstrumentSpecification
+
+INSTRUMENT_SUMMARY_CACHE_TTL = float(os.environ.get("INSTRUMENT_SUMMARY_CACHE_TTL", "30"))
+SUMMARY_CACHE: TTLCache[str, Sequence[Dict[str, Any]]] = TTLCache(ttl=INSTRUMENT_SUMMARY_CACHE_TTL, max_size=1)
+
+_REPO: AsyncRepo[Instrument] = AsyncRepo()
+
+
+async def get_instrument_summaries() -> Sequence[Dict[str, Any]]:
+    """
+    Get the run count, reduction count and count of reductions in each state of every instrument, counted in one
+    query. The summaries are cached for INSTRUMENT_SUMMARY_CACHE_TTL seconds.
+    :return: The summary fields of each instrument, ordered by instrument name
+    """
+    summaries = SUMMARY_CACHE.get("summaries")
+    if summaries is None:
+        summaries = await _REPO.find_fields(InstrumentSpecification().summary())
+        SUMMARY_CACHE.set("summaries", summaries)
+    return summaries
@@ -2,11 +2,17 @@
 Service Layer for reductions
 """
 
-from typing import Sequence, Literal
+# pylint: disable=too-many-arguments
+# Service functions take each of the query parameters of the endpoints they serve
 
+from collections.abc import AsyncGenerator
+from typing import Sequence, Literal, Optional, Dict, Any, AsyncIterator, List, Tuple
+
+from ir_api.core.catalog import INSTRUMENT_CATALOG
+from ir_api.core.etags import reduction_etag_from_versions
 from ir_api.core.exceptions import MissingRecordError
 from ir_api.core.model import Reduction
-from ir_api.core.repositories import Repo
+from ir_api.core.repositories import AsyncRepo, Page
 from ir_api.core.specifications.reduction import ReductionSpecification
 
 OrderField = Literal[
@@ -22,47 +28,305 @@ OrderField = Literal[
     "filename",
 ]
 
-_REPO: Repo[Reduction] = Repo()
+_REPO: AsyncRepo[Reduction] = AsyncRepo()
+
+# The runs are loaded with selectin, which selects the runs of up to 500 reductions per query, so a batch of at most
+# this many reductions is loaded in two queries
+MAX_BATCH_SIZE = 500
 
 
-def get_reductions_by_instrument(
+async def get_reductions_by_instrument(
     instrument: str,
     limit: int = 0,
     offset: int = 0,
     order_by: OrderField = "reduction_start",
     order_direction: Literal["asc", "desc"] = "desc",
-) -> Sequence[Reduction]:
+    cursor: Optional[str] = None,
+    include_runs: bool = False,
+) -> Page[Reduction]:
+    """
+    Given an instrument name return a page of reductions for that instrument. Optionally providing a limit and
+    offset or cursor to be applied to the sequence, and whether to load the runs of the reductions
+    :param instrument: (str) - The instrument to get by
+    :param limit: (int) - the maximum number of results to be allowed in the sequence
+    :param offset: (int) - the number of reductions to offset the sequence from the entire reduction set
+    :param order_direction: (str) Direction to der by "asc" | "desc"
+    :param order_by: (str) Field to order by.
+    :param cursor: (str) The next_cursor of the previous page
+    :param include_runs: (bool) Whether to load the runs of each reduction
+    :return: Page of Reductions for an instrument
+    """
+    spec = ReductionSpecification().by_instrument_id(
+        instrument_id=await INSTRUMENT_CATALOG.id_for(instrument),
+        limit=limit,
+        offset=offset,
+        order_by=order_by,
+        order_direction=order_direction,
+        cursor=cursor,
+    )
+    spec.with_script()
+    if include_runs:
+        spec.with_runs()
+    return await _REPO.find_page(spec)
+
+
+async def get_reduction_fields_by_instrument(
+    instrument: str,
+    fields: Sequence[str],
+    limit: int = 0,
+    offset: int = 0,
+    order_by: OrderField = "reduction_start",
+    order_direction: Literal["asc", "desc"] = "desc",
+    cursor: Optional[str] = None,
+) -> Page[Dict[str, Any]]:
+    """
+    Given an instrument name return a page of only the given fields of the reductions for that instrument, without
+    loading the reductions. Optionally providing a limit and offset or cursor to be applied to the sequence
+    :param instrument: (str) - The instrument to get by
+    :param fields: (Sequence[str]) - The fields of the reductions to return
+    :param limit: (int) - the maximum number of results to be allowed in the sequence
+    :param offset: (int) - the number of reductions to offset the sequence from the entire reduction set
+    :param order_direction: (str) Direction to der by "asc" | "desc"
+    :param order_by: (str) Field to order by.
+    :param cursor: (str) The next_cursor of the previous page
+    :return: Page of dicts of field name to value
+    """
+    return await _REPO.find_fields_page(
+        ReductionSpecification()
+        .by_instrument_id(
+            instrument_id=await INSTRUMENT_CATALOG.id_for(instrument),
+            limit=limit,
+            offset=offset,
+            order_by=order_by,
+            order_direction=order_direction,
+            cursor=cursor,
+        )
+        .project(fields)
+    )
+
+
+async def get_reduction_json_by_instrument(
+    instrument: str,
+    limit: int = 0,
+    offset: int = 0,
+    order_by: OrderField = "reduction_start",
+    order_direction: Literal["asc", "desc"] = "desc",
+    cursor: Optional[str] = None,
+    include_runs: bool = False,
+) -> Page[str]:
+    """
+    Given an instrument name return a page of the reductions for that instrument, each as the JSON text of its
+    response assembled by postgres. Optionally providing a limit and offset or cursor to be applied to the sequence,
+    and whether to nest the runs of the reductions
+    :param instrument: (str) - The instrument to get by
+    :param limit: (int) - the maximum number of results to be allowed in the sequence
+    :param offset: (int) - the number of reductions to offset the sequence from the entire reduction set
+    :param order_direction: (str) Direction to der by "asc" | "desc"
+    :param order_by: (str) Field to order by.
+    :param cursor: (str) The next_cursor of the previous page
+    :param include_runs: (bool) Whether to nest the runs of each reduction
+    :return: Page of the JSON of the reductions
+    """
+    page = await _REPO.find_fields_page(
+        ReductionSpecification()
+        .by_instrument_id(
+            instrument_id=await INSTRUMENT_CATALOG.id_for(instrument),
+            limit=limit,
+            offset=offset,
+            order_by=order_by,
+            order_direction=order_direction,
+            cursor=cursor,
+        )
+        .as_json(include_runs=include_runs)
+    )
+    return Page([row["json"] for row in page.items], page.next_cursor)
+
+
+async def stream_reductions_by_instrument(
+    instrument: str,
+    limit: int = 0,
+    offset: int = 0,
+    order_by: OrderField = "reduction_start",
+    order_direction: Literal["asc", "desc"] = "desc",
+    cursor: Optional[str] = None,
+    include_runs: bool = False,
+) -> AsyncIterator[Reduction]:
+    """
+    Given an instrument name stream the reductions for that instrument as they are fetched, rather than holding them
+    all. Optionally providing a limit and offset or cursor to be applied to the sequence, and whether to load the runs
+    of the reductions
+    :param instrument: (str) - The instrument to get by
+    :param limit: (int) - the maximum number of results to be allowed in the sequence
+    :param offset: (int) - the number of reductions to offset the sequence from the entire reduction set
+    :param order_direction: (str) Direction to der by "asc" | "desc"
+    :param order_by: (str) Field to order by.
+    :param cursor: (str) The next_cursor of the previous page
+    :param include_runs: (bool) Whether to load the runs of each reduction
+    :return: Async iterator of the reductions for an instrument
+    """
+    spec = ReductionSpecification().by_instrument_id(
+        instrument_id=await INSTRUMENT_CATALOG.id_for(instrument),
+        limit=limit,
+        offset=offset,
+        order_by=order_by,
+        order_direction=order_direction,
+        cursor=cursor,
+    )
+    spec.with_script()
+    if include_runs:
+        spec.with_runs()
+    return _REPO.stream(spec)
+
+
+async def stream_reduction_fields_by_instrument(
+    instrument: str,
+    fields: Sequence[str],
+    limit: int = 0,
+    offset: int = 0,
+    order_by: OrderField = "reduction_start",
+    order_direction: Literal["asc", "desc"] = "desc",
+    cursor: Optional[str] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Given an instrument name stream only the given fields of the reductions for that instrument as they are fetched.
+    Optionally providing a limit and offset or cursor to be applied to the sequence
+    :param instrument: (str) - The instrument to get by
+    :param fields: (Sequence[str]) - The fields of the reductions to return
+    :param limit: (int) - the maximum number of results to be allowed in the sequence
+    :param offset: (int) - the number of reductions to offset the sequence from the entire reduction set
+    :param order_direction: (str) Direction to der by "asc" | "desc"
+    :param order_by: (str) Field to order by.
+    :param cursor: (str) The next_cursor of the previous page
+    :return: Async iterator of dicts of field name to value
+    """
+    return _REPO.stream_fields(
+        ReductionSpecification()
+        .by_instrument_id(
+            instrument_id=await INSTRUMENT_CATALOG.id_for(instrument),
+            limit=limit,
+            offset=offset,
+            order_by=order_by,
+            order_direction=order_direction,
+            cursor=cursor,
+        )
+        .project(fields)
+    )
+
+
+async def stream_reduction_json_by_instrument(
+    instrument: str,
+    limit: int = 0,
+    offset: int = 0,
+    order_by: OrderField = "reduction_start",
+    order_direction: Literal["asc", "desc"] = "desc",
+    cursor: Optional[str] = None,
+    include_runs: bool = False,
+) -> AsyncIterator[str]:
     """
-    Given an instrument name return a sequence of reductions for that instrument. Optionally providing a limit and
-    offset to be applied to the sequence
+    Given an instrument name stream the reductions for that instrument as they are fetched, each as the JSON text of
+    its response assembled by postgres. Optionally providing a limit and offset or cursor to be applied to the
+    sequence, and whether to nest the runs of the reductions
     :param instrument: (str) - The instrument to get by
     :param limit: (int) - the maximum number of results to be allowed in the sequence
     :param offset: (int) - the number of reductions to offset the sequence from the entire reduction set
     :param order_direction: (str) Direction to der by "asc" | "desc"
     :param order_by: (str) Field to order by.
-    :return: Sequence of Reductions for an instrument
+    :param cursor: (str) The next_cursor of the previous page
+    :param include_runs: (bool) Whether to nest the runs of each reduction
+    :return: Async iterator of the JSON of the reductions
     """
-    return _REPO.find(
-        ReductionSpecification().by_instrument(
-            instrument=instrument, limit=limit, offset=offset, order_by=order_by, order_direction=order_direction
+    rows = _REPO.stream_fields(
+        ReductionSpecification()
+        .by_instrument_id(
+            instrument_id=await INSTRUMENT_CATALOG.id_for(instrument),
+            limit=limit,
+            offset=offset,
+            order_by=order_by,
+            order_direction=order_direction,
+            cursor=cursor,
         )
+        .as_json(include_runs=include_runs)
     )
+    return _json_of_rows(rows)
+
+
+async def _json_of_rows(rows: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """
+    The JSON text of each row, closing the rows when closed, as a generator expression would not
+    :param rows: The rows, each with the JSON text of its response
+    :return: Async iterator of the JSON text
+    """
+    try:
+        async for row in rows:
+            yield row["json"]
+    finally:
+        if isinstance(rows, AsyncGenerator):
+            await rows.aclose()
 
 
-def get_reduction_by_id(reduction_id: int) -> Reduction:
+async def get_reduction_by_id(reduction_id: int) -> Reduction:
     """
-    Given an ID return the reduction with that ID
+    Given an ID return the reduction with that ID, with its script and runs
     :param reduction_id: The id of the reduction to search for
     :return: The reduction
     :raises: MissingRecordError when no reduction for that ID is found
     """
-    reduction = _REPO.find_one(ReductionSpecification().by_id(reduction_id))
+    spec = ReductionSpecification()
+    spec.by_id(reduction_id)
+    reduction = await _REPO.find_one(spec.with_script().with_runs())
     if reduction is None:
         raise MissingRecordError(f"No Reduction for id {reduction_id}")
     return reduction
 
 
-def get_reductions_by_experiment_number(
+async def get_reduction_etag(reduction_id: int) -> str:
+    """
+    Given an ID return the entity tag of the reduction with that ID, with its script and runs, from their row versions
+    alone, without loading them
+    :param reduction_id: The id of the reduction
+    :return: The quoted entity tag, equal to the reduction_etag of the loaded reduction
+    :raises: MissingRecordError when no reduction for that ID is found
+    """
+    spec = ReductionSpecification()
+    spec.by_id(reduction_id)
+    versions = await _REPO.find_fields(spec.versions())
+    if not versions:
+        raise MissingRecordError(f"No Reduction for id {reduction_id}")
+    return reduction_etag_from_versions(versions[0])
+
+
+async def get_reductions_by_ids(reduction_ids: Sequence[int]) -> Tuple[Sequence[Reduction], List[int]]:
+    """
+    Given up to MAX_BATCH_SIZE ids, return the reductions with those ids, with their scripts and runs, in two queries
+    however many ids are given. Repeated ids are returned once.
+    :param reduction_ids: The ids of the reductions to search for
+    :return: The reductions in the order the ids were given, and the ids with no reduction
+    """
+    ids = list(dict.fromkeys(reduction_ids))
+    if not ids:
+        return [], []
+    reductions = await _REPO.find(ReductionSpecification().by_ids(ids).with_script().with_runs())
+    found = {reduction.id: reduction for reduction in reductions}
+    return [found[id_] for id_ in ids if id_ in found], [id_ for id_ in ids if id_ not in found]
+
+
+async def get_reduction_json_by_id(reduction_id: int) -> str:
+    """
+    Given an ID return the JSON text of the reduction with that ID, with its script and runs, assembled by postgres
+    :param reduction_id: The id of the reduction to search for
+    :return: The JSON of the reduction
+    :raises: MissingRecordError when no reduction for that ID is found
+    """
+    spec = ReductionSpecification()
+    spec.by_id(reduction_id)
+    rows = await _REPO.find_fields(spec.as_json(include_runs=True))
+    if not rows:
+        raise MissingRecordError(f"No Reduction for id {reduction_id}")
+    json_: str = rows[0]["json"]
+    return json_
+
+
+async def get_reductions_by_experiment_number(
     experiment_number: int,
     limit: int = 0,
     offset: int = 0,
@@ -78,29 +342,98 @@ def get_reductions_by_experiment_number(
     :param order_by: (str) Field to order by.
     :return: List of reductions
     """
-    return _REPO.find(
-        ReductionSpecification().by_experiment_number(
+    return await _REPO.find(
+        ReductionSpecification()
+        .by_experiment_number(
+            experiment_number=experiment_number,
+            limit=limit,
+            offset=offset,
+            order_direction=order_direction,
+            order_by=order_by,
+        )
+        .with_script()
+    )
+
+
+async def get_reduction_fields_by_experiment_number(
+    experiment_number: int,
+    fields: Sequence[str],
+    limit: int = 0,
+    offset: int = 0,
+    order_by: Literal["reduction_start", "reduction_end", "reduction_state", "id"] = "reduction_start",
+    order_direction: Literal["asc", "desc"] = "desc",
+) -> Sequence[Dict[str, Any]]:
+    """
+    Given an experiment number, return only the given fields of the reductions for that experiment, without loading
+    the reductions
+    :param experiment_number: The experiment number
+    :param fields: (Sequence[str]) - The fields of the reductions to return
+    :param limit: (int) - the maximum number of results to be allowed in the sequence
+    :param offset: (int) - the number of reductions to offset the sequence from the entire reduction set
+    :param order_direction: (str) Direction to der by "asc" | "desc"
+    :param order_by: (str) Field to order by.
+    :return: List of dicts of field name to value
+    """
+    return await _REPO.find_fields(
+        ReductionSpecification()
+        .by_experiment_number(
+            experiment_number=experiment_number,
+            limit=limit,
+            offset=offset,
+            order_direction=order_direction,
+            order_by=order_by,
+        )
+        .project(fields)
+    )
+
+
+async def get_reduction_json_by_experiment_number(
+    experiment_number: int,
+    limit: int = 0,
+    offset: int = 0,
+    order_by: Literal["reduction_start", "reduction_end", "reduction_state", "id"] = "reduction_start",
+    order_direction: Literal["asc", "desc"] = "desc",
+) -> Sequence[str]:
+    """
+    Given an experiment number, return the reductions for that experiment, each as the JSON text of its response
+    assembled by postgres
+    :param experiment_number: The experiment number
+    :param limit: (int) - the maximum number of results to be allowed in the sequence
+    :param offset: (int) - the number of reductions to offset the sequence from the entire reduction set
+    :param order_direction: (str) Direction to der by "asc" | "desc"
+    :param order_by: (str) Field to order by.
+    :return: List of the JSON of the reductions
+    """
+    rows = await _REPO.find_fields(
+        ReductionSpecification()
+        .by_experiment_number(
             experiment_number=experiment_number,
             limit=limit,
             offset=offset,
             order_direction=order_direction,
             order_by=order_by,
         )
+        .as_json()
     )
+    return [row["json"] for row in rows]
 
 
-def count_reductions_by_instrument(instrument: str) -> int:
+async def count_reductions_by_instrument(instrument: str, approximate: bool = False) -> int:
     """
     Given an instrument name, count the reductions for that instrument
     :param instrument: Instrument to count from
+    :param approximate: Estimate the count from the table statistics rather than counting
     :return: Number of reductions
     """
-    return _REPO.count(ReductionSpecification().by_instrument(instrument=instrument))
+    spec = ReductionSpecification().by_instrument_id(instrument_id=await INSTRUMENT_CATALOG.id_for(instrument))
+    return await (_REPO.estimate_count(spec) if approximate else _REPO.count(spec))
 
 
-def count_reductions() -> int:
+async def count_reductions(approximate: bool = False) -> int:
     """
     Count the total number of reductions
+    :param approximate: Estimate the count from the table statistics rather than counting
     :return: (int) number of reductions
     """
-    return _REPO.count(ReductionSpecification().all())
+    spec = ReductionSpecification().all()
+    return await (_REPO.estimate_count(spec) if approximate else _REPO.count(spec))
@@ -2,52 +2,175 @@
 Service Layer for runs
 """
 
-from typing import Sequence, Literal
+# pylint: disable=too-many-arguments
+# Service functions take each of the query parameters of the endpoints they serve
 
+from typing import Literal, Optional, Sequence, Dict, Any, AsyncIterator
+
+from ir_api.core.catalog import INSTRUMENT_CATALOG
 from ir_api.core.model import Run
-from ir_api.core.repositories import Repo
+from ir_api.core.repositories import AsyncRepo, Page
 from ir_api.core.specifications.run import RunSpecification
 
-_REPO: Repo[Run] = Repo()
+_REPO: AsyncRepo[Run] = AsyncRepo()
 
 
-def get_total_run_count() -> int:
+async def get_total_run_count(approximate: bool = False) -> int:
     """
     Get the total number of runs
+    :param approximate: Estimate the count from the table statistics rather than counting
     :return: The number of runs
     """
-    return _REPO.count(RunSpecification().all())
+    spec = RunSpecification().all()
+    return await (_REPO.estimate_count(spec) if approximate else _REPO.count(spec))
 
 
-def get_run_count_by_instrument(instrument: str) -> int:
+async def get_run_count_by_instrument(instrument: str, approximate: bool = False) -> int:
     """
     Get the total number of runs for the given instrument
     :param instrument: The instrument
+    :param approximate: Estimate the count from the table statistics rather than counting
     :return: The number of runs
     """
-    return _REPO.count(RunSpecification().by_instrument(instrument))
+    spec = RunSpecification().by_instrument_id(await INSTRUMENT_CATALOG.id_for(instrument))
+    return await (_REPO.estimate_count(spec) if approximate else _REPO.count(spec))
+
+
+async def get_runs_by_instrument(
+    instrument: str,
+    limit: int = 0,
+    offset: int = 0,
+    order_by: Literal[
+        "experiment_number", "run_end", "run_start", "good_frames", "raw_frames", "id", "filename"
+    ] = "run_start",
+    order_direction: Literal["asc", "desc"] = "desc",
+    cursor: Optional[str] = None,
+) -> Page[Run]:
+    """
+    Get the runs for the given instrument, with their instrument
+    :param instrument: Instrument name
+    :param limit: optional limit to be applied
+    :param offset: optional offset to be applied
+    :param order_by: optional field to order by
+    :param order_direction: optional direction to order by in
+    :param cursor: optional next_cursor of the previous page
+    :return: The page of runs
+    """
+    return await _REPO.find_page(
+        RunSpecification()
+        .by_instrument_id(
+            await INSTRUMENT_CATALOG.id_for(instrument),
+            limit=limit,
+            offset=offset,
+            order_by=order_by,
+            order_direction=order_direction,
+            cursor=cursor,
+        )
+        .with_instrument()
+    )
+
+
+async def get_run_fields_by_instrument(
+    instrument: str,
+    fields: Sequence[str],
+    limit: int = 0,
+    offset: int = 0,
+    order_by: Literal[
+        "experiment_number", "run_end", "run_start", "good_frames", "raw_frames", "id", "filename"
+    ] = "run_start",
+    order_direction: Literal["asc", "desc"] = "desc",
+    cursor: Optional[str] = None,
+) -> Page[Dict[str, Any]]:
+    """
+    Get only the given fields of the runs for the given instrument, without loading the runs
+    :param instrument: Instrument name
+    :param fields: The fields of the runs to return
+    :param limit: optional limit to be applied
+    :param offset: optional offset to be applied
+    :param order_by: optional field to order by
+    :param order_direction: optional direction to order by in
+    :param cursor: optional next_cursor of the previous page
+    :return: The page of dicts of field name to value
+    """
+    return await _REPO.find_fields_page(
+        RunSpecification()
+        .by_instrument_id(
+            await INSTRUMENT_CATALOG.id_for(instrument),
+            limit=limit,
+            offset=offset,
+            order_by=order_by,
+            order_direction=order_direction,
+            cursor=cursor,
+        )
+        .project(fields)
+    )
+
+
+async def stream_runs_by_instrument(
+    instrument: str,
+    limit: int = 0,
+    offset: int = 0,
+    order_by: Literal[
+        "experiment_number", "run_end", "run_start", "good_frames", "raw_frames", "id", "filename"
+    ] = "run_start",
+    order_direction: Literal["asc", "desc"] = "desc",
+    cursor: Optional[str] = None,
+) -> AsyncIterator[Run]:
+    """
+    Stream the runs for the given instrument, with their instrument, as they are fetched rather than holding them all
+    :param instrument: Instrument name
+    :param limit: optional limit to be applied
+    :param offset: optional offset to be applied
+    :param order_by: optional field to order by
+    :param order_direction: optional direction to order by in
+    :param cursor: optional next_cursor of the previous page
+    :return: Async iterator of the runs
+    """
+    return _REPO.stream(
+        RunSpecification()
+        .by_instrument_id(
+            await INSTRUMENT_CATALOG.id_for(instrument),
+            limit=limit,
+            offset=offset,
+            order_by=order_by,
+            order_direction=order_direction,
+            cursor=cursor,
+        )
+        .with_instrument()
+    )
 
 
-def get_runs_by_instrument(
+async def stream_run_fields_by_instrument(
     instrument: str,
+    fields: Sequence[str],
     limit: int = 0,
     offset: int = 0,
     order_by: Literal[
         "experiment_number", "run_end", "run_start", "good_frames", "raw_frames", "id", "filename"
     ] = "run_start",
     order_direction: Literal["asc", "desc"] = "desc",
-) -> Sequence[Run]:
+    cursor: Optional[str] = None,
+) -> AsyncIterator[Dict[str, Any]]:
     """
-    Get the runs for the given instrument
+    Stream only the given fields of the runs for the given instrument as they are fetched
     :param instrument: Instrument name
+    :param fields: The fields of the runs to return
     :param limit: optional limit to be applied
     :param offset: optional offset to be applied
     :param order_by: optional field to order by
     :param order_direction: optional direction to order by in
-    :return: The sequence of runs
+    :param cursor: optional next_cursor of the previous page
+    :return: Async iterator of dicts of field name to value
     """
-    return _REPO.find(
-        RunSpecification().by_instrument(
-            instrument, limit=limit, offset=offset, order_by=order_by, order_direction=order_direction
+    return _REPO.stream_fields(
+        RunSpecification()
+        .by_instrument_id(
+            await INSTRUMENT_CATALOG.id_for(instrument),
+            limit=limit,
+            offset=offset,
+            order_by=order_by,
+            order_direction=order_direction,
+            cursor=cursor,
         )
+        .project(fields)
     )
@@ -0,0 +1,58 @@
+"""
+Coalescing of concurrent calls for the same key into a single call, whose result or exception every caller shares
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class SingleFlight(Generic[K, V]):
+    """
+    Runs the call of the first caller for a key as a task, which every caller for the key awaits until it completes,
+    sharing its result, or its exception. The next call for the key once it has completed runs again, so results are
+    not cached. A caller that is cancelled does not cancel the call the others await. This is intended to be used from
+    the event loop.
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight: Dict[K, asyncio.Task[V]] = {}
+
+    async def run(self, key: K, call: Callable[[], Awaitable[V]]) -> V:
+        """
+        Await the call in flight for the key, or make the call when there is none
+        :param key: The key of the call
+        :param call: Makes the call
+        :return: The result of the call
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(call())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._land(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _land(self, key: K, task: asyncio.Task[V]) -> None:
+        """
+        Remove the completed call, so the next call for the key runs again. Its exception is retrieved, so that it is
+        not reported as unretrieved when every caller was cancelled.
+        :param key: The key of the call
+        :param task: The completed call
+        :return: None
+        """
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            task.exception()
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
@@ -9,16 +9,60 @@ the concerns of how objects are retrieved from the database from the rest of the
 
 from __future__ import annotations
 
+import base64
+import binascii
+import enum
+import json
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
 from functools import wraps
-from typing import TypeVar, Generic, Type, Literal, Tuple, Callable, Any
+from typing import (
+    TypeVar,
+    Generic,
+    Type,
+    Literal,
+    Tuple,
+    Callable,
+    Any,
+    Optional,
+    Hashable,
+    Dict,
+    Sequence,
+    Union,
+    FrozenSet,
+    Set,
+)
 
-from sqlalchemy import select, Select
+from sqlalchemy import (
+    select,
+    Select,
+    literal,
+    BigInteger,
+    ColumnElement,
+    and_,
+    or_,
+    tuple_,
+    distinct,
+    false,
+    inspect,
+    func as sql_func,
+)
+from sqlalchemy.orm import InstrumentedAttribute, Load
+from sqlalchemy.sql.util import find_tables
 
+from ir_api.core.exceptions import InvalidCursorError, InvalidFieldsError
 from ir_api.core.model import Base
 
 T = TypeVar("T", bound=Base)
 
+LoadingStrategy = Literal["selectin", "joined", "none", "raise"]
+
+# A column of the model or a joined model, or a column of a joined subquery such as an aggregate of related rows
+OrderColumn = Union[InstrumentedAttribute[Any], ColumnElement[Any]]
+
+_LOADER_METHODS = {"selectin": "selectinload", "joined": "joinedload", "none": "noload", "raise": "raiseload"}
+
 
 def apply_pagination(spec_value: Select[Tuple[T]], limit: int, offset: int) -> Select[Tuple[T]]:
     """
@@ -35,50 +79,102 @@ def apply_pagination(spec_value: Select[Tuple[T]], limit: int, offset: int) -> S
     return spec_value
 
 
-def apply_ordering(
-    spec_value: Select[Tuple[T]],
-    model: Type[T],
-    order_by: str,
-    order_direction: str,
-) -> Select[Tuple[T]]:
-    """
-    Apply basic ordering to the specification value.
-    Note: This can only be called when there are no joins. Orders based on relations should be implemented in the
-    specification method directly
-    :param spec_value:
-    :param model:
-    :param order_by:
-    :param order_direction:
-    :return:
-    """
-    column_element = getattr(model, order_by)
-    spec_value = (
-        spec_value.order_by(column_element.asc())
-        if order_direction == "asc"
-        else spec_value.order_by(column_element.desc())
-    )
-    return spec_value
-
-
 def paginate(func: Callable[..., Any]) -> Callable[..., Any]:
     """
-    This decorator allows any specification method to accept the args limit: int and offset: int
-    and will apply them to the specifications query automagically. This means that the limit and offset args
-    will appear to be unused in the specification method, but they are not.
+    This decorator allows any specification method to accept the args limit: int, offset: int and cursor: str
+    and will apply them to the specifications query automagically. This means that the limit, offset and cursor args
+    will appear to be unused in the specification method, but they are not. The cursor is applied after the
+    specification method, so that it can seek on the ordering the method applies.
     :param func:  The specification Method
     :return: Wrapped specification method with pagination
     """
 
     @wraps(func)
-    def wrapper(self: Specification[T], *args: Tuple[Any], **kwargs: int) -> Any:
-        limit = kwargs.get("limit", 0)
-        offset = kwargs.get("offset", 0)
+    def wrapper(self: Specification[T], *args: Tuple[Any], **kwargs: Any) -> Any:
+        limit = kwargs.get("limit", 0) or 0
+        offset = kwargs.get("offset", 0) or 0
+        cursor = kwargs.get("cursor")
+        result = func(self, *args, **kwargs)
+        if cursor:
+            self.value = self.value.where(self.seek(cursor))
+        self.limit = limit
+        self.cursor = cursor
         self.value = apply_pagination(self.value, limit, offset)
-        return func(self, *args, **kwargs)
+        return result
 
     return wrapper
 
 
+@dataclass(frozen=True)
+class Cursor:
+    """
+    The position of the last row of a page, used to seek to the next page. The ordering the cursor was taken from is
+    included so that a cursor cannot be applied to a differently ordered query.
+    """
+
+    order_by: str
+    order_direction: str
+    value: Any
+    id: int
+
+    def encode(self) -> str:
+        """
+        Encode the cursor as an opaque url safe string
+        :return: The encoded cursor
+        """
+        value = self.value
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, enum.Enum):
+            value = value.value
+        payload = json.dumps([self.order_by, self.order_direction, value, self.id], separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def decode(cursor: str) -> Cursor:
+        """
+        Decode a cursor produced by encode. The value is left as it was serialised, it is converted back when the
+        cursor is applied to a column.
+        :param cursor: The encoded cursor
+        :return: The Cursor
+        :raises InvalidCursorError: If the cursor is not a valid encoded cursor
+        """
+        try:
+            order_by, order_direction, value, id_ = json.loads(
+                base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            )
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError) as exc:
+            raise InvalidCursorError(f"Malformed cursor: {cursor}") from exc
+        if not isinstance(id_, int):
+            raise InvalidCursorError(f"Malformed cursor: {cursor}")
+        return Cursor(order_by=order_by, order_direction=order_direction, value=value, id=id_)
+
+
+def _cursor_value_for_column(value: Any, column: OrderColumn) -> Any:
+    """
+    Convert a decoded cursor value back into the python type of the column it will be compared against
+    :param value: The decoded value
+    :param column: The column
+    :return: The converted value
+    :raises InvalidCursorError: If the value cannot be converted
+    """
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    try:
+        if python_type is datetime:
+            return datetime.fromisoformat(value)
+        if issubclass(python_type, enum.Enum):
+            return python_type(value)
+    except (TypeError, ValueError) as exc:
+        raise InvalidCursorError(f"Invalid cursor value {value} for {column}") from exc
+    if not isinstance(value, python_type):
+        raise InvalidCursorError(f"Invalid cursor value {value} for {column}")
+    return value
+
+
+# pylint: disable=too-many-instance-attributes
+# The specification records what its query selects, orders by and reads, for the repositories
 class Specification(Generic[T], ABC):
     """
     An abstract base class that defines a generic query specification for an ORM model.
@@ -88,7 +184,22 @@ class Specification(Generic[T], ABC):
     """
 
     def __init__(self) -> None:
-        self.value: Select[Tuple[T]] = select(self.model)
+        # The explicit FROM keeps joins resolving from the model when columns of joined models are selected alongside it
+        self.value: Select[Tuple[T]] = select(self.model).select_from(self.model)
+        self.limit = 0
+        # The cursor the query seeks from, if any
+        self.cursor: Optional[str] = None
+        self.order_column: Optional[OrderColumn] = None
+        self.order_direction: Literal["asc", "desc"] = "desc"
+        # Set by specification methods that join to many related rows, so an entity may be selected more than once
+        self.joins_to_many = False
+        # The fields projected by project, when the query selects columns rather than entities
+        self.fields: Tuple[str, ...] = ()
+        # Set by specification methods that know no entity can match, so the repository need not query
+        self.matches_none = False
+        # The tables of the relationships declared with load, which are read by further queries or options rather
+        # than appearing in the query itself
+        self._loaded_tables: Set[str] = set()
 
     @property
     @abstractmethod
@@ -121,10 +232,62 @@ class Specification(Generic[T], ABC):
         # We can't decorate this method like inherited ones, as there is not a clean way to inherit the decorator
         # metaclass hacks
         self.value = apply_pagination(self.value, limit, offset)
-        self.value = apply_ordering(self.value, self.model, order_by, order_direction)
+        self.limit = limit
+        self.order(getattr(self.model, order_by), order_direction)
 
         return self
 
+    @property
+    def filter_value(self) -> Select[Tuple[int]]:
+        """
+        The ids of the entities matching the specification. The ordering, pagination and the loading of the entity's
+        columns and relationships are removed, leaving only the joins and conditions that filter the entities.
+        :return: The select of matching ids
+        """
+        return (
+            self.value.with_only_columns(self.model.id, maintain_column_froms=True)
+            .order_by(None)
+            .limit(None)
+            .offset(None)
+        )
+
+    @property
+    def count_value(self) -> Select[Tuple[int]]:
+        """
+        A minimal count of the entities matching the specification. When the specification joins to many related
+        rows, distinct ids are counted so each entity is counted once.
+        :return: The count select
+        """
+        # pylint: disable = not-callable
+        count = sql_func.count(distinct(self.model.id)) if self.joins_to_many else sql_func.count()
+        # pylint: enable = not-callable
+        return self.filter_value.with_only_columns(count)
+
+    @property
+    def cache_key(self) -> Tuple[Hashable, ...]:
+        """
+        A key identifying the query of the specification and its parameter values, for caching results. This uses
+        SQLAlchemy's statement cache key, which is far cheaper to produce than compiling the statement.
+        :return: The key
+        """
+        # pylint: disable = protected-access
+        key = self.value._generate_cache_key()
+        # pylint: enable = protected-access
+        if key is None:
+            # The statement contains an element SQLAlchemy cannot cache, so fall back to the compiled statement
+            compiled = self.value.compile()
+            return str(compiled), tuple(compiled.params.items())
+        return key.key, tuple(bind.effective_value for bind in key.bindparams)
+
+    @property
+    def tables(self) -> FrozenSet[str]:
+        """
+        The names of the tables the specification reads, including those of the subqueries and of the relationships it
+        loads, for invalidating cached results when a table is written
+        :return: The table names
+        """
+        return frozenset(table.name for table in find_tables(self.value)) | self._loaded_tables
+
     def by_id(self, id_: int) -> Specification[T]:
         """
         Filters the query to select only the record with the specified primary key ID.
@@ -135,5 +298,127 @@ class Specification(Generic[T], ABC):
         :param id_: The primary key ID of the model instance to retrieve.
         :return: An instance of the specification class with the query filtered by the specified ID.
         """
-        self.value = select(self.model).where(self.model.id == id_)
+        # The id is bound as a BIGINT, as asyncpg will refuse to send an out of range id as an INTEGER parameter,
+        # rather than finding no record
+        self.value = select(self.model).where(self.model.id == literal(id_, BigInteger))
+        return self
+
+    def match_none(self) -> None:
+        """
+        Declare that no entity can match the specification, e.g. when filtering by an instrument that does not exist.
+        The AsyncRepo then returns no entities without querying. The query is also made to select nothing, for
+        repositories that execute it regardless.
+        :return: None
+        """
+        self.matches_none = True
+        self.value = self.value.where(false())
+
+    def load(self, *path: Tuple[InstrumentedAttribute[Any], LoadingStrategy]) -> Specification[T]:
+        """
+        Declare how the query loads a relationship, and optionally the relationships of the related entities. Each step
+        of the path is a relationship and the strategy to load it with:
+        - selectin: a second query selecting the related entities of every entity with an IN, for collections
+        - joined: a LEFT OUTER JOIN in the same query, for many to one relationships
+        - none: the relationship is left empty
+        - raise: accessing the relationship raises, which is the default for relationships that are not declared
+        e.g. spec.load((Reduction.runs, "selectin"), (Run.instrument, "joined"))
+        :param path: The relationships, each with the strategy to load it
+        :return: The specification with the loading applied
+        """
+        option = Load(self.model)
+        for relationship, strategy in path:
+            option = getattr(option, _LOADER_METHODS[strategy])(relationship)
+            self._loaded_tables.add(relationship.property.mapper.local_table.name)
+            if relationship.property.secondary is not None:
+                self._loaded_tables.add(relationship.property.secondary.name)
+        self.value = self.value.options(option)
+        return self
+
+    @property
+    def field_columns(self) -> Dict[str, Any]:
+        """
+        The fields that may be projected with project, and the column each is selected from. By default, the columns
+        of the model.
+        :return: dict of field name to column
+        """
+        return {attr.key: getattr(self.model, attr.key) for attr in inspect(self.model).column_attrs}
+
+    def project(self, fields: Sequence[str]) -> Specification[T]:
+        """
+        Select only the given fields, labelled with their field names, rather than the entity. No entities are built
+        when the query is executed, and the columns that were not requested are not read from the database. The fields
+        are selected in the order of field_columns whatever order they are requested in, so that each set of fields
+        compiles to one statement.
+        :param fields: The names of the fields to select
+        :return: The specification with the projection applied
+        :raises InvalidFieldsError: If a field is not one of field_columns
+        """
+        columns = self.field_columns
+        unknown = [field for field in fields if field not in columns]
+        if unknown or not fields:
+            problem = f"Invalid fields: {', '.join(unknown)}" if unknown else "No fields were requested"
+            raise InvalidFieldsError(f"{problem}. Fields must be one or more of: {', '.join(columns)}")
+        requested = set(fields)
+        self.fields = tuple(field for field in columns if field in requested)
+        self.value = self.value.with_only_columns(
+            *(columns[field].label(field) for field in self.fields), maintain_column_froms=True
+        )
         return self
+
+    def order(self, column: OrderColumn, order_direction: Literal["asc", "desc"]) -> None:
+        """
+        Order the query by the given column, then by id so that the order is total and can be seeked with a cursor.
+        Nulls are ordered as postgres orders them by default, last when ascending and first when descending.
+        :param column: The column to order by, this may be a column of a joined model or subquery
+        :param order_direction: The direction to order by
+        :return: None
+        """
+        self.order_column = column
+        self.order_direction = order_direction
+        if order_direction == "asc":
+            self.value = self.value.order_by(column.asc().nulls_last())
+            if column is not self.model.id:
+                self.value = self.value.order_by(self.model.id.asc())
+        else:
+            self.value = self.value.order_by(column.desc().nulls_first())
+            if column is not self.model.id:
+                self.value = self.value.order_by(self.model.id.desc())
+
+    def seek(self, cursor: str) -> ColumnElement[bool]:
+        """
+        Build the predicate selecting the rows after the given cursor, in the order applied by order.
+        :param cursor: The encoded cursor of the last row of the previous page
+        :return: The seek predicate
+        :raises InvalidCursorError: If the cursor is malformed or was taken from a different ordering
+        """
+        decoded = Cursor.decode(cursor)
+        column = self.order_column
+        if column is None or decoded.order_by != str(column) or decoded.order_direction != self.order_direction:
+            raise InvalidCursorError(f"Cursor does not match the ordering of the query: {cursor}")
+        value = _cursor_value_for_column(decoded.value, column)
+        id_column = self.model.id
+        last_id = literal(decoded.id, BigInteger)
+        nullable = getattr(column.expression, "nullable", True)
+
+        if self.order_direction == "asc":
+            if value is None:
+                # Within the trailing nulls
+                return and_(column.is_(None), id_column > last_id)
+            after = tuple_(column, id_column) > tuple_(literal(value, column.type), last_id)
+            return or_(after, column.is_(None)) if nullable else after
+
+        if value is None:
+            # Within the leading nulls
+            return or_(and_(column.is_(None), id_column < last_id), column.is_not(None))
+        return tuple_(column, id_column) < tuple_(literal(value, column.type), last_id)
+
+    def next_cursor(self, value: Any, id_: int) -> str:
+        """
+        Create the cursor for the page following a row with the given order column value and id
+        :param value: The value of the order column of the last row
+        :param id_: The id of the last row
+        :return: The encoded cursor
+        """
+        return Cursor(
+            order_by=str(self.order_column), order_direction=self.order_direction, value=value, id=id_
+        ).encode()
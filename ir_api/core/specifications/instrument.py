@@ -0,0 +1,89 @@
+"""
+Module defining specifications for querying Instrument entities in the IR API.
+"""
+
+from __future__ import annotations
+
+from typing import Type, Dict, Any
+
+from sqlalchemy import select, func
+
+from ir_api.core.model import Instrument, Run, Reduction, ReductionState, run_reduction_junction_table
+from ir_api.core.specifications.base import Specification
+
+
+def state_count_field(state: ReductionState) -> str:
+    """
+    :param state: A reduction state
+    :return: The name of the summary field counting the reductions in the state
+    """
+    return f"{state.value.lower()}_count"
+
+
+class InstrumentSpecification(Specification[Instrument]):
+    """
+    A specification class for building queries to fetch Instrument entities.
+    """
+
+    @property
+    def model(self) -> Type[Instrument]:
+        return Instrument
+
+    def names(self) -> InstrumentSpecification:
+        """
+        Select the id and name of every instrument, as the fields "id" and "instrument_name"
+        :return: The specification with the names selected
+        """
+        self.value = self.value.order_by(Instrument.id)
+        self.project(["id", "instrument_name"])
+        return self
+
+    def summary(self) -> InstrumentSpecification:
+        """
+        Select the totals of every instrument, ordered by name, in one query: the instrument_name, run_count,
+        reduction_count and the count of reductions in each state, e.g. successful_count. The runs and reductions are
+        each counted in a subquery grouped by instrument, which are outer joined to the instruments. A reduction is
+        counted once for each instrument it has runs of, as by_instrument counts them.
+        :return: The specification with the summary selected
+        """
+        # pylint: disable = not-callable
+        run_counts = select(Run.instrument_id, func.count().label("count")).group_by(Run.instrument_id).subquery()
+        # Each reduction once per instrument, however many of its runs are of the instrument
+        instrument_reductions = (
+            select(Run.instrument_id, Reduction.id, Reduction.reduction_state)
+            .select_from(Reduction)
+            .join(run_reduction_junction_table)
+            .join(Run)
+            .distinct()
+            .subquery()
+        )
+        reduction_counts = (
+            select(
+                instrument_reductions.c.instrument_id,
+                func.count().label("count"),
+                *(
+                    func.count()
+                    .filter(instrument_reductions.c.reduction_state == state)
+                    .label(state_count_field(state))
+                    for state in ReductionState
+                ),
+            )
+            .group_by(instrument_reductions.c.instrument_id)
+            .subquery()
+        )
+        columns: Dict[str, Any] = {
+            "instrument_name": Instrument.instrument_name,
+            "run_count": func.coalesce(run_counts.c.count, 0),
+            "reduction_count": func.coalesce(reduction_counts.c.count, 0),
+        }
+        for state in ReductionState:
+            columns[state_count_field(state)] = func.coalesce(reduction_counts.c[state_count_field(state)], 0)
+        # pylint: enable = not-callable
+        self.fields = tuple(columns)
+        self.value = (
+            self.value.with_only_columns(*(column.label(field) for field, column in columns.items()))
+            .outerjoin(run_counts, run_counts.c.instrument_id == Instrument.id)
+            .outerjoin(reduction_counts, reduction_counts.c.instrument_id == Instrument.id)
+            .order_by(Instrument.instrument_name, Instrument.id)
+        )
+        return self
@@ -0,0 +1,153 @@
+"""
+SQL expressions that assemble response JSON in postgres, as text byte for byte equal to the API's own encoding of the
+same response: compact separators, unescaped unicode, datetimes in ISO 8601 with microseconds only when non-zero, and
+keys in the order of the response model.
+
+The JSONB reduction inputs are written as postgres stores them, with the separators compacted. Numbers stored from
+python floats are written as python writes them, other than those postgres stores without an exponent that python
+writes with one, such as 1e-07.
+"""
+
+# pylint: disable=not-callable
+# func.concat is a generic function, which pylint cannot infer is callable
+import functools
+import json
+from typing import Any, Tuple
+
+from sqlalchemy import ColumnElement, Text, case, cast, func, literal_column, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import aliased
+
+from ir_api.core.model import Instrument, Reduction, Run, Script, run_reduction_junction_table
+
+# Matches a JSON string, which is kept, or the space following a separator, which is removed
+_JSONB_SEPARATOR_PATTERN = r'("(?:[^"\\]|\\.)*")|([,:]) '
+
+
+def _text(value: str) -> ColumnElement[str]:
+    """
+    A constant text literal rendered into the statement, so the statement is the same for every query
+    :param value: The text
+    :return: The literal
+    """
+    return literal_column("'" + value.replace("'", "''") + "'", Text)
+
+
+NULL = _text("null")
+
+
+def json_string(column: Any) -> ColumnElement[str]:
+    """
+    :param column: A text or enum column
+    :return: The column as a JSON string, or null
+    """
+    return func.coalesce(cast(func.to_json(column), Text), NULL)
+
+
+def json_number(column: Any) -> ColumnElement[str]:
+    """
+    :param column: An integer column
+    :return: The column as a JSON number, or null
+    """
+    return func.coalesce(cast(column, Text), NULL)
+
+
+def json_timestamp(column: Any) -> ColumnElement[str]:
+    """
+    :param column: A timestamp column
+    :return: The column as an ISO 8601 JSON string, with microseconds only when they are non-zero, or null
+    """
+    fraction = case((func.date_trunc("second", column) == column, _text("")), else_=func.to_char(column, ".US"))
+    return case(
+        (column.is_(None), NULL),
+        else_=func.concat(_text('"'), func.to_char(column, 'YYYY-MM-DD"T"HH24:MI:SS'), fraction, _text('"')),
+    )
+
+
+def json_document(column: Any) -> ColumnElement[str]:
+    """
+    :param column: A JSONB column
+    :return: The column as compact JSON, or null
+    """
+    return func.coalesce(
+        func.regexp_replace(cast(column, Text), _text(_JSONB_SEPARATOR_PATTERN), _text(r"\1\2"), _text("g")), NULL
+    )
+
+
+def json_object(*members: Tuple[str, ColumnElement[str]]) -> ColumnElement[str]:
+    """
+    Concatenate JSON values into a JSON object, with the keys in the given order
+    :param members: The key and JSON value of each member
+    :return: The JSON object
+    """
+    parts = []
+    for index, (key, value) in enumerate(members):
+        parts.append(_text(("{" if index == 0 else ",") + json.dumps(key) + ":"))
+        parts.append(value)
+    parts.append(_text("}"))
+    return func.concat(*parts, type_=Text)
+
+
+def run_json(run: Any, instrument: Any) -> ColumnElement[str]:
+    """
+    :param run: The Run model, or an alias of it
+    :param instrument: The Instrument model, or an alias of it, joined to the run
+    :return: The run as the JSON of a RunResponse
+    """
+    return json_object(
+        ("filename", json_string(run.filename)),
+        ("experiment_number", json_number(run.experiment_number)),
+        ("title", json_string(run.title)),
+        ("users", json_string(run.users)),
+        ("run_start", json_timestamp(run.run_start)),
+        ("run_end", json_timestamp(run.run_end)),
+        ("good_frames", json_number(run.good_frames)),
+        ("raw_frames", json_number(run.raw_frames)),
+        ("instrument_name", json_string(instrument.instrument_name)),
+    )
+
+
+def reduction_runs_json() -> ColumnElement[str]:
+    """
+    The runs of each reduction, ordered by id, as a JSON array of RunResponses. Selected with a subquery correlated to
+    the reduction, against aliases so that it is not correlated to runs the outer query joins to filter by.
+    :return: The JSON array
+    """
+    run = aliased(Run)
+    instrument = aliased(Instrument)
+    junction = run_reduction_junction_table.alias()
+    runs = func.string_agg(run_json(run, instrument), aggregate_order_by(_text(","), run.id))  # type: ignore
+    return (
+        select(func.concat(_text("["), runs, _text("]")))
+        .select_from(junction)
+        .join(run, junction.c.run_id == run.id)
+        .join(instrument, run.instrument_id == instrument.id)
+        .where(junction.c.reduction_id == Reduction.id)
+        .correlate(Reduction)
+        .scalar_subquery()
+    )
+
+
+@functools.cache
+def reduction_json(include_runs: bool) -> ColumnElement[str]:
+    """
+    The reduction as the JSON of a ReductionResponse, or of a ReductionWithRunsResponse. The script must be outer
+    joined. The expression holds no values, so it is built once for each include_runs and shared by every statement,
+    which also reuses its memoized cache key.
+    :param include_runs: Whether to nest the runs
+    :return: The JSON object
+    """
+    script = case((Script.id.is_(None), NULL), else_=json_object(("value", json_string(Script.script))))
+    members = [
+        ("id", json_number(Reduction.id)),
+        ("reduction_start", json_timestamp(Reduction.reduction_start)),
+        ("reduction_end", json_timestamp(Reduction.reduction_end)),
+        ("reduction_state", json_string(Reduction.reduction_state)),
+        ("reduction_status_message", json_string(Reduction.reduction_status_message)),
+        ("reduction_inputs", json_document(Reduction.reduction_inputs)),
+        ("reduction_outputs", json_string(Reduction.reduction_outputs)),
+        ("script", script),
+    ]
+    if include_runs:
+        members.append(("runs", reduction_runs_json()))
+    return json_object(*members)
@@ -7,19 +7,42 @@ and ordering preferences.
 """
 
 # pylint: disable=unused-argument
-# The limit and offsets in specifications will incorrectly flag as unused. They are used when they are intercepted by
-# the paginate decorator
+# The limit, offset and cursors in specifications will incorrectly flag as unused. They are used when they are
+# intercepted by the paginate decorator
+# pylint: disable=too-many-arguments
+# Specification methods take each of the query parameters of the endpoints they serve
 from __future__ import annotations
 
-from typing import Type, Optional, Literal, Union
+from typing import Type, Optional, Literal, Union, Dict, Any, Sequence, Tuple
 
-from ir_api.core.model import Reduction, Instrument, Run, run_reduction_junction_table
-from ir_api.core.specifications.base import Specification, paginate, apply_ordering
+from sqlalchemy import select, any_, literal, BigInteger, Select, func
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by
+from sqlalchemy.orm import InstrumentedAttribute
+
+from ir_api.core.model import Reduction, Instrument, Run, Script, run_reduction_junction_table
+from ir_api.core.specifications.base import Specification, paginate
+from ir_api.core.specifications.json_assembly import reduction_json
 
 ReductionOrderField = Literal["reduction_start", "reduction_end", "reduction_state", "id", "reduction_outputs"]
 RunOrderField = Literal["run_start", "run_end", "experiment_number", "experiment_title", "filename"]
 JointRunReductionOrderField = Union[RunOrderField, ReductionOrderField]
 
+RUN_ORDER_COLUMNS: Dict[str, InstrumentedAttribute[Any]] = {
+    "filename": Run.filename,
+    "run_start": Run.run_start,
+    "run_end": Run.run_end,
+    "experiment_number": Run.experiment_number,
+    "experiment_title": Run.title,
+}
+
+
+def reduction_runs() -> Select[Tuple[int]]:
+    """
+    Select the reduction id of each run of each reduction, to be filtered by the runs' columns
+    :return: The select of reduction ids
+    """
+    return select(run_reduction_junction_table.c.reduction_id).select_from(run_reduction_junction_table).join(Run)
+
 
 class ReductionSpecification(Specification[Reduction]):
     """
@@ -33,6 +56,74 @@ class ReductionSpecification(Specification[Reduction]):
     def model(self) -> Type[Reduction]:
         return Reduction
 
+    @property
+    def field_columns(self) -> Dict[str, Any]:
+        return {
+            "id": Reduction.id,
+            "reduction_start": Reduction.reduction_start,
+            "reduction_end": Reduction.reduction_end,
+            "reduction_state": Reduction.reduction_state,
+            "reduction_status_message": Reduction.reduction_status_message,
+            "reduction_inputs": Reduction.reduction_inputs,
+            "reduction_outputs": Reduction.reduction_outputs,
+            "script": Script.script,
+        }
+
+    def project(self, fields: Sequence[str]) -> ReductionSpecification:
+        """
+        Select only the given fields of the reductions. The script is outer joined only when it is requested.
+        :param fields: The names of the fields to select
+        :return: The specification with the projection applied
+        """
+        super().project(fields)
+        if "script" in self.fields:
+            self.value = self.value.outerjoin(Script, Reduction.script_id == Script.id)
+        return self
+
+    def as_json(self, include_runs: bool = False) -> ReductionSpecification:
+        """
+        Select each reduction as the JSON text of its response, assembled by postgres, as the single field "json".
+        The script is outer joined, and the runs are selected with a correlated subquery.
+        :param include_runs: Whether to nest the runs, as in a ReductionWithRunsResponse
+        :return: The specification with the JSON selected
+        """
+        self.fields = ("json",)
+        self.value = self.value.with_only_columns(
+            reduction_json(include_runs).label("json"), maintain_column_froms=True
+        ).outerjoin(Script, Reduction.script_id == Script.id)
+        return self
+
+    def versions(self) -> ReductionSpecification:
+        """
+        Select only the row versions a reduction's response with its runs is built from: the reduction's as
+        "row_version", its script's as "script_row_version", and "runs", the id, row version and instrument row version
+        of each of its runs, ordered by run id, as etags.run_version gives them. Far cheaper than loading the reduction
+        with its script and runs, to check whether a client's copy is current.
+        :return: The specification with the versions selected
+        """
+        # pylint: disable = not-callable
+        run_version = func.concat_ws(":", Run.id, Run.row_version, Instrument.row_version)
+        ordered_versions = aggregate_order_by(run_version, Run.id)  # type: ignore
+        runs = (
+            select(func.array_agg(ordered_versions))
+            .select_from(run_reduction_junction_table)
+            .join(Run)
+            .join(Instrument)
+            .where(run_reduction_junction_table.c.reduction_id == Reduction.id)
+            .correlate(Reduction)
+            .scalar_subquery()
+        )
+        # pylint: enable = not-callable
+        self.fields = ("id", "row_version", "script_row_version", "runs")
+        self.value = self.value.with_only_columns(
+            Reduction.id.label("id"),
+            Reduction.row_version.label("row_version"),
+            Script.row_version.label("script_row_version"),
+            runs.label("runs"),
+            maintain_column_froms=True,
+        ).outerjoin(Script, Reduction.script_id == Script.id)
+        return self
+
     @paginate
     def by_instrument(
         self,
@@ -41,6 +132,7 @@ class ReductionSpecification(Specification[Reduction]):
         offset: Optional[int] = None,
         order_by: JointRunReductionOrderField = "id",
         order_direction: Literal["asc", "desc"] = "desc",
+        cursor: Optional[str] = None,
     ) -> ReductionSpecification:
         """
         Filters reductions by the specified instrument and applies ordering, limit, and offset to the query.
@@ -51,51 +143,80 @@ class ReductionSpecification(Specification[Reduction]):
         :param order_by: The attribute to order the reductions by. Can be attributes of Reduction or Run entities.
         :param order_direction: The direction to order the reductions, either 'asc' for ascending or 'desc' for
         descending.
+        :param cursor: The cursor of the last reduction of the previous page, to seek past. None for the first page.
         :return: An instance of ReductionSpecification with the applied filters and ordering.
         """
-        self.value = (
-            self.value.join(run_reduction_junction_table)
-            .join(Run)
-            .join(Instrument)
-            .where(Instrument.instrument_name == instrument)
+        self._filter_by_runs(
+            reduction_runs().join(Instrument).where(Instrument.instrument_name == instrument), order_by, order_direction
         )
+        return self
 
-        match order_by:
-            case "filename":
-                self.value = (
-                    self.value.order_by(Run.filename.desc())
-                    if order_direction == "desc"
-                    else self.value.order_by(Run.filename.asc())
-                )
-            case "run_start":
-                self.value = (
-                    self.value.order_by(Run.run_start.desc())
-                    if order_direction == "desc"
-                    else self.value.order_by(Run.run_start.asc())
-                )
-            case "run_end":
-                self.value = (
-                    self.value.order_by(Run.run_end.desc())
-                    if order_direction == "desc"
-                    else self.value.order_by(Run.run_end.asc())
-                )
-            case "experiment_number":
-                self.value = (
-                    self.value.order_by(Run.experiment_number.desc())
-                    if order_direction == "desc"
-                    else self.value.order_by(Run.experiment_number.asc())
-                )
-            case "experiment_title":
-                self.value = (
-                    self.value.order_by(Run.title.desc())
-                    if order_direction == "desc"
-                    else self.value.order_by(Run.title.asc())
-                )
-            case _:
-                self.value = apply_ordering(self.value, self.model, order_by, order_direction)
+    @paginate
+    def by_instrument_id(
+        self,
+        instrument_id: Optional[int],
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        order_by: JointRunReductionOrderField = "id",
+        order_direction: Literal["asc", "desc"] = "desc",
+        cursor: Optional[str] = None,
+    ) -> ReductionSpecification:
+        """
+        Filters reductions by the id of the instrument of their runs, without joining the instruments, and applies
+        ordering, limit, and offset to the query. The services look the id up in the instrument catalog.
 
+        :param instrument_id: The id of the instrument to filter reductions by. None when there is no such instrument,
+        in which case no reductions match.
+        :param limit: The maximum number of reductions to return. None indicates no limit.
+        :param offset: The number of reductions to skip before starting to return the results. None for no offset.
+        :param order_by: The attribute to order the reductions by. Can be attributes of Reduction or Run entities.
+        :param order_direction: The direction to order the reductions, either 'asc' for ascending or 'desc' for
+        descending.
+        :param cursor: The cursor of the last reduction of the previous page, to seek past. None for the first page.
+        :return: An instance of ReductionSpecification with the applied filters and ordering.
+        """
+        runs = reduction_runs()
+        if instrument_id is None:
+            self.match_none()
+        else:
+            runs = runs.where(Run.instrument_id == instrument_id)
+        self._filter_by_runs(runs, order_by, order_direction)
         return self
 
+    def _filter_by_runs(
+        self,
+        runs: Select[Tuple[int]],
+        order_by: JointRunReductionOrderField,
+        order_direction: Literal["asc", "desc"],
+    ) -> None:
+        """
+        Filter the reductions to those with any of the given runs, and order them by an attribute of the reductions or
+        of their runs. The runs are not joined to the reductions, which would select a reduction once for each of its
+        runs. When ordering by an attribute of the reductions, the runs are a semi-join (EXISTS). When ordering by an
+        attribute of the runs, the runs are grouped by reduction, and the reductions ordered by the least value of
+        their runs when ascending and the greatest when descending, which is where each reduction would first appear
+        if ordered by each of its runs.
+        :param runs: The select of the reduction ids of the runs, from reduction_runs
+        :param order_by: The attribute to order by
+        :param order_direction: The direction to order by
+        :return: None
+        """
+        run_column = RUN_ORDER_COLUMNS.get(order_by)
+        if run_column is None:
+            self.value = self.value.where(
+                runs.where(run_reduction_junction_table.c.reduction_id == Reduction.id).correlate(Reduction).exists()
+            )
+            self.order(getattr(self.model, order_by), order_direction)
+            return
+        aggregate = func.min(run_column) if order_direction == "asc" else func.max(run_column)
+        runs_by_reduction = (
+            runs.add_columns(aggregate.label(order_by))
+            .group_by(run_reduction_junction_table.c.reduction_id)
+            .subquery("reduction_runs")
+        )
+        self.value = self.value.join(runs_by_reduction, runs_by_reduction.c.reduction_id == Reduction.id)
+        self.order(runs_by_reduction.c[order_by], order_direction)
+
     @paginate
     def by_experiment_number(
         self,
@@ -104,6 +225,7 @@ class ReductionSpecification(Specification[Reduction]):
         offset: Optional[int] = None,
         order_by: ReductionOrderField = "id",
         order_direction: Literal["asc", "desc"] = "desc",
+        cursor: Optional[str] = None,
     ) -> ReductionSpecification:
         """
         Filters reductions by the specified experiment number and applies ordering, limit, and offset to the query.
@@ -114,11 +236,37 @@ class ReductionSpecification(Specification[Reduction]):
         :param order_by: The attribute of the Reduction entity to order the reductions by.
         :param order_direction: The direction to order the reductions, either 'asc' for ascending or 'desc' for
         descending.
+        :param cursor: The cursor of the last reduction of the previous page, to seek past. None for the first page.
         :return: An instance of ReductionSpecification with the applied filters and ordering.
         """
-
-        self.value = (
-            self.value.join(run_reduction_junction_table).join(Run).where(Run.experiment_number == experiment_number)
+        self._filter_by_runs(
+            reduction_runs().where(Run.experiment_number == experiment_number), order_by, order_direction
         )
-        apply_ordering(self.value, self.model, order_by, order_direction)
+        return self
+
+    def by_ids(self, ids: Sequence[int]) -> ReductionSpecification:
+        """
+        Filters the query to select the reductions with any of the given ids, ordered by id. The ids are bound as a
+        single array parameter, so the statement is the same however many ids are given.
+        :param ids: The ids of the reductions
+        :return: The specification with the filter applied
+        """
+        self.value = select(Reduction).where(Reduction.id == any_(literal(list(ids), ARRAY(BigInteger))))
+        self.order(Reduction.id, "asc")
+        return self
+
+    def with_script(self) -> ReductionSpecification:
+        """
+        Load the script of each reduction in the same query
+        :return: The specification with the script loading applied
+        """
+        self.load((Reduction.script, "joined"))
+        return self
+
+    def with_runs(self) -> ReductionSpecification:
+        """
+        Load the runs of each reduction, and the instrument of each run, in one further query
+        :return: The specification with the run loading applied
+        """
+        self.load((Reduction.runs, "selectin"), (Run.instrument, "joined"))
         return self
@@ -7,14 +7,16 @@ order by, and order direction.
 """
 
 # pylint: disable=unused-argument
-# The limit and offsets in specifications will incorrectly flag as unused. They are used when they are intercepted by
-# the paginate decorator
+# The limit, offset and cursors in specifications will incorrectly flag as unused. They are used when they are
+# intercepted by the paginate decorator
+# pylint: disable=too-many-arguments
+# Specification methods take each of the query parameters of the endpoints they serve
 from __future__ import annotations
 
-from typing import Type, Literal
+from typing import Type, Literal, Optional, Dict, Any, Sequence
 
 from ir_api.core.model import Run, Instrument
-from ir_api.core.specifications.base import Specification, paginate, apply_ordering
+from ir_api.core.specifications.base import Specification, paginate
 
 
 class RunSpecification(Specification[Run]):
@@ -25,10 +27,41 @@ class RunSpecification(Specification[Run]):
     instrument name, experiment number, run start/end times, and more.
     """
 
+    def __init__(self) -> None:
+        super().__init__()
+        self.joins_instrument = False
+
     @property
     def model(self) -> Type[Run]:
         return Run
 
+    @property
+    def field_columns(self) -> Dict[str, Any]:
+        return {
+            "filename": Run.filename,
+            "experiment_number": Run.experiment_number,
+            "title": Run.title,
+            "users": Run.users,
+            "run_start": Run.run_start,
+            "run_end": Run.run_end,
+            "good_frames": Run.good_frames,
+            "raw_frames": Run.raw_frames,
+            "instrument_name": Instrument.instrument_name,
+        }
+
+    def project(self, fields: Sequence[str]) -> RunSpecification:
+        """
+        Select only the given fields of the runs. The instrument is joined for its name if the query does not already
+        join it.
+        :param fields: The names of the fields to select
+        :return: The specification with the projection applied
+        """
+        super().project(fields)
+        if "instrument_name" in self.fields and not self.joins_instrument:
+            self.value = self.value.join(Instrument)
+            self.joins_instrument = True
+        return self
+
     @paginate
     def by_instrument(
         self,
@@ -39,6 +72,7 @@ class RunSpecification(Specification[Run]):
             "experiment_number", "run_end", "run_start", "good_frames", "raw_frames", "id", "filename"
         ] = "run_start",
         order_direction: Literal["asc", "desc"] = "desc",
+        cursor: Optional[str] = None,
     ) -> RunSpecification:
         """
         Filters runs by the specified instrument and applies ordering, limit, and offset to the query.
@@ -48,8 +82,50 @@ class RunSpecification(Specification[Run]):
         :param offset: The number of runs to skip before starting to return the results.
         :param order_by: The attribute to order the runs by.
         :param order_direction: The direction to order the runs, either 'asc' for ascending or 'desc' for descending.
+        :param cursor: The cursor of the last run of the previous page, to seek past. None for the first page.
         :return: An instance of RunSpecification with the applied filters and ordering.
         """
         self.value = self.value.join(Instrument).where(Instrument.instrument_name == instrument)
-        apply_ordering(self.value, self.model, order_by, order_direction)
+        self.joins_instrument = True
+        self.order(getattr(self.model, order_by), order_direction)
+        return self
+
+    @paginate
+    def by_instrument_id(
+        self,
+        instrument_id: Optional[int],
+        limit: int = 0,
+        offset: int = 0,
+        order_by: Literal[
+            "experiment_number", "run_end", "run_start", "good_frames", "raw_frames", "id", "filename"
+        ] = "run_start",
+        order_direction: Literal["asc", "desc"] = "desc",
+        cursor: Optional[str] = None,
+    ) -> RunSpecification:
+        """
+        Filters runs by the id of their instrument, without joining the instruments, and applies ordering, limit, and
+        offset to the query. The services look the id up in the instrument catalog.
+
+        :param instrument_id: The id of the instrument to filter runs by. None when there is no such instrument, in
+        which case no runs match.
+        :param limit: The maximum number of runs to return.
+        :param offset: The number of runs to skip before starting to return the results.
+        :param order_by: The attribute to order the runs by.
+        :param order_direction: The direction to order the runs, either 'asc' for ascending or 'desc' for descending.
+        :param cursor: The cursor of the last run of the previous page, to seek past. None for the first page.
+        :return: An instance of RunSpecification with the applied filters and ordering.
+        """
+        if instrument_id is None:
+            self.match_none()
+        else:
+            self.value = self.value.where(Run.instrument_id == instrument_id)
+        self.order(getattr(self.model, order_by), order_direction)
+        return self
+
+    def with_instrument(self) -> RunSpecification:
+        """
+        Load the instrument of each run in the same query
+        :return: The specification with the instrument loading applied
+        """
+        self.load((Run.instrument, "joined"))
         return self
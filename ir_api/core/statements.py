@@ -0,0 +1,86 @@
+"""
+Configuration and instrumentation of SQLAlchemy's compiled statement cache. The specifications build each query from
+the same constructs for the same request shape, with every value a bound parameter, so the compiled form of each query
+is cached by its shape and reused for any values. The hit rate is recorded so that a specification that defeats the
+cache, e.g. by rendering a value into the statement, shows up as misses.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from sqlalchemy import Engine, event
+from sqlalchemy.engine.interfaces import CacheStats
+
+# The number of compiled statements each engine caches. Each route compiles a handful of statements per request shape,
+# so the default holds every statement the API makes many times over
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", "500"))
+
+
+@dataclass
+class StatementCacheStats:
+    """
+    Running totals of statements executed, by whether their compiled form was found in the cache. Uncached statements
+    are those that are not compiled or cannot be cached, such as SQL executed directly on the driver.
+    """
+
+    hits: int = 0
+    misses: int = 0
+    uncached: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        The fraction of the cacheable statements that were found in the cache
+        :return: float between 0 and 1
+        """
+        cacheable = self.hits + self.misses
+        return self.hits / cacheable if cacheable else 0.0
+
+
+class StatementCacheRecorder:
+    """
+    Records whether the compiled form of each statement an engine executes was found in its compiled cache
+    """
+
+    def __init__(self, engine: Engine, capacity: int = DB_STATEMENT_CACHE_SIZE) -> None:
+        self.engine = engine
+        self.capacity = capacity
+        self.stats = StatementCacheStats()
+        self._stats_lock = threading.Lock()
+        event.listen(engine, "before_cursor_execute", self._record)
+
+    def _record(self, _conn: Any, _cursor: Any, _statement: str, _parameters: Any, context: Any, _many: bool) -> None:
+        """
+        Record the execution of a statement
+        :param context: The execution context, which gives whether the statement was found in the cache
+        :return: None
+        """
+        cache_hit = getattr(context, "cache_hit", None)
+        with self._stats_lock:
+            if cache_hit == CacheStats.CACHE_HIT:
+                self.stats.hits += 1
+            elif cache_hit == CacheStats.CACHE_MISS:
+                self.stats.misses += 1
+            else:
+                self.stats.uncached += 1
+
+    @property
+    def entries(self) -> int:
+        """
+        The number of compiled statements in the engine's cache
+        :return: The number of entries, 0 when caching is disabled
+        """
+        cache: Optional[Any] = self.engine._compiled_cache  # pylint: disable=protected-access
+        return len(cache) if cache is not None else 0
+
+    def reset(self) -> None:
+        """
+        Reset the running totals
+        :return: None
+        """
+        with self._stats_lock:
+            self.stats = StatementCacheStats()
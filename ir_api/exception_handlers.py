@@ -45,3 +45,29 @@ async def unsafe_path_handler(_: Request, __: Exception) -> JSONResponse:
         status_code=400,
         content={"message": "The given request contains bad characters"},
     )
+
+
+async def invalid_cursor_handler(_: Request, __: Exception) -> JSONResponse:
+    """
+    Automatically return 400 status code when an invalid pagination cursor is given
+    :param _:
+    :param __:
+    :return: JSONResponse with 400
+    """
+    return JSONResponse(
+        status_code=400,
+        content={"message": "The given cursor is invalid, or does not match the requested ordering"},
+    )
+
+
+async def invalid_fields_handler(_: Request, exc: Exception) -> JSONResponse:
+    """
+    Automatically return 400 status code when fields are requested that the resource does not have
+    :param _:
+    :param exc: The InvalidFieldsError
+    :return: JSONResponse with 400
+    """
+    return JSONResponse(
+        status_code=400,
+        content={"message": str(exc)},
+    )
@@ -2,23 +2,37 @@
 Main module contains the uvicorn entrypoint
 """
 
+import asyncio
+import contextlib
 import logging
 import sys
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 
 from fastapi import FastAPI
+from sqlalchemy.exc import SQLAlchemyError
 from starlette.middleware.cors import CORSMiddleware
 
+from ir_api.core.catalog import INSTRUMENT_CATALOG
+from ir_api.core.compression import CompressionMiddleware
+from ir_api.core.notifications import WRITE_LISTENER
+from ir_api.core.repositories import READ_ROUTER, RESULT_CACHE_TTL
+from ir_api.scripts.github import GITHUB
 from ir_api.core.exceptions import (
+    InvalidCursorError,
+    InvalidFieldsError,
     MissingRecordError,
     MissingScriptError,
     UnsafePathError,
 )
 from ir_api.exception_handlers import (
+    invalid_cursor_handler,
+    invalid_fields_handler,
     missing_record_handler,
     missing_script_handler,
     unsafe_path_handler,
 )
-from ir_api.router import ROUTER
+from ir_api.router import ROUTER, NEXT_CURSOR_HEADER
 
 stdout_handler = logging.StreamHandler(stream=sys.stdout)
 logging.basicConfig(
@@ -29,7 +43,35 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    """
+    Load the instrument catalog before serving requests. If the database cannot be reached, the catalog is loaded on
+    the first request for an instrument instead. Listen for writes to the tables while serving, so that results can
+    be cached until the tables they were read from are written, and check the read replicas, so that queries are only
+    routed to those that are available. Close the connections kept alive to GitHub on shutdown.
+    :return: None
+    """
+    if READ_ROUTER.replicas:
+        await READ_ROUTER.check()
+    try:
+        await INSTRUMENT_CATALOG.refresh()
+    except (SQLAlchemyError, OSError):
+        logger.exception("Could not load the instrument catalog at startup")
+    tasks = []
+    if RESULT_CACHE_TTL > 0:
+        tasks.append(asyncio.create_task(WRITE_LISTENER.run()))
+    if READ_ROUTER.replicas:
+        tasks.append(asyncio.create_task(READ_ROUTER.run()))
+    yield
+    for task in tasks:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    await GITHUB.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # This must be updated before exposing outside the vpn
 ALLOWED_ORIGINS = ["*"]
@@ -40,10 +82,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
+app.add_middleware(CompressionMiddleware)
 
 app.include_router(ROUTER)
 
 app.add_exception_handler(MissingRecordError, missing_record_handler)
 app.add_exception_handler(MissingScriptError, missing_script_handler)
 app.add_exception_handler(UnsafePathError, unsafe_path_handler)
+app.add_exception_handler(InvalidCursorError, invalid_cursor_handler)
+app.add_exception_handler(InvalidFieldsError, invalid_fields_handler)
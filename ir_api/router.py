@@ -2,38 +2,161 @@
 Module containing the REST endpoints
 """
 
+# pylint: disable=too-many-arguments
+# Endpoint arguments are the query parameters of the endpoint
 from __future__ import annotations
 
+import os
+from typing import Optional, List, Literal, Dict, Any, Sequence
 
-from typing import Optional, List, Literal
-
-from fastapi import APIRouter
+from fastapi import APIRouter, Header, Query, Request, Response
+from pydantic import BaseModel, Field
 from starlette.background import BackgroundTasks
 
+from ir_api.core.compression import cache_compressed
+from ir_api.core.etags import body_etag, etag_matches, make_etag, reduction_etag, reduction_version, run_version
+from ir_api.core.exceptions import InvalidFieldsError
+from ir_api.core.repositories import ASYNC_ENGINE, READ_ROUTER, RESULT_CACHE, STATEMENT_CACHE
 from ir_api.core.responses import (
+    encode_json,
+    FastJSONResponse,
+    NDJSONResponse,
+    PoolResponse,
     PreScriptResponse,
+    ReplicasResponse,
+    ResultCacheResponse,
+    StatementCacheResponse,
+    ReductionBatchResponse,
     ReductionResponse,
     ReductionWithRunsResponse,
     CountResponse,
+    InstrumentSummaryResponse,
     RunResponse,
 )
+from ir_api.core.services.instrument import get_instrument_summaries
 from ir_api.core.services.reduction import (
     get_reductions_by_instrument,
     get_reduction_by_id,
+    get_reduction_etag,
+    get_reductions_by_ids,
+    MAX_BATCH_SIZE,
     get_reductions_by_experiment_number,
+    get_reduction_fields_by_experiment_number,
+    get_reduction_fields_by_instrument,
+    get_reduction_json_by_experiment_number,
+    get_reduction_json_by_id,
+    get_reduction_json_by_instrument,
     count_reductions,
     count_reductions_by_instrument,
+    stream_reductions_by_instrument,
+    stream_reduction_fields_by_instrument,
+    stream_reduction_json_by_instrument,
+)
+from ir_api.core.services.run import (
+    get_total_run_count,
+    get_run_count_by_instrument,
+    get_runs_by_instrument,
+    get_run_fields_by_instrument,
+    stream_runs_by_instrument,
+    stream_run_fields_by_instrument,
 )
-from ir_api.core.services.run import get_total_run_count, get_run_count_by_instrument, get_runs_by_instrument
 from ir_api.scripts.acquisition import (
     get_script_for_reduction,
     write_script_locally,
     get_script_by_sha,
+    get_script_etag_by_sha,
 )
 from ir_api.scripts.pre_script import PreScript
 
 ROUTER = APIRouter()
 
+NEXT_CURSOR_HEADER = "Next-Cursor"
+# The If-None-Match header of conditional requests, the entity tags of the client's copies
+IF_NONE_MATCH_HEADER = Header(None)
+
+# When enabled, reductions are assembled into JSON by postgres and the text is passed through, rather than the entities
+# being loaded and encoded by the API. The responses are byte for byte the same
+POSTGRES_JSON_ASSEMBLY = os.environ.get("POSTGRES_JSON_ASSEMBLY", "false").lower() in ("true", "1", "yes")
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]) -> None:
+    """
+    Set the Next-Cursor header on the response when there is a following page
+    :param response: The response
+    :param next_cursor: The cursor of the following page, if any
+    :return: None
+    """
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+
+def not_modified(etag: str, next_cursor: Optional[str] = None) -> Response:
+    """
+    The 304 response to a conditional request for a representation the client already has
+    :param etag: The entity tag of the representation
+    :param next_cursor: The cursor of the following page, if any
+    :return: The empty response
+    """
+    response = Response(status_code=304, headers={"ETag": etag})
+    set_next_cursor(response, next_cursor)
+    return response
+
+
+def body_tagged_response(response: Response, if_none_match: Optional[str]) -> Response:
+    """
+    Tag a response that is not built from entities, whose row versions are not selected, with an entity tag hashed
+    from its body. When the client's copy matches, the 304 response is returned instead, which saves sending the body
+    though not the query.
+    :param response: The response
+    :param if_none_match: The If-None-Match header of the request, if given
+    :return: The tagged response, or the 304 response
+    """
+    etag = body_etag(response.body)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, response.headers.get(NEXT_CURSOR_HEADER))
+    response.headers["ETag"] = etag
+    return response
+
+
+def list_response(
+    items: Sequence[Dict[str, Any]], next_cursor: Optional[str] = None, etag: Optional[str] = None
+) -> FastJSONResponse:
+    """
+    Encode a list of response dicts directly to JSON. The list endpoints return this rather than response models, so
+    that each row is not built into, then validated and serialized from, a pydantic model. The response_model of the
+    endpoint still declares the schema.
+    :param items: The response dicts
+    :param next_cursor: The cursor of the following page, if any
+    :param etag: The entity tag of the list, if computed from the versions of its rows
+    :return: The JSON response
+    """
+    response = FastJSONResponse(items)
+    set_next_cursor(response, next_cursor)
+    if etag is not None:
+        response.headers["ETag"] = etag
+    return response
+
+
+def json_list_response(items: Sequence[str], next_cursor: Optional[str] = None) -> Response:
+    """
+    Join the JSON text of each item, as assembled by postgres, into the response body without decoding it
+    :param items: The JSON of each item
+    :param next_cursor: The cursor of the following page, if any
+    :return: The JSON response
+    """
+    response = Response(("[" + ",".join(items) + "]").encode("utf-8"), media_type="application/json")
+    set_next_cursor(response, next_cursor)
+    return response
+
+
+def parse_fields(fields: str) -> List[str]:
+    """
+    Parse the comma separated fields query parameter
+    :param fields: The fields query parameter e.g. "id,reduction_state"
+    :return: The list of field names
+    """
+    return [field.strip() for field in fields.split(",") if field.strip()]
+
 
 @ROUTER.get("/healthz")
 async def get() -> Literal["ok"]:
@@ -41,43 +164,132 @@ async def get() -> Literal["ok"]:
     return "ok"
 
 
-@ROUTER.get("/instrument/{instrument}/script")
+@ROUTER.get("/metrics/pool")
+async def get_pool_metrics() -> PoolResponse:
+    """
+    Database connection pool utilisation and checkout wait times for this worker.
+    \f
+    :return: PoolResponse
+    """
+    return PoolResponse.from_pool(ASYNC_ENGINE.pool)
+
+
+@ROUTER.get("/metrics/cache")
+async def get_cache_metrics() -> ResultCacheResponse:
+    """
+    Hits, misses, evictions and invalidations of the result cache for this worker, and whether it is listening for the
+    writes that invalidate it.
+    \f
+    :return: ResultCacheResponse
+    """
+    return ResultCacheResponse.from_cache(RESULT_CACHE)
+
+
+@ROUTER.get("/metrics/replicas")
+async def get_replica_metrics() -> ReplicasResponse:
+    """
+    The health and replication lag of each read replica at its last check, and the sessions of this worker routed to
+    each replica and to the primary.
+    \f
+    :return: ReplicasResponse
+    """
+    return ReplicasResponse.from_router(READ_ROUTER)
+
+
+@ROUTER.get("/metrics/statements")
+async def get_statement_metrics() -> StatementCacheResponse:
+    """
+    Hits and misses of the compiled statement cache for this worker. A miss compiles a statement, so once each request
+    shape has been seen the hit rate should approach 1.
+    \f
+    :return: StatementCacheResponse
+    """
+    return StatementCacheResponse.from_recorder(STATEMENT_CACHE)
+
+
+@ROUTER.get("/instruments/summary")
+async def get_instruments_summary() -> List[InstrumentSummaryResponse]:
+    """
+    The run count, reduction count and count of reductions in each state of every instrument, ordered by instrument
+    name. The summary is cached for a short time, so it may lag the counts by a few seconds.
+    \f
+    :return: List of InstrumentSummaryResponse objects
+    """
+    return [InstrumentSummaryResponse.from_summary(summary) for summary in await get_instrument_summaries()]
+
+
+@ROUTER.get("/instrument/{instrument}/script", response_model=PreScriptResponse)
 async def get_pre_script(
     instrument: str,
     background_tasks: BackgroundTasks,
+    request: Request,
+    response: Response,
     reduction_id: Optional[int] = None,
-) -> PreScriptResponse:
+    if_none_match: Optional[str] = IF_NONE_MATCH_HEADER,
+) -> PreScriptResponse | Response:
     """
     Script URI - Not intended for calling
     \f
     :param instrument: the instrument
     :param background_tasks: handled by fastapi
+    :param request: handled by fastapi, to cache the compressed script for
+    :param response: handled by fastapi, to set the ETag of the script on
     :param reduction_id: optional query parameter of runfile, used to apply transform
+    :param if_none_match: the entity tags of the client's copies, if any
     :return: ScriptResponse
     """
     script = PreScript(value="")
     # This will never be returned from the api, but is necessary for the background task to run
     try:
-        script = get_script_for_reduction(instrument, reduction_id)
+        script = await get_script_for_reduction(instrument, reduction_id)
+        etag = script.etag(instrument)
+        if etag is not None:
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
+            response.headers["ETag"] = etag
+            cache_compressed(request)
         return script.to_response()
     finally:
         background_tasks.add_task(write_script_locally, script, instrument)
         # write the script after to not slow down request
 
 
-@ROUTER.get("/instrument/{instrument}/script/sha/{sha}")
-async def get_pre_script_by_sha(instrument: str, sha: str, reduction_id: Optional[int] = None) -> PreScriptResponse:
+@ROUTER.get("/instrument/{instrument}/script/sha/{sha}", response_model=PreScriptResponse)
+async def get_pre_script_by_sha(
+    instrument: str,
+    sha: str,
+    request: Request,
+    response: Response,
+    reduction_id: Optional[int] = None,
+    if_none_match: Optional[str] = IF_NONE_MATCH_HEADER,
+) -> PreScriptResponse | Response:
     """
     Given an instrument and the commit sha of a script, obtain the pre script. Optionally providing a reduction id to
-    transform the script
+    transform the script. When the client's copy is current, 304 is returned without fetching the script.
     \f
     :param instrument: The instrument
     :param sha: The commit sha of the script
+    :param request: handled by fastapi, to cache the compressed script for
+    :param response: handled by fastapi, to set the ETag of the script on
     :param reduction_id: The reduction id to apply transforms
+    :param if_none_match: the entity tags of the client's copies, if any
     :return:
     """
-    return get_script_by_sha(instrument, sha, reduction_id).to_response()
+    if if_none_match is not None:
+        current = await get_script_etag_by_sha(instrument, sha, reduction_id)
+        if etag_matches(if_none_match, current):
+            return not_modified(current)
+    script = await get_script_by_sha(instrument, sha, reduction_id)
+    etag = script.etag(instrument)
+    if etag is not None:
+        response.headers["ETag"] = etag
+        cache_compressed(request)
+    return script.to_response()
+
 
+ListFormat = Literal["json", "ndjson"]
+# format shadows the builtin as a parameter name, so is aliased
+FORMAT_QUERY = Query("json", alias="format")
 
 OrderField = Literal[
     "reduction_start",
@@ -93,7 +305,10 @@ OrderField = Literal[
 ]
 
 
-@ROUTER.get("/instrument/{instrument}/reductions")
+@ROUTER.get(
+    "/instrument/{instrument}/reductions",
+    response_model=List[ReductionResponse] | List[ReductionWithRunsResponse] | List[Dict[str, Any]],
+)
 async def get_reductions_for_instrument(
     instrument: str,
     limit: int = 0,
@@ -101,9 +316,17 @@ async def get_reductions_for_instrument(
     order_by: OrderField = "reduction_start",
     order_direction: Literal["asc", "desc"] = "desc",
     include_runs: bool = False,
-) -> List[ReductionResponse] | List[ReductionWithRunsResponse]:
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    format_: ListFormat = FORMAT_QUERY,
+    if_none_match: Optional[str] = IF_NONE_MATCH_HEADER,
+) -> Response:
     """
-    Retrieve a list of reductions for a given instrument.
+    Retrieve a list of reductions for a given instrument. When the list is limited and more reductions follow, the
+    Next-Cursor header contains the cursor to request the following page with. When fields are given, only those
+    fields of each reduction are selected and returned. With format=ndjson, the reductions are streamed as newline
+    delimited JSON as they are fetched, suited to exporting every reduction, and no Next-Cursor is given. The ETag of
+    a JSON list is given, and when it matches If-None-Match, 304 is returned.
     \f
     :param instrument: the name of the instrument
     :param limit: optional limit for the number of reductions returned (default is 0, which can be interpreted as
@@ -112,102 +335,276 @@ async def get_reductions_for_instrument(
     :param order_by: Literal["reduction_start", "reduction_end", "reduction_state", "id"]
     :param order_direction: Literal["asc", "desc"]
     :param include_runs: bool
+    :param cursor: optional Next-Cursor of the previous page, with the same order_by and order_direction
+    :param fields: optional comma separated fields of the reductions to return e.g. "id,reduction_state"
+    :param format_: "json" for a JSON list, or "ndjson" to stream newline delimited JSON
+    :param if_none_match: the entity tags of the client's copies, if any
     :return: List of ReductionResponse objects
     """
     instrument = instrument.upper()
-    reductions = get_reductions_by_instrument(
-        instrument, limit=limit, offset=offset, order_by=order_by, order_direction=order_direction
+    if fields is not None and include_runs:
+        raise InvalidFieldsError("Runs cannot be included when fields are requested")
+    if format_ == "ndjson":
+        return await stream_reductions_for_instrument(
+            instrument, limit, offset, order_by, order_direction, include_runs, cursor, fields
+        )
+    if fields is not None:
+        fields_page = await get_reduction_fields_by_instrument(
+            instrument,
+            parse_fields(fields),
+            limit=limit,
+            offset=offset,
+            order_by=order_by,
+            order_direction=order_direction,
+            cursor=cursor,
+        )
+        return body_tagged_response(
+            list_response(
+                [ReductionResponse.fields_from_projection(r) for r in fields_page.items], fields_page.next_cursor
+            ),
+            if_none_match,
+        )
+    if POSTGRES_JSON_ASSEMBLY:
+        json_page = await get_reduction_json_by_instrument(
+            instrument,
+            limit=limit,
+            offset=offset,
+            order_by=order_by,
+            order_direction=order_direction,
+            cursor=cursor,
+            include_runs=include_runs,
+        )
+        return body_tagged_response(json_list_response(json_page.items, json_page.next_cursor), if_none_match)
+    page = await get_reductions_by_instrument(
+        instrument,
+        limit=limit,
+        offset=offset,
+        order_by=order_by,
+        order_direction=order_direction,
+        cursor=cursor,
+        include_runs=include_runs,
+    )
+    etag = make_etag("reductions", tuple(reduction_version(r, include_runs) for r in page.items), page.next_cursor)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, page.next_cursor)
+    to_dict = ReductionWithRunsResponse.dict_from_reduction if include_runs else ReductionResponse.dict_from_reduction
+    return list_response([to_dict(r) for r in page.items], page.next_cursor, etag)
+
+
+async def stream_reductions_for_instrument(
+    instrument: str,
+    limit: int,
+    offset: int,
+    order_by: OrderField,
+    order_direction: Literal["asc", "desc"],
+    include_runs: bool,
+    cursor: Optional[str],
+    fields: Optional[str],
+) -> NDJSONResponse:
+    """
+    Stream the reductions for the given instrument as newline delimited JSON, each line the reduction's response, or
+    its requested fields
+    :param instrument: the name of the instrument
+    :param limit: limit for the number of reductions, 0 for no limit
+    :param offset: offset for the list of reductions
+    :param order_by: the field to order by
+    :param order_direction: the direction to order by
+    :param include_runs: whether to include the runs of each reduction
+    :param cursor: the Next-Cursor of a previous page, if any
+    :param fields: comma separated fields of the reductions to return, if any
+    :return: The streamed response
+    """
+    if fields is not None:
+        return NDJSONResponse(
+            await stream_reduction_fields_by_instrument(
+                instrument, parse_fields(fields), limit, offset, order_by, order_direction, cursor
+            ),
+            lambda fields_: encode_json(ReductionResponse.fields_from_projection(fields_)),
+        )
+    if POSTGRES_JSON_ASSEMBLY:
+        return NDJSONResponse(
+            await stream_reduction_json_by_instrument(
+                instrument, limit, offset, order_by, order_direction, cursor, include_runs=include_runs
+            ),
+            str.encode,
+        )
+    to_dict = ReductionWithRunsResponse.dict_from_reduction if include_runs else ReductionResponse.dict_from_reduction
+    return NDJSONResponse(
+        await stream_reductions_by_instrument(
+            instrument, limit, offset, order_by, order_direction, cursor, include_runs=include_runs
+        ),
+        lambda reduction: encode_json(to_dict(reduction)),
     )
-    if include_runs:
-        return [ReductionWithRunsResponse.from_reduction(r) for r in reductions]
-    return [ReductionResponse.from_reduction(r) for r in reductions]
 
 
 @ROUTER.get("/instrument/{instrument}/reductions/count")
 async def count_reductions_for_instrument(
     instrument: str,
+    approximate: bool = False,
 ) -> CountResponse:
     """
-    Count reductions for a given instrument.
+    Count reductions for a given instrument. Counts may be cached for a few seconds. The approximate count is an
+    estimate from the table statistics, and returns in constant time.
     \f
     :param instrument: the name of the instrument
+    :param approximate: whether to estimate rather than count
     :return: List of ReductionResponse objects
     """
     instrument = instrument.upper()
-    return CountResponse(count=count_reductions_by_instrument(instrument))
+    return CountResponse(count=await count_reductions_by_instrument(instrument, approximate=approximate))
 
 
-@ROUTER.get("/reduction/{reduction_id}")
-async def get_reduction(reduction_id: int) -> ReductionWithRunsResponse:
+@ROUTER.get("/reduction/{reduction_id}", response_model=ReductionWithRunsResponse)
+async def get_reduction(
+    reduction_id: int, response: Response, if_none_match: Optional[str] = IF_NONE_MATCH_HEADER
+) -> ReductionWithRunsResponse | Response:
     """
-    Retrieve a reduction with nested run data, by iD.
+    Retrieve a reduction with nested run data, by iD. The ETag of the reduction is given, and when it matches
+    If-None-Match, 304 is returned, after checking only the row versions of the reduction, its script and its runs.
     \f
     :param reduction_id: the unique identifier of the reduction
+    :param response: handled by fastapi, to set the ETag of the reduction on
+    :param if_none_match: the entity tags of the client's copies, if any
     :return: ReductionWithRunsResponse object
     """
-    reduction = get_reduction_by_id(reduction_id)
+    if POSTGRES_JSON_ASSEMBLY:
+        return body_tagged_response(
+            Response((await get_reduction_json_by_id(reduction_id)).encode("utf-8"), media_type="application/json"),
+            if_none_match,
+        )
+    if if_none_match is not None:
+        etag = await get_reduction_etag(reduction_id)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+    reduction = await get_reduction_by_id(reduction_id)
+    response.headers["ETag"] = reduction_etag(reduction)
     return ReductionWithRunsResponse.from_reduction(reduction)
 
 
-@ROUTER.get("/experiment/{experiment_number}/reductions")
+class ReductionBatchRequest(BaseModel):
+    """
+    The ids of a batch of reductions to retrieve
+    """
+
+    ids: List[int] = Field(max_length=MAX_BATCH_SIZE)
+
+
+@ROUTER.post("/reductions/batch", response_model=ReductionBatchResponse)
+async def get_reduction_batch(batch: ReductionBatchRequest) -> Response:
+    """
+    Retrieve up to 500 reductions, with nested run data, by their ids. The reductions found are returned in the order
+    of the requested ids, and the ids with no reduction are listed in missing_ids.
+    \f
+    :param batch: The ids of the reductions
+    :return: ReductionBatchResponse
+    """
+    reductions, missing_ids = await get_reductions_by_ids(batch.ids)
+    return FastJSONResponse(
+        {
+            "reductions": [ReductionWithRunsResponse.dict_from_reduction(reduction) for reduction in reductions],
+            "missing_ids": missing_ids,
+        }
+    )
+
+
+@ROUTER.get("/experiment/{experiment_number}/reductions", response_model=List[ReductionResponse] | List[Dict[str, Any]])
 async def get_reductions_for_experiment(
     experiment_number: int,
     limit: int = 0,
     offset: int = 0,
     order_by: Literal["reduction_start", "reduction_end", "reduction_state", "id"] = "reduction_start",
     order_direction: Literal["desc", "asc"] = "desc",
-) -> List[ReductionResponse]:
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = IF_NONE_MATCH_HEADER,
+) -> Response:
     """
-    Retrieve a list of reductions associated with a specific experiment number.
+    Retrieve a list of reductions associated with a specific experiment number. When fields are given, only those
+    fields of each reduction are selected and returned. The ETag of the list is given, and when it matches
+    If-None-Match, 304 is returned.
     \f
     :param experiment_number: the unique experiment number:
     :param limit: Number of results to limit to
     :param offset: Number of results to offset by
     :param order_by: Literal["reduction_start", "reduction_end", "reduction_state", "id"]
     :param order_direction: Literal["asc", "desc"]
+    :param fields: optional comma separated fields of the reductions to return e.g. "id,reduction_state"
+    :param if_none_match: the entity tags of the client's copies, if any
     :return: List of ReductionResponse objects
     """
-    return [
-        ReductionResponse.from_reduction(r)
-        for r in get_reductions_by_experiment_number(
-            experiment_number, limit=limit, offset=offset, order_by=order_by, order_direction=order_direction
+    if fields is not None:
+        return body_tagged_response(
+            list_response(
+                [
+                    ReductionResponse.fields_from_projection(r)
+                    for r in await get_reduction_fields_by_experiment_number(
+                        experiment_number,
+                        parse_fields(fields),
+                        limit=limit,
+                        offset=offset,
+                        order_by=order_by,
+                        order_direction=order_direction,
+                    )
+                ]
+            ),
+            if_none_match,
+        )
+    if POSTGRES_JSON_ASSEMBLY:
+        return body_tagged_response(
+            json_list_response(
+                await get_reduction_json_by_experiment_number(
+                    experiment_number, limit=limit, offset=offset, order_by=order_by, order_direction=order_direction
+                )
+            ),
+            if_none_match,
         )
-    ]
+    reductions = await get_reductions_by_experiment_number(
+        experiment_number, limit=limit, offset=offset, order_by=order_by, order_direction=order_direction
+    )
+    etag = make_etag("reductions", tuple(reduction_version(r, include_runs=False) for r in reductions))
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    return list_response([ReductionResponse.dict_from_reduction(r) for r in reductions], etag=etag)
 
 
 @ROUTER.get("/reductions/count")
-async def count_all_reductions() -> CountResponse:
+async def count_all_reductions(approximate: bool = False) -> CountResponse:
     """
-    Count all reductions
+    Count all reductions. Counts may be cached for a few seconds. The approximate count is an estimate from the table
+    statistics, and returns in constant time.
     \f
+    :param approximate: whether to estimate rather than count
     :return: CountResponse containing the count
     """
-    return CountResponse(count=count_reductions())
+    return CountResponse(count=await count_reductions(approximate=approximate))
 
 
 @ROUTER.get("/runs/count")
-async def count_all_runs() -> CountResponse:
+async def count_all_runs(approximate: bool = False) -> CountResponse:
     """
-    Count all runs
+    Count all runs. Counts may be cached for a few seconds. The approximate count is an estimate from the table
+    statistics, and returns in constant time.
     \f
+    :param approximate: whether to estimate rather than count
     :return: Count response containing the count
     """
-    return CountResponse(count=get_total_run_count())
+    return CountResponse(count=await get_total_run_count(approximate=approximate))
 
 
 @ROUTER.get("/instrument/{instrument}/runs/count")
-async def count_runs_for_instrument(instrument: str) -> CountResponse:
+async def count_runs_for_instrument(instrument: str, approximate: bool = False) -> CountResponse:
     """
-    Count the total runs for the given instrument
+    Count the total runs for the given instrument. Counts may be cached for a few seconds. The approximate count is an
+    estimate from the table statistics, and returns in constant time.
     \f
     :param instrument: The instrument
+    :param approximate: whether to estimate rather than count
     :return: The count response
     """
     instrument = instrument.upper()
-    return CountResponse(count=get_run_count_by_instrument(instrument))
+    return CountResponse(count=await get_run_count_by_instrument(instrument, approximate=approximate))
 
 
-@ROUTER.get("/instrument/{instrument}/runs")
+@ROUTER.get("/instrument/{instrument}/runs", response_model=List[RunResponse] | List[Dict[str, Any]])
 async def get_runs_for_instrument(
     instrument: str,
     limit: int = 0,
@@ -216,20 +613,60 @@ async def get_runs_for_instrument(
         "experiment_number", "run_end", "run_start", "good_frames", "raw_frames", "id", "filename"
     ] = "run_start",
     order_direction: Literal["asc", "desc"] = "desc",
-) -> List[RunResponse]:
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    format_: ListFormat = FORMAT_QUERY,
+    if_none_match: Optional[str] = IF_NONE_MATCH_HEADER,
+) -> Response:
     """
-    Get all runs for the given instrument
+    Get all runs for the given instrument. When the list is limited and more runs follow, the Next-Cursor header
+    contains the cursor to request the following page with. When fields are given, only those fields of each run are
+    selected and returned. With format=ndjson, the runs are streamed as newline delimited JSON as they are fetched,
+    suited to exporting every run, and no Next-Cursor is given. The ETag of a JSON list is given, and when it matches
+    If-None-Match, 304 is returned.
     \f
     :param instrument: The instrument
     :param limit: Optional limit to apply
     :param offset: Optional offset to apply
     :param order_by: Optional field to order by
     :param order_direction: Optional direction to order by
+    :param cursor: Optional Next-Cursor of the previous page, with the same order_by and order_direction
+    :param fields: Optional comma separated fields of the runs to return e.g. "filename,run_start"
+    :param format_: "json" for a JSON list, or "ndjson" to stream newline delimited JSON
+    :param if_none_match: the entity tags of the client's copies, if any
     :return: List of RunResponses
     """
-    return [
-        RunResponse.from_run(run)
-        for run in get_runs_by_instrument(
-            instrument.upper(), limit=limit, offset=offset, order_by=order_by, order_direction=order_direction
+    if format_ == "ndjson":
+        if fields is not None:
+            return NDJSONResponse(
+                await stream_run_fields_by_instrument(
+                    instrument.upper(), parse_fields(fields), limit, offset, order_by, order_direction, cursor
+                )
+            )
+        return NDJSONResponse(
+            await stream_runs_by_instrument(instrument.upper(), limit, offset, order_by, order_direction, cursor),
+            lambda run: encode_json(RunResponse.dict_from_run(run)),
         )
-    ]
+    if fields is not None:
+        fields_page = await get_run_fields_by_instrument(
+            instrument.upper(),
+            parse_fields(fields),
+            limit=limit,
+            offset=offset,
+            order_by=order_by,
+            order_direction=order_direction,
+            cursor=cursor,
+        )
+        return body_tagged_response(list_response(fields_page.items, fields_page.next_cursor), if_none_match)
+    page = await get_runs_by_instrument(
+        instrument.upper(),
+        limit=limit,
+        offset=offset,
+        order_by=order_by,
+        order_direction=order_direction,
+        cursor=cursor,
+    )
+    etag = make_etag("runs", tuple(run_version(run) for run in page.items), page.next_cursor)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, page.next_cursor)
+    return list_response([RunResponse.dict_from_run(run) for run in page.items], page.next_cursor, etag)
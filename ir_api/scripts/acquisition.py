@@ -1,40 +1,70 @@
 """
-Acquisition module contains all the functionality for obtaining the script locally and from the remote repository
+Acquisition module contains all the functionality for obtaining the script locally and from the remote repository.
+Scripts are fetched from GitHub by the shared async client of ir_api.scripts.github, so a fetch does not block the
+event loop, and concurrent fetches proceed together.
 """
 
+import asyncio
+import functools
+import json
 import logging
 import os
-from typing import Optional
+from typing import Optional, Tuple
 
-import requests
+import httpx
 
+from ir_api.core.etags import script_etag
 from ir_api.core.exceptions import MissingRecordError, MissingScriptError
 from ir_api.core.model import Reduction
-from ir_api.core.repositories import Repo
+from ir_api.core.repositories import AsyncRepo
+from ir_api.core.single_flight import SingleFlight
 from ir_api.core.specifications.reduction import ReductionSpecification
 from ir_api.core.utility import forbid_path_characters
+from ir_api.scripts.github import GITHUB, Fetched
 from ir_api.scripts.pre_script import PreScript
+from ir_api.scripts.script_cache import SCRIPT_CACHE
 from ir_api.scripts.transforms.factory import get_transform_for_instrument
 from ir_api.scripts.transforms.mantid_transform import MantidTransform
 
 logger = logging.getLogger(__name__)
 
 LOCAL_SCRIPT_DIR = "ir_api/local_scripts"
+# The GitHub API and raw file hosts, configurable so that a stand-in can be used
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_RAW_URL = os.environ.get("GITHUB_RAW_URL", "https://raw.githubusercontent.com").rstrip("/")
+SCRIPT_REPOSITORY = "interactivereduction/autoreduction-scripts"
+# "concurrent" fetches the latest script and the sha of the latest commit together, "sha_first" fetches the sha, then
+# the script at that sha, so that the script is the one at the sha even when a commit is pushed between the fetches
+SCRIPT_FETCH_MODE = os.environ.get("SCRIPT_FETCH_MODE", "concurrent")
+SCRIPT_FETCH_MODES = ("concurrent", "sha_first")
+if SCRIPT_FETCH_MODE not in SCRIPT_FETCH_MODES:
+    raise ValueError(f"Unknown script fetch mode: {SCRIPT_FETCH_MODE}. Must be one of: {', '.join(SCRIPT_FETCH_MODES)}")
 
+# Concurrent fetches of the latest script of an instrument, and of an instrument's script at a sha, share one fetch
+LATEST_SCRIPT_FETCHES: SingleFlight[str, PreScript] = SingleFlight()
+SCRIPT_BY_SHA_FETCHES: SingleFlight[Tuple[str, str], Fetched] = SingleFlight()
 
-def _get_latest_commit_sha() -> Optional[str]:
+
+def _script_url(instrument: str, ref: str) -> str:
+    """
+    :param instrument: The instrument
+    :param ref: The branch or commit sha
+    :return: The URL of the instrument's script at the ref
     """
-    Get the latest commit sha of the autoreduction-script repository
+    return f"{GITHUB_RAW_URL}/{SCRIPT_REPOSITORY}/{ref}/{instrument.upper()}/reduce.py"
+
+
+async def _get_latest_commit_sha() -> Optional[str]:
+    """
+    Get the latest commit sha of the autoreduction-script repository. The commit is fetched conditionally, so costs
+    only a 304 while the repository is unchanged.
     :return: (str) - the commit sha
     """
     try:
         logger.info("Getting latest commit sha for autoreduction-script repo")
-        response = requests.get(
-            "https://api.github.com/repos/interactivereduction/autoreduction-scripts/commits/HEAD",
-            timeout=30,
-        )
+        response = await GITHUB.get(f"{GITHUB_API_URL}/repos/{SCRIPT_REPOSITORY}/commits/HEAD")
 
-        return response.json()["sha"] if response.ok else None
+        return str(json.loads(response.text)["sha"]) if response.ok else None
 
     except Exception as exc:  # pylint:disable=broad-exception-caught
         logger.exception(exc)
@@ -42,33 +72,46 @@ def _get_latest_commit_sha() -> Optional[str]:
         return None
 
 
-def _get_script_from_remote(instrument: str) -> PreScript:
+async def _get_script_from_remote(instrument: str) -> PreScript:
     """
-    Get the remote script for given instrument
+    Get the remote script for given instrument. Concurrent calls for the instrument share one fetch, and its result or
+    exception, and each is returned its own copy of the script to transform.
     :param instrument: str - instrument name
     :return: Script - Returned script
+    :raises RuntimeError: When the script could not be fetched
     """
+    script = await LATEST_SCRIPT_FETCHES.run(
+        instrument.upper(), functools.partial(_fetch_script_from_remote, instrument)
+    )
+    return PreScript(script.original_value, is_latest=True, sha=script.sha)
 
+
+async def _fetch_script_from_remote(instrument: str) -> PreScript:
+    """
+    Fetch the remote script for given instrument, with the sha of the latest commit, fetched as SCRIPT_FETCH_MODE says.
+    When the sha is fetched first and cannot be, the script is fetched from main. The script is fetched
+    conditionally, so an unchanged script costs only a 304, and its kept body is returned.
+    :param instrument: str - instrument name
+    :return: Script - Returned script
+    :raises RuntimeError: When the script could not be fetched
+    """
     try:
         logger.info("Attempting to get latest %s script...", instrument)
-        request = requests.get(
-            f"https://raw.githubusercontent.com/interactivereduction/autoreduction-scripts/main/"
-            f"{instrument.upper()}/reduce.py",
-            timeout=30,
-        )
-        if request.status_code != 200:
-            logger.warning("Could not get %s script from remote", instrument)
-            raise RuntimeError(f"Could not get {instrument} script from remote")
-        logger.info("Obtained %s script", instrument)
-        sha = _get_latest_commit_sha()
-        if sha is not None:
-            os.environ["sha"] = sha
-        return PreScript(request.text, is_latest=True, sha=sha)
-
-    except ConnectionError:
-        # log exception
+        if SCRIPT_FETCH_MODE == "sha_first":
+            sha = await _get_latest_commit_sha()
+            request = await GITHUB.get(_script_url(instrument, sha or "main"))
+        else:
+            request, sha = await asyncio.gather(GITHUB.get(_script_url(instrument, "main")), _get_latest_commit_sha())
+    except httpx.HTTPError as exc:
+        logger.warning("Could not get %s script from remote", instrument)
+        raise RuntimeError(f"Could not get {instrument} script from remote") from exc
+    if request.status_code != 200:
         logger.warning("Could not get %s script from remote", instrument)
-        raise
+        raise RuntimeError(f"Could not get {instrument} script from remote")
+    logger.info("Obtained %s script", instrument)
+    if sha is not None:
+        os.environ["sha"] = sha
+    return PreScript(request.text, is_latest=True, sha=sha)
 
 
 def _get_script_locally(instrument: str) -> PreScript:
@@ -80,7 +123,7 @@ def _get_script_locally(instrument: str) -> PreScript:
     try:
         logger.info("Attempting to get %s script locally...", instrument)
         with open(f"{LOCAL_SCRIPT_DIR}/{instrument}.py", "r", encoding="utf-8") as fle:
-            return PreScript(value="".join(line for line in fle), sha=os.environ.get("sha", None))
+            return PreScript(value="".join(line for line in fle), sha=os.environ.get("sha", None), source="local")
     except FileNotFoundError as exc:
         logger.exception("Could not retrieve %s script locally", instrument)
         raise MissingScriptError(f"Unable to load any script for instrument: {instrument}") from exc
@@ -103,19 +146,21 @@ def write_script_locally(script: PreScript, instrument: str) -> None:
 
 
 @forbid_path_characters
-def get_by_instrument_name(instrument: str) -> PreScript:
+async def get_by_instrument_name(instrument: str) -> PreScript:
     """
-    Get the script object for the given instrument
+    Get the script object for the given instrument. The latest script is cached for SCRIPT_CACHE_TTL seconds after it
+    is fetched, and served while stale for SCRIPT_CACHE_STALE_WHILE_REVALIDATE seconds more, while it is fetched again
+    in the background. When it is neither cached nor can be fetched, the local copy is returned.
     :param instrument: str - the instrument
     :return: Script - The script object
     """
     try:
-        return _get_script_from_remote(instrument)
+        return await SCRIPT_CACHE.get(instrument, _get_script_from_remote)
     except RuntimeError:
         return _get_script_locally(instrument)
 
 
-def get_script_for_reduction(instrument: str, reduction_id: Optional[int] = None) -> PreScript:
+async def get_script_for_reduction(instrument: str, reduction_id: Optional[int] = None) -> PreScript:
     """
     Get the script object for the given instrument, and optional reduction id
     :param instrument: str -  The instrument
@@ -123,14 +168,14 @@ def get_script_for_reduction(instrument: str, reduction_id: Optional[int] = None
     :return: PreScript -  The script
     """
     logger.info("Getting script for instrument: %s...", instrument)
-    script = get_by_instrument_name(instrument)
+    script = await get_by_instrument_name(instrument)
     if reduction_id:
-        _transform_script(instrument, reduction_id, script)
+        await _transform_script(instrument, reduction_id, script)
 
     return script
 
 
-def _transform_script(instrument: str, reduction_id: int, script: PreScript) -> None:
+async def _transform_script(instrument: str, reduction_id: int, script: PreScript) -> None:
     """
     Given an instrument, reduction id, and script, apply the correct transforms to the script
     :param instrument: The instrument
@@ -138,43 +183,68 @@ def _transform_script(instrument: str, reduction_id: int, script: PreScript) ->
     :param script: The Pre script
     :return: None
     """
-    reduction_repo: Repo[Reduction] = Repo()
+    reduction = await _find_reduction(reduction_id)
+    transform = get_transform_for_instrument(instrument)
+    transform.apply(script, reduction)
+    mantid_transform = MantidTransform()
+    mantid_transform.apply(script, reduction)
+    script.transformed_for = reduction
+
+
+async def _find_reduction(reduction_id: int) -> Reduction:
+    """
+    Find the reduction a script is to be transformed for
+    :param reduction_id: The reduction ID
+    :return: The reduction
+    :raises MissingRecordError: When there is no reduction with the ID
+    """
+    reduction_repo: AsyncRepo[Reduction] = AsyncRepo()
     logger.info("Querying for reduction: %s", reduction_id)
-    reduction = reduction_repo.find_one(ReductionSpecification().by_id(reduction_id))
+    reduction = await reduction_repo.find_one(ReductionSpecification().by_id(reduction_id))
     if not reduction:
         logger.info("Reduction not found")
         raise MissingRecordError(f"No reduction found with id: {reduction_id}")
     logger.info("Reduction %s found", reduction_id)
-    transform = get_transform_for_instrument(instrument)
-    transform.apply(script, reduction)
-    mantid_transform = MantidTransform()
-    mantid_transform.apply(script, reduction)
+    return reduction
 
 
-def get_script_by_sha(instrument: str, sha: str, reduction_id: Optional[int] = None) -> PreScript:
+async def get_script_etag_by_sha(instrument: str, sha: str, reduction_id: Optional[int] = None) -> str:
+    """
+    Given an instrument, commit sha and optional reduction id, return the entity tag of the script get_script_by_sha
+    would return, without fetching it from GitHub. The script at a sha never changes, so is pinned to it, and only the
+    reduction, whose inputs the transforms apply, is queried.
+    :param instrument: The instrument the script is for
+    :param sha: The commit sha
+    :param reduction_id: Optional reduction id
+    :return: The quoted entity tag
+    """
+    reduction = await _find_reduction(reduction_id) if reduction_id else None
+    return script_etag(instrument, sha, False, "github", reduction)
+
+
+async def get_script_by_sha(instrument: str, sha: str, reduction_id: Optional[int] = None) -> PreScript:
     """
     Given an instrument and commit sha, return the script for that instrument at that point in history. If a reduction
-    id is provided, the transformed version of the script will be returned.
+    id is provided, the transformed version of the script will be returned. Concurrent calls for the instrument and
+    sha share one fetch, and its result or exception, and each transforms its own script.
     :param instrument: The instrument the script is for
     :param sha: The sha to look for
     :param reduction_id: Optional reduction id
     :return: PreScript object
     """
     try:
-        response = requests.get(
-            f"https://raw.githubusercontent.com/interactivereduction/autoreduction-scripts/{sha}/"
-            f"{instrument.upper()}/reduce.py",
-            timeout=30,
+        response = await SCRIPT_BY_SHA_FETCHES.run(
+            (instrument.upper(), sha), functools.partial(GITHUB.get, _script_url(instrument, sha))
         )
-        if response.status_code == 404:
-            raise MissingRecordError(f"No script for instrument {instrument} or non existent sha: {sha}")
-        if response.status_code != 200:
-            raise RuntimeError("Cannot get script from GitHub")
-        script = PreScript(value=response.text, sha=sha)
-        if reduction_id:
-            # TODO: When the frontend related PR is merged, add a function to the reduction or script service to find
-            #  script from reduction and has, to prevent retransforming unnecessarily
-            _transform_script(instrument, reduction_id, script)
-        return script
-    except ConnectionError as exc:
+    except httpx.HTTPError as exc:
         raise RuntimeError("Cannot get script from github") from exc
+    if response.status_code == 404:
+        raise MissingRecordError(f"No script for instrument {instrument} or non existent sha: {sha}")
+    if response.status_code != 200:
+        raise RuntimeError("Cannot get script from GitHub")
+    script = PreScript(value=response.text, sha=sha, pinned=True)
+    if reduction_id:
+        # TODO: When the frontend related PR is merged, add a function to the reduction or script service to find
+        #  script from reduction and has, to prevent retransforming unnecessarily
+        await _transform_script(instrument, reduction_id, script)
+    return script
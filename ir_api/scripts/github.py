@@ -0,0 +1,174 @@
+"""
+Conditional fetches from GitHub. The validators (ETag and Last-Modified) and body of each URL fetched are kept, and the
+URL fetched again with a conditional request, so that a file that has not changed costs a 304 round trip, with no body,
+rather than downloading it again. Conditional requests answered with 304 do not count against GitHub's rate limit.
+Fetches are made by a shared async client, which keeps its connections to GitHub alive for the next fetch, and
+negotiates HTTP/2 with hosts that offer it, so concurrent fetches are multiplexed rather than made one at a time.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# The number of URLs whose validators and body are kept, least recently fetched first out. 0 disables revalidation
+GITHUB_VALIDATOR_CACHE_SIZE = int(os.environ.get("GITHUB_VALIDATOR_CACHE_SIZE", "256"))
+# Seconds to wait to connect to GitHub, and for each read of a response, once connected
+GITHUB_CONNECT_TIMEOUT = float(os.environ.get("GITHUB_CONNECT_TIMEOUT", "5"))
+GITHUB_READ_TIMEOUT = float(os.environ.get("GITHUB_READ_TIMEOUT", "30"))
+# Connections open to GitHub at once, and those kept alive between fetches
+GITHUB_MAX_CONNECTIONS = int(os.environ.get("GITHUB_MAX_CONNECTIONS", "20"))
+GITHUB_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("GITHUB_MAX_KEEPALIVE_CONNECTIONS", "10"))
+GITHUB_HTTP2 = os.environ.get("GITHUB_HTTP2", "true").lower() in ("true", "1", "yes")
+
+
+def github_client() -> httpx.AsyncClient:
+    """
+    :return: A client with connections pooled and kept alive, and HTTP/2 negotiated with hosts that offer it
+    """
+    return httpx.AsyncClient(
+        http2=GITHUB_HTTP2,
+        limits=httpx.Limits(
+            max_connections=GITHUB_MAX_CONNECTIONS, max_keepalive_connections=GITHUB_MAX_KEEPALIVE_CONNECTIONS
+        ),
+        timeout=httpx.Timeout(GITHUB_READ_TIMEOUT, connect=GITHUB_CONNECT_TIMEOUT),
+    )
+
+
+@dataclass(frozen=True)
+class Validated:
+    """
+    The validators of a URL's last 200 response, and its body
+    """
+
+    etag: Optional[str]
+    last_modified: Optional[str]
+    text: str
+
+    def headers(self) -> Dict[str, str]:
+        """
+        :return: The headers that make a request conditional on the body having changed
+        """
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+@dataclass(frozen=True)
+class Fetched:
+    """
+    The status and body of a fetch. A 304 is answered with the body kept, as a 200 that was revalidated.
+    """
+
+    status_code: int
+    text: str
+    revalidated: bool = False
+
+    @property
+    def ok(self) -> bool:
+        """
+        :return: Whether the body was fetched, or revalidated
+        """
+        return self.status_code == 200
+
+
+class ConditionalFetcher:
+    """
+    Fetches URLs, keeping the validators and body of the last 200 response of up to capacity URLs, and revalidating
+    them with conditional requests. The client is made on the first fetch in each event loop, as its connections belong
+    to the loop they were opened in.
+    """
+
+    def __init__(
+        self, capacity: int = GITHUB_VALIDATOR_CACHE_SIZE, client: Callable[[], httpx.AsyncClient] = github_client
+    ) -> None:
+        self.capacity = capacity
+        self.requests = 0
+        self.not_modified = 0
+        self._validated: OrderedDict[str, Validated] = OrderedDict()
+        self._make_client = client
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        :return: The client of the running event loop
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = self._make_client()
+            self._loop = loop
+        return self._client
+
+    async def get(self, url: str) -> Fetched:
+        """
+        Fetch the URL, conditionally when it has been fetched before
+        :param url: The URL
+        :return: The status and body, the kept body when the URL is unchanged
+        :raises httpx.HTTPError: When GitHub could not be reached, or did not answer within the timeouts
+        """
+        validated = self._validated.get(url)
+        self.requests += 1
+        headers = validated.headers() if validated is not None else {}
+        response = await self.client.get(url, headers=headers)
+        if response.status_code == 304 and validated is not None:
+            logger.info("%s is unchanged", url)
+            self.not_modified += 1
+            if url in self._validated:
+                self._validated.move_to_end(url)
+            return Fetched(200, validated.text, revalidated=True)
+        self._keep(url, response)
+        return Fetched(response.status_code, response.text)
+
+    def _keep(self, url: str, response: httpx.Response) -> None:
+        """
+        Keep the validators and body of a 200 response that has validators, and forget those of a URL that has gone.
+        Those kept are unchanged by any other response, such as an error GitHub may recover from.
+        :param url: The URL
+        :param response: The response
+        :return: None
+        """
+        if response.status_code in (404, 410):
+            self._validated.pop(url, None)
+            return
+        if response.status_code != 200:
+            return
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        self._validated.pop(url, None)
+        if self.capacity <= 0 or (etag is None and last_modified is None):
+            return
+        self._validated[url] = Validated(etag, last_modified, response.text)
+        while len(self._validated) > self.capacity:
+            self._validated.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Forget the validators of every URL
+        :return: None
+        """
+        self._validated.clear()
+
+    async def aclose(self) -> None:
+        """
+        Close the client's connections, unless they belong to another event loop, which has closed them
+        :return: None
+        """
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+
+
+GITHUB = ConditionalFetcher()
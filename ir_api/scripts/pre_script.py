@@ -4,6 +4,8 @@ PreScript contains the PreScript definition. As it is not strictly a model, it d
 
 from typing import Optional
 
+from ir_api.core.etags import ScriptSource, script_etag
+from ir_api.core.model import Reduction
 from ir_api.core.responses import PreScriptResponse
 
 
@@ -13,11 +15,22 @@ class PreScript:
     database.
     """
 
-    def __init__(self, value: str, is_latest: bool = False, sha: Optional[str] = None):
+    def __init__(
+        self,
+        value: str,
+        is_latest: bool = False,
+        sha: Optional[str] = None,
+        source: ScriptSource = "github",
+        pinned: bool = False,
+    ) -> None:
         self.value = value
         self._original_value = value
         self.is_latest = is_latest
         self.sha: Optional[str] = sha
+        self.source: ScriptSource = source
+        # Whether the script was fetched at its sha, so that the sha identifies its body
+        self.pinned = pinned
+        self.transformed_for: Optional[Reduction] = None
 
     @property
     def original_value(self) -> str:
@@ -27,6 +40,18 @@ class PreScript:
         """
         return self._original_value
 
+    def etag(self, instrument: str) -> Optional[str]:
+        """
+        The entity tag of the script, from where it was read, its sha, its body unless it is pinned to the sha, and the
+        reduction it was transformed for
+        :param instrument: The instrument of the script
+        :return: The quoted entity tag, or None when the sha of the script is not known
+        """
+        if self.sha is None:
+            return None
+        body = None if self.pinned else self._original_value
+        return script_etag(instrument, self.sha, self.is_latest, self.source, self.transformed_for, body)
+
     def to_response(self) -> PreScriptResponse:
         """
         Return a ScriptResponse model to be returned by the api
@@ -0,0 +1,133 @@
+"""
+In process cache of the latest script of each instrument, as fetched from the remote repository, so that the scripts
+requested for every reduction started are not fetched from GitHub each time.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional
+
+from ir_api.scripts.pre_script import PreScript
+
+logger = logging.getLogger(__name__)
+
+# Seconds a fetched script is served without being fetched again
+SCRIPT_CACHE_TTL = float(os.environ.get("SCRIPT_CACHE_TTL", "60"))
+# Seconds after the ttl that the script is still served, while it is fetched again in the background
+SCRIPT_CACHE_STALE_WHILE_REVALIDATE = float(os.environ.get("SCRIPT_CACHE_STALE_WHILE_REVALIDATE", "600"))
+
+Fetch = Callable[[str], Awaitable[PreScript]]
+
+
+@dataclass(frozen=True)
+class CachedScript:
+    """
+    The text and commit sha of a script as fetched, and when it was fetched
+    """
+
+    value: str
+    sha: Optional[str]
+    fetched_at: float
+
+    def to_pre_script(self, is_latest: bool) -> PreScript:
+        """
+        A new PreScript of the cached script, which can be transformed without changing the cached script
+        :param is_latest: Whether the script is reported as the latest
+        :return: The PreScript
+        """
+        return PreScript(self.value, is_latest=is_latest, sha=self.sha)
+
+
+class ScriptCache:
+    """
+    Caches the latest script of each instrument for ttl seconds after it was fetched. For stale_while_revalidate
+    seconds after that, the stale script is served while it is fetched again by a background task, once at a time for
+    each instrument. A stale script is served until the window passes if fetching it again fails. Only scripts fetched
+    from the remote repository are cached, with the sha fetched with them. A script is reported as the latest while it
+    is fresh, and not while it is stale, as it may have been superseded.
+    """
+
+    def __init__(
+        self, ttl: float, stale_while_revalidate: float = 0.0, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self._clock = clock
+        self._entries: Dict[str, CachedScript] = {}
+        self._revalidating: Dict[str, asyncio.Task[None]] = {}
+
+    async def get(self, instrument: str, fetch: Fetch) -> PreScript:
+        """
+        Get the latest script of the instrument, from the cache when it is fresh or stale, and otherwise by fetching it
+        :param instrument: The instrument
+        :param fetch: Fetches the latest script of an instrument from the remote repository
+        :return: The script
+        :raises RuntimeError: When the script is not cached and could not be fetched
+        """
+        key = instrument.upper()
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = self._clock() - entry.fetched_at
+            if age < self.ttl:
+                return entry.to_pre_script(is_latest=True)
+            if age < self.ttl + self.stale_while_revalidate:
+                self._start_revalidating(key, instrument, fetch)
+                return entry.to_pre_script(is_latest=False)
+            del self._entries[key]
+        script = await fetch(instrument)
+        self._store(key, script)
+        return script
+
+    def _store(self, key: str, script: PreScript) -> None:
+        """
+        Cache the fetched script, unless caching is disabled
+        :param key: The key of the instrument
+        :param script: The script, as fetched
+        :return: None
+        """
+        if self.ttl <= 0 or not script.is_latest:
+            return
+        self._entries[key] = CachedScript(script.original_value, script.sha, self._clock())
+
+    def _start_revalidating(self, key: str, instrument: str, fetch: Fetch) -> None:
+        """
+        Fetch the script again in a background task, unless it is already being fetched
+        :param key: The key of the instrument
+        :param instrument: The instrument
+        :param fetch: Fetches the latest script of an instrument
+        :return: None
+        """
+        if key in self._revalidating:
+            return
+        self._revalidating[key] = asyncio.create_task(self._revalidate(key, instrument, fetch))
+
+    async def _revalidate(self, key: str, instrument: str, fetch: Fetch) -> None:
+        """
+        Fetch the script again, and cache it. Any failure is logged and the stale script kept, as nothing awaits the
+        background task to handle it.
+        :param key: The key of the instrument
+        :param instrument: The instrument
+        :param fetch: Fetches the latest script of an instrument
+        :return: None
+        """
+        try:
+            self._store(key, await fetch(instrument))
+        except Exception:  # pylint:disable=broad-exception-caught
+            logger.exception("Could not revalidate the %s script, the stale script is served until it expires", key)
+        finally:
+            self._revalidating.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Remove every script
+        :return: None
+        """
+        self._entries.clear()
+
+
+SCRIPT_CACHE = ScriptCache(SCRIPT_CACHE_TTL, SCRIPT_CACHE_STALE_WHILE_REVALIDATE)
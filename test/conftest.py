@@ -0,0 +1,13 @@
+"""
+Global test configuration
+"""
+
+import os
+
+# Test clients and async tests run each request or test on a new event loop, and pooled asyncpg connections cannot be
+# shared between event loops. This must be set before the engines are created on import of the repositories module.
+os.environ.setdefault("DB_POOL_ENABLED", "false")
+# The scripts fetched by one test must not be served to the next, so the script cache is disabled, other than in the
+# tests that enable it
+os.environ.setdefault("SCRIPT_CACHE_TTL", "0")
+os.environ.setdefault("SCRIPT_CACHE_STALE_WHILE_REVALIDATE", "0")
@@ -0,0 +1,43 @@
+"""
+Tests for instrument service
+"""
+
+from unittest.mock import patch, AsyncMock
+
+import pytest
+
+from ir_api.core.cache import TTLCache
+from ir_api.core.services.instrument import get_instrument_summaries
+
+
+@patch("ir_api.core.services.instrument.SUMMARY_CACHE", TTLCache(ttl=10))
+@patch("ir_api.core.services.instrument._REPO", new_callable=AsyncMock)
+@patch("ir_api.core.services.instrument.InstrumentSpecification")
+@pytest.mark.asyncio
+async def test_get_instrument_summaries_is_cached(mock_spec_class, mock_repo):
+    """
+    Test the summaries are found with the summary specification, and repeated requests are served from the cache
+    :param mock_repo: Mocked Repo
+    :return: None
+    """
+    summaries = [{"instrument_name": "MARI", "run_count": 1}]
+    mock_repo.find_fields.return_value = summaries
+
+    assert await get_instrument_summaries() == summaries
+    assert await get_instrument_summaries() == summaries
+    mock_repo.find_fields.assert_awaited_once_with(mock_spec_class.return_value.summary.return_value)
+
+
+@patch("ir_api.core.services.instrument.SUMMARY_CACHE", TTLCache(ttl=0))
+@patch("ir_api.core.services.instrument._REPO", new_callable=AsyncMock)
+@pytest.mark.asyncio
+async def test_get_instrument_summaries_uncached_when_ttl_is_zero(mock_repo):
+    """
+    Test a ttl of 0 disables the cache
+    :param mock_repo: Mocked Repo
+    :return: None
+    """
+    mock_repo.find_fields.return_value = []
+    await get_instrument_summaries()
+    await get_instrument_summaries()
+    assert mock_repo.find_fields.await_count == 2
@@ -2,36 +2,147 @@
 Tests for reduction service
 """
 
-from unittest.mock import patch, Mock
+# pylint: disable = redefined-outer-name
+from unittest.mock import patch, Mock, AsyncMock, MagicMock
 
 import pytest
 
+from ir_api.core.etags import reduction_etag_from_versions
 from ir_api.core.exceptions import MissingRecordError
+from ir_api.core.repositories import Page
 from ir_api.core.services.reduction import (
     get_reductions_by_instrument,
     get_reduction_by_id,
+    get_reduction_etag,
+    get_reductions_by_ids,
     get_reductions_by_experiment_number,
+    get_reduction_fields_by_experiment_number,
+    get_reduction_fields_by_instrument,
+    get_reduction_json_by_experiment_number,
+    get_reduction_json_by_id,
+    get_reduction_json_by_instrument,
     count_reductions,
     count_reductions_by_instrument,
+    stream_reductions_by_instrument,
+    stream_reduction_fields_by_instrument,
+    stream_reduction_json_by_instrument,
 )
 
 
-@patch("ir_api.core.services.reduction._REPO")
+@pytest.fixture(autouse=True)
+def instrument_catalog():
+    """
+    Patch the instrument catalog to find every instrument with the id 1
+    :return: The catalog mock
+    """
+    with patch("ir_api.core.services.reduction.INSTRUMENT_CATALOG") as catalog:
+        catalog.id_for = AsyncMock(return_value=1)
+        yield catalog
+
+
+@patch("ir_api.core.services.reduction._REPO", new_callable=AsyncMock)
 @patch("ir_api.core.services.reduction.ReductionSpecification")
-def test_get_reductions_by_instrument(mock_spec_class, mock_repo):
+@pytest.mark.asyncio
+async def test_get_reductions_by_instrument(mock_spec_class, mock_repo):
     """
     Test that get_reductions by instrument makes correct repo call
     :param mock_repo: Mocked Repo class
     :return: None
     """
     spec = mock_spec_class.return_value
-    get_reductions_by_instrument("test", limit=5, offset=6)
+    await get_reductions_by_instrument("test", limit=5, offset=6)
 
-    mock_repo.find.assert_called_once_with(spec.by_instrument("test", limit=5, offset=6))
+    spec.by_instrument_id.assert_called_once_with(
+        instrument_id=1, limit=5, offset=6, order_by="reduction_start", order_direction="desc", cursor=None
+    )
+    mock_repo.find_page.assert_called_once_with(spec.by_instrument_id.return_value)
+    spec.by_instrument_id.return_value.with_script.assert_called_once_with()
+    spec.by_instrument_id.return_value.with_runs.assert_not_called()
 
 
-@patch("ir_api.core.services.reduction._REPO")
-def test_get_reduction_by_id_reduction_exists(mock_repo):
+@patch("ir_api.core.services.reduction._REPO", new_callable=AsyncMock)
+@patch("ir_api.core.services.reduction.ReductionSpecification")
+@pytest.mark.asyncio
+async def test_get_reductions_by_instrument_include_runs(mock_spec_class, mock_repo):
+    """
+    Test that get_reductions by instrument loads the runs when they are included
+    :param mock_repo: Mocked Repo class
+    :return: None
+    """
+    spec = mock_spec_class.return_value
+    await get_reductions_by_instrument("test", include_runs=True)
+
+    spec.by_instrument_id.return_value.with_runs.assert_called_once_with()
+    mock_repo.find_page.assert_called_once_with(spec.by_instrument_id.return_value)
+
+
+@patch("ir_api.core.services.reduction._REPO", new_callable=AsyncMock)
+@patch("ir_api.core.services.reduction.ReductionSpecification")
+@pytest.mark.asyncio
+async def test_get_reduction_fields_by_instrument(mock_spec_class, mock_repo):
+    """
+    Test that get_reduction_fields_by_instrument projects the fields and finds the fields page
+    :param mock_repo: Mocked Repo class
+    :return: None
+    """
+    spec = mock_spec_class.return_value
+    await get_reduction_fields_by_instrument("test", ["id"], limit=5, offset=6)
+
+    mock_repo.find_fields_page.assert_called_once_with(spec.by_instrument_id(1, limit=5, offset=6).project(["id"]))
+
+
+@patch("ir_api.core.services.reduction._REPO", new_callable=AsyncMock)
+@patch("ir_api.core.services.reduction.ReductionSpecification")
+@pytest.mark.asyncio
+async def test_get_reduction_json_by_instrument(mock_spec_class, mock_repo):
+    """
+    Test that get_reduction_json_by_instrument selects the reductions as JSON and returns the JSON page
+    :param mock_repo: Mocked Repo class
+    :return: None
+    """
+    spec = mock_spec_class.return_value
+    mock_repo.find_fields_page.return_value = Page([{"json": '{"id":1}'}], "cursor")
+
+    page = await get_reduction_json_by_instrument("test", limit=5, offset=6, include_runs=True)
+
+    spec.by_instrument_id.return_value.as_json.assert_called_once_with(include_runs=True)
+    mock_repo.find_fields_page.assert_called_once_with(spec.by_instrument_id.return_value.as_json.return_value)
+    assert page == Page(['{"id":1}'], "cursor")
+
+
+@patch("ir_api.core.services.reduction._REPO", new_callable=AsyncMock)
+@patch("ir_api.core.services.reduction.ReductionSpecification")
+@pytest.mark.asyncio
+async def test_get_reduction_json_by_id(mock_spec_class, mock_repo):
+    """
+    Test that get_reduction_json_by_id selects the reduction with its runs as JSON
+    :param mock_repo: Mocked Repo class
+    :return: None
+    """
+    spec = mock_spec_class.return_value
+    mock_repo.find_fields.return_value = [{"json": '{"id":1}'}]
+
+    assert await get_reduction_json_by_id(1) == '{"id":1}'
+    spec.by_id.assert_called_once_with(1)
+    mock_repo.find_fields.assert_called_once_with(spec.as_json(include_runs=True))
+
+
+@patch("ir_api.core.services.reduction._REPO", new_callable=AsyncMock)
+@pytest.mark.asyncio
+async def test_get_reduction_json_by_id_not_found_raises(mock_repo):
+    """
+    Test MissingRecordError raised when no reduction is found
+    :param mock_repo: Mocked Repo
+    :return: None
+    """
+    mock_repo.find_fields.return_value = []
+    with pytest.raises(MissingRecordError):
+        await get_reduction_json_by_id(1)
+
+
+@patch("ir_api.core.services.reduction._REPO", new_callable=AsyncMock)
+@pytest.mark.asyncio
+async def test_get_reduction_by_id_reduction_exists(mock_repo):
     """
     Test that correct repo call and return is made
     :param mock_repo: Mocked Repo
@@ -39,12 +150,76 @@ def test_get_reduction_by_id_reduction_exists(mock_repo):
     """
     expected_reduction = Mock()
     mock_repo.find_one.return_value = expected_reduction
-    reduction = get_reduction_by_id(1)
+    reduction = await get_reduction_by_id(1)
     assert reduction == expected_reduction
 
 
-@patch("ir_api.core.services.reduction._REPO")
-def test_get_reduction_by_id_not_found_raises(mock_repo):
+@patch("ir_api.core.services.reduction._REPO", new_callable=AsyncMock)
+@patch("ir_api.core.services.reduction.ReductionSpecification")
+@pytest.mark.asyncio
+async def test_get_reduction_etag(mock_spec_class, mock_repo):
+    """
+    Test the etag is computed from the selected versions of the reduction, without loading it
+    :param mock_spec_class: Mocked Specification class
+    :param mock_repo: Mocked Repo
+    :return: None
+    """
+    spec = mock_spec_class.return_value
+    versions = {"id": 1, "row_version": 2, "script_row_version": None, "runs": ["3:4:5"]}
+    mock_repo.find_fields.return_value = [versions]
+
+    assert await get_reduction_etag(1) == reduction_etag_from_versions(versions)
+    spec.by_id.assert_called_once_with(1)
+    mock_repo.find_fields.assert_called_once_with(spec.versions())
+    mock_repo.find_one.assert_not_called()
+
+
+@patch("ir_api.core.services.reduction._REPO", new_callable=AsyncMock)
+@pytest.mark.asyncio
+async def test_get_reduction_etag_not_found_raises(mock_repo):
+    """
+    Test MissingRecordError raised when no reduction is found
+    :param mock_repo: Mocked Repo
+    :return: None
+    """
+    mock_repo.find_fields.return_value = []
+    with pytest.raises(MissingRecordError):
+        await get_reduction_etag(1)
+
+
+@patch("ir_api.core.services.reduction._REPO", new_callable=AsyncMock)
+@patch("ir_api.core.services.reduction.ReductionSpecification")
+@pytest.mark.asyncio
+async def test_get_reductions_by_ids(mock_spec_class, mock_repo):
+    """
+    Test the reductions are found in one call, returned in the order requested, and the missing ids are reported
+    :param mock_repo: Mocked Repo
+    :return: None
+    """
+    spec = mock_spec_class.return_value
+    reductions = [Mock(id=1), Mock(id=3)]
+    mock_repo.find.return_value = reductions
+
+    assert await get_reductions_by_ids([3, 2, 1, 3]) == ([reductions[1], reductions[0]], [2])
+    spec.by_ids.assert_called_once_with([3, 2, 1])
+    mock_repo.find.assert_called_once_with(spec.by_ids.return_value.with_script.return_value.with_runs.return_value)
+
+
+@patch("ir_api.core.services.reduction._REPO", new_callable=AsyncMock)
+@pytest.mark.asyncio
+async def test_get_reductions_by_ids_empty(mock_repo):
+    """
+    Test an empty batch does not query
+    :param mock_repo: Mocked Repo
+    :return: None
+    """
+    assert await get_reductions_by_ids([]) == ([], [])
+    mock_repo.find.assert_not_called()
+
+
+@patch("ir_api.core.services.reduction._REPO", new_callable=AsyncMock)
+@pytest.mark.asyncio
+async def test_get_reduction_by_id_not_found_raises(mock_repo):
     """
     Test MissingRecordError raised when repo returns None
     :param mock_repo: Mocked Repo
@@ -52,41 +227,203 @@ def test_get_reduction_by_id_not_found_raises(mock_repo):
     """
     mock_repo.find_one.return_value = None
     with pytest.raises(MissingRecordError):
-        get_reduction_by_id(1)
+        await get_reduction_by_id(1)
 
 
-@patch("ir_api.core.services.reduction._REPO")
+@patch("ir_api.core.services.reduction._REPO", new_callable=AsyncMock)
 @patch("ir_api.core.services.reduction.ReductionSpecification")
-def test_get_reductions_by_experiment_number(mock_spec_class, mock_repo):
+@pytest.mark.asyncio
+async def test_get_reductions_by_experiment_number(mock_spec_class, mock_repo):
     """
     Test correct Repo calls are made for by experiment number
     :param mock_repo: The Mocked Repo
     :return: None
     """
     spec = mock_spec_class.return_value
-    get_reductions_by_experiment_number(123456, limit=6, offset=7)
+    await get_reductions_by_experiment_number(123456, limit=6, offset=7)
 
-    mock_repo.find.assert_called_once_with(spec.by_experiment_number(experiment_number=123456, limit=6, offset=7))
+    mock_repo.find.assert_called_once_with(
+        spec.by_experiment_number(experiment_number=123456, limit=6, offset=7).with_script()
+    )
 
 
-@patch("ir_api.core.services.reduction._REPO")
-def test_count_reductions(mock_repo):
+@patch("ir_api.core.services.reduction._REPO", new_callable=AsyncMock)
+@patch("ir_api.core.services.reduction.ReductionSpecification")
+@pytest.mark.asyncio
+async def test_get_reduction_fields_by_experiment_number(mock_spec_class, mock_repo):
+    """
+    Test that get_reduction_fields_by_experiment_number projects the fields and finds the fields
+    :param mock_repo: The Mocked Repo
+    :return: None
+    """
+    spec = mock_spec_class.return_value
+    await get_reduction_fields_by_experiment_number(123456, ["id", "script"])
+
+    mock_repo.find_fields.assert_called_once_with(spec.by_experiment_number(123456).project(["id", "script"]))
+
+
+@patch("ir_api.core.services.reduction._REPO", new_callable=AsyncMock)
+@patch("ir_api.core.services.reduction.ReductionSpecification")
+@pytest.mark.asyncio
+async def test_get_reduction_json_by_experiment_number(mock_spec_class, mock_repo):
+    """
+    Test that get_reduction_json_by_experiment_number selects the reductions as JSON
+    :param mock_repo: Mocked Repo class
+    :return: None
+    """
+    spec = mock_spec_class.return_value
+    mock_repo.find_fields.return_value = [{"json": '{"id":1}'}, {"json": '{"id":2}'}]
+
+    assert await get_reduction_json_by_experiment_number(1, limit=5) == ['{"id":1}', '{"id":2}']
+    spec.by_experiment_number.return_value.as_json.assert_called_once_with()
+    mock_repo.find_fields.assert_called_once_with(spec.by_experiment_number.return_value.as_json.return_value)
+
+
+@patch("ir_api.core.services.reduction._REPO", new_callable=AsyncMock)
+@pytest.mark.asyncio
+async def test_count_reductions(mock_repo):
     """
     Test count is called
     :return: None
     """
-    count_reductions()
+    await count_reductions()
     mock_repo.count.assert_called_once()
 
 
-@patch("ir_api.core.services.reduction._REPO")
+@patch("ir_api.core.services.reduction._REPO", new_callable=AsyncMock)
 @patch("ir_api.core.services.reduction.ReductionSpecification")
-def test_count_reductions_by_instrument(mock_spec_class, mock_repo):
+@pytest.mark.asyncio
+async def test_count_reductions_by_instrument(mock_spec_class, mock_repo):
     """
     Test count by instrument
     :param mock_repo: mock repo fixture
     :return: None
     """
     spec = mock_spec_class.return_value
-    count_reductions_by_instrument("TEST")
-    mock_repo.count.assert_called_once_with(spec.by_instrument("TEST"))
+    await count_reductions_by_instrument("TEST")
+    spec.by_instrument_id.assert_called_once_with(instrument_id=1)
+    mock_repo.count.assert_called_once_with(spec.by_instrument_id.return_value)
+
+
+@patch("ir_api.core.services.reduction._REPO", new_callable=AsyncMock)
+@patch("ir_api.core.services.reduction.ReductionSpecification")
+@pytest.mark.asyncio
+async def test_count_reductions_by_unknown_instrument(mock_spec_class, mock_repo, instrument_catalog):
+    """
+    Test the reductions of an instrument missing from the catalog are counted with a specification matching nothing
+    :param mock_repo: mock repo fixture
+    :return: None
+    """
+    instrument_catalog.id_for.return_value = None
+    spec = mock_spec_class.return_value
+    await count_reductions_by_instrument("NOPE")
+    instrument_catalog.id_for.assert_awaited_once_with("NOPE")
+    spec.by_instrument_id.assert_called_once_with(instrument_id=None)
+    mock_repo.count.assert_called_once_with(spec.by_instrument_id.return_value)
+
+
+@pytest.mark.asyncio
+@patch("ir_api.core.services.reduction._REPO", new_callable=AsyncMock)
+@patch("ir_api.core.services.reduction.ReductionSpecification")
+async def test_count_reductions_by_instrument_approximate(mock_spec_class, mock_repo):
+    """
+    Test approximate count by instrument estimates rather than counts
+    :param mock_repo: mock repo fixture
+    :return: None
+    """
+    spec = mock_spec_class.return_value
+    await count_reductions_by_instrument("TEST", approximate=True)
+    mock_repo.estimate_count.assert_called_once_with(spec.by_instrument_id(1))
+    mock_repo.count.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch("ir_api.core.services.reduction._REPO", new_callable=AsyncMock)
+async def test_count_reductions_approximate(mock_repo):
+    """
+    Test approximate count estimates rather than counts
+    :return: None
+    """
+    await count_reductions(approximate=True)
+    mock_repo.estimate_count.assert_called_once()
+    mock_repo.count.assert_not_called()
+
+
+@patch("ir_api.core.services.reduction._REPO")
+@patch("ir_api.core.services.reduction.ReductionSpecification")
+@pytest.mark.asyncio
+async def test_stream_reductions_by_instrument(mock_spec_class, mock_repo):
+    """
+    Test that stream_reductions_by_instrument streams the reductions, loading the runs when they are included
+    :param mock_repo: Mocked Repo class
+    :return: None
+    """
+    spec = mock_spec_class.return_value
+    assert await stream_reductions_by_instrument("test", include_runs=True) == mock_repo.stream.return_value
+    spec.by_instrument_id.return_value.with_script.assert_called_once_with()
+    spec.by_instrument_id.return_value.with_runs.assert_called_once_with()
+    mock_repo.stream.assert_called_once_with(spec.by_instrument_id.return_value)
+
+
+@patch("ir_api.core.services.reduction._REPO")
+@patch("ir_api.core.services.reduction.ReductionSpecification")
+@pytest.mark.asyncio
+async def test_stream_reduction_fields_by_instrument(mock_spec_class, mock_repo):
+    """
+    Test that stream_reduction_fields_by_instrument projects the fields and streams them
+    :param mock_repo: Mocked Repo class
+    :return: None
+    """
+    spec = mock_spec_class.return_value
+    assert await stream_reduction_fields_by_instrument("test", ["id"]) == mock_repo.stream_fields.return_value
+    mock_repo.stream_fields.assert_called_once_with(spec.by_instrument_id(1).project(["id"]))
+
+
+@patch("ir_api.core.services.reduction._REPO")
+@patch("ir_api.core.services.reduction.ReductionSpecification")
+@pytest.mark.asyncio
+async def test_stream_reduction_json_by_instrument(mock_spec_class, mock_repo):
+    """
+    Test that stream_reduction_json_by_instrument streams the JSON of each reduction
+    :param mock_repo: Mocked Repo class
+    :return: None
+    """
+
+    async def rows():
+        yield {"json": '{"id":1}'}
+        yield {"json": '{"id":2}'}
+
+    mock_repo.stream_fields = MagicMock(return_value=rows())
+    spec = mock_spec_class.return_value
+
+    assert [json_ async for json_ in await stream_reduction_json_by_instrument("test", include_runs=True)] == [
+        '{"id":1}',
+        '{"id":2}',
+    ]
+    spec.by_instrument_id.return_value.as_json.assert_called_once_with(include_runs=True)
+    mock_repo.stream_fields.assert_called_once_with(spec.by_instrument_id.return_value.as_json.return_value)
+
+
+@patch("ir_api.core.services.reduction._REPO")
+@patch("ir_api.core.services.reduction.ReductionSpecification")
+@pytest.mark.asyncio
+async def test_stream_reduction_json_closed_early_closes_rows(_, mock_repo):
+    """
+    Test closing the stream of JSON before it is exhausted closes the rows it is streamed from, and so their session
+    :param mock_repo: Mocked Repo class
+    :return: None
+    """
+    closed = []
+
+    async def rows():
+        try:
+            yield {"json": '{"id":1}'}
+            yield {"json": '{"id":2}'}
+        finally:
+            closed.append(True)
+
+    mock_repo.stream_fields = MagicMock(return_value=rows())
+    stream = await stream_reduction_json_by_instrument("test")
+    assert await anext(stream) == '{"id":1}'
+    await stream.aclose()
+    assert closed == [True]
@@ -2,43 +2,143 @@
 Tests for run service
 """
 
-from unittest.mock import patch
+# pylint: disable = redefined-outer-name
+from unittest.mock import patch, AsyncMock
 
-from ir_api.core.services.run import get_runs_by_instrument, get_run_count_by_instrument, get_total_run_count
+import pytest
 
+from ir_api.core.services.run import (
+    get_runs_by_instrument,
+    get_run_count_by_instrument,
+    get_total_run_count,
+    get_run_fields_by_instrument,
+    stream_runs_by_instrument,
+    stream_run_fields_by_instrument,
+)
 
-@patch("ir_api.core.services.run._REPO")
+
+@pytest.fixture(autouse=True)
+def instrument_catalog():
+    """
+    Patch the instrument catalog to find every instrument with the id 1
+    :return: The catalog mock
+    """
+    with patch("ir_api.core.services.run.INSTRUMENT_CATALOG") as catalog:
+        catalog.id_for = AsyncMock(return_value=1)
+        yield catalog
+
+
+@patch("ir_api.core.services.run._REPO", new_callable=AsyncMock)
 @patch("ir_api.core.services.run.RunSpecification")
-def test_get_runs_by_instrument(mock_spec_class, mock_run_repo):
+@pytest.mark.asyncio
+async def test_get_runs_by_instrument(mock_spec_class, mock_run_repo):
     """
     Test that get_runs by instrument makes correct repo call
     :param mock_run_repo: Mock repo
     :return: None
     """
     spec = mock_spec_class.return_value
-    get_runs_by_instrument("test", limit=5, offset=6)
-    mock_run_repo.find.assert_called_once_with(spec.by_instrument(instrument="test", limit=5, offset=6))
+    await get_runs_by_instrument("test", limit=5, offset=6)
+    spec.by_instrument_id.assert_called_once_with(
+        1, limit=5, offset=6, order_by="run_start", order_direction="desc", cursor=None
+    )
+    mock_run_repo.find_page.assert_called_once_with(spec.by_instrument_id.return_value.with_instrument())
 
 
-@patch("ir_api.core.services.run._REPO")
+@patch("ir_api.core.services.run._REPO", new_callable=AsyncMock)
+@patch("ir_api.core.services.run.RunSpecification")
+@pytest.mark.asyncio
+async def test_get_runs_by_unknown_instrument(mock_spec_class, mock_run_repo, instrument_catalog):
+    """
+    Test that the runs of an instrument missing from the catalog are found with a specification matching nothing
+    :param mock_run_repo: Mock repo
+    :return: None
+    """
+    instrument_catalog.id_for.return_value = None
+    spec = mock_spec_class.return_value
+    await get_runs_by_instrument("nope")
+    instrument_catalog.id_for.assert_awaited_once_with("nope")
+    assert spec.by_instrument_id.call_args.args == (None,)
+    mock_run_repo.find_page.assert_called_once_with(spec.by_instrument_id.return_value.with_instrument())
+
+
+@patch("ir_api.core.services.run._REPO", new_callable=AsyncMock)
 @patch("ir_api.core.services.run.RunSpecification")
-def test_get_run_count_by_instrument(mock_spec_class, mock_repo):
+@pytest.mark.asyncio
+async def test_get_run_count_by_instrument(mock_spec_class, mock_repo):
     """
     Test correct repo calls for count by instrument
     :return: None
     """
     spec = mock_spec_class.return_value
-    get_run_count_by_instrument("test")
-    mock_repo.count.assert_called_once_with(spec.by_instrument(instrument="test", limit=5, offset=6))
+    await get_run_count_by_instrument("test")
+    mock_repo.count.assert_called_once_with(spec.by_instrument_id(1, limit=5, offset=6))
 
 
-@patch("ir_api.core.services.run._REPO")
+@patch("ir_api.core.services.run._REPO", new_callable=AsyncMock)
 @patch("ir_api.core.services.run.RunSpecification")
-def test_get_total_run_count(mock_spec_class, mock_repo):
+@pytest.mark.asyncio
+async def test_get_total_run_count(mock_spec_class, mock_repo):
     """
     Test correct repo calls for counting all runs
     :return: None
     """
     spec = mock_spec_class.return_value
-    get_total_run_count()
+    await get_total_run_count()
     mock_repo.count.assert_called_once_with(spec.all())
+
+
+@pytest.mark.asyncio
+@patch("ir_api.core.services.run._REPO", new_callable=AsyncMock)
+@patch("ir_api.core.services.run.RunSpecification")
+async def test_get_run_count_by_instrument_approximate(mock_spec_class, mock_repo):
+    """
+    Test approximate run count by instrument estimates rather than counts
+    :return: None
+    """
+    spec = mock_spec_class.return_value
+    await get_run_count_by_instrument("test", approximate=True)
+    mock_repo.estimate_count.assert_called_once_with(spec.by_instrument_id(1))
+    mock_repo.count.assert_not_called()
+
+
+@patch("ir_api.core.services.run._REPO", new_callable=AsyncMock)
+@patch("ir_api.core.services.run.RunSpecification")
+@pytest.mark.asyncio
+async def test_get_run_fields_by_instrument(mock_spec_class, mock_repo):
+    """
+    Test that get_run_fields_by_instrument projects the fields and finds the fields page
+    :return: None
+    """
+    spec = mock_spec_class.return_value
+    await get_run_fields_by_instrument("test", ["filename"], limit=5)
+
+    mock_repo.find_fields_page.assert_called_once_with(spec.by_instrument_id(1, limit=5).project(["filename"]))
+
+
+@patch("ir_api.core.services.run._REPO")
+@patch("ir_api.core.services.run.RunSpecification")
+@pytest.mark.asyncio
+async def test_stream_runs_by_instrument(mock_spec_class, mock_repo):
+    """
+    Test that stream_runs_by_instrument streams the runs with their instrument
+    :param mock_repo: Mock repo
+    :return: None
+    """
+    spec = mock_spec_class.return_value
+    assert await stream_runs_by_instrument("test", limit=5) == mock_repo.stream.return_value
+    mock_repo.stream.assert_called_once_with(spec.by_instrument_id(1, limit=5).with_instrument())
+
+
+@patch("ir_api.core.services.run._REPO")
+@patch("ir_api.core.services.run.RunSpecification")
+@pytest.mark.asyncio
+async def test_stream_run_fields_by_instrument(mock_spec_class, mock_repo):
+    """
+    Test that stream_run_fields_by_instrument projects the fields and streams them
+    :param mock_repo: Mock repo
+    :return: None
+    """
+    spec = mock_spec_class.return_value
+    assert await stream_run_fields_by_instrument("test", ["filename"]) == mock_repo.stream_fields.return_value
+    mock_repo.stream_fields.assert_called_once_with(spec.by_instrument_id(1).project(["filename"]))
@@ -0,0 +1,216 @@
+"""
+Tests for the base specification cursor pagination
+"""
+
+import datetime
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from ir_api.core.exceptions import InvalidCursorError
+from ir_api.core.model import ReductionState, Run
+from ir_api.core.specifications.base import Cursor
+from ir_api.core.specifications.reduction import ReductionSpecification
+from ir_api.core.specifications.run import RunSpecification
+
+
+def compile_sql(spec) -> str:
+    """
+    Compile the specification's query with literal values for postgres
+    :param spec: The specification
+    :return: The SQL
+    """
+    return str(spec.value.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+@pytest.mark.parametrize(
+    "value",
+    [None, 1, "MARI123.nxs", datetime.datetime(2023, 1, 2, 3, 4, 5, 6), ReductionState.SUCCESSFUL],
+)
+def test_cursor_encode_decode_round_trip(value):
+    """
+    Test a cursor decodes to the values it was encoded with, with values in their serialised form
+    :param value: The order column value
+    :return: None
+    """
+    cursor = Cursor(order_by="Run.run_start", order_direction="asc", value=value, id=5).encode()
+    decoded = Cursor.decode(cursor)
+    assert decoded.order_by == "Run.run_start"
+    assert decoded.order_direction == "asc"
+    assert decoded.id == 5
+    if isinstance(value, datetime.datetime):
+        assert decoded.value == value.isoformat()
+    elif isinstance(value, ReductionState):
+        assert decoded.value == value.value
+    else:
+        assert decoded.value == value
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", "", "W10", "WyJhIiwiYiIsbnVsbCwieCJd"])
+def test_cursor_decode_malformed_raises(cursor):
+    """
+    Test malformed cursors raise InvalidCursorError
+    :param cursor: The malformed cursor
+    :return: None
+    """
+    with pytest.raises(InvalidCursorError):
+        Cursor.decode(cursor)
+
+
+def test_ordering_includes_id_tie_breaker():
+    """
+    Test ordering by a column also orders by id in the same direction
+    :return: None
+    """
+    sql = compile_sql(RunSpecification().by_instrument("MARI", order_by="run_start", order_direction="asc"))
+    assert "ORDER BY runs.run_start ASC NULLS LAST, runs.id ASC" in sql
+
+
+def test_seek_descending_non_nullable_column():
+    """
+    Test the seek predicate is a row comparison on the order column and id
+    :return: None
+    """
+    cursor = RunSpecification().by_instrument("MARI", order_by="good_frames").next_cursor(100, 7)
+    sql = compile_sql(RunSpecification().by_instrument("MARI", order_by="good_frames", limit=10, cursor=cursor))
+    assert "(runs.good_frames, runs.id) < (100, 7)" in sql
+    assert "ORDER BY runs.good_frames DESC NULLS FIRST, runs.id DESC" in sql
+    assert "LIMIT 10" in sql
+
+
+def test_seek_ascending_nullable_column_includes_trailing_nulls():
+    """
+    Test seeking ascending on a nullable column includes the nulls that are ordered last
+    :return: None
+    """
+    start = datetime.datetime(2023, 1, 1)
+    spec = ReductionSpecification().by_instrument("MARI", order_by="reduction_start", order_direction="asc")
+    cursor = spec.next_cursor(start, 3)
+    sql = compile_sql(
+        ReductionSpecification().by_instrument("MARI", order_by="reduction_start", order_direction="asc", cursor=cursor)
+    )
+    assert (
+        "(reductions.reduction_start, reductions.id) > ('2023-01-01 00:00:00', 3) OR reductions.reduction_start IS NULL"
+        in sql
+    )
+
+
+def test_seek_descending_from_null_value():
+    """
+    Test seeking descending from within the leading nulls continues through the nulls, then the non nulls
+    :return: None
+    """
+    spec = ReductionSpecification().by_instrument("MARI", order_by="reduction_end")
+    cursor = spec.next_cursor(None, 3)
+    sql = compile_sql(ReductionSpecification().by_instrument("MARI", order_by="reduction_end", cursor=cursor))
+    assert "reductions.reduction_end IS NULL AND reductions.id < 3 OR reductions.reduction_end IS NOT NULL" in sql
+
+
+def test_seek_on_aggregated_run_column():
+    """
+    Test reductions ordered by a run field seek on the aggregate of their runs' field and reduction id
+    :return: None
+    """
+    run_start = datetime.datetime(2023, 1, 1)
+    cursor = ReductionSpecification().by_instrument("MARI", order_by="run_start").next_cursor(run_start, 9)
+    sql = compile_sql(ReductionSpecification().by_instrument("MARI", order_by="run_start", cursor=cursor))
+    assert "(reduction_runs.run_start, reductions.id) < ('2023-01-01 00:00:00', 9)" in sql
+
+
+def test_seek_with_cursor_from_different_ordering_raises():
+    """
+    Test a cursor cannot be applied to a differently ordered query
+    :return: None
+    """
+    cursor = RunSpecification().by_instrument("MARI", order_by="good_frames").next_cursor(100, 7)
+    with pytest.raises(InvalidCursorError):
+        RunSpecification().by_instrument("MARI", order_by="raw_frames", cursor=cursor)
+    with pytest.raises(InvalidCursorError):
+        RunSpecification().by_instrument("MARI", order_by="good_frames", order_direction="asc", cursor=cursor)
+
+
+def test_seek_with_wrongly_typed_value_raises():
+    """
+    Test a cursor value that does not match the column type raises
+    :return: None
+    """
+    cursor = Cursor(order_by=str(Run.run_start), order_direction="desc", value=[1], id=1).encode()
+    with pytest.raises(InvalidCursorError):
+        RunSpecification().by_instrument("MARI", order_by="run_start", cursor=cursor)
+
+
+def test_cache_key_equal_for_equal_specifications():
+    """
+    Test specifications built with the same arguments share a cache key, and different arguments do not
+    :return: None
+    """
+    key = ReductionSpecification().by_instrument("MARI", limit=10).cache_key
+    assert key == ReductionSpecification().by_instrument("MARI", limit=10).cache_key
+    assert key != ReductionSpecification().by_instrument("LET", limit=10).cache_key
+    assert key != ReductionSpecification().by_instrument("MARI", limit=20).cache_key
+    assert key != RunSpecification().by_instrument("MARI", limit=10).cache_key
+    assert hash(key)
+
+
+@pytest.mark.parametrize(
+    "build",
+    [
+        lambda instrument, number: ReductionSpecification().by_instrument(instrument, limit=number, offset=number),
+        lambda instrument, number: ReductionSpecification().by_instrument(instrument, limit=number).as_json(True),
+        lambda instrument, number: ReductionSpecification().by_instrument(instrument, limit=number).project(["id"]),
+        lambda instrument, number: ReductionSpecification().by_instrument(instrument, order_by="run_start"),
+        lambda instrument, number: ReductionSpecification().by_instrument_id(number, limit=number),
+        lambda instrument, number: ReductionSpecification().by_experiment_number(number),
+        lambda instrument, number: ReductionSpecification().by_id(number).with_runs(),
+        lambda instrument, number: ReductionSpecification().by_id(number).versions(),
+        lambda instrument, number: ReductionSpecification().by_ids(list(range(number))),
+        lambda instrument, number: RunSpecification().by_instrument(instrument, limit=number),
+    ],
+)
+def test_statement_cache_key_varies_only_in_bound_values(build):
+    """
+    Test a specification built with different values generates the same statement cache key, differing only in the
+    values bound, so that its compiled statement is reused from SQLAlchemy's compiled cache
+    :param build: Builds the specification from an instrument name and a number
+    :return: None
+    """
+    # pylint: disable = protected-access
+    key = build("MARI", 10).value._generate_cache_key()
+    other = build("LET", 20).value._generate_cache_key()
+    assert key is not None
+    assert key.key == other.key
+    assert [param.value for param in key.bindparams] != [param.value for param in other.bindparams]
+
+
+def test_by_ids_binds_one_array_parameter():
+    """
+    Test the ids are bound as one array parameter, so the statement is the same however many ids are found
+    :return: None
+    """
+    spec = ReductionSpecification().by_ids([3, 1, 2])
+    compiled = spec.value.compile(dialect=postgresql.dialect())
+    assert "WHERE reductions.id = ANY (%(param_1)s::BIGINT[])" in str(compiled)
+    assert "ORDER BY reductions.id ASC" in str(compiled)
+    assert compiled.params == {"param_1": [3, 1, 2]}
+    assert str(ReductionSpecification().by_ids(list(range(100))).value) == str(spec.value)
+
+
+def test_tables_include_subqueries_and_loaded_relationships():
+    """
+    Test the tables read include those of subqueries, and those of the relationships loaded by further queries
+    :return: None
+    """
+    assert ReductionSpecification().by_id(1).tables == {"reductions"}
+    assert ReductionSpecification().by_instrument("MARI").tables == {
+        "reductions",
+        "runs_reductions",
+        "runs",
+        "instruments",
+    }
+    assert ReductionSpecification().by_id(1).with_script().with_runs().tables == {
+        "reductions",
+        "scripts",
+        "runs_reductions",
+        "runs",
+        "instruments",
+    }
@@ -0,0 +1,87 @@
+"""
+Tests for the specifications filtering by the id of an instrument from the instrument catalog
+"""
+
+# pylint: disable=wrong-import-order
+import pytest
+
+from ir_api.core.exceptions import InvalidCursorError
+from ir_api.core.specifications.reduction import ReductionSpecification
+from ir_api.core.specifications.run import RunSpecification
+from test.core.specifications.test_base import compile_sql
+
+
+def test_reductions_by_instrument_id_do_not_join_instruments():
+    """
+    Test reductions are filtered by the instrument id of their runs, without joining the instruments
+    :return: None
+    """
+    spec = ReductionSpecification().by_instrument_id(3, order_by="run_start", limit=10)
+    sql = compile_sql(spec)
+    assert "instruments" not in sql
+    assert "WHERE runs.instrument_id = 3" in sql
+    assert "ORDER BY reduction_runs.run_start DESC NULLS FIRST, reductions.id DESC" in sql
+    assert not spec.joins_to_many
+
+
+def test_runs_by_instrument_id_do_not_join_instruments():
+    """
+    Test runs are filtered by their instrument id, and the instrument is only joined to load or project its name
+    :return: None
+    """
+    assert "JOIN instruments" not in compile_sql(RunSpecification().by_instrument_id(3))
+    assert "WHERE runs.instrument_id = 3" in compile_sql(RunSpecification().by_instrument_id(3))
+    sql = compile_sql(RunSpecification().by_instrument_id(3).project(["filename", "instrument_name"]))
+    assert sql.count("JOIN instruments") == 1
+
+
+@pytest.mark.parametrize("spec_class", [ReductionSpecification, RunSpecification])
+def test_by_unknown_instrument_id_matches_none(spec_class):
+    """
+    Test filtering by the missing id of an unknown instrument matches nothing, and the query selects nothing
+    :param spec_class: The specification class
+    :return: None
+    """
+    spec = spec_class().by_instrument_id(None, limit=10)
+    assert spec.matches_none
+    assert "WHERE false" in compile_sql(spec)
+    assert not spec_class().by_instrument_id(3).matches_none
+
+
+def test_by_unknown_instrument_id_still_validates_cursor():
+    """
+    Test an invalid cursor is rejected even when no instrument matches
+    :return: None
+    """
+    with pytest.raises(InvalidCursorError):
+        RunSpecification().by_instrument_id(None, cursor="not a cursor")
+
+
+def test_reductions_by_instrument_id_semi_join_runs():
+    """
+    Test reductions ordered by a reduction field are filtered with EXISTS, so the runs are not joined to the reductions
+    :return: None
+    """
+    sql = compile_sql(ReductionSpecification().by_instrument_id(3, limit=10))
+    assert "FROM reductions \nWHERE EXISTS (SELECT runs_reductions.reduction_id" in sql
+    assert "runs.instrument_id = 3 AND runs_reductions.reduction_id = reductions.id" in sql
+    assert "ORDER BY reductions.id DESC" in sql
+
+
+@pytest.mark.parametrize("order_direction, aggregate", [("asc", "min"), ("desc", "max")])
+def test_reductions_by_instrument_id_ordered_by_run_field_aggregate_runs(order_direction, aggregate):
+    """
+    Test reductions ordered by a run field are ordered by the least value of their runs ascending, and the greatest
+    descending, from their runs grouped by reduction
+    :param order_direction: The direction to order by
+    :param aggregate: The aggregate of the runs' field expected
+    :return: None
+    """
+    sql = compile_sql(
+        ReductionSpecification().by_instrument_id(3, order_by="experiment_title", order_direction=order_direction)
+    )
+    assert f"{aggregate}(runs.title) AS experiment_title" in sql
+    assert (
+        "GROUP BY runs_reductions.reduction_id) AS reduction_runs ON reduction_runs.reduction_id = reductions.id" in sql
+    )
+    assert f"ORDER BY reduction_runs.experiment_title {order_direction.upper()}" in sql
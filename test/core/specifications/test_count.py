@@ -0,0 +1,76 @@
+"""
+Tests for the SQL emitted to count the specifications of each count endpoint
+"""
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from ir_api.core.specifications.reduction import ReductionSpecification
+from ir_api.core.specifications.run import RunSpecification
+
+
+def compile_count_sql(spec) -> str:
+    """
+    Compile the specification's count query with literal values for postgres, on a single line
+    :param spec: The specification
+    :return: The SQL
+    """
+    sql = str(spec.count_value.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    return " ".join(sql.split())
+
+
+@pytest.mark.parametrize(
+    "spec, expected",
+    [
+        # /reductions/count
+        (ReductionSpecification().all(), "SELECT count(*) AS count_1 FROM reductions"),
+        # /runs/count
+        (RunSpecification().all(), "SELECT count(*) AS count_1 FROM runs"),
+        # /instrument/{instrument}/reductions/count
+        (
+            ReductionSpecification().by_instrument("MARI"),
+            "SELECT count(*) AS count_1 FROM reductions WHERE EXISTS (SELECT runs_reductions.reduction_id "
+            "FROM runs_reductions JOIN runs ON runs.id = runs_reductions.run_id "
+            "JOIN instruments ON instruments.id = runs.instrument_id "
+            "WHERE instruments.instrument_name = 'MARI' AND runs_reductions.reduction_id = reductions.id)",
+        ),
+        # /instrument/{instrument}/runs/count
+        (
+            RunSpecification().by_instrument("MARI"),
+            "SELECT count(*) AS count_1 FROM runs JOIN instruments ON instruments.id = runs.instrument_id "
+            "WHERE instruments.instrument_name = 'MARI'",
+        ),
+    ],
+)
+def test_count_sql(spec, expected):
+    """
+    Test each count endpoint counts with only the filtering joins, without ordering, pagination or loading
+    """
+    assert compile_count_sql(spec) == expected
+
+
+def test_count_sql_ignores_ordering_and_pagination():
+    """
+    Test the ordering and pagination of the specification are not part of the count
+    """
+    paged = RunSpecification().by_instrument("MARI", limit=10, offset=20, order_by="run_start", order_direction="asc")
+
+    assert compile_count_sql(paged) == compile_count_sql(RunSpecification().by_instrument("MARI"))
+
+
+def test_count_sql_counts_reductions_by_experiment_number_once():
+    """
+    Test reductions filtered through their runs are counted without joining the runs, so each is counted once
+    """
+    assert compile_count_sql(ReductionSpecification().by_experiment_number(123)).startswith(
+        "SELECT count(*) AS count_1 FROM reductions WHERE EXISTS"
+    )
+
+
+def test_count_sql_of_reductions_ordered_by_run_field_counts_grouped_runs():
+    """
+    Test reductions ordered by a run field are counted from their runs grouped by reduction, once each
+    """
+    sql = compile_count_sql(ReductionSpecification().by_instrument("MARI", order_by="run_start"))
+    assert sql.startswith("SELECT count(*) AS count_1 FROM reductions JOIN (SELECT")
+    assert "GROUP BY runs_reductions.reduction_id" in sql
@@ -0,0 +1,45 @@
+"""
+Tests for the instrument specification
+"""
+
+# pylint: disable=wrong-import-order
+from ir_api.core.specifications.instrument import InstrumentSpecification
+from test.core.specifications.test_base import compile_sql
+
+
+def test_instrument_names():
+    """
+    Test the catalog's query selects only the id and name of every instrument
+    :return: None
+    """
+    spec = InstrumentSpecification().names()
+    assert spec.fields == ("instrument_name", "id")
+    assert compile_sql(spec) == (
+        "SELECT instruments.instrument_name AS instrument_name, instruments.id AS id \nFROM instruments "
+        "ORDER BY instruments.id"
+    )
+
+
+def test_summary_is_one_grouped_query():
+    """
+    Test the summary selects every instrument with its counts, from one grouped subquery of runs and one of reductions
+    :return: None
+    """
+    spec = InstrumentSpecification().summary()
+    sql = compile_sql(spec)
+
+    assert spec.fields == (
+        "instrument_name",
+        "run_count",
+        "reduction_count",
+        "successful_count",
+        "unsuccessful_count",
+        "error_count",
+        "not_started_count",
+    )
+    assert sql.startswith("SELECT instruments.instrument_name AS instrument_name, coalesce(")
+    assert "FROM instruments LEFT OUTER JOIN" in sql
+    assert sql.count("GROUP BY") == 2
+    assert "SELECT DISTINCT runs.instrument_id" in sql
+    assert "count(*) FILTER (WHERE anon_3.reduction_state = 'SUCCESSFUL') AS successful_count" in sql
+    assert sql.endswith("ORDER BY instruments.instrument_name, instruments.id")
@@ -0,0 +1,124 @@
+"""
+Tests for the SQL emitted for projected fields of specifications
+"""
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from ir_api.core.exceptions import InvalidFieldsError
+from ir_api.core.specifications.reduction import ReductionSpecification
+from ir_api.core.specifications.run import RunSpecification
+
+
+def compile_sql(spec) -> str:
+    """
+    Compile the specification's query with literal values for postgres, on a single line
+    :param spec: The specification
+    :return: The SQL
+    """
+    sql = str(spec.value.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    return " ".join(sql.split())
+
+
+def test_reduction_projection_selects_only_fields():
+    """
+    Test only the requested reduction columns are selected, labelled with their field names
+    """
+    spec = ReductionSpecification().by_instrument("MARI", limit=10).project(["id", "reduction_state"])
+
+    sql = compile_sql(spec)
+
+    assert sql.startswith("SELECT reductions.id AS id, reductions.reduction_state AS reduction_state FROM reductions ")
+    assert "scripts" not in sql
+    assert sql.endswith("LIMIT 10")
+    assert spec.fields == ("id", "reduction_state")
+
+
+def test_reduction_projection_outer_joins_script_when_requested():
+    """
+    Test the script text is outer joined only when the script field is requested
+    """
+    sql = compile_sql(ReductionSpecification().by_experiment_number(123).project(["id", "script"]))
+
+    assert sql.startswith("SELECT reductions.id AS id, scripts.script AS script FROM reductions ")
+    assert "LEFT OUTER JOIN scripts ON reductions.script_id = scripts.id" in sql
+
+
+def test_run_projection_uses_existing_instrument_join():
+    """
+    Test the instrument name is selected from the instrument already joined by the specification
+    """
+    sql = compile_sql(RunSpecification().by_instrument("MARI").project(["filename", "instrument_name"]))
+
+    assert sql.startswith(
+        "SELECT runs.filename AS filename, instruments.instrument_name AS instrument_name "
+        "FROM runs JOIN instruments ON instruments.id = runs.instrument_id WHERE"
+    )
+    assert sql.count("JOIN instruments") == 1
+
+
+def test_run_projection_joins_instrument_when_needed():
+    """
+    Test the instrument is joined for its name when the specification does not join it
+    """
+    sql = compile_sql(RunSpecification().all().project(["instrument_name"]))
+
+    assert sql.startswith(
+        "SELECT instruments.instrument_name AS instrument_name FROM runs "
+        "JOIN instruments ON instruments.id = runs.instrument_id"
+    )
+
+
+def test_projection_deduplicates_fields():
+    """
+    Test a field requested more than once is selected once
+    """
+    assert ReductionSpecification().all().project(["id", "id"]).fields == ("id",)
+
+
+def test_projection_selects_fields_in_one_order():
+    """
+    Test the same fields requested in any order are selected in one order, so compile to one statement
+    """
+    spec = ReductionSpecification().all().project(["reduction_state", "id"])
+
+    assert spec.fields == ("id", "reduction_state")
+    assert str(spec.value) == str(ReductionSpecification().all().project(["id", "reduction_state"]).value)
+
+
+@pytest.mark.parametrize("fields", [["id", "not_a_field"], ["runs"], []])
+def test_projection_raises_for_invalid_fields(fields):
+    """
+    Test fields that are not fields of the resource, or no fields, are rejected
+    """
+    with pytest.raises(InvalidFieldsError):
+        ReductionSpecification().all().project(fields)
+
+
+def test_reduction_as_json_selects_single_json_field():
+    """
+    Test the reductions are selected as a single JSON field, with the script outer joined and without the runs
+    """
+    spec = ReductionSpecification().by_experiment_number(123, limit=10).as_json()
+
+    sql = compile_sql(spec)
+
+    assert spec.fields == ("json",)
+    assert sql.startswith("SELECT concat('{\"id\":', ")
+    assert "AS json FROM reductions " in sql
+    assert "LEFT OUTER JOIN scripts ON reductions.script_id = scripts.id" in sql
+    assert "string_agg" not in sql
+    assert sql.endswith("LIMIT 10")
+
+
+def test_reduction_as_json_with_runs_correlates_aliased_runs():
+    """
+    Test the runs are aggregated in a subquery correlated to the reduction, against aliases rather than the runs the
+    outer query joins to filter by instrument
+    """
+    sql = compile_sql(ReductionSpecification().by_instrument("MARI").as_json(include_runs=True))
+
+    assert "string_agg(concat('{\"filename\":', " in sql
+    assert "ORDER BY runs_1.id" in sql
+    assert "WHERE runs_reductions_1.reduction_id = reductions.id" in sql
+    assert "WHERE instruments.instrument_name = 'MARI'" in sql
@@ -0,0 +1,216 @@
+"""
+Tests for the in process cache
+"""
+
+from ir_api.core.cache import TTLCache, ResultCache, CacheStats
+
+
+class FakeClock:
+    """A clock that only moves when told to"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_get_returns_value_before_expiry():
+    """
+    Test a value is returned until the ttl has passed
+    :return: None
+    """
+    clock = FakeClock()
+    cache: TTLCache[str, int] = TTLCache(ttl=10, clock=clock)
+    cache.set("key", 1)
+    clock.now = 9.9
+    assert cache.get("key") == 1
+    clock.now = 10
+    assert cache.get("key") is None
+    assert len(cache) == 0
+
+
+def test_get_missing_returns_none():
+    """
+    Test None is returned for keys never set
+    :return: None
+    """
+    assert TTLCache(ttl=10).get("key") is None
+
+
+def test_set_evicts_oldest_when_full():
+    """
+    Test the least recently set entry is evicted when the cache is full
+    :return: None
+    """
+    cache: TTLCache[str, int] = TTLCache(ttl=10, max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("a", 3)
+    cache.set("c", 4)
+    assert cache.get("b") is None
+    assert cache.get("a") == 3
+    assert cache.get("c") == 4
+
+
+def test_zero_ttl_disables_cache():
+    """
+    Test nothing is cached when the ttl is 0
+    :return: None
+    """
+    cache: TTLCache[str, int] = TTLCache(ttl=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+def test_clear():
+    """
+    Test clear removes all entries
+    :return: None
+    """
+    cache: TTLCache[str, int] = TTLCache(ttl=10)
+    cache.set("a", 1)
+    cache.clear()
+    assert cache.get("a") is None
+
+
+def test_stats_count_hits_misses_and_evictions():
+    """
+    Test lookups are counted as hits or misses, and expired or displaced entries as evictions
+    :return: None
+    """
+    clock = FakeClock()
+    cache: TTLCache[str, int] = TTLCache(ttl=10, max_size=1, clock=clock)
+    cache.get("a")
+    cache.set("a", 1)
+    cache.get("a")
+    cache.set("b", 2)
+    clock.now = 10
+    cache.get("b")
+    assert cache.stats == CacheStats(hits=1, misses=2, evictions=2)
+
+
+def test_remove_where_counts_invalidations():
+    """
+    Test remove_where removes only the matching entries, counting them as invalidations
+    :return: None
+    """
+    cache: TTLCache[str, int] = TTLCache(ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.remove_where(lambda value: value == 1) == 1
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.stats.invalidations == 1
+
+
+def listening_cache(**kwargs) -> ResultCache:
+    """
+    A result cache listening for writes to the reductions and runs
+    :return: The cache
+    """
+    cache: ResultCache = ResultCache(ttl=10, **kwargs)
+    cache.listening = True
+    cache.notified_tables = frozenset({"reductions", "runs"})
+    return cache
+
+
+def test_result_cache_only_used_while_listening():
+    """
+    Test results are neither stored nor returned while the cache is not listening for writes
+    :return: None
+    """
+    cache = listening_cache()
+    cache.listening = False
+    cache.set("key", [1], frozenset({"reductions"}), cache.generation)
+    assert len(cache) == 0
+
+    cache.listening = True
+    cache.set("key", [1], frozenset({"reductions"}), cache.generation)
+    assert cache.get("key") == [1]
+    cache.listening = False
+    assert cache.get("key") is None
+
+
+def test_result_cache_only_stores_results_of_notified_tables():
+    """
+    Test a result read from a table whose writes are not notified is not stored, as it could not be invalidated
+    :return: None
+    """
+    cache = listening_cache()
+    cache.set("key", [1], frozenset({"reductions", "scripts"}), cache.generation)
+    assert cache.get("key") is None
+
+
+def test_result_cache_invalidates_results_of_written_table():
+    """
+    Test a write invalidates only the results read from the table written
+    :return: None
+    """
+    cache = listening_cache()
+    cache.set("reductions", [1], frozenset({"reductions"}), cache.generation)
+    cache.set("runs", [2], frozenset({"runs"}), cache.generation)
+    cache.set("both", [3], frozenset({"reductions", "runs"}), cache.generation)
+
+    assert cache.invalidate("runs") == 2
+    assert cache.get("reductions") == [1]
+    assert cache.get("runs") is None
+    assert cache.get("both") is None
+    assert cache.stats.invalidations == 2
+
+
+def test_result_cache_does_not_store_result_queried_across_invalidation():
+    """
+    Test a result is not stored if an invalidation happened while it was queried, as it may predate the write
+    :return: None
+    """
+    cache = listening_cache()
+    generation = cache.generation
+    cache.invalidate("instruments")
+    cache.set("key", [1], frozenset({"reductions"}), generation)
+    assert cache.get("key") is None
+
+    generation = cache.generation
+    cache.clear()
+    cache.set("key", [1], frozenset({"reductions"}), generation)
+    assert cache.get("key") is None
+
+
+def test_result_cache_does_not_store_replica_result_read_within_staleness_of_invalidation():
+    """
+    Test a result read from a replica is not stored if a table it read was invalidated, or the cache cleared, within
+    the replica's staleness, as the replica may not have replayed the write
+    :return: None
+    """
+    clock = FakeClock()
+    cache = listening_cache(clock=clock)
+    cache.invalidate("runs")
+    clock.now = 5
+    cache.set("runs", [1], frozenset({"runs"}), cache.generation, staleness=10)
+    cache.set("reductions", [2], frozenset({"reductions"}), cache.generation, staleness=10)
+    assert cache.get("runs") is None
+    assert cache.get("reductions") == [2]
+
+    cache.set("runs", [1], frozenset({"runs"}), cache.generation)
+    assert cache.get("runs") == [1]
+
+    cache.clear()
+    clock.now = 14
+    cache.set("reductions", [2], frozenset({"reductions"}), cache.generation, staleness=10)
+    assert cache.get("reductions") is None
+    clock.now = 15.5
+    cache.set("reductions", [2], frozenset({"reductions"}), cache.generation, staleness=10)
+    assert cache.get("reductions") == [2]
+
+
+def test_result_cache_entries_expire():
+    """
+    Test results expire after the ttl, in case a notification was lost
+    :return: None
+    """
+    clock = FakeClock()
+    cache = listening_cache(clock=clock)
+    cache.set("key", [1], frozenset({"reductions"}), cache.generation)
+    clock.now = 10
+    assert cache.get("key") is None
+    assert cache.stats.evictions == 1
@@ -0,0 +1,111 @@
+"""
+Tests for the instrument catalog
+"""
+
+# pylint: disable = redefined-outer-name, wrong-import-order
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from ir_api.core.catalog import InstrumentCatalog
+from test.core.test_cache import FakeClock
+
+
+@pytest.fixture
+def repo():
+    """
+    Mocked AsyncRepo returning two instruments
+    :return: The repo mock
+    """
+    repo_ = AsyncMock()
+    repo_.find_fields.return_value = [{"id": 1, "instrument_name": "MARI"}, {"id": 2, "instrument_name": "LET"}]
+    return repo_
+
+
+@pytest.fixture
+def clock():
+    """
+    A clock that only moves when told to
+    :return: The clock
+    """
+    return FakeClock()
+
+
+@pytest.fixture
+def catalog(repo, clock):
+    """
+    A catalog with a 300 second ttl and 5 second miss interval
+    :return: The catalog
+    """
+    return InstrumentCatalog(repo, ttl=300, miss_interval=5, clock=clock)
+
+
+@pytest.mark.asyncio
+async def test_id_for_loads_once(catalog, repo):
+    """
+    Test the catalog is loaded on the first lookup, and later lookups do not query
+    :return: None
+    """
+    assert await catalog.id_for("MARI") == 1
+    assert await catalog.id_for("LET") == 2
+    assert await catalog.id_for("MARI") == 1
+    repo.find_fields.assert_awaited_once()
+    assert len(catalog) == 2
+
+
+@pytest.mark.asyncio
+async def test_id_for_reloads_after_ttl(catalog, repo, clock):
+    """
+    Test the catalog is reloaded when it is older than the ttl
+    :return: None
+    """
+    await catalog.id_for("MARI")
+    repo.find_fields.return_value = [{"id": 3, "instrument_name": "MARI"}]
+    clock.now = 299
+    assert await catalog.id_for("MARI") == 1
+    clock.now = 300
+    assert await catalog.id_for("MARI") == 3
+    assert repo.find_fields.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_unknown_instrument_reloads_at_most_every_miss_interval(catalog, repo, clock):
+    """
+    Test an unknown name reloads the catalog only when the miss interval has passed since it was loaded, so repeated
+    lookups of unknown names do not query
+    :return: None
+    """
+    await catalog.id_for("MARI")
+    clock.now = 4
+    assert await catalog.id_for("NOPE") is None
+    assert await catalog.id_for("NOPE") is None
+    repo.find_fields.assert_awaited_once()
+
+    repo.find_fields.return_value = [{"id": 1, "instrument_name": "MARI"}, {"id": 4, "instrument_name": "NOPE"}]
+    clock.now = 5
+    assert await catalog.id_for("NOPE") == 4
+    assert repo.find_fields.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups_load_once(catalog, repo):
+    """
+    Test concurrent lookups of an empty catalog are served by one query
+    :return: None
+    """
+    assert await asyncio.gather(*(catalog.id_for(name) for name in ("MARI", "LET", "NOPE"))) == [1, 2, None]
+    repo.find_fields.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_clear_reloads_on_next_lookup(catalog, repo):
+    """
+    Test a cleared catalog is reloaded on the next lookup
+    :return: None
+    """
+    await catalog.id_for("MARI")
+    catalog.clear()
+    assert len(catalog) == 0
+    assert await catalog.id_for("MARI") == 1
+    assert repo.find_fields.await_count == 2
@@ -0,0 +1,234 @@
+"""
+Tests for the negotiated compression of responses
+"""
+
+# pylint: disable = redefined-outer-name
+import gzip
+from typing import Dict, Tuple
+from unittest.mock import patch
+
+import brotli
+import pytest
+import zstandard
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from ir_api.core.compression import (
+    COMPRESSED_CACHE,
+    CompressionMiddleware,
+    Compressor,
+    cache_compressed,
+    compress,
+    negotiate,
+)
+
+LARGE = b'{"script":"' + b"print('science')\\n" * 200 + b'"}'
+
+
+def decompress(body: bytes, encoding: str) -> bytes:
+    """
+    Decompress a body
+    :param body: The compressed body
+    :param encoding: The encoding
+    :return: The body
+    """
+    if encoding == "gzip":
+        return gzip.decompress(body)
+    if encoding == "br":
+        return bytes(brotli.decompress(body))
+    return bytes(zstandard.ZstdDecompressor().decompressobj().decompress(body))
+
+
+async def large(_: Request) -> Response:
+    """A large response, with a strong ETag"""
+    return Response(LARGE, media_type="application/json", headers={"ETag": '"large"'})
+
+
+async def small(_: Request) -> Response:
+    """A response below the minimum size"""
+    return Response(b"[]", media_type="application/json", headers={"ETag": '"small"'})
+
+
+async def encoded(_: Request) -> Response:
+    """A response already encoded"""
+    return Response(gzip.compress(LARGE), headers={"Content-Encoding": "gzip"})
+
+
+async def not_modified(_: Request) -> Response:
+    """A 304 response"""
+    return Response(status_code=304, headers={"ETag": '"large"'})
+
+
+async def streamed(_: Request) -> StreamingResponse:
+    """A response streamed in chunks"""
+
+    async def lines():
+        for index in range(3):
+            yield f'{{"line":{index}}}\n'.encode()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+async def cached(request: Request) -> Response:
+    """A large response marked to have its compressed body cached, of the version requested"""
+    cache_compressed(request)
+    return Response(LARGE + request.query_params["version"].encode(), media_type="application/json")
+
+
+CLIENT = TestClient(
+    CompressionMiddleware(
+        Starlette(
+            routes=[
+                Route("/large", large),
+                Route("/small", small),
+                Route("/encoded", encoded),
+                Route("/not_modified", not_modified),
+                Route("/streamed", streamed),
+                Route("/cached", cached),
+            ]
+        ),
+        minimum_size=1024,
+    )
+)
+
+
+def request(path: str, accept_encoding: str) -> Tuple[Dict[str, str], bytes]:
+    """
+    Send a request through the middleware
+    :param path: The path, with any query
+    :param accept_encoding: The Accept-Encoding header
+    :return: The response headers and the body as sent, without decoding
+    """
+    with CLIENT.stream("GET", path, headers={"Accept-Encoding": accept_encoding}) as response:
+        return dict(response.headers), b"".join(response.iter_raw())
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        ("gzip, deflate, br, zstd", "zstd"),
+        ("gzip, br", "br"),
+        ("gzip", "gzip"),
+        ("gzip;q=0.5, br;q=0", "gzip"),
+        ("*", "zstd"),
+        ("*, zstd;q=0", "br"),
+        ("deflate", None),
+        ("identity", None),
+        ("", None),
+        ("gzip;q=nonsense", None),
+    ],
+)
+def test_negotiate(accept_encoding, expected):
+    """
+    Test the preferred accepted encoding is chosen, and refused encodings are not
+    :param accept_encoding: The Accept-Encoding header
+    :param expected: The encoding
+    :return: None
+    """
+    assert negotiate(accept_encoding) == expected
+
+
+@pytest.mark.parametrize("encoding", ["zstd", "br", "gzip"])
+def test_compressor_chunks_decompress_to_body(encoding):
+    """
+    Test a body compressed in flushed chunks decompresses to the body, as does a body compressed whole
+    :param encoding: The encoding
+    :return: None
+    """
+    compressor = Compressor(encoding)
+    chunks = [compressor.chunk(b"line 1\n"), compressor.chunk(b"line 2\n"), compressor.finish()]
+    assert decompress(b"".join(chunks), encoding) == b"line 1\nline 2\n"
+    assert decompress(compress(LARGE, encoding), encoding) == LARGE
+    assert len(compress(LARGE, encoding)) < len(LARGE) / 10
+
+
+def test_compressor_unknown_encoding_raises():
+    """
+    Test an unknown encoding raises
+    :return: None
+    """
+    with pytest.raises(ValueError):
+        Compressor("deflate")
+
+
+@pytest.mark.parametrize("encoding", ["zstd", "br", "gzip"])
+def test_large_response_compressed_with_weak_etag(encoding):
+    """
+    Test a large response is compressed with the accepted encoding, its length set, and its ETag made weak
+    :param encoding: The encoding
+    :return: None
+    """
+    headers, body = request("/large", encoding)
+    assert headers["content-encoding"] == encoding
+    assert headers["vary"] == "Accept-Encoding"
+    assert headers["etag"] == 'W/"large"'
+    assert int(headers["content-length"]) == len(body)
+    assert decompress(body, encoding) == LARGE
+
+
+def test_response_not_compressed_without_accepted_encoding():
+    """
+    Test a response is sent as it is when no supported encoding is accepted
+    :return: None
+    """
+    headers, body = request("/large", "deflate")
+    assert "content-encoding" not in headers
+    assert headers["etag"] == '"large"'
+    assert body == LARGE
+
+
+@pytest.mark.parametrize("path", ["/small", "/not_modified"])
+def test_small_and_empty_responses_not_compressed_but_etag_weak(path):
+    """
+    Test a response below the minimum size, or without a body, is not compressed, and has the weak ETag a compressed
+    response would
+    :param path: The path
+    :return: None
+    """
+    headers, _ = request(path, "gzip")
+    assert "content-encoding" not in headers
+    assert headers["etag"].startswith('W/"')
+
+
+def test_encoded_response_not_recompressed():
+    """
+    Test a response already encoded is sent as it is
+    :return: None
+    """
+    headers, body = request("/encoded", "br")
+    assert headers["content-encoding"] == "gzip"
+    assert gzip.decompress(body) == LARGE
+
+
+@pytest.mark.parametrize("encoding", ["zstd", "br", "gzip"])
+def test_streamed_response_compressed_per_chunk(encoding):
+    """
+    Test each chunk of a streamed response is compressed and flushed, so can be decoded as it arrives
+    :param encoding: The encoding
+    :return: None
+    """
+    headers, body = request("/streamed", encoding)
+    assert headers["content-encoding"] == encoding
+    assert "content-length" not in headers
+    assert decompress(body, encoding) == b'{"line":0}\n{"line":1}\n{"line":2}\n'
+
+
+def test_marked_response_compressed_once_per_body_and_encoding():
+    """
+    Test the compressed body of a response marked with cache_compressed is reused for the same body and encoding, and a
+    changed body is compressed again
+    :return: None
+    """
+    COMPRESSED_CACHE.clear()
+    with patch("ir_api.core.compression.compress", side_effect=compress) as mock_compress:
+        for _ in range(3):
+            _, body = request("/cached?version=1", "br")
+            assert brotli.decompress(body) == LARGE + b"1"
+        assert mock_compress.call_count == 1
+        request("/cached?version=1", "gzip")
+        _, body = request("/cached?version=2", "br")
+        assert brotli.decompress(body) == LARGE + b"2"
+        assert mock_compress.call_count == 3
@@ -0,0 +1,169 @@
+"""
+Tests for the entity tags of responses
+"""
+
+import pytest
+
+from ir_api.core.etags import (
+    body_etag,
+    etag_matches,
+    make_etag,
+    reduction_etag,
+    reduction_etag_from_versions,
+    reduction_version,
+    script_etag,
+)
+from ir_api.core.model import Instrument, Reduction, ReductionState, Run, Script
+
+
+def make_reduction(script_version=7):
+    """
+    A reduction of two runs, with row versions as if loaded
+    :param script_version: The row version of the script, or None for no script
+    :return: The reduction
+    """
+    instrument = Instrument(id=1, instrument_name="MARI", row_version=3)
+    reduction = Reduction(
+        id=10,
+        row_version=42,
+        reduction_state=ReductionState.SUCCESSFUL,
+        reduction_inputs={"ei": 10, "runno": 1},
+        script=Script(id=2, script="print()", row_version=script_version) if script_version is not None else None,
+    )
+    reduction.runs = [Run(id=run_id, row_version=run_id * 100, instrument=instrument) for run_id in (4, 5)]
+    return reduction
+
+
+@pytest.mark.parametrize(
+    "if_none_match, expected",
+    [
+        (None, False),
+        ('"abc"', True),
+        ('"other", "abc"', True),
+        ('W/"abc"', True),
+        ("*", True),
+        ('"other"', False),
+        ("abc", False),
+    ],
+)
+def test_etag_matches(if_none_match, expected):
+    """
+    Test If-None-Match matches any listed tag by weak comparison, or any tag for *
+    :param if_none_match: The header
+    :param expected: Whether it matches
+    :return: None
+    """
+    assert etag_matches(if_none_match, '"abc"') is expected
+
+
+def test_etags_are_quoted_and_stable():
+    """
+    Test the tags are quoted, equal for equal parts and bodies, and differ otherwise
+    :return: None
+    """
+    assert make_etag("runs", (1, 2)) == make_etag("runs", (1, 2))
+    assert make_etag("runs", (1, 2)) != make_etag("runs", (2, 1))
+    assert body_etag(b"[]") == body_etag(b"[]") != body_etag(b"[1]")
+    assert make_etag("runs").startswith('"') and make_etag("runs").endswith('"')
+
+
+def test_reduction_etag_equals_etag_from_versions():
+    """
+    Test the tag of a loaded reduction equals the tag from the versions ReductionSpecification.versions selects
+    :return: None
+    """
+    versions = {"id": 10, "row_version": 42, "script_row_version": 7, "runs": ["4:400:3", "5:500:3"]}
+    assert reduction_etag(make_reduction()) == reduction_etag_from_versions(versions)
+
+
+def test_reduction_etag_without_script_or_runs_equals_etag_from_versions():
+    """
+    Test the tags agree when the reduction has no script nor runs, for which postgres selects nulls
+    :return: None
+    """
+    reduction = make_reduction(script_version=None)
+    reduction.runs = []
+    versions = {"id": 10, "row_version": 42, "script_row_version": None, "runs": None}
+    assert reduction_etag(reduction) == reduction_etag_from_versions(versions)
+
+
+def test_reduction_etag_changes_with_runs():
+    """
+    Test the tag of a reduction changes when a run or its instrument is written
+    :return: None
+    """
+    reduction = make_reduction()
+    etag = reduction_etag(reduction)
+    reduction.runs[0].row_version = 401
+    assert reduction_etag(reduction) != etag
+    reduction.runs[0].row_version = 400
+    reduction.runs[0].instrument.row_version = 4
+    assert reduction_etag(reduction) != etag
+
+
+def test_reduction_version_without_runs_does_not_read_runs():
+    """
+    Test the runs are not part of the version when not included, so need not be loaded
+    :return: None
+    """
+    reduction = make_reduction()
+    assert reduction_version(reduction, include_runs=False) == (10, 42, 7)
+
+
+def test_script_etag_changes_with_transform_inputs():
+    """
+    Test the tag of a script changes with its sha and the inputs of the reduction it is transformed for, and not with
+    the order of the inputs
+    :return: None
+    """
+    reduction = make_reduction()
+    etag = script_etag("mari", "abc", False, "github", reduction)
+    assert etag == script_etag("MARI", "abc", False, "github", reduction)
+    assert etag != script_etag("mari", "abc", False, "github")
+    assert etag != script_etag("mari", "def", False, "github", reduction)
+    reduction.reduction_inputs = {"runno": 1, "ei": 10}
+    assert etag == script_etag("mari", "abc", False, "github", reduction)
+    reduction.reduction_inputs = {"runno": 1, "ei": 11}
+    assert etag != script_etag("mari", "abc", False, "github", reduction)
+
+
+def test_script_etag_changes_with_source():
+    """
+    Test the tag of a script read locally differs from that of the script at its sha, as the local copy may differ
+    :return: None
+    """
+    assert script_etag("mari", "abc", False, "local") != script_etag("mari", "abc", False, "github")
+    reduction = make_reduction()
+    assert script_etag("mari", "abc", False, "local", reduction) != script_etag(
+        "mari", "abc", False, "github", reduction
+    )
+
+
+def test_transformed_script_etag_changes_with_github_api_token(monkeypatch):
+    """
+    Test the tag of a transformed script, into which the token is written, changes with the token, and does not hold it
+    :param monkeypatch: the pytest monkeypatch fixture
+    :return: None
+    """
+    reduction = make_reduction()
+    monkeypatch.setenv("GITHUB_API_TOKEN", "first-token")
+    etag = script_etag("mari", "abc", False, "github", reduction)
+    untransformed = script_etag("mari", "abc", False, "github")
+    assert "first-token" not in etag
+    monkeypatch.setenv("GITHUB_API_TOKEN", "second-token")
+    assert script_etag("mari", "abc", False, "github", reduction) != etag
+    assert script_etag("mari", "abc", False, "github") == untransformed
+
+
+def test_script_etag_changes_with_body_unless_pinned():
+    """
+    Test the tag of a script whose body is given changes with the body, and differs from the tag of the script pinned
+    to its sha
+    :return: None
+    """
+    reduction = make_reduction()
+    etag = script_etag("mari", "abc", True, "github", reduction, body="older script")
+    assert etag == script_etag("mari", "abc", True, "github", reduction, body="older script")
+    assert etag != script_etag("mari", "abc", True, "github", reduction, body="newer script")
+    assert etag != script_etag("mari", "abc", True, "github", reduction)
+    assert script_etag("mari", "abc", True, "github", body="older script") != script_etag("mari", "abc", True, "github")
@@ -0,0 +1,127 @@
+"""
+Tests for the listener invalidating cached results on the notification of writes
+"""
+
+# pylint: disable = redefined-outer-name
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import asyncpg
+import pytest
+
+from ir_api.core.cache import ResultCache
+from ir_api.core.model import WRITE_NOTIFY_CHANNEL
+from ir_api.core.notifications import WriteListener
+
+
+@pytest.fixture
+def connection():
+    """
+    Mocked asyncpg connection with triggers on the reductions and runs
+    :return: The connection mock
+    """
+    connection_ = AsyncMock()
+    connection_.fetch.return_value = [("reductions",), ("runs",)]
+    connection_.terminate = Mock()
+    return connection_
+
+
+@pytest.fixture
+def cache():
+    """
+    An empty result cache
+    :return: The cache
+    """
+    return ResultCache(ttl=10)
+
+
+async def wait_for(condition) -> None:
+    """
+    Wait until the condition is true, or fail after a second
+    :param condition: The condition
+    :return: None
+    """
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("Condition not met")
+
+
+@pytest.mark.asyncio
+async def test_listener_invalidates_written_tables(cache, connection):
+    """
+    Test the cache is used for the notified tables while listening, and the results of a written table invalidated
+    :return: None
+    """
+    task = asyncio.create_task(WriteListener(cache, AsyncMock(return_value=connection), 0.01).run())
+    try:
+        await wait_for(lambda: cache.listening)
+        assert cache.notified_tables == {"reductions", "runs"}
+        channel, callback = connection.add_listener.call_args.args
+        assert channel == WRITE_NOTIFY_CHANNEL
+
+        cache.set("key", [1], frozenset({"runs"}), cache.generation)
+        callback(connection, 1, channel, "runs")
+        assert cache.get("key") is None
+        assert cache.stats.invalidations == 1
+    finally:
+        task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_listener_stops_caching_and_reconnects_when_connection_lost(cache, connection):
+    """
+    Test the cache is cleared and not used once the connection is lost, until the listener reconnects
+    :return: None
+    """
+    connect = AsyncMock(return_value=connection)
+    task = asyncio.create_task(WriteListener(cache, connect, 0.01).run())
+    try:
+        await wait_for(lambda: cache.listening)
+        cache.set("key", [1], frozenset({"runs"}), cache.generation)
+        connection.fetch.side_effect = asyncpg.ConnectionDoesNotExistError()
+        await wait_for(lambda: not cache.listening)
+        assert len(cache) == 0
+        connection.terminate.assert_called()
+
+        connection.fetch.side_effect = None
+        await wait_for(lambda: cache.listening)
+        assert connect.await_count >= 2
+    finally:
+        task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_listener_restarts_cache_when_triggers_change(cache, connection):
+    """
+    Test the cache is cleared and the notified tables updated when a trigger is dropped
+    :return: None
+    """
+    task = asyncio.create_task(WriteListener(cache, AsyncMock(return_value=connection), 0.01).run())
+    try:
+        await wait_for(lambda: cache.listening)
+        cache.set("key", [1], frozenset({"runs"}), cache.generation)
+        connection.fetch.return_value = [("reductions",)]
+        await wait_for(lambda: cache.notified_tables == {"reductions"})
+        assert len(cache) == 0
+    finally:
+        task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_listener_does_not_cache_without_triggers(cache, connection, caplog):
+    """
+    Test nothing is cached when no table notifies its writes, and the problem is only logged once
+    :return: None
+    """
+    connection.fetch.return_value = []
+    connect = AsyncMock(return_value=connection)
+    task = asyncio.create_task(WriteListener(cache, connect, 0.01).run())
+    try:
+        await wait_for(lambda: connect.await_count >= 3)
+        assert not cache.listening
+        connection.add_listener.assert_not_called()
+        assert len([record for record in caplog.records if "No tables notify" in record.message]) == 1
+    finally:
+        task.cancel()
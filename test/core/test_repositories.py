@@ -0,0 +1,223 @@
+"""
+Tests for the repositories that do not require a database
+"""
+
+# pylint: disable = redefined-outer-name
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+
+import pytest
+
+from ir_api.core.cache import TTLCache, ResultCache
+from ir_api.core.exceptions import NonUniqueRecordError
+from ir_api.core.repositories import AsyncRepo
+from ir_api.core.specifications.reduction import ReductionSpecification
+
+
+@pytest.fixture
+def session():
+    """
+    Mocked AsyncSession
+    :return: The session mock
+    """
+    return AsyncMock()
+
+
+@pytest.fixture
+def repo(session):
+    """
+    AsyncRepo with a mocked session
+    :param session: The mocked session
+    :return: The repo
+    """
+    repo_ = AsyncRepo()
+    context = MagicMock()
+    context.__aenter__.return_value = session
+    repo_._session = Mock(return_value=context)  # pylint: disable = protected-access
+    return repo_
+
+
+@pytest.mark.asyncio
+@patch("ir_api.core.repositories.COUNT_CACHE", TTLCache(ttl=10))
+async def test_count_is_cached(repo, session):
+    """
+    Test repeated counts of the same specification only query once
+    :return: None
+    """
+    session.execute.return_value = Mock(scalar_one=Mock(return_value=5))
+
+    assert await repo.count(ReductionSpecification().by_instrument("MARI")) == 5
+    assert await repo.count(ReductionSpecification().by_instrument("MARI")) == 5
+    session.execute.assert_awaited_once()
+
+    session.execute.return_value = Mock(scalar_one=Mock(return_value=7))
+    assert await repo.count(ReductionSpecification().by_instrument("LET")) == 7
+
+
+@pytest.mark.asyncio
+@patch("ir_api.core.repositories.COUNT_CACHE", TTLCache(ttl=10))
+async def test_estimate_count_uses_planner_rows(repo, session):
+    """
+    Test the estimate is the planner's row estimate for the specification's query
+    :return: None
+    """
+    connection = AsyncMock()
+    connection.exec_driver_sql.return_value = Mock(
+        scalar_one=Mock(return_value=[{"Plan": {"Node Type": "Hash Join", "Plan Rows": 132}}])
+    )
+    session.connection.return_value = connection
+
+    assert await repo.estimate_count(ReductionSpecification().by_instrument("MARI")) == 132
+
+    sql = connection.exec_driver_sql.call_args.args[0]
+    assert sql.startswith("EXPLAIN (FORMAT JSON) SELECT")
+    assert "instruments.instrument_name = 'MARI'" in sql
+    session.execute.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch("ir_api.core.repositories.STREAM_BATCH_SIZE", 50)
+async def test_stream_yields_from_server_side_cursor(repo, session):
+    """
+    Test streaming executes with yield_per, so that rows are fetched from a server-side cursor in batches
+    :return: None
+    """
+
+    async def entities():
+        for entity in ("reduction 1", "reduction 2"):
+            yield entity
+
+    session.stream_scalars.return_value = entities()
+
+    assert [entity async for entity in repo.stream(ReductionSpecification().by_instrument("MARI"))] == [
+        "reduction 1",
+        "reduction 2",
+    ]
+    statement = session.stream_scalars.call_args.args[0]
+    assert statement.get_execution_options()["yield_per"] == 50
+
+
+@pytest.mark.asyncio
+async def test_stream_closed_early_closes_its_session(repo, session):
+    """
+    Test a stream closed before it is exhausted, as when the client disconnects, closes its session then
+    :return: None
+    """
+
+    async def entities():
+        for index in range(1000):
+            yield f"reduction {index}"
+
+    session.stream_scalars.return_value = entities()
+    stream = repo.stream(ReductionSpecification().by_instrument("MARI"))
+    assert await anext(stream) == "reduction 0"
+    repo._session.return_value.__aexit__.assert_not_awaited()  # pylint: disable = protected-access
+
+    await stream.aclose()
+    repo._session.return_value.__aexit__.assert_awaited_once()  # pylint: disable = protected-access
+
+
+@pytest.mark.asyncio
+async def test_specification_matching_none_is_not_queried(repo, session):
+    """
+    Test a specification known to match nothing returns nothing without opening a session
+    :return: None
+    """
+    spec = ReductionSpecification().by_instrument_id(None, limit=10, order_by="run_start")
+    assert (await repo.find_page(spec)).items == []
+    assert (await repo.find_fields_page(ReductionSpecification().by_instrument_id(None).project(["id"]))).items == []
+    assert [entity async for entity in repo.stream(spec)] == []
+    assert await repo.count(spec) == 0
+    assert await repo.estimate_count(spec) == 0
+    repo._session.assert_not_called()  # pylint: disable = protected-access
+    session.execute.assert_not_called()
+
+
+@pytest.fixture
+def result_cache():
+    """
+    A result cache listening for writes to every table
+    :return: The cache
+    """
+    cache: ResultCache = ResultCache(ttl=10)
+    cache.listening = True
+    cache.notified_tables = frozenset({"reductions", "runs", "runs_reductions", "instruments", "scripts"})
+    with patch("ir_api.core.repositories.RESULT_CACHE", cache):
+        yield cache
+
+
+@pytest.mark.asyncio
+async def test_find_and_find_one_share_cached_results(repo, session, result_cache):
+    """
+    Test find and find_one of the same specification query once, until a table the query read is written
+    :return: None
+    """
+    reduction = Mock()
+    session.execute.return_value = Mock(scalars=Mock(return_value=Mock(all=Mock(return_value=[reduction]))))
+
+    assert await repo.find_one(ReductionSpecification().by_id(1).with_runs()) is reduction
+    assert await repo.find(ReductionSpecification().by_id(1).with_runs()) == [reduction]
+    session.execute.assert_awaited_once()
+
+    result_cache.invalidate("runs")
+    assert await repo.find_one(ReductionSpecification().by_id(1).with_runs()) is reduction
+    assert session.execute.await_count == 2
+    assert (result_cache.stats.hits, result_cache.stats.misses) == (1, 2)
+
+
+@pytest.mark.asyncio
+async def test_find_one_of_cached_results_raises_when_non_unique(repo, session, result_cache):
+    """
+    Test find_one returns None for no results and raises for many, whether or not the results are cached
+    :return: None
+    """
+    session.execute.return_value = Mock(scalars=Mock(return_value=Mock(all=Mock(return_value=[]))))
+    assert await repo.find_one(ReductionSpecification().by_id(1)) is None
+    assert await repo.find_one(ReductionSpecification().by_id(1)) is None
+
+    session.execute.return_value = Mock(scalars=Mock(return_value=Mock(all=Mock(return_value=[Mock(), Mock()]))))
+    for _ in range(2):
+        with pytest.raises(NonUniqueRecordError):
+            await repo.find_one(ReductionSpecification().by_id(2))
+    assert session.execute.await_count == 2
+    assert len(result_cache) == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("result_cache")
+async def test_instrument_listing_pages_are_cached_with_their_cursors(repo, session):
+    """
+    Test a second request for a page of an instrument's reductions is not queried, and its next cursor is built from
+    the cached rows, while the following page, and the page of fields, are queried apart
+    :return: None
+    """
+    session.execute.return_value = Mock(all=Mock(return_value=[(Mock(id=9), 9), (Mock(id=8), 8)]))
+    first = await repo.find_page(ReductionSpecification().by_instrument("MARI", limit=2))
+    second = await repo.find_page(ReductionSpecification().by_instrument("MARI", limit=2))
+    session.execute.assert_awaited_once()
+    assert second.items == first.items
+    assert first.next_cursor is not None
+    assert second.next_cursor == first.next_cursor
+
+    await repo.find_page(ReductionSpecification().by_instrument("MARI", limit=2, cursor=first.next_cursor))
+    assert session.execute.await_count == 2
+
+    session.execute.return_value = Mock(all=Mock(return_value=[(9, 9, 9), (8, 8, 8)]))
+    for _ in range(2):
+        page = await repo.find_fields_page(ReductionSpecification().by_instrument("MARI", limit=2).project(["id"]))
+        assert page.items == [{"id": 9}, {"id": 8}]
+        assert page.next_cursor == first.next_cursor
+    assert session.execute.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_find_fields_returns_copies_of_cached_rows(repo, session, result_cache):
+    """
+    Test the fields found are cached, and each call is returned its own dicts, which it may modify
+    :return: None
+    """
+    session.execute.return_value = Mock(mappings=Mock(return_value=Mock(all=Mock(return_value=[{"id": 1}]))))
+    found = await repo.find_fields(ReductionSpecification().by_id(1).project(["id"]))
+    found[0]["id"] = 2
+    assert await repo.find_fields(ReductionSpecification().by_id(1).project(["id"])) == [{"id": 1}]
+    session.execute.assert_awaited_once()
+    assert len(result_cache) == 1
@@ -5,13 +5,33 @@ Tests designed to test every specification with it's respective repo
 with a live db connection
 """
 
+import asyncio
 import datetime
+from functools import partial
+from unittest.mock import patch
 
 import pytest
+from sqlalchemy import text, delete
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.ext.asyncio import create_async_engine
 
+from ir_api.core.cache import ResultCache
+from ir_api.core.etags import reduction_etag, reduction_etag_from_versions
 from ir_api.core.exceptions import NonUniqueRecordError
-from ir_api.core.model import Base, Script, Instrument, Reduction, ReductionState, Run
-from ir_api.core.repositories import ENGINE, SESSION, Repo
+from ir_api.core.model import Base, Script, Instrument, Reduction, ReductionState, Run, run_reduction_junction_table
+from ir_api.core.notifications import WriteListener, connect
+from ir_api.core.pool import InstrumentedAsyncQueuePool
+from ir_api.core.replicas import Replica, ReplicaRouter
+from ir_api.core.repositories import (
+    ENGINE,
+    SESSION,
+    Repo,
+    AsyncRepo,
+    ASYNC_ENGINE,
+    ASYNC_SESSION,
+    COUNT_CACHE,
+    replica_engine,
+)
 from ir_api.core.specifications.reduction import ReductionSpecification
 from ir_api.core.specifications.run import RunSpecification
 
@@ -89,6 +109,7 @@ def setup() -> None:
     Set up the test database before module
     :return: None
     """
+    COUNT_CACHE.clear()
     Base.metadata.drop_all(ENGINE)
     Base.metadata.create_all(ENGINE)
 
@@ -107,6 +128,9 @@ def setup() -> None:
         session.refresh(TEST_RUN_1)
         session.refresh(TEST_RUN_2)
         session.refresh(TEST_RUN_3)
+        session.refresh(TEST_REDUCTION)
+        session.refresh(TEST_REDUCTION_2)
+        session.refresh(TEST_REDUCTION_4)
 
     yield
 
@@ -129,6 +153,15 @@ def run_repo() -> Repo[Run]:
     return Repo()
 
 
+@pytest.fixture()
+def async_reduction_repo() -> AsyncRepo[Reduction]:
+    """
+    Async ReductionRepo fixture
+    :return: AsyncRepo of reductions
+    """
+    return AsyncRepo()
+
+
 def test_base_spec_all(run_repo):
     """Test all are in result"""
     result = run_repo.find(RunSpecification().all())
@@ -146,7 +179,7 @@ def test_base_spec_by_id(run_repo):
 def test_run_by_instrument(run_repo):
     """Test finding runs by instrument"""
     result = run_repo.find(RunSpecification().by_instrument("instrument 1"))
-    assert result == [TEST_RUN_1, TEST_RUN_2]
+    assert result == [TEST_RUN_2, TEST_RUN_1]  # ordered by run_start descending by default
     result = run_repo.find(
         RunSpecification().by_instrument(
             "instrument 1", limit=1, offset=1, order_by="good_frames", order_direction="desc"
@@ -197,3 +230,405 @@ def test_reductions_by_instrument_sort_by_reduction_field(reduction_repo):
     )
     expected.reverse()
     assert result == expected
+
+
+@pytest.mark.asyncio
+async def test_async_repo_find(async_reduction_repo):
+    """Test the async repo finds the same reductions as the sync repo"""
+    result = await async_reduction_repo.find(
+        ReductionSpecification().by_instrument("instrument 1", order_by="reduction_state", order_direction="asc")
+    )
+    assert result == [TEST_REDUCTION_2, TEST_REDUCTION]
+
+
+@pytest.mark.asyncio
+async def test_async_repo_find_one(async_reduction_repo):
+    """Test the async repo finds by id, and returns None when no record exists"""
+    assert await async_reduction_repo.find_one(ReductionSpecification().by_id(TEST_REDUCTION.id)) == TEST_REDUCTION
+    assert await async_reduction_repo.find_one(ReductionSpecification().by_id(-1)) is None
+
+
+@pytest.mark.asyncio
+async def test_async_repo_find_one_raises_when_non_unique():
+    """Test correct exception raised when multiple runs exist"""
+    with pytest.raises(NonUniqueRecordError):
+        await AsyncRepo[Run]().find_one(RunSpecification().by_instrument("instrument 1"))
+
+
+@pytest.mark.asyncio
+async def test_async_repo_count(async_reduction_repo):
+    """Test the async repo counts"""
+    assert await async_reduction_repo.count(ReductionSpecification().all()) == 3
+    assert await async_reduction_repo.count(ReductionSpecification().by_instrument("instrument 1")) == 2
+
+
+@pytest.mark.asyncio
+async def test_async_repo_loads_declared_relationships(async_reduction_repo):
+    """Test the relationships declared by the specification are loaded, including nested relationships"""
+    result = await async_reduction_repo.find(
+        ReductionSpecification()
+        .by_instrument("instrument 1", order_by="id", order_direction="asc")
+        .with_script()
+        .with_runs()
+    )
+    assert [reduction.script for reduction in result] == [TEST_SCRIPT, TEST_SCRIPT]
+    assert {reduction.id: reduction.runs for reduction in result} == {
+        TEST_REDUCTION.id: [TEST_RUN_2],
+        TEST_REDUCTION_2.id: [TEST_RUN_1],
+    }
+    assert [reduction.runs[0].instrument for reduction in result] == [TEST_INSTRUMENT_1, TEST_INSTRUMENT_1]
+
+
+@pytest.mark.asyncio
+async def test_async_repo_raises_on_undeclared_relationships(async_reduction_repo):
+    """Test relationships that were not declared are not loaded implicitly"""
+    reduction = await async_reduction_repo.find_one(ReductionSpecification().by_id(TEST_REDUCTION.id))
+    with pytest.raises(InvalidRequestError):
+        _ = reduction.runs
+    with pytest.raises(InvalidRequestError):
+        _ = reduction.script
+
+
+@pytest.mark.asyncio
+async def test_async_repo_loads_no_relationships(async_reduction_repo):
+    """Test a relationship declared as none is left empty"""
+    spec = ReductionSpecification()
+    spec.by_id(TEST_REDUCTION.id)
+    reduction = await async_reduction_repo.find_one(spec.load((Reduction.runs, "none")))
+    assert reduction.runs == []
+
+
+@pytest.mark.asyncio
+async def test_async_repo_reads_from_replica_stand_ins_in_turn():
+    """
+    Test the async repo reads from two stand-in replicas in turn once they have been checked, and not from the
+    primary. The stand-ins are the test database reached by two hosts, which is not replicating so is not behind.
+    """
+    stand_ins = [Replica(host, replica_engine(host)) for host in ("localhost:5432", "127.0.0.1:5432")]
+    router = ReplicaRouter(ASYNC_SESSION, stand_ins)
+    await router.check()
+    assert [(replica.healthy, replica.lag) for replica in stand_ins] == [(True, 0.0), (True, 0.0)]
+
+    with patch("ir_api.core.repositories.READ_ROUTER", router):
+        repo = AsyncRepo()
+        for _ in range(4):
+            assert await repo.find_fields(ReductionSpecification().by_id(TEST_REDUCTION.id).project(["id"])) == [
+                {"id": TEST_REDUCTION.id}
+            ]
+
+    assert [replica.sessions for replica in stand_ins] == [2, 2]
+    assert [replica.open_sessions for replica in stand_ins] == [0, 0]
+    assert router.primary_sessions == 0
+
+
+@pytest.mark.asyncio
+async def test_async_repo_reads_from_primary_when_replica_is_lost():
+    """
+    Test the async repo reads from the primary when a replica that passed its last check can no longer be reached
+    """
+    lost = Replica("localhost:1", replica_engine("localhost:1"))
+    lost.healthy, lost.lag = True, 0.0
+    router = ReplicaRouter(ASYNC_SESSION, [lost])
+
+    with patch("ir_api.core.repositories.READ_ROUTER", router):
+        assert await AsyncRepo().find_one(ReductionSpecification().by_id(TEST_REDUCTION.id)) == TEST_REDUCTION
+
+    assert router.primary_sessions == 1
+    assert not lost.healthy
+    await router.check()
+    assert router.available() == []
+
+
+@pytest.mark.asyncio
+async def test_instrumented_pool_records_checkout_wait_and_saturation():
+    """Test the pool records waits for connections when saturated, and reuses the pooled connections"""
+    engine = create_async_engine(
+        ASYNC_ENGINE.url,
+        poolclass=InstrumentedAsyncQueuePool,
+        pool_size=2,
+        max_overflow=0,
+    )
+    pool = engine.pool
+    assert isinstance(pool, InstrumentedAsyncQueuePool)
+    saturation = []
+
+    async def sleep_query() -> None:
+        async with engine.connect() as connection:
+            saturation.append(pool.saturation)
+            await connection.execute(text("SELECT pg_sleep(0.2)"))
+
+    try:
+        await asyncio.gather(*(sleep_query() for _ in range(4)))
+    finally:
+        await engine.dispose()
+
+    assert pool.stats.checkouts == 4
+    assert pool.stats.max_wait >= 0.15  # The last two queries must wait for the first two to finish
+    assert max(saturation) == 1.0
+    assert pool.capacity == 2
+
+
+async def _collect_pages(repo, build_spec, limit):
+    """Follow the next cursors from the first page until there are no more pages"""
+    items = []
+    cursor = None
+    while True:
+        page = await repo.find_page(build_spec(limit=limit, cursor=cursor))
+        items.extend(page.items)
+        if page.next_cursor is None:
+            return items
+        assert len(page.items) == limit
+        cursor = page.next_cursor
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("order_direction", ["asc", "desc"])
+@pytest.mark.parametrize(
+    "order_by",
+    [
+        "reduction_start",
+        "reduction_end",
+        "reduction_state",
+        "id",
+        "reduction_outputs",
+        "run_start",
+        "run_end",
+        "experiment_number",
+        "experiment_title",
+        "filename",
+    ],
+)
+async def test_reductions_by_instrument_cursor_pages_match_unpaginated(async_reduction_repo, order_by, order_direction):
+    """Test following cursors through single reduction pages yields the same reductions as one query"""
+
+    def build_spec(**kwargs):
+        return ReductionSpecification().by_instrument(
+            "instrument 1", order_by=order_by, order_direction=order_direction, **kwargs
+        )
+
+    expected = await async_reduction_repo.find(build_spec())
+    assert await _collect_pages(async_reduction_repo, build_spec, 1) == expected
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("order_direction", ["asc", "desc"])
+@pytest.mark.parametrize(
+    "order_by", ["experiment_number", "run_end", "run_start", "good_frames", "raw_frames", "id", "filename"]
+)
+async def test_runs_by_instrument_cursor_pages_match_unpaginated(order_by, order_direction):
+    """Test following cursors through single run pages yields the same runs as one query"""
+    repo: AsyncRepo[Run] = AsyncRepo()
+
+    def build_spec(**kwargs):
+        return RunSpecification().by_instrument(
+            "instrument 1", order_by=order_by, order_direction=order_direction, **kwargs
+        )
+
+    expected = await repo.find(build_spec())
+    assert len(expected) == 2
+    assert await _collect_pages(repo, build_spec, 1) == expected
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("order_by", ["run_start", "reduction_state", "id"])
+async def test_reduction_fields_cursor_pages_match_entities(async_reduction_repo, order_by):
+    """Test following cursors through pages of projected fields yields the fields of the same reductions in order"""
+
+    def build_spec(**kwargs):
+        return ReductionSpecification().by_instrument("instrument 1", order_by=order_by, **kwargs)
+
+    expected = [
+        {"id": reduction.id, "reduction_state": reduction.reduction_state}
+        for reduction in await async_reduction_repo.find(build_spec())
+    ]
+    items = []
+    cursor = None
+    while True:
+        page = await async_reduction_repo.find_fields_page(
+            build_spec(limit=1, cursor=cursor).project(["id", "reduction_state"])
+        )
+        items.extend(page.items)
+        if page.next_cursor is None:
+            break
+        cursor = page.next_cursor
+    assert items == expected
+
+
+@pytest.mark.asyncio
+async def test_find_fields_outer_joins_script(async_reduction_repo):
+    """Test the projected script is the text of each reduction's script"""
+    result = await async_reduction_repo.find_fields(
+        ReductionSpecification().by_experiment_number(1, order_by="id").project(["script"])
+    )
+    assert result == [{"script": TEST_SCRIPT.script}]
+
+
+@pytest.mark.asyncio
+@patch("ir_api.core.repositories.STREAM_BATCH_SIZE", 1)
+async def test_async_repo_stream_matches_find(async_reduction_repo):
+    """Test streaming in batches of one yields the reductions find does, with the declared relationships loaded"""
+
+    def build_spec():
+        return ReductionSpecification().by_instrument("instrument 1", order_by="id").with_script().with_runs()
+
+    expected = await async_reduction_repo.find(build_spec())
+    result = [reduction async for reduction in async_reduction_repo.stream(build_spec())]
+
+    assert result == expected
+    assert [reduction.runs for reduction in result] == [reduction.runs for reduction in expected]
+    assert [reduction.script for reduction in result] == [TEST_SCRIPT, TEST_SCRIPT]
+
+
+@pytest.mark.asyncio
+@patch("ir_api.core.repositories.STREAM_BATCH_SIZE", 1)
+async def test_async_repo_stream_fields_matches_find_fields(async_reduction_repo):
+    """Test streaming projected fields in batches of one yields the fields find_fields does"""
+
+    def build_spec():
+        return ReductionSpecification().by_instrument("instrument 1", order_by="id").project(["id", "script"])
+
+    expected = await async_reduction_repo.find_fields(build_spec())
+    assert [fields async for fields in async_reduction_repo.stream_fields(build_spec())] == expected
+
+
+@pytest.mark.asyncio
+async def test_async_repo_estimate_count(async_reduction_repo):
+    """Test the estimate is a non negative row estimate from the planner"""
+    estimate = await async_reduction_repo.estimate_count(ReductionSpecification().by_instrument("instrument 1"))
+    assert isinstance(estimate, int)
+    assert estimate >= 0
+
+
+@pytest.fixture()
+def multi_run_reductions():
+    """
+    A reduction of three runs, on the first and third days, and a reduction of one run on the second day, of an
+    instrument of their own. Removed after the test.
+    :return: The reduction of three runs and the reduction of one run
+    """
+    instrument = Instrument(instrument_name="instrument 3")
+    day = datetime.datetime(2023, 1, 1, tzinfo=datetime.UTC)
+    many = Reduction(reduction_state=ReductionState.SUCCESSFUL, reduction_inputs={}, script=TEST_SCRIPT)
+    one = Reduction(reduction_state=ReductionState.SUCCESSFUL, reduction_inputs={}, script=TEST_SCRIPT)
+    for reduction, days in ((many, (0, 0, 2)), (one, (1,))):
+        for offset in days:
+            reduction.runs.append(
+                Run(
+                    filename="multi_run",
+                    experiment_number=4,
+                    title="Multi Run",
+                    users="User1",
+                    run_start=day + datetime.timedelta(days=offset),
+                    run_end=day + datetime.timedelta(days=offset),
+                    good_frames=1,
+                    raw_frames=1,
+                    instrument=instrument,
+                )
+            )
+    with SESSION(expire_on_commit=False) as session:
+        session.add_all([instrument, many, one])
+        session.commit()
+    yield many, one
+    run_ids = [run.id for run in (*many.runs, *one.runs)]
+    with SESSION() as session:
+        session.execute(delete(run_reduction_junction_table).where(run_reduction_junction_table.c.run_id.in_(run_ids)))
+        session.execute(delete(Run).where(Run.id.in_(run_ids)))
+        session.execute(delete(Reduction).where(Reduction.id.in_([many.id, one.id])))
+        session.execute(delete(Instrument).where(Instrument.id == instrument.id))
+        session.commit()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("order_direction", ["asc", "desc"])
+@pytest.mark.parametrize("order_by", ["id", "run_start"])
+async def test_reductions_of_many_runs_are_found_and_counted_once(
+    async_reduction_repo, multi_run_reductions, order_by, order_direction
+):
+    """Test a reduction of several runs of the instrument or experiment is found once, counted once, and paged once"""
+    many, one = multi_run_reductions
+    for build_spec in (
+        partial(ReductionSpecification().by_instrument, "instrument 3"),
+        partial(ReductionSpecification().by_experiment_number, 4),
+    ):
+        result = await async_reduction_repo.find(build_spec(order_by=order_by, order_direction=order_direction))
+        assert sorted(reduction.id for reduction in result) == sorted([many.id, one.id])
+        assert await async_reduction_repo.count(build_spec()) == 2
+
+    def build_paged_spec(**kwargs):
+        return ReductionSpecification().by_instrument(
+            "instrument 3", order_by=order_by, order_direction=order_direction, **kwargs
+        )
+
+    expected = await async_reduction_repo.find(build_paged_spec())
+    assert await _collect_pages(async_reduction_repo, build_paged_spec, 1) == expected
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("order_direction", ["asc", "desc"])
+async def test_reductions_ordered_by_run_field_use_least_or_greatest_run(
+    async_reduction_repo, multi_run_reductions, order_direction
+):
+    """
+    Test reductions are ordered by the earliest of their runs ascending, and the latest descending, so the reduction
+    with runs on the first and third days comes before the reduction with a run on the second day both ways
+    """
+    many, one = multi_run_reductions
+    result = await async_reduction_repo.find(
+        ReductionSpecification().by_instrument("instrument 3", order_by="run_start", order_direction=order_direction)
+    )
+    assert [reduction.id for reduction in result] == [many.id, one.id]
+
+
+@pytest.mark.asyncio
+async def test_reduction_versions_give_etag_of_loaded_reduction(async_reduction_repo, multi_run_reductions):
+    """
+    Test the entity tag from the selected row versions equals that of the reduction loaded with its script and runs,
+    and changes when one of its runs is written
+    """
+    many, _ = multi_run_reductions
+
+    async def etags():
+        spec = ReductionSpecification().by_id(many.id)
+        versions = await async_reduction_repo.find_fields(ReductionSpecification().by_id(many.id).versions())
+        reduction = await async_reduction_repo.find_one(spec.with_script().with_runs())
+        return reduction_etag_from_versions(versions[0]), reduction_etag(reduction)
+
+    from_versions, loaded = await etags()
+    assert from_versions == loaded
+
+    with SESSION() as session:
+        session.execute(text("UPDATE runs SET users = users WHERE id = :id"), {"id": many.runs[-1].id})
+        session.commit()
+    written_from_versions, written_loaded = await etags()
+    assert written_from_versions == written_loaded
+    assert written_from_versions != from_versions
+
+
+@pytest.mark.asyncio
+async def test_write_listener_invalidates_results_of_written_table():
+    """
+    Test the triggers created with the tables notify their writes, and the listener invalidates the results read from
+    the table written
+    """
+    cache: ResultCache = ResultCache(ttl=60)
+    listener = asyncio.create_task(WriteListener(cache, connect, 0.05).run())
+    try:
+        for _ in range(100):
+            if cache.listening:
+                break
+            await asyncio.sleep(0.01)
+        assert cache.notified_tables == {"instruments", "reductions", "runs", "runs_reductions", "scripts"}
+        cache.set("runs", [TEST_RUN_1], RunSpecification().by_id(TEST_RUN_1.id).tables, cache.generation)
+        cache.set("scripts", [TEST_SCRIPT], frozenset({"scripts"}), cache.generation)
+
+        with SESSION() as session:
+            session.execute(text("UPDATE runs SET users = users WHERE id = :id"), {"id": TEST_RUN_1.id})
+            session.commit()
+        for _ in range(100):
+            if cache.stats.invalidations:
+                break
+            await asyncio.sleep(0.01)
+        assert cache.get("runs") is None
+        assert cache.get("scripts") == [TEST_SCRIPT]
+    finally:
+        listener.cancel()
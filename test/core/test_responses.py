@@ -2,10 +2,32 @@
 Test cases for response objects
 """
 
+import asyncio
 import datetime
+import json
+from unittest.mock import Mock
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import NullPool
+from starlette.responses import JSONResponse
 
 from ir_api.core.model import Run, Instrument, Reduction, ReductionState, Script
-from ir_api.core.responses import RunResponse, ReductionResponse, ReductionWithRunsResponse
+from ir_api.core.pool import InstrumentedAsyncQueuePool, CheckoutStats
+from ir_api.core.responses import (
+    RunResponse,
+    ReductionResponse,
+    ReductionWithRunsResponse,
+    PoolResponse,
+    ReplicasResponse,
+    ReplicaResponse,
+    StatementCacheResponse,
+    FastJSONResponse,
+    NDJSONResponse,
+    InstrumentSummaryResponse,
+)
+from ir_api.core.replicas import Replica, ReplicaRouter
+from ir_api.core.statements import StatementCacheStats
 
 RUN = Run(
     filename="filename",
@@ -80,3 +102,247 @@ def test_reduction_with_runs_response_from_reduction():
     assert response.reduction_outputs == REDUCTION.reduction_outputs
     assert response.reduction_status_message == REDUCTION.reduction_status_message
     assert isinstance(response.runs[0], RunResponse)
+
+
+def test_pool_response_from_pool():
+    """
+    Test pool response is built from the pool and its checkout stats
+    :return: None
+    """
+    pool = Mock(spec=InstrumentedAsyncQueuePool)
+    pool.size.return_value = 5
+    pool.capacity = 15
+    pool.checkedout.return_value = 6
+    pool.overflow.return_value = 1
+    pool.saturation = 0.4
+    pool.stats = CheckoutStats(checkouts=4, total_wait=0.2, max_wait=0.1, timeouts=1)
+
+    response = PoolResponse.from_pool(pool)
+
+    assert response == PoolResponse(
+        pooled=True,
+        size=5,
+        capacity=15,
+        checked_out=6,
+        overflow=1,
+        saturation=0.4,
+        checkouts=4,
+        mean_checkout_wait_ms=50.0,
+        max_checkout_wait_ms=100.0,
+        checkout_timeouts=1,
+    )
+
+
+def test_pool_response_from_unpooled_engine():
+    """
+    Test pool response reports no pooling for a NullPool
+    :return: None
+    """
+    assert PoolResponse.from_pool(NullPool(Mock())) == PoolResponse(pooled=False)
+
+
+def test_replicas_response_from_router():
+    """
+    Test replicas response reports each replica's last check and sessions, and the sessions routed to the primary
+    :return: None
+    """
+    current, lagging = Replica("replica-1", Mock()), Replica("replica-2", Mock())
+    current.healthy, current.lag, current.open_sessions, current.sessions = True, 0.5, 2, 40
+    lagging.healthy, lagging.lag = True, 9.0
+    router = ReplicaRouter(Mock(), [current, lagging], selection="least_loaded", max_lag=5)
+    router.primary_sessions = 3
+
+    assert ReplicasResponse.from_router(router) == ReplicasResponse(
+        selection="least_loaded",
+        max_lag_seconds=5,
+        primary_sessions=3,
+        replicas=[
+            ReplicaResponse(
+                name="replica-1", healthy=True, available=True, lag_seconds=0.5, open_sessions=2, sessions=40
+            ),
+            ReplicaResponse(
+                name="replica-2", healthy=True, available=False, lag_seconds=9.0, open_sessions=0, sessions=0
+            ),
+        ],
+    )
+
+
+def test_statement_cache_response_from_recorder():
+    """
+    Test statement cache response reports the recorded totals and the entries of the cache
+    :return: None
+    """
+    recorder = Mock(entries=7, capacity=500, stats=StatementCacheStats(hits=9, misses=3, uncached=2))
+
+    assert StatementCacheResponse.from_recorder(recorder) == StatementCacheResponse(
+        entries=7, capacity=500, hits=9, misses=3, uncached=2, hit_rate=0.75
+    )
+
+
+def test_reduction_fields_from_projection_nests_script():
+    """
+    Test projected reduction fields are shaped as a reduction response, with the script nested
+    """
+    assert ReductionResponse.fields_from_projection({"id": 1, "script": "print('foo')"}) == {
+        "id": 1,
+        "script": {"value": "print('foo')"},
+    }
+    assert ReductionResponse.fields_from_projection({"id": 1, "script": None}) == {"id": 1, "script": None}
+
+
+def test_instrument_summary_response_from_summary():
+    """
+    Test the summary fields of an instrument are shaped with the state counts nested, keyed by state
+    """
+    response = InstrumentSummaryResponse.from_summary(
+        {
+            "instrument_name": "MARI",
+            "run_count": 10,
+            "reduction_count": 6,
+            "successful_count": 3,
+            "unsuccessful_count": 2,
+            "error_count": 1,
+            "not_started_count": 0,
+        }
+    )
+    assert response.model_dump(mode="json") == {
+        "instrument_name": "MARI",
+        "run_count": 10,
+        "reduction_count": 6,
+        "reduction_states": {"SUCCESSFUL": 3, "UNSUCCESSFUL": 2, "ERROR": 1, "NOT_STARTED": 0},
+    }
+
+
+def test_reduction_fields_from_projection_without_script():
+    """
+    Test projected reduction fields without the script are returned as they are
+    """
+    assert ReductionResponse.fields_from_projection({"id": 1, "reduction_state": "SUCCESSFUL"}) == {
+        "id": 1,
+        "reduction_state": "SUCCESSFUL",
+    }
+
+
+UNSTARTED_REDUCTION = Reduction(
+    id=2,
+    reduction_state=ReductionState.NOT_STARTED,
+    reduction_inputs={"title": "caf\u00e9 \u2014 \U0001F52C", "ei": 1.5, "runs": [1, 2], "sum": False},
+    runs=[
+        Run(
+            filename="filename",
+            experiment_number=123456,
+            title="title",
+            users="user 1",
+            run_start=datetime.datetime(2000, 1, 1, 1, 1, 1, 123456),
+            run_end=datetime.datetime(2000, 1, 1, 1, 2, 1, 1),
+            good_frames=1,
+            raw_frames=2,
+            instrument=Instrument(instrument_name="instrument name"),
+        )
+    ],
+)
+
+
+@pytest.mark.parametrize("reduction", [REDUCTION, UNSTARTED_REDUCTION])
+@pytest.mark.parametrize("response_class", [ReductionResponse, ReductionWithRunsResponse])
+def test_fast_json_response_matches_response_model_encoding(reduction, response_class):
+    """
+    Test the fast path encodes the same bytes as FastAPI encoding the response model
+    """
+    expected = JSONResponse(jsonable_encoder([response_class.from_reduction(reduction)])).body
+
+    assert FastJSONResponse([response_class.dict_from_reduction(reduction)]).body == expected
+
+
+def test_fast_json_response_run_matches_response_model_encoding():
+    """
+    Test the fast path encodes runs with the same bytes as FastAPI encoding the response model
+    """
+    expected = JSONResponse(jsonable_encoder([RunResponse.from_run(RUN)])).body
+
+    assert FastJSONResponse([RunResponse.dict_from_run(RUN)]).body == expected
+
+
+def test_fast_json_response_exponent_floats_decode_equal():
+    """
+    Test floats written in exponent notation decode to the same values, orjson writes 1e-7 where json writes 1e-07
+    """
+    content = [{"reduction_inputs": {"small": 1.5e-7, "large": 1e16}}]
+
+    assert json.loads(FastJSONResponse(content).body) == json.loads(JSONResponse(content).body)
+
+
+def test_fast_json_response_falls_back_for_content_orjson_cannot_encode():
+    """
+    Test integers beyond 64 bits, which orjson cannot encode, fall back to the standard encoder
+    """
+    assert (
+        FastJSONResponse([{"reduction_inputs": {"big": 2**70}}]).body
+        == b'[{"reduction_inputs":{"big":1180591620717411303424}}]'
+    )
+
+
+@pytest.mark.asyncio
+async def test_ndjson_response_streams_a_line_per_item():
+    """
+    Test each item is encoded to a line as it is iterated, as FastJSONResponse encodes the items of a list
+    """
+
+    async def items():
+        yield RunResponse.dict_from_run(RUN)
+        yield {"reduction_inputs": {"big": 2**70}}
+
+    response = NDJSONResponse(items())
+    lines = [line async for line in response.body_iterator]
+
+    assert response.media_type == "application/x-ndjson"
+    assert lines == [
+        FastJSONResponse(RunResponse.dict_from_run(RUN)).body + b"\n",
+        b'{"reduction_inputs":{"big":1180591620717411303424}}\n',
+    ]
+
+
+@pytest.mark.asyncio
+async def test_ndjson_response_encodes_with_given_encode():
+    """
+    Test JSON text is passed through as a line when encoded with str.encode
+    """
+
+    async def items():
+        yield '{"id":1}'
+
+    assert [line async for line in NDJSONResponse(items(), str.encode).body_iterator] == [b'{"id":1}\n']
+
+
+@pytest.mark.asyncio
+async def test_ndjson_response_closes_items_when_client_disconnects():
+    """
+    Test the items are closed as soon as the client disconnects part way through the stream, rather than when they are
+    garbage collected
+    """
+    closed = asyncio.Event()
+
+    async def items():
+        try:
+            for index in range(1000):
+                yield {"id": index}
+        finally:
+            closed.set()
+
+    sent = []
+    disconnected = asyncio.Event()
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+        if len(sent) == 3:
+            disconnected.set()
+            await asyncio.sleep(1)
+
+    await NDJSONResponse(items())({"type": "http"}, receive, send)
+
+    assert closed.is_set()
+    assert len(sent) == 3
@@ -0,0 +1,93 @@
+"""
+Tests for the coalescing of concurrent calls
+"""
+
+import asyncio
+
+import pytest
+
+from ir_api.core.single_flight import SingleFlight
+
+
+class Call:
+    """A call that waits to be released, counting the times it is made"""
+
+    def __init__(self, result: object = "result") -> None:
+        self.result = result
+        self.made = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self) -> object:
+        self.made += 1
+        await self.release.wait()
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+async def started(*coroutines):
+    """
+    Start the coroutines as tasks, and let them run until they wait
+    :param coroutines: The coroutines
+    :return: The tasks
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    await asyncio.sleep(0)
+    return tasks
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_for_key_share_one_call():
+    """
+    Test concurrent calls for a key share the result of one call, and calls for another key are made separately
+    :return: None
+    """
+    flight = SingleFlight()
+    mari, let = Call("MARI"), Call("LET")
+    tasks = await started(*(flight.run("MARI", mari) for _ in range(5)), flight.run("LET", let))
+    assert len(flight) == 2
+    mari.release.set()
+    let.release.set()
+
+    assert await asyncio.gather(*tasks) == ["MARI"] * 5 + ["LET"]
+    assert (mari.made, let.made) == (1, 1)
+    assert (flight.calls, flight.coalesced, len(flight)) == (2, 4, 0)
+
+
+@pytest.mark.asyncio
+async def test_exception_raised_to_every_caller_and_next_call_made_again():
+    """
+    Test the exception of the shared call is raised to every caller, and a call once it has completed is made again
+    :return: None
+    """
+    flight = SingleFlight()
+    failing = Call(RuntimeError("Could not get MARI script from remote"))
+    tasks = await started(*(flight.run("MARI", failing) for _ in range(3)))
+    failing.release.set()
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    assert [type(result) for result in results] == [RuntimeError] * 3
+    assert failing.made == 1
+
+    succeeding = Call()
+    succeeding.release.set()
+    assert await flight.run("MARI", succeeding) == "result"
+    assert succeeding.made == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_shared_call():
+    """
+    Test cancelling the caller that made the call leaves it running for the others
+    :return: None
+    """
+    flight = SingleFlight()
+    call = Call()
+    first, second = await started(flight.run("MARI", call), flight.run("MARI", call))
+    first.cancel()
+    await asyncio.sleep(0)
+    call.release.set()
+
+    assert await second == "result"
+    assert first.cancelled()
+    assert call.made == 1
@@ -0,0 +1,52 @@
+"""
+Tests for the instrumentation of the compiled statement cache
+"""
+
+from sqlalchemy import create_engine, literal, select
+
+from ir_api.core.statements import StatementCacheRecorder, StatementCacheStats
+
+
+def test_recorder_counts_hits_misses_and_uncached_statements():
+    """
+    Test a statement is a miss when first compiled and a hit when executed again with other values, and that SQL
+    executed directly on the driver, which is not compiled, is counted apart
+    :return: None
+    """
+    engine = create_engine("sqlite://", query_cache_size=10)
+    recorder = StatementCacheRecorder(engine, capacity=10)
+    with engine.connect() as connection:
+        connection.execute(select(literal(1)))
+        connection.execute(select(literal(2)))
+        connection.execute(select(literal(3)))
+        connection.exec_driver_sql("SELECT 1")
+
+    assert recorder.stats == StatementCacheStats(hits=2, misses=1, uncached=1)
+    assert recorder.entries == 1
+    assert recorder.capacity == 10
+    recorder.reset()
+    assert recorder.stats == StatementCacheStats()
+
+
+def test_recorder_counts_statements_uncached_when_caching_disabled():
+    """
+    Test every statement is uncached when the engine's cache is disabled
+    :return: None
+    """
+    engine = create_engine("sqlite://", query_cache_size=0)
+    recorder = StatementCacheRecorder(engine, capacity=0)
+    with engine.connect() as connection:
+        connection.execute(select(literal(1)))
+        connection.execute(select(literal(1)))
+
+    assert recorder.stats == StatementCacheStats(uncached=2)
+    assert recorder.entries == 0
+
+
+def test_hit_rate():
+    """
+    Test the hit rate is of the cacheable statements, and 0 before any are executed
+    :return: None
+    """
+    assert StatementCacheStats(hits=3, misses=1, uncached=10).hit_rate == 0.75
+    assert StatementCacheStats(uncached=10).hit_rate == 0.0
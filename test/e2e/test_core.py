@@ -5,9 +5,15 @@ end-to-end tests
 # pylint: disable=line-too-long, wrong-import-order
 from unittest.mock import patch
 
+import pytest
+
 from starlette.testclient import TestClient
 
+from ir_api.core.cache import TTLCache
+from ir_api.core.compression import COMPRESSED_CACHE
+from ir_api.core.model import ReductionState
 from ir_api.ir_api import app
+from ir_api.scripts.github import Fetched
 from test.utils import IR_FAKER_PROVIDER
 
 client = TestClient(app)
@@ -70,6 +76,28 @@ def test_get_reduction_by_id_reduction_exists():
 
 
 @patch("ir_api.scripts.acquisition.LOCAL_SCRIPT_DIR", "ir_api/local_scripts")
+def test_get_reductions_batch_matches_reductions_by_id():
+    """
+    Test the batch returns each found reduction once, in the order requested, as /reduction/{id} does, and reports the
+    missing ids
+    :return: None
+    """
+    response = client.post("/reductions/batch", json={"ids": [5001, 123144324234234234, 5000, 5001]})
+    assert response.status_code == 200
+    assert response.json() == {
+        "reductions": [client.get("/reduction/5001").json(), client.get("/reduction/5000").json()],
+        "missing_ids": [123144324234234234],
+    }
+
+
+def test_get_reductions_batch_over_max_size_returns_422():
+    """
+    Test a batch of more than MAX_BATCH_SIZE ids is rejected
+    :return: None
+    """
+    assert client.post("/reductions/batch", json={"ids": list(range(501))}).status_code == 422
+
+
 def test_get_prescript_when_reduction_does_not_exist():
     """
     Test return 404 when requesting pre script from non existant reduction
@@ -248,6 +276,36 @@ def test_reductions_by_instrument_no_reductions():
     assert response.json() == []
 
 
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("/instrument/foo/reductions?format=ndjson", b""),
+        ("/instrument/foo/runs", b"[]"),
+        ("/instrument/foo/reductions/count", b'{"count":0}'),
+        ("/instrument/foo/runs/count?approximate=true", b'{"count":0}'),
+    ],
+)
+def test_unknown_instrument_is_empty(url, expected):
+    """
+    Test an instrument missing from the instrument catalog has no reductions or runs
+    :param url: The url to request
+    :param expected: The expected body
+    :return: None
+    """
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.content == expected
+
+
+def test_unknown_instrument_still_validates_query():
+    """
+    Test invalid fields and cursors are rejected for an instrument missing from the instrument catalog
+    :return: None
+    """
+    assert client.get("/instrument/foo/reductions?fields=id,foo").status_code == 400
+    assert client.get("/instrument/foo/runs?cursor=foo&format=ndjson").status_code == 400
+
+
 def test_reductions_count():
     """
     Test count endpoint for all reductions
@@ -284,6 +342,216 @@ def test_limit_offset_reductions():
     assert response_one.json() != response_two.json()
 
 
+def test_cursor_reductions_match_offset_reductions():
+    """
+    Test following the Next-Cursor header gives the same pages as offsets
+    """
+    first = client.get("/instrument/mari/reductions?limit=4&order_by=run_start")
+    cursor = first.headers["Next-Cursor"]
+    second = client.get(f"/instrument/mari/reductions?limit=4&order_by=run_start&cursor={cursor}")
+    by_offset = client.get("/instrument/mari/reductions?limit=4&offset=4&order_by=run_start")
+
+    assert second.status_code == 200
+    assert second.json() == by_offset.json()
+    assert second.headers["Next-Cursor"] != cursor
+
+
+def test_cursor_runs_match_offset_runs():
+    """
+    Test following the Next-Cursor header for runs gives the same pages as offsets
+    """
+    first = client.get("/instrument/mari/runs?limit=3&order_by=good_frames&order_direction=asc")
+    cursor = first.headers["Next-Cursor"]
+    second = client.get(f"/instrument/mari/runs?limit=3&order_by=good_frames&order_direction=asc&cursor={cursor}")
+    by_offset = client.get("/instrument/mari/runs?limit=3&offset=3&order_by=good_frames&order_direction=asc")
+
+    assert second.json() == by_offset.json()
+
+
+def test_no_next_cursor_for_last_page():
+    """
+    Test there is no Next-Cursor header when there are no further results
+    """
+    response = client.get("/instrument/test/reductions?limit=5")
+    assert len(response.json()) == 1
+    assert "Next-Cursor" not in response.headers
+
+
+def test_invalid_cursor_returns_400():
+    """
+    Test a 400 is returned for a malformed cursor, or a cursor from a different ordering
+    """
+    response = client.get("/instrument/mari/reductions?limit=4&cursor=foo")
+    assert response.status_code == 400
+
+    cursor = client.get("/instrument/mari/reductions?limit=4").headers["Next-Cursor"]
+    response = client.get(f"/instrument/mari/reductions?limit=4&order_by=filename&cursor={cursor}")
+    assert response.status_code == 400
+    assert response.json() == {"message": "The given cursor is invalid, or does not match the requested ordering"}
+
+
+def test_reduction_fields_match_full_reductions():
+    """
+    Test requesting fields returns only those fields, with the same values as the full reductions, and follows the
+    same cursors
+    """
+    full = client.get("/instrument/mari/reductions?limit=4&order_by=run_start")
+    response = client.get("/instrument/mari/reductions?limit=4&order_by=run_start&fields=id,reduction_state,script")
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {"id": r["id"], "reduction_state": r["reduction_state"], "script": r["script"]} for r in full.json()
+    ]
+    assert response.headers["Next-Cursor"] == full.headers["Next-Cursor"]
+
+
+def test_run_fields_match_full_runs():
+    """
+    Test requesting fields of runs returns only those fields
+    """
+    full = client.get("/instrument/mari/runs?limit=3")
+    response = client.get("/instrument/mari/runs?limit=3&fields=filename,instrument_name")
+
+    assert response.json() == [{"filename": r["filename"], "instrument_name": "MARI"} for r in full.json()]
+
+
+def test_experiment_reduction_fields():
+    """
+    Test requesting fields of the reductions of an experiment
+    """
+    response = client.get("/experiment/1820497/reductions?fields=id,reduction_inputs")
+
+    assert response.json() == [
+        {"id": 5001, "reduction_inputs": client.get("/reduction/5001").json()["reduction_inputs"]}
+    ]
+
+
+def test_invalid_fields_returns_400():
+    """
+    Test a 400 is returned for unknown fields, or when runs are included with fields
+    """
+    response = client.get("/instrument/mari/reductions?fields=id,foo")
+    assert response.status_code == 400
+    assert response.json()["message"].startswith("Invalid fields: foo.")
+
+    response = client.get("/instrument/mari/reductions?fields=id&include_runs=true")
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/reduction/5001",
+        "/instrument/mari/reductions?limit=4",
+        "/instrument/mari/reductions?limit=4&include_runs=true",
+        "/instrument/mari/reductions?limit=4&fields=id,reduction_state",
+        "/experiment/1820497/reductions",
+        "/experiment/1820497/reductions?fields=id",
+        "/instrument/mari/runs?limit=3",
+        "/instrument/mari/runs?limit=3&fields=filename",
+    ],
+)
+def test_conditional_request_returns_304_for_current_etag(url):
+    """
+    Test the ETag of a response is given, a request with it in If-None-Match returns 304 with no body and the same
+    ETag and Next-Cursor, and a request with another tag returns the full response
+    :param url: The url to request
+    """
+    response = client.get(url)
+    etag = response.headers["ETag"]
+
+    not_modified = client.get(url, headers={"If-None-Match": f'"stale", {etag}'})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["ETag"] == etag
+    assert not_modified.headers.get("Next-Cursor") == response.headers.get("Next-Cursor")
+
+    modified = client.get(url, headers={"If-None-Match": '"stale"'})
+    assert modified.status_code == 200
+    assert modified.json() == response.json()
+    assert modified.headers["ETag"] == etag
+
+
+def test_list_etags_differ_between_pages():
+    """
+    Test the pages of a list have different ETags, so one page is not taken for another
+    """
+    first = client.get("/instrument/mari/reductions?limit=4&order_by=run_start")
+    cursor = first.headers["Next-Cursor"]
+    second = client.get(f"/instrument/mari/reductions?limit=4&order_by=run_start&cursor={cursor}")
+    assert first.headers["ETag"] != second.headers["ETag"]
+
+
+def test_conditional_request_for_missing_reduction_returns_404():
+    """
+    Test a conditional request for a reduction that does not exist returns 404
+    """
+    response = client.get("/reduction/123144324234234234", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 404
+
+
+@patch("ir_api.router.POSTGRES_JSON_ASSEMBLY", True)
+def test_conditional_request_returns_304_for_postgres_json_assembly():
+    """
+    Test the reductions assembled into JSON by postgres are tagged by their body, and return 304 when current
+    """
+    for url in ("/reduction/5001", "/instrument/mari/reductions?limit=4"):
+        etag = client.get(url).headers["ETag"]
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_reductions_compressed_when_accepted():
+    """
+    Test a reduction listing is compressed with an accepted encoding, and decodes to the same reductions
+    """
+    url = "/instrument/mari/reductions?limit=50"
+    plain = client.get(url, headers={"Accept-Encoding": "identity"})
+    compressed = client.get(url, headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in plain.headers
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.json() == plain.json()
+    assert compressed.headers["ETag"] == f"W/{plain.headers['ETag']}"
+
+
+@patch("ir_api.scripts.acquisition.GITHUB.get", return_value=Fetched(200, "print('science')\n" * 200))
+def test_script_by_sha_compressed_once(_):
+    """
+    Test the compressed script at a sha is reused rather than compressed for every request
+    """
+    COMPRESSED_CACHE.clear()
+    hits = COMPRESSED_CACHE.stats.hits
+    for _ in range(3):
+        response = client.get("/instrument/test/script/sha/abc123", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.json()["value"] == "print('science')\n" * 200
+    assert COMPRESSED_CACHE.stats.hits == hits + 2
+    assert len(COMPRESSED_CACHE) == 1
+
+
+def test_instruments_summary_matches_instrument_counts():
+    """
+    Test the summary of every instrument matches the counts of each instrument's runs and reductions, and of its
+    reductions in each state
+    """
+    with patch("ir_api.core.services.instrument.SUMMARY_CACHE", TTLCache(ttl=10)):
+        summaries = client.get("/instruments/summary").json()
+
+    assert [summary["instrument_name"] for summary in summaries] == sorted(
+        summary["instrument_name"] for summary in summaries
+    )
+    assert len(summaries) >= 2
+    for summary in summaries:
+        instrument = summary["instrument_name"]
+        reductions = client.get(f"/instrument/{instrument}/reductions?fields=id,reduction_state").json()
+        assert summary["run_count"] == client.get(f"/instrument/{instrument}/runs/count").json()["count"]
+        assert summary["reduction_count"] == client.get(f"/instrument/{instrument}/reductions/count").json()["count"]
+        assert summary["reduction_states"] == {
+            state.value: len({r["id"] for r in reductions if r["reduction_state"] == state.value})
+            for state in ReductionState
+        }
+
+
 def test_instrument_reductions_count():
     """
     Test instrument reductions count
@@ -309,6 +577,21 @@ def test_total_runs_count():
     assert response.json()["count"] == 5001
 
 
+def test_approximate_counts():
+    """
+    Test approximate counts are returned for each count endpoint
+    """
+    for url in (
+        "/reductions/count",
+        "/runs/count",
+        "/instrument/MARI/reductions/count",
+        "/instrument/MARI/runs/count",
+    ):
+        response = client.get(f"{url}?approximate=true")
+        assert response.status_code == 200
+        assert response.json()["count"] >= 0
+
+
 def test_get_runs_by_instrument():
     """
     Test getting runs by instrument
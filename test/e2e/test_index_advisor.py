@@ -0,0 +1,27 @@
+"""
+end-to-end tests asserting the indexes declared on the model cover the specification queries, using the index advisor
+"""
+
+# pylint: disable=wrong-import-order
+from utils.index_advisor import advise, build_cases, missing_indexes, sample_values
+
+
+def test_declared_indexes_are_created():
+    """
+    Test every index declared on the model exists in the database created from the model
+    :return: None
+    """
+    assert not missing_indexes()
+
+
+def test_specification_queries_are_covered_by_indexes():
+    """
+    Test no specification query sequentially scans a table, other than those that read every row, when sequential
+    scans are disabled so that any index that can serve the query is used
+    :return: None
+    """
+    reports = advise(build_cases(*sample_values(None)))
+
+    assert len(reports) > 0
+    assert [(report.case.name, report.seq_scans) for report in reports if report.flagged] == []
+    assert all(report.statements for report in reports)
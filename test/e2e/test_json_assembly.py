@@ -0,0 +1,189 @@
+"""
+end-to-end tests comparing the responses of reductions assembled into JSON by postgres with those encoded by the API
+"""
+
+# pylint: disable=wrong-import-order
+from datetime import datetime
+from typing import Iterator
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import delete
+from starlette.testclient import TestClient
+
+from ir_api.core.catalog import INSTRUMENT_CATALOG
+from ir_api.core.model import Instrument, Reduction, ReductionState, Run, Script, run_reduction_junction_table
+from ir_api.core.repositories import SESSION
+from ir_api.ir_api import app
+
+client = TestClient(app)
+
+AWKWARD_EXPERIMENT_NUMBER = 9999999
+
+
+@pytest.fixture(scope="module", autouse=True)
+def awkward_reduction() -> Iterator[None]:
+    """
+    Add a reduction, on its own instrument and experiment, whose fields exercise the encoding: escapes, unicode,
+    separators within strings, nested inputs, microseconds, nulls and more than one run
+    :return: None
+    """
+    instrument = Instrument(instrument_name="JSONTEST")
+    runs = [
+        Run(
+            filename=f"/archive/JSONTEST{index}.nxs",
+            experiment_number=AWKWARD_EXPERIMENT_NUMBER,
+            title='Vanadium "calibration", é 🔬',
+            users="Wood, Guidi\t ",
+            run_start=datetime(2023, 1, 1, 10, 15, 44, 123400),
+            run_end=datetime(2023, 1, 1, 11, 0, 0),
+            good_frames=index,
+            raw_frames=10000,
+            instrument=instrument,
+        )
+        for index in range(3)
+    ]
+    reduction = Reduction(
+        reduction_start=datetime(2023, 1, 1, 12, 0, 0, 1),
+        reduction_end=None,
+        reduction_state=ReductionState.ERROR,
+        reduction_status_message=None,
+        reduction_inputs={
+            "text": 'a, "b": c\\',
+            "unicode": "é 🔬  ",
+            "control": "\x01\n",
+            "nested": [1, 2.5, {"key": None, "flag": True}, []],
+            "float": -6370992.17326865,
+            "": {},
+        },
+        reduction_outputs="['out, put.nxs']",
+        runs=runs,
+    )
+    with SESSION() as session:
+        session.add(reduction)
+        session.add(Reduction(reduction_state=ReductionState.NOT_STARTED, reduction_inputs=[], runs=[runs[0]]))
+        session.add(
+            Reduction(
+                reduction_state=ReductionState.SUCCESSFUL,
+                reduction_inputs={"ei": "'auto'"},
+                script=Script(script="from mantid.simpleapi import *\n\n\tprint('é')", sha=None),
+                runs=[runs[1]],
+            )
+        )
+        session.commit()
+        # The catalog may have been loaded before the instrument was added
+        INSTRUMENT_CATALOG.clear()
+        yield
+        reduction_ids = [reduction_.id for reduction_ in instrument_reductions(session)]
+        session.execute(
+            delete(run_reduction_junction_table).where(run_reduction_junction_table.c.reduction_id.in_(reduction_ids))
+        )
+        session.execute(delete(Reduction).where(Reduction.id.in_(reduction_ids)))
+        session.execute(delete(Run).where(Run.experiment_number == AWKWARD_EXPERIMENT_NUMBER))
+        session.execute(delete(Instrument).where(Instrument.id == instrument.id))
+        session.commit()
+
+
+def instrument_reductions(session):
+    """
+    Find the reductions of the awkward reduction's instrument
+    :param session: The session
+    :return: The reductions
+    """
+    return (
+        session.query(Reduction)
+        .join(run_reduction_junction_table)
+        .join(Run)
+        .where(Run.experiment_number == AWKWARD_EXPERIMENT_NUMBER)
+        .distinct()
+        .all()
+    )
+
+
+def awkward_reduction_id() -> int:
+    """
+    :return: The id of the awkward reduction
+    """
+    with SESSION() as session:
+        return max(
+            reduction.id
+            for reduction in instrument_reductions(session)
+            if reduction.reduction_state == ReductionState.ERROR
+        )
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/instrument/jsontest/reductions",
+        "/instrument/jsontest/reductions?include_runs=true",
+        "/instrument/jsontest/reductions?include_runs=true&order_by=filename&order_direction=asc",
+        "/instrument/jsontest/reductions?include_runs=true&limit=2",
+        "/instrument/mari/reductions?include_runs=true",
+        "/instrument/mari/reductions?include_runs=true&limit=10&offset=5&order_by=reduction_state",
+        "/instrument/tosca/reductions?limit=7&order_by=run_start&order_direction=asc",
+        f"/experiment/{AWKWARD_EXPERIMENT_NUMBER}/reductions",
+        "/experiment/1820497/reductions",
+        "/reduction/5001",
+        "/reduction/1",
+        "/reduction/123144324234",
+    ],
+)
+def test_postgres_json_assembly_matches_api_encoding(url):
+    """
+    Test the responses assembled by postgres are byte for byte those encoded by the API, with the same Next-Cursor
+    :param url: The url to request
+    :return: None
+    """
+    expected = client.get(url)
+    with patch("ir_api.router.POSTGRES_JSON_ASSEMBLY", True):
+        response = client.get(url)
+
+    assert response.status_code == expected.status_code
+    assert response.content == expected.content
+    assert response.headers.get("Next-Cursor") == expected.headers.get("Next-Cursor")
+    assert response.headers["content-type"] == expected.headers["content-type"]
+
+
+def test_postgres_json_assembly_matches_api_encoding_for_awkward_reduction():
+    """
+    Test the reduction by id, whose fields exercise the encoding, is byte for byte that encoded by the API
+    :return: None
+    """
+    url = f"/reduction/{awkward_reduction_id()}"
+    expected = client.get(url)
+    with patch("ir_api.router.POSTGRES_JSON_ASSEMBLY", True):
+        response = client.get(url)
+
+    assert [run["good_frames"] for run in expected.json()["runs"]] == [0, 1, 2]
+    assert response.content == expected.content
+
+
+def follow_cursor(url: str) -> bytes:
+    """
+    Request the url, then each following page by its Next-Cursor
+    :param url: The url of the first page
+    :return: The concatenated bodies of the pages
+    """
+    body = b""
+    next_url = url
+    while next_url:
+        response = client.get(next_url)
+        body += response.content
+        cursor = response.headers.get("Next-Cursor")
+        next_url = f"{url}&cursor={cursor}" if cursor else ""
+    return body
+
+
+def test_postgres_json_assembly_cursor_pages():
+    """
+    Test following the Next-Cursor of reductions assembled by postgres gives the pages encoded by the API
+    :return: None
+    """
+    url = "/instrument/jsontest/reductions?include_runs=true&limit=1&order_by=run_start"
+    expected = follow_cursor(url)
+    with patch("ir_api.router.POSTGRES_JSON_ASSEMBLY", True):
+        body = follow_cursor(url)
+
+    assert expected.count(b'[{"id":') == 3
+    assert body == expected
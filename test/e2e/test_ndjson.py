@@ -0,0 +1,64 @@
+"""
+end-to-end tests for the newline delimited JSON export of the list endpoints
+"""
+
+# pylint: disable=wrong-import-order
+from unittest.mock import patch
+
+import pytest
+from starlette.testclient import TestClient
+
+from ir_api.ir_api import app
+
+client = TestClient(app)
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/instrument/mari/reductions?",
+        "/instrument/mari/reductions?include_runs=true",
+        "/instrument/mari/reductions?fields=id,reduction_state,script",
+        "/instrument/mari/reductions?limit=5&offset=3&order_by=run_start&order_direction=asc",
+        "/instrument/mari/runs?",
+        "/instrument/mari/runs?fields=filename,instrument_name",
+        "/instrument/mari/runs?limit=5&order_by=good_frames",
+    ],
+)
+@pytest.mark.parametrize("postgres_json_assembly", [False, True])
+def test_ndjson_lines_are_the_items_of_the_json_list(url, postgres_json_assembly):
+    """
+    Test streaming in small batches gives a line for each item of the JSON list, encoded identically
+    :param url: The url to request, without the format
+    :param postgres_json_assembly: Whether postgres assembles the reduction JSON
+    :return: None
+    """
+    with patch("ir_api.router.POSTGRES_JSON_ASSEMBLY", postgres_json_assembly):
+        expected = client.get(url)
+        with patch("ir_api.core.repositories.STREAM_BATCH_SIZE", 7):
+            response = client.get(f"{url}&format=ndjson")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "Next-Cursor" not in response.headers
+    assert response.content.endswith(b"\n")
+    lines = response.content.splitlines()
+    assert len(lines) == len(expected.json()) > 0
+    assert b"[" + b",".join(lines) + b"]" == expected.content
+
+
+def test_ndjson_rejects_fields_with_runs():
+    """
+    Test runs cannot be included with fields when streaming, as when listing
+    :return: None
+    """
+    response = client.get("/instrument/mari/reductions?fields=id&include_runs=true&format=ndjson")
+    assert response.status_code == 400
+
+
+def test_unknown_format_is_rejected():
+    """
+    Test a format other than json or ndjson is a validation error
+    :return: None
+    """
+    assert client.get("/instrument/mari/runs?format=csv").status_code == 422
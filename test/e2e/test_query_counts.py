@@ -0,0 +1,317 @@
+"""
+end-to-end tests asserting the number of queries each route makes, to guard against relationships being loaded with
+more queries than the route needs
+"""
+
+# pylint: disable=wrong-import-order
+import asyncio
+from contextlib import contextmanager
+from typing import Iterator, List
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from sqlalchemy import event
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from ir_api.core.catalog import INSTRUMENT_CATALOG
+from ir_api.core.repositories import ASYNC_ENGINE, COUNT_CACHE, RESULT_CACHE, STATEMENT_CACHE
+from ir_api.core.services.instrument import SUMMARY_CACHE
+from ir_api.core.statements import StatementCacheStats
+from ir_api.ir_api import app
+from ir_api.router import ROUTER
+from ir_api.scripts.github import Fetched
+from ir_api.scripts.pre_script import PreScript
+
+client = TestClient(app)
+
+# Route path: [(request url, number of queries), with the instrument catalog loaded. An instrument missing from the
+# catalog is answered without a query]
+EXPECTED_QUERY_COUNTS = {
+    "/healthz": [("/healthz", 0)],
+    "/metrics/pool": [("/metrics/pool", 0)],
+    "/metrics/cache": [("/metrics/cache", 0)],
+    "/metrics/statements": [("/metrics/statements", 0)],
+    "/metrics/replicas": [("/metrics/replicas", 0)],
+    # The runs and reductions of every instrument are counted in one grouped query
+    "/instruments/summary": [("/instruments/summary", 1)],
+    "/instrument/{instrument}/script": [("/instrument/test/script", 0), ("/instrument/test/script?reduction_id=1", 1)],
+    "/instrument/{instrument}/script/sha/{sha}": [
+        ("/instrument/test/script/sha/abc123", 0),
+        ("/instrument/test/script/sha/abc123?reduction_id=1", 1),
+    ],
+    "/instrument/{instrument}/reductions": [
+        # The script is joined
+        ("/instrument/mari/reductions?limit=10", 1),
+        # The runs, with their instrument joined, are selected in one further query
+        ("/instrument/mari/reductions?limit=10&include_runs=true", 2),
+        ("/instrument/mari/reductions?limit=10&fields=id,reduction_state,script", 1),
+        # Streamed from a server-side cursor, the runs are selected once per batch of STREAM_BATCH_SIZE reductions
+        ("/instrument/mari/reductions?format=ndjson", 1),
+        ("/instrument/mari/reductions?format=ndjson&include_runs=true", 2),
+        ("/instrument/nope/reductions?limit=10", 0),
+        ("/instrument/nope/reductions?format=ndjson", 0),
+    ],
+    "/instrument/{instrument}/reductions/count": [
+        ("/instrument/mari/reductions/count", 1),
+        ("/instrument/mari/reductions/count?approximate=true", 1),
+        ("/instrument/nope/reductions/count", 0),
+    ],
+    "/reduction/{reduction_id}": [("/reduction/5001", 2)],
+    "/experiment/{experiment_number}/reductions": [
+        ("/experiment/1820497/reductions", 1),
+        ("/experiment/1820497/reductions?fields=id", 1),
+    ],
+    "/reductions/count": [("/reductions/count", 1)],
+    "/runs/count": [("/runs/count", 1)],
+    "/instrument/{instrument}/runs/count": [
+        ("/instrument/mari/runs/count", 1),
+        ("/instrument/nope/runs/count", 0),
+    ],
+    # The instrument is joined to load its name
+    "/instrument/{instrument}/runs": [
+        ("/instrument/mari/runs?limit=10", 1),
+        ("/instrument/nope/runs?limit=10", 0),
+        ("/instrument/mari/runs?limit=10&fields=filename,instrument_name", 1),
+        ("/instrument/mari/runs?format=ndjson", 1),
+    ],
+}
+
+# Route path: [(request url, json body, number of queries)] for the POST routes
+EXPECTED_POST_QUERY_COUNTS = {
+    # The script is joined, and the runs of up to MAX_BATCH_SIZE reductions are selected in one further query
+    "/reductions/batch": [
+        ("/reductions/batch", {"ids": list(range(1, 501))}, 2),
+        ("/reductions/batch", {"ids": [5001, 999999]}, 2),
+        ("/reductions/batch", {"ids": []}, 0),
+    ],
+}
+
+# Reductions assembled into JSON by postgres, with the script joined and the runs selected by a correlated subquery
+EXPECTED_JSON_ASSEMBLY_QUERY_COUNTS = [
+    ("/instrument/mari/reductions?limit=10", 1),
+    ("/instrument/mari/reductions?limit=10&include_runs=true", 1),
+    ("/instrument/mari/reductions?format=ndjson&include_runs=true", 1),
+    ("/reduction/5001", 1),
+    ("/experiment/1820497/reductions", 1),
+]
+
+
+# Conditional requests with a current ETag, answered 304. A reduction's ETag is checked by selecting only the row
+# versions of it, its script and its runs. A script at a sha is not fetched, and only the reduction it is transformed
+# for is read.
+EXPECTED_NOT_MODIFIED_QUERY_COUNTS = [
+    ("/reduction/5001", 1),
+    ("/instrument/test/script/sha/abc123", 0),
+    ("/instrument/test/script/sha/abc123?reduction_id=1", 1),
+    ("/instrument/mari/reductions?limit=10", 1),
+    ("/instrument/mari/runs?limit=10", 1),
+]
+
+# Pairs of requests of the same shape with different values, whose statements differ only in their bound parameters,
+# so the second request's statements are compiled by the first
+EXPECTED_SHARED_STATEMENTS = [
+    ("/instrument/mari/reductions?limit=10&offset=10", "/instrument/let/reductions?limit=20&offset=5"),
+    ("/instrument/mari/reductions?limit=10&include_runs=true", "/instrument/let/reductions?limit=3&include_runs=true"),
+    ("/instrument/mari/reductions?fields=reduction_state,id", "/instrument/let/reductions?fields=id,reduction_state"),
+    ("/instrument/mari/runs?limit=10&order_by=run_start", "/instrument/let/runs?limit=5&order_by=run_start"),
+    ("/reduction/5001", "/reduction/5000"),
+    ("/experiment/1820497/reductions", "/experiment/1820498/reductions"),
+    ("/instrument/mari/reductions/count", "/instrument/let/reductions/count"),
+]
+
+# Request url: number of statements executed on the driver without being compiled. An estimated count EXPLAINs its
+# query rendered with literal values, as EXPLAIN cannot take bound parameters
+EXPECTED_UNCOMPILED_STATEMENTS = {"/instrument/mari/reductions/count?approximate=true": 1}
+
+
+@contextmanager
+def count_queries() -> Iterator[List[str]]:
+    """
+    Record the statements executed against the database within the context
+    :return: The list the statements are recorded to
+    """
+    statements: List[str] = []
+
+    def record(_conn, _cursor, statement, *_args) -> None:
+        statements.append(statement)
+
+    event.listen(ASYNC_ENGINE.sync_engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(ASYNC_ENGINE.sync_engine, "before_cursor_execute", record)
+
+
+def test_every_route_has_expected_query_counts():
+    """
+    Test every route of the router has its query counts asserted
+    :return: None
+    """
+    assert {route.path for route in ROUTER.routes if isinstance(route, Route)} == set(EXPECTED_QUERY_COUNTS) | set(
+        EXPECTED_POST_QUERY_COUNTS
+    )
+
+
+@pytest.mark.parametrize(
+    "url, expected_queries",
+    [request for requests in EXPECTED_QUERY_COUNTS.values() for request in requests],
+)
+@patch("ir_api.scripts.acquisition.GITHUB.get", return_value=Fetched(200, "print('science')\n"))
+@patch(
+    "ir_api.scripts.acquisition.get_by_instrument_name",
+    new_callable=AsyncMock,
+    return_value=PreScript(value="print('science')\n"),
+)
+def test_route_query_count(_, __, url, expected_queries):
+    """
+    Test the route makes the expected number of queries
+    :param url: The url to request
+    :param expected_queries: The number of queries
+    :return: None
+    """
+    COUNT_CACHE.clear()
+    SUMMARY_CACHE.clear()
+    asyncio.run(INSTRUMENT_CATALOG.refresh())
+    with count_queries() as statements:
+        response = client.get(url)
+
+    assert response.status_code == 200
+    assert len(statements) == expected_queries, "\n\n".join(statements)
+
+
+@pytest.mark.parametrize(
+    "url, body, expected_queries",
+    [request for requests in EXPECTED_POST_QUERY_COUNTS.values() for request in requests],
+)
+def test_post_route_query_count(url, body, expected_queries):
+    """
+    Test the POST route makes the expected number of queries
+    :param url: The url to post to
+    :param body: The json body
+    :param expected_queries: The number of queries
+    :return: None
+    """
+    with count_queries() as statements:
+        response = client.post(url, json=body)
+
+    assert response.status_code == 200
+    assert len(statements) == expected_queries, "\n\n".join(statements)
+
+
+@pytest.mark.parametrize("url, expected_queries", EXPECTED_NOT_MODIFIED_QUERY_COUNTS)
+@patch("ir_api.scripts.acquisition.GITHUB.get", return_value=Fetched(200, "print('science')\n"))
+def test_not_modified_query_count(mock_get, url, expected_queries):
+    """
+    Test a conditional request with the current ETag makes the expected number of queries, and fetches no script
+    :param mock_get: The mocked GitHub request
+    :param url: The url to request
+    :param expected_queries: The number of queries
+    :return: None
+    """
+    asyncio.run(INSTRUMENT_CATALOG.refresh())
+    etag = client.get(url).headers["ETag"]
+    mock_get.reset_mock()
+    with count_queries() as statements:
+        response = client.get(url, headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert len(statements) == expected_queries, "\n\n".join(statements)
+    mock_get.assert_not_called()
+
+
+def test_unloaded_instrument_catalog_is_loaded_once():
+    """
+    Test the first request for an instrument loads the instrument catalog, and later requests do not
+    :return: None
+    """
+    INSTRUMENT_CATALOG.clear()
+    with count_queries() as statements:
+        client.get("/instrument/mari/runs?limit=10")
+        client.get("/instrument/mari/runs?limit=10")
+    assert len(statements) == 3, "\n\n".join(statements)
+
+
+@pytest.mark.parametrize("url, expected_queries", EXPECTED_JSON_ASSEMBLY_QUERY_COUNTS)
+@patch("ir_api.router.POSTGRES_JSON_ASSEMBLY", True)
+def test_route_query_count_postgres_json_assembly(url, expected_queries):
+    """
+    Test the route makes the expected number of queries when postgres assembles the JSON
+    :param url: The url to request
+    :param expected_queries: The number of queries
+    :return: None
+    """
+    asyncio.run(INSTRUMENT_CATALOG.refresh())
+    with count_queries() as statements:
+        response = client.get(url)
+
+    assert response.status_code == 200
+    assert len(statements) == expected_queries, "\n\n".join(statements)
+
+
+@contextmanager
+def record_statement_cache() -> Iterator[StatementCacheStats]:
+    """
+    Record the use of the compiled statement cache within the context
+    :return: The stats the use is recorded to, filled in when the context exits
+    """
+    recorded = StatementCacheStats()
+    before = STATEMENT_CACHE.stats
+    STATEMENT_CACHE.reset()
+    try:
+        yield recorded
+    finally:
+        during = STATEMENT_CACHE.stats
+        recorded.hits, recorded.misses, recorded.uncached = during.hits, during.misses, during.uncached
+        STATEMENT_CACHE.stats = StatementCacheStats(
+            before.hits + during.hits, before.misses + during.misses, before.uncached + during.uncached
+        )
+
+
+@pytest.mark.parametrize(
+    "url, expected_queries",
+    [request for requests in EXPECTED_QUERY_COUNTS.values() for request in requests],
+)
+@patch("ir_api.scripts.acquisition.GITHUB.get", return_value=Fetched(200, "print('science')\n"))
+@patch(
+    "ir_api.scripts.acquisition.get_by_instrument_name",
+    new_callable=AsyncMock,
+    return_value=PreScript(value="print('science')\n"),
+)
+def test_route_statements_hit_compiled_cache(_, __, url, expected_queries):
+    """
+    Test every compiled statement of a repeated request is found in the compiled statement cache
+    :param url: The url to request
+    :param expected_queries: The number of queries
+    :return: None
+    """
+    asyncio.run(INSTRUMENT_CATALOG.refresh())
+    client.get(url)
+    COUNT_CACHE.clear()
+    SUMMARY_CACHE.clear()
+    RESULT_CACHE.clear()
+    with record_statement_cache() as stats:
+        response = client.get(url)
+
+    assert response.status_code == 200
+    uncompiled = EXPECTED_UNCOMPILED_STATEMENTS.get(url, 0)
+    assert stats == StatementCacheStats(hits=expected_queries - uncompiled, uncached=uncompiled)
+
+
+@pytest.mark.parametrize("first_url, second_url", EXPECTED_SHARED_STATEMENTS)
+def test_requests_differing_in_values_share_compiled_statements(first_url, second_url):
+    """
+    Test a request of the same shape as an earlier request, with different values, compiles no statements
+    :param first_url: The earlier request
+    :param second_url: The request with different values
+    :return: None
+    """
+    asyncio.run(INSTRUMENT_CATALOG.refresh())
+    client.get(first_url)
+    with record_statement_cache() as stats:
+        response = client.get(second_url)
+
+    assert response.status_code == 200
+    assert stats.misses == 0
+    assert stats.uncached == 0
+    assert stats.hits > 0
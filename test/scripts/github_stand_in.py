@@ -0,0 +1,120 @@
+"""
+A local stand-in for GitHub's raw file and API hosts, serving files by path with validators, and answering conditional
+requests for unchanged files with 304
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+class GitHubStandIn:
+    """
+    Serves the files set on it, with an ETag and Last-Modified for each unless etags is False, in which case only
+    Last-Modified is sent. Each response is sent delay seconds after its request, over a connection kept alive, and its
+    path and status are recorded, as is the client address of each connection.
+    """
+
+    def __init__(self, etags: bool = True, delay: float = 0.0) -> None:
+        self.etags = etags
+        self.delay = delay
+        self.responses: List[Tuple[str, int]] = []
+        self.connections: Set[Tuple[str, int]] = set()
+        self._files: Dict[str, Tuple[bytes, str]] = {}
+        self._versions = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+
+    @property
+    def url(self) -> str:
+        """
+        :return: The base URL of the stand-in
+        """
+        host, port = self._server.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    def set(self, path: str, text: str) -> None:
+        """
+        Serve the text at the path, last modified at a time later than any file set before
+        :param path: The path
+        :param text: The text
+        :return: None
+        """
+        self._versions += 1
+        self._files[path] = (text.encode(), formatdate(1_700_000_000 + self._versions, usegmt=True))
+
+    def file(self, path: str) -> Optional[Tuple[bytes, str]]:
+        """
+        :param path: The path
+        :return: The body and Last-Modified of the file at the path, None when there is none
+        """
+        return self._files.get(path)
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        """
+        :return: The request handler class, serving the stand-in's files
+        """
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Answers a GET for a file, conditionally when asked to"""
+
+            protocol_version = "HTTP/1.1"
+            # The headers and body are written separately, so are not held back for an acknowledgement
+            disable_nagle_algorithm = True
+
+            def do_GET(self) -> None:  # pylint: disable = invalid-name
+                """
+                Answer with the file, 304 when it matches the validators sent, or 404
+                :return: None
+                """
+                stand_in.connections.add(self.client_address[:2])
+                time.sleep(stand_in.delay)
+                file = stand_in.file(self.path)
+                if file is None:
+                    self._respond(404, {}, b"404: Not Found")
+                    return
+                body, last_modified = file
+                headers = {"Last-Modified": last_modified}
+                if stand_in.etags:
+                    headers["ETag"] = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+                if_none_match = self.headers.get("If-None-Match")
+                if (if_none_match is not None and if_none_match == headers.get("ETag")) or (
+                    if_none_match is None and self.headers.get("If-Modified-Since") == last_modified
+                ):
+                    self._respond(304, headers, b"")
+                    return
+                self._respond(200, headers, body)
+
+            def _respond(self, status: int, headers: Dict[str, str], body: bytes) -> None:
+                """
+                Send and record a response
+                :param status: The status
+                :param headers: The headers
+                :param body: The body
+                :return: None
+                """
+                stand_in.responses.append((self.path, status))
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:  # pylint: disable = redefined-builtin
+                """Do not log every request"""
+
+        return Handler
+
+    def __enter__(self) -> GitHubStandIn:
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -3,8 +3,9 @@ Tests for script acquisition
 """
 
 import os
-from unittest.mock import Mock, patch, mock_open, MagicMock
+from unittest.mock import Mock, patch, mock_open, MagicMock, AsyncMock
 
+import httpx
 import pytest
 
 from ir_api.core.exceptions import (
@@ -19,8 +20,13 @@ from ir_api.scripts.acquisition import (
     get_by_instrument_name,
     get_script_for_reduction,
     _get_latest_commit_sha,
+    get_script_etag_by_sha,
+    get_script_by_sha,
 )
+from ir_api.core.etags import script_etag
+from ir_api.scripts.github import Fetched
 from ir_api.scripts.pre_script import PreScript
+from ir_api.scripts.script_cache import ScriptCache
 
 # pylint: disable = redefined-outer-name
 INSTRUMENT = "instrument_1"
@@ -32,86 +38,87 @@ def mock_response():
     Response pytest fixture
     :return:
     """
-    response = Mock()
-    response.status_code = 200
-    response.text = "test script content"
-    return response
+    return Fetched(200, "test script content")
 
 
-@patch("requests.get")
+@pytest.mark.asyncio
+@patch("ir_api.scripts.acquisition.GITHUB.get")
 @patch("ir_api.scripts.acquisition._get_latest_commit_sha")
-def test_sha_env_set_when_sha_present(mock_sha, mock_get, mock_response):
+async def test_sha_env_set_when_sha_present(mock_sha, mock_get, mock_response):
     """Test that environment variable is set when sha is not None."""
     mock_sha.return_value = "valid_sha"
     mock_get.return_value = mock_response
 
-    _get_script_from_remote(INSTRUMENT)
+    await _get_script_from_remote(INSTRUMENT)
 
     assert os.environ["sha"] == "valid_sha"
 
 
-@patch("requests.get")
+@pytest.mark.asyncio
+@patch("ir_api.scripts.acquisition.GITHUB.get")
 @patch("ir_api.scripts.acquisition.os.environ.__setitem__")
 @patch("ir_api.scripts.acquisition._get_latest_commit_sha")
-def test_sha_env_not_set_when_sha_none(mock_sha, mock_setitem, mock_get, mock_response):
+async def test_sha_env_not_set_when_sha_none(mock_sha, mock_setitem, mock_get, mock_response):
     """Test that environment variable is not set when sha is None."""
     mock_sha.return_value = None
     mock_get.return_value = mock_response
 
-    _get_script_from_remote(INSTRUMENT)
+    await _get_script_from_remote(INSTRUMENT)
 
     mock_setitem.assert_not_called()
 
 
-@patch("requests.get")
+@pytest.mark.asyncio
+@patch("ir_api.scripts.acquisition.GITHUB.get")
 @patch("ir_api.scripts.acquisition._get_latest_commit_sha")
-def test_prescript_sha_assigned_correctly(mock_sha, mock_get, mock_response):
+async def test_prescript_sha_assigned_correctly(mock_sha, mock_get, mock_response):
     """Test that the sha attribute of the PreScript object is assigned the correct value."""
     mock_sha.return_value = "valid_sha"
     mock_get.return_value = mock_response
 
-    result = _get_script_from_remote(INSTRUMENT)
+    result = await _get_script_from_remote(INSTRUMENT)
     assert result.sha == "valid_sha"
 
 
-@patch("requests.get")
-def test__get_script_from_remote(mock_get, mock_response):
+@pytest.mark.asyncio
+@patch("ir_api.scripts.acquisition._get_latest_commit_sha", return_value=None)
+@patch("ir_api.scripts.acquisition.GITHUB.get")
+async def test__get_script_from_remote(mock_get, _, mock_response):
     """
     Test script is created from remote request
-    :param mock_get: mock - request.get mock
-    :param mock_response: mock - the mocked response object
+    :param mock_get: mock - GitHub get mock
+    :param mock_response: the response
     :return: None
     """
     mock_get.return_value = mock_response
 
-    result = _get_script_from_remote(INSTRUMENT)
+    result = await _get_script_from_remote(INSTRUMENT)
     assert result.value == "test script content"
     assert result.is_latest
+    mock_get.assert_called_once_with(
+        "https://raw.githubusercontent.com/interactivereduction/autoreduction-scripts/main/INSTRUMENT_1/reduce.py"
+    )
 
 
-@patch("requests.get")
-def test__get_script_from_remote_failure(mock_get, mock_response):
+@pytest.mark.asyncio
+@patch("ir_api.scripts.acquisition.GITHUB.get", return_value=Fetched(404, "404: Not Found"))
+async def test__get_script_from_remote_failure(_):
     """Test Runtime Error is raised when remote acquisition fails"""
-    mock_response.status_code = 404
-    mock_get.return_value = mock_response
-
     with pytest.raises(RuntimeError):
-        _get_script_from_remote(INSTRUMENT)
+        await _get_script_from_remote(INSTRUMENT)
 
 
-@patch("requests.get")
-def test__get_script_from_remote_connection_error(mock_get, caplog):
+@pytest.mark.asyncio
+@patch("ir_api.scripts.acquisition.GITHUB.get", side_effect=httpx.ConnectError("Connection refused"))
+async def test__get_script_from_remote_connection_error(_, caplog):
     """
-    Test exception is logged, then reraised when remote is not reachable
-    :param mock_get: mock - the mock request.get
+    Test the failure is logged, and raised as a RuntimeError, when remote is not reachable
     :param caplog: the pytest log capture object
     :return: None
     """
-    mock_get.side_effect = ConnectionError
-
-    with pytest.raises(ConnectionError):
-        _get_script_from_remote(INSTRUMENT)
-        assert "Could not get instrument_1 script from remote" in caplog.text
+    with pytest.raises(RuntimeError):
+        await _get_script_from_remote(INSTRUMENT)
+    assert "Could not get instrument_1 script from remote" in caplog.text
 
 
 @patch("builtins.open", new_callable=mock_open, read_data="test script content")
@@ -151,36 +158,61 @@ def test_write_script_locally(mock_file):
     mock_file().writelines.assert_called_once_with("test script content")
 
 
+@pytest.mark.asyncio
 @patch("ir_api.scripts.acquisition._get_script_from_remote")
 @patch("ir_api.scripts.acquisition._get_script_locally")
-def test_get_by_instrument_name_remote_(mock_get_local, mock_get_remote):
+async def test_get_by_instrument_name_remote_(mock_get_local, mock_get_remote):
     """
     test will not get locally when script retrieved from remote
     :param mock_get_local: mock - mocked get local
     :param mock_get_remote: mock - mocked get remote
     :return: None
     """
-    get_by_instrument_name(INSTRUMENT)
+    await get_by_instrument_name(INSTRUMENT)
     mock_get_remote.assert_called_once()
     mock_get_local.assert_not_called()
 
 
+@pytest.mark.asyncio
 @patch("ir_api.scripts.acquisition._get_script_from_remote", side_effect=RuntimeError)
 @patch("ir_api.scripts.acquisition._get_script_locally")
-def test_get_by_instrument_name_local(mock_local, mock_remote):
+async def test_get_by_instrument_name_local(mock_local, mock_remote):
     """
     Test will attempt to get script locally when remote fails
     :param mock_local: mock - mock get local
     :param mock_remote: mock - mock get remote
     :return: None
     """
-    get_by_instrument_name(INSTRUMENT)
+    await get_by_instrument_name(INSTRUMENT)
     mock_remote.assert_called_once()
     mock_local.assert_called_once()
 
 
-@patch("ir_api.scripts.acquisition.get_by_instrument_name")
-def test_get_script_for_reduction_no_reduction_id(mock_get_by_name):
+@pytest.mark.asyncio
+@patch("ir_api.scripts.acquisition.SCRIPT_CACHE", ScriptCache(ttl=60))
+@patch("ir_api.scripts.acquisition._get_latest_commit_sha", return_value="valid_sha")
+@patch("ir_api.scripts.acquisition.GITHUB.get")
+async def test_get_by_instrument_name_cached_script_served_without_requests(mock_get, mock_sha, mock_response):
+    """
+    Test the latest script is fetched once, then served from the script cache with the sha it was fetched with
+    :param mock_get: mock - GitHub get mock
+    :param mock_sha: mock - mocked get latest commit sha
+    :param mock_response: mock - the mocked response object
+    :return: None
+    """
+    mock_get.return_value = mock_response
+    scripts = [await get_by_instrument_name(INSTRUMENT) for _ in range(3)]
+
+    mock_get.assert_called_once()
+    mock_sha.assert_called_once()
+    assert [(script.value, script.sha, script.is_latest) for script in scripts] == [
+        ("test script content", "valid_sha", True)
+    ] * 3
+
+
+@pytest.mark.asyncio
+@patch("ir_api.scripts.acquisition.get_by_instrument_name", new_callable=AsyncMock)
+async def test_get_script_for_reduction_no_reduction_id(mock_get_by_name):
     """
     Test base script returned when no id provided
     :param mock_get_by_name: Mock
@@ -188,15 +220,16 @@ def test_get_script_for_reduction_no_reduction_id(mock_get_by_name):
     """
     expected_script = PreScript(value="some script")
     mock_get_by_name.return_value = expected_script
-    result = get_script_for_reduction("some instrument")
+    result = await get_script_for_reduction("some instrument")
 
     assert result == expected_script
 
 
+@pytest.mark.asyncio
 @patch("ir_api.scripts.acquisition.get_transform_for_instrument")
-@patch("ir_api.scripts.acquisition.Repo")
-@patch("ir_api.scripts.acquisition.get_by_instrument_name")
-def test_get_script_for_reduction_with_valid_reduction_id(mock_get_by_name, mock_repo, mock_get_transform):
+@patch("ir_api.scripts.acquisition.AsyncRepo")
+@patch("ir_api.scripts.acquisition.get_by_instrument_name", new_callable=AsyncMock)
+async def test_get_script_for_reduction_with_valid_reduction_id(mock_get_by_name, mock_repo, mock_get_transform):
     """
     Test transform applied to obtained script when reduction id provided
     :param mock_get_by_name: Mock
@@ -207,10 +240,10 @@ def test_get_script_for_reduction_with_valid_reduction_id(mock_get_by_name, mock
     mock_reduction = MagicMock()
     mock_transform = Mock()
     mock_get_transform.return_value = mock_transform
-    mock_repo.return_value.find_one.return_value = mock_reduction
+    mock_repo.return_value.find_one = AsyncMock(return_value=mock_reduction)
     expected_script = PreScript("some script")
     mock_get_by_name.return_value = expected_script
-    result = get_script_for_reduction("some instrument", 1)
+    result = await get_script_for_reduction("some instrument", 1)
     mock_get_by_name.assert_called_once_with("some instrument")
     mock_get_transform.assert_called_once_with("some instrument")
     mock_transform.apply.assert_called_once_with(expected_script, mock_reduction)
@@ -218,62 +251,119 @@ def test_get_script_for_reduction_with_valid_reduction_id(mock_get_by_name, mock
     assert result == expected_script
 
 
-@patch("ir_api.scripts.acquisition.Repo")
-@patch("ir_api.scripts.acquisition.get_by_instrument_name", return_value="some instrument")
-def test_get_script_for_reduction_with_invalid_reduction_id(_, mock_repo):
+@pytest.mark.asyncio
+@patch("ir_api.scripts.acquisition.AsyncRepo")
+@patch("ir_api.scripts.acquisition.get_by_instrument_name", new_callable=AsyncMock, return_value="some instrument")
+async def test_get_script_for_reduction_with_invalid_reduction_id(_, mock_repo):
     """
     Test exception raised when reduction id is given but no reduction exists
     :param _: Mock
     :param mock_repo: Mock
     :return: None
     """
-    mock_repo.return_value.find_one.return_value = None
+    mock_repo.return_value.find_one = AsyncMock(return_value=None)
     instrument = "some_instrument"
     reduction_id = -1
 
     with pytest.raises(MissingRecordError) as excinfo:
-        get_script_for_reduction(instrument, reduction_id)
+        await get_script_for_reduction(instrument, reduction_id)
 
     assert f"No reduction found with id: {reduction_id}" in str(excinfo.value)
 
 
-@patch("ir_api.scripts.acquisition.requests.get")
-def test_get_latest_commit_sha_ok(mock_get):
+@pytest.mark.asyncio
+@patch("ir_api.scripts.acquisition.get_transform_for_instrument")
+@patch("ir_api.scripts.acquisition.AsyncRepo")
+@patch("ir_api.scripts.acquisition.GITHUB.get", new_callable=AsyncMock, return_value=Fetched(200, "some script"))
+async def test_transformed_script_etag_matches_etag_by_sha(_, mock_repo, __):
     """
-    Test sha is returned when ok
-    :param mock_get: mocked get request
+    Test the etag of a script fetched at its sha and transformed for a reduction is computed from its sha and the
+    reduction's inputs, and equals the etag by sha, which is computed without fetching the script
+    :param mock_repo: Mock
     :return: None
     """
-    mock_response = Mock()
-    mock_response.json.return_value = {"sha": "abcd1234"}
-    mock_get.return_value = mock_response
+    reduction = MagicMock(id=1, reduction_inputs={"runno": 1})
+    mock_repo.return_value.find_one = AsyncMock(return_value=reduction)
+    script = await get_script_by_sha("mari", "abc", 1)
 
-    assert _get_latest_commit_sha() == "abcd1234"
+    assert script.etag("mari") == script_etag("mari", "abc", False, "github", reduction)
+    assert script.etag("mari") == await get_script_etag_by_sha("mari", "abc", 1)
+    assert (await get_script_by_sha("mari", "abc")).etag("mari") == await get_script_etag_by_sha("mari", "abc")
 
 
-@patch("ir_api.scripts.acquisition.requests.get")
-def test_get_latest_commit_sha_not_ok(mock_get):
+@pytest.mark.asyncio
+@patch("ir_api.scripts.acquisition.get_transform_for_instrument")
+@patch("ir_api.scripts.acquisition.AsyncRepo")
+@patch("ir_api.scripts.acquisition.get_by_instrument_name", new_callable=AsyncMock)
+async def test_latest_script_etag_changes_with_body_at_same_sha(mock_get_by_name, mock_repo, _):
     """
-    Test None is returned for non-ok get
-    :param mock_get: mocked get request
+    Test the etag of the latest script, which is fetched from main alongside the sha, changes with its body, so a
+    client's copy of another body fetched with the same sha is not taken as current
+    :param mock_get_by_name: Mock
+    :param mock_repo: Mock
     :return: None
     """
-    mock_response = Mock()
-    mock_response.ok = False
-    mock_get.return_value = mock_response
+    mock_repo.return_value.find_one = AsyncMock(return_value=MagicMock(id=1, reduction_inputs={"runno": 1}))
+    etags = []
+    for body in ("older script", "newer script"):
+        mock_get_by_name.return_value = PreScript(body, is_latest=True, sha="abc")
+        etags.append((await get_script_for_reduction("mari", 1)).etag("mari"))
+    assert etags[0] != etags[1]
+    assert etags[1] != await get_script_etag_by_sha("mari", "abc", 1)
 
-    assert _get_latest_commit_sha() is None
+
+def test_script_without_sha_has_no_etag():
+    """
+    Test a script of unknown sha, read locally, has no etag
+    :return: None
+    """
+    assert PreScript("some script").etag("mari") is None
+
+
+@patch("builtins.open", new_callable=mock_open, read_data="local script")
+@pytest.mark.asyncio
+async def test_local_script_etag_differs_from_etag_by_sha(_, monkeypatch):
+    """
+    Test the local copy of a script, read with the sha of the last fetch, is not tagged as the script at that sha
+    :param monkeypatch: the pytest monkeypatch fixture
+    :return: None
+    """
+    monkeypatch.setenv("sha", "abc")
+    script = _get_script_locally(INSTRUMENT)
+    assert script.source == "local"
+    assert script.etag(INSTRUMENT) != await get_script_etag_by_sha(INSTRUMENT, "abc")
+
+
+@pytest.mark.asyncio
+@patch("ir_api.scripts.acquisition.GITHUB.get", return_value=Fetched(200, '{"sha": "abcd1234"}'))
+async def test_get_latest_commit_sha_ok(_):
+    """
+    Test sha is returned when ok
+    :return: None
+    """
+    assert await _get_latest_commit_sha() == "abcd1234"
+
+
+@pytest.mark.asyncio
+@patch("ir_api.scripts.acquisition.GITHUB.get", return_value=Fetched(403, "rate limit exceeded"))
+async def test_get_latest_commit_sha_not_ok(_):
+    """
+    Test None is returned for non-ok get
+    :return: None
+    """
+    assert await _get_latest_commit_sha() is None
 
 
-@patch("ir_api.scripts.acquisition.requests.get")
-def test_get_latest_commit_sha_returns_none_on_exception(mock_get):
+@pytest.mark.asyncio
+@patch("ir_api.scripts.acquisition.GITHUB.get")
+async def test_get_latest_commit_sha_returns_none_on_exception(mock_get):
     """
     Test None is still returned if the request results in an exception
     :param mock_get: Mock get
     :return: None
     """
-    mock_get.side_effect = Exception
-    assert _get_latest_commit_sha() is None
+    mock_get.side_effect = httpx.ReadTimeout("timed out")
+    assert await _get_latest_commit_sha() is None
 
 
 def test_get_by_instrument_path_character_raises_exception():
@@ -0,0 +1,317 @@
+"""
+Tests for the conditional fetches from GitHub
+"""
+
+# pylint: disable=wrong-import-order
+import asyncio
+import json
+import time
+from typing import List, Optional, Tuple
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from ir_api.core.exceptions import MissingRecordError
+from ir_api.scripts.acquisition import (
+    SCRIPT_REPOSITORY,
+    _get_script_from_remote,
+    get_by_instrument_name,
+    get_script_by_sha,
+)
+from ir_api.scripts.github import ConditionalFetcher, github_client
+from test.scripts.github_stand_in import GitHubStandIn
+
+SCRIPT_PATH = f"/{SCRIPT_REPOSITORY}/main/MARI/reduce.py"
+COMMIT_PATH = f"/repos/{SCRIPT_REPOSITORY}/commits/HEAD"
+
+# pylint: disable = redefined-outer-name
+
+
+@pytest.fixture
+def github():
+    """
+    A GitHub stand-in, used for the raw file and API hosts, by a fetcher of its own
+    :return: The stand-in
+    """
+    with GitHubStandIn() as stand_in, patch("ir_api.scripts.acquisition.GITHUB_RAW_URL", stand_in.url), patch(
+        "ir_api.scripts.acquisition.GITHUB_API_URL", stand_in.url
+    ), patch("ir_api.scripts.acquisition.GITHUB", ConditionalFetcher()):
+        yield stand_in
+
+
+@pytest.mark.asyncio
+async def test_unchanged_script_costs_only_304(github):
+    """
+    Test a script and its commit are downloaded once, then cost only a 304 each while unchanged, with the kept script
+    and sha returned, and are downloaded again once changed
+    :param github: The GitHub stand-in
+    :return: None
+    """
+    github.set(SCRIPT_PATH, "print('science')\n")
+    github.set(COMMIT_PATH, json.dumps({"sha": "abc123"}))
+
+    scripts = [await _get_script_from_remote("mari") for _ in range(3)]
+    assert [(script.value, script.sha, script.is_latest) for script in scripts] == [
+        ("print('science')\n", "abc123", True)
+    ] * 3
+    assert github.responses == [(SCRIPT_PATH, 200), (COMMIT_PATH, 200)] + [(SCRIPT_PATH, 304), (COMMIT_PATH, 304)] * 2
+
+    github.set(SCRIPT_PATH, "print('more science')\n")
+    github.set(COMMIT_PATH, json.dumps({"sha": "def456"}))
+    github.responses.clear()
+    script = await _get_script_from_remote("mari")
+    assert (script.value, script.sha) == ("print('more science')\n", "def456")
+    assert github.responses == [(SCRIPT_PATH, 200), (COMMIT_PATH, 200)]
+
+
+@pytest.mark.asyncio
+async def test_script_and_sha_fetched_concurrently(github):
+    """
+    Test the script and the sha of the latest commit are fetched together, taking about as long as one fetch
+    :param github: The GitHub stand-in
+    :return: None
+    """
+    github.set(SCRIPT_PATH, "print('science')\n")
+    github.set(COMMIT_PATH, json.dumps({"sha": "abc123"}))
+    github.delay = 0.25
+
+    start = time.perf_counter()
+    script = await _get_script_from_remote("mari")
+
+    assert time.perf_counter() - start < 0.45
+    assert (script.value, script.sha) == ("print('science')\n", "abc123")
+    assert sorted(github.responses) == sorted([(SCRIPT_PATH, 200), (COMMIT_PATH, 200)])
+
+
+@pytest.mark.asyncio
+@patch("ir_api.scripts.acquisition.SCRIPT_FETCH_MODE", "sha_first")
+async def test_sha_first_fetches_script_at_sha(github):
+    """
+    Test the sha is fetched first, then the script at that sha, so the script is the one at the sha even when main has
+    moved on since
+    :param github: The GitHub stand-in
+    :return: None
+    """
+    at_sha = f"/{SCRIPT_REPOSITORY}/abc123/MARI/reduce.py"
+    github.set(at_sha, "print('science')\n")
+    github.set(SCRIPT_PATH, "print('pushed since')\n")
+    github.set(COMMIT_PATH, json.dumps({"sha": "abc123"}))
+
+    script = await _get_script_from_remote("mari")
+
+    assert (script.value, script.sha, script.is_latest) == ("print('science')\n", "abc123", True)
+    assert github.responses == [(COMMIT_PATH, 200), (at_sha, 200)]
+
+
+@pytest.mark.asyncio
+@patch("ir_api.scripts.acquisition.SCRIPT_FETCH_MODE", "sha_first")
+async def test_sha_first_fetches_main_when_sha_unknown(github):
+    """
+    Test the script is fetched from main, without a sha, when the sha cannot be fetched
+    :param github: The GitHub stand-in
+    :return: None
+    """
+    github.set(SCRIPT_PATH, "print('science')\n")
+
+    script = await _get_script_from_remote("mari")
+
+    assert (script.value, script.sha) == ("print('science')\n", None)
+    assert github.responses == [(COMMIT_PATH, 404), (SCRIPT_PATH, 200)]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_for_latest_script_share_one_fetch(github):
+    """
+    Test concurrent requests for the latest script of an instrument share one fetch of the script and of the sha, and
+    each is returned its own script, so transforming one does not change the others
+    :param github: The GitHub stand-in
+    :return: None
+    """
+    github.set(SCRIPT_PATH, "print('science')\n")
+    github.set(COMMIT_PATH, json.dumps({"sha": "abc123"}))
+    github.delay = 0.1
+
+    scripts = await asyncio.gather(*(get_by_instrument_name(instrument) for instrument in ["mari", "MARI"] * 5))
+    scripts[0].value = "transformed"
+
+    assert sorted(github.responses) == sorted([(SCRIPT_PATH, 200), (COMMIT_PATH, 200)])
+    assert len({id(script) for script in scripts}) == 10
+    assert [(script.value, script.sha) for script in scripts[1:]] == [("print('science')\n", "abc123")] * 9
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_for_script_at_sha_share_one_fetch(github):
+    """
+    Test concurrent requests for the script at a sha share one fetch, and the error of a fetch is raised to every
+    request that shared it
+    :param github: The GitHub stand-in
+    :return: None
+    """
+    at_sha = f"/{SCRIPT_REPOSITORY}/abc123/MARI/reduce.py"
+    github.set(at_sha, "print('science')\n")
+    github.delay = 0.1
+
+    results = await asyncio.gather(
+        *(get_script_by_sha("mari", sha) for sha in ["abc123", "def456"] * 3), return_exceptions=True
+    )
+
+    assert [getattr(result, "value", type(result)) for result in results] == [
+        "print('science')\n",
+        MissingRecordError,
+    ] * 3
+    assert sorted(github.responses) == sorted([(at_sha, 200), (f"/{SCRIPT_REPOSITORY}/def456/MARI/reduce.py", 404)])
+
+
+@pytest.mark.asyncio
+async def test_revalidated_with_last_modified_without_etag():
+    """
+    Test a URL served without an ETag is revalidated with its Last-Modified
+    :return: None
+    """
+    fetcher = ConditionalFetcher()
+    with GitHubStandIn(etags=False) as github:
+        github.set("/script.py", "print('science')\n")
+        fetched = [await fetcher.get(f"{github.url}/script.py") for _ in range(2)]
+
+    assert github.responses == [("/script.py", 200), ("/script.py", 304)]
+    assert [(response.ok, response.text, response.revalidated) for response in fetched] == [
+        (True, "print('science')\n", False),
+        (True, "print('science')\n", True),
+    ]
+    assert (fetcher.requests, fetcher.not_modified) == (2, 1)
+
+
+def answering(statuses: List[int], etag: str = '"a"', capacity: int = 256) -> Tuple[ConditionalFetcher, List[str]]:
+    """
+    A fetcher whose client answers each request with the next status
+    :param statuses: The statuses
+    :param etag: The ETag of each response, or "" for none
+    :param capacity: The capacity of the fetcher
+    :return: The fetcher, and the If-None-Match sent with each request, "" for none
+    """
+    sent: List[str] = []
+    answers = iter(statuses)
+
+    def answer(request: httpx.Request) -> httpx.Response:
+        sent.append(request.headers.get("If-None-Match", ""))
+        return httpx.Response(next(answers), headers={"ETag": etag} if etag else {}, text="body")
+
+    return ConditionalFetcher(capacity, lambda: httpx.AsyncClient(transport=httpx.MockTransport(answer))), sent
+
+
+@pytest.mark.asyncio
+async def test_validators_kept_through_errors_and_forgotten_when_gone():
+    """
+    Test the validators of a URL are kept after an error GitHub may recover from, and forgotten once it has gone
+    :return: None
+    """
+    fetcher, sent = answering([200, 503, 404, 200])
+    statuses = [(await fetcher.get("https://github.example/script.py")).status_code for _ in range(4)]
+
+    assert statuses == [200, 503, 404, 200]
+    assert sent == ["", '"a"', '"a"', ""]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("capacity, etag", [(0, '"a"'), (1, "")])
+async def test_nothing_kept_when_disabled_or_without_validators(capacity, etag):
+    """
+    Test no request is conditional when the fetcher keeps nothing, or the response has no validators
+    :param capacity: The capacity of the fetcher
+    :param etag: The ETag of the response
+    :return: None
+    """
+    fetcher, sent = answering([200, 200], etag, capacity)
+    await fetcher.get("https://github.example/script.py")
+    await fetcher.get("https://github.example/script.py")
+
+    assert sent == ["", ""]
+
+
+@pytest.mark.asyncio
+async def test_least_recently_fetched_url_forgotten_at_capacity():
+    """
+    Test the least recently fetched URL is forgotten when more than capacity URLs are kept
+    :return: None
+    """
+    fetcher, sent = answering([200] * 6, capacity=2)
+    for url in ["a", "b", "a", "c", "a", "b"]:
+        await fetcher.get(f"https://github.example/{url}")
+
+    assert sent == ["", "", '"a"', "", '"a"', ""]
+
+
+def test_client_pools_connections_with_separate_timeouts():
+    """
+    Test the client keeps connections alive, negotiates HTTP/2, and waits less to connect than to read
+    :return: None
+    """
+    client = github_client()
+    # pylint: disable = protected-access
+    pool = client._transport._pool
+
+    assert (client.timeout.connect, client.timeout.read) == (5, 30)
+    assert (pool._max_connections, pool._max_keepalive_connections, pool._http2) == (20, 10, True)
+
+
+@pytest.mark.asyncio
+async def test_connection_kept_alive_and_concurrent_fetches_not_serialized():
+    """
+    Test fetches one after another reuse a single connection, and concurrent fetches are made together, taking about
+    as long as one fetch, rather than one at a time
+    :return: None
+    """
+    instruments = ["LET", "MAPS", "MERLIN", "TOSCA"]
+    fetcher = ConditionalFetcher()
+    with GitHubStandIn(delay=0.25) as github:
+        for instrument in ["MARI", *instruments]:
+            github.set(f"/{instrument}.py", f"print('{instrument}')\n")
+        for _ in range(3):
+            await fetcher.get(f"{github.url}/MARI.py")
+        assert len(github.connections) == 1
+
+        start = time.perf_counter()
+        fetched = await asyncio.gather(*(fetcher.get(f"{github.url}/{instrument}.py") for instrument in instruments))
+        elapsed = time.perf_counter() - start
+        await fetcher.aclose()
+
+    assert [response.text for response in fetched] == [f"print('{instrument}')\n" for instrument in instruments]
+    assert elapsed < 0.75
+
+
+def test_client_made_for_each_event_loop():
+    """
+    Test the fetcher makes a client in each event loop it is used in, as a client's connections belong to the loop
+    they were opened in
+    :return: None
+    """
+    fetcher = ConditionalFetcher()
+    clients: List[Optional[httpx.AsyncClient]] = []
+
+    async def fetch(url: str) -> str:
+        response = await fetcher.get(url)
+        clients.append(fetcher.client)
+        return response.text
+
+    with GitHubStandIn() as github:
+        github.set("/script.py", "print('science')\n")
+        texts = [asyncio.run(fetch(f"{github.url}/script.py")) for _ in range(2)]
+
+    assert texts == ["print('science')\n"] * 2
+    assert clients[0] is not clients[1]
+
+
+@pytest.mark.asyncio
+async def test_slow_github_times_out_as_runtime_error():
+    """
+    Test a script that is not read within the read timeout is reported as not fetched, so the local copy is used
+    :return: None
+    """
+    fetcher = ConditionalFetcher(client=lambda: httpx.AsyncClient(timeout=httpx.Timeout(5, read=0.05)))
+    with GitHubStandIn(delay=0.5) as github, patch("ir_api.scripts.acquisition.GITHUB_RAW_URL", github.url), patch(
+        "ir_api.scripts.acquisition.GITHUB", fetcher
+    ):
+        github.set(SCRIPT_PATH, "print('science')\n")
+        with pytest.raises(RuntimeError):
+            await _get_script_from_remote("mari")
@@ -0,0 +1,170 @@
+"""
+Tests for the cache of the latest script of each instrument
+"""
+
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from ir_api.scripts.pre_script import PreScript
+from ir_api.scripts.script_cache import ScriptCache
+
+
+class FakeClock:
+    """A clock that only moves when told to"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def latest(value: str, sha: str = "abc123") -> PreScript:
+    """
+    :param value: The text of the script
+    :param sha: The commit sha
+    :return: A script as fetched from the remote repository
+    """
+    return PreScript(value, is_latest=True, sha=sha)
+
+
+async def wait_for_revalidation(cache: ScriptCache) -> None:
+    """
+    Wait for the background revalidations of the cache to finish
+    :param cache: The cache
+    :return: None
+    """
+    # pylint: disable = protected-access
+    await asyncio.wait_for(asyncio.gather(*cache._revalidating.values()), timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_fresh_script_served_without_fetching():
+    """
+    Test a script is fetched once, and served from the cache until the ttl passes, as a new PreScript each time so
+    that transforming it does not change the cached script
+    :return: None
+    """
+    cache = ScriptCache(ttl=60, clock=FakeClock())
+    fetch = AsyncMock(return_value=latest("print('science')\n"))
+
+    first = await cache.get("mari", fetch)
+    first.value = "transformed"
+    second = await cache.get("MARI", fetch)
+
+    fetch.assert_called_once_with("mari")
+    assert second is not first
+    assert (second.value, second.original_value, second.sha, second.is_latest) == (
+        "print('science')\n",
+        "print('science')\n",
+        "abc123",
+        True,
+    )
+
+
+@pytest.mark.asyncio
+async def test_stale_script_served_while_revalidated_once():
+    """
+    Test a stale script is served at once, not as the latest, while a single background fetch replaces it, whose
+    script is then served as the latest
+    :return: None
+    """
+    clock = FakeClock()
+    cache = ScriptCache(ttl=60, stale_while_revalidate=600, clock=clock)
+    await cache.get("MARI", AsyncMock(return_value=latest("old", sha="old-sha")))
+    clock.now = 61
+    fetched = asyncio.Event()
+    release = asyncio.Event()
+
+    async def fetch(_):
+        fetched.set()
+        await release.wait()
+        return latest("new", sha="new-sha")
+
+    revalidate = AsyncMock(side_effect=fetch)
+    stale = [await cache.get("MARI", revalidate), await cache.get("MARI", revalidate)]
+    await asyncio.wait_for(fetched.wait(), timeout=5)
+    release.set()
+    await wait_for_revalidation(cache)
+
+    assert [(script.value, script.sha, script.is_latest) for script in stale] == [("old", "old-sha", False)] * 2
+    revalidate.assert_called_once_with("MARI")
+    fresh = await cache.get("MARI", revalidate)
+    assert (fresh.value, fresh.sha, fresh.is_latest) == ("new", "new-sha", True)
+    revalidate.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_stale_script_served_when_revalidation_fails_until_window_passes():
+    """
+    Test a stale script is still served when fetching it again fails, and once the window has passed, the script is
+    fetched before it is served
+    :return: None
+    """
+    clock = FakeClock()
+    cache = ScriptCache(ttl=60, stale_while_revalidate=600, clock=clock)
+    await cache.get("MARI", AsyncMock(return_value=latest("old")))
+    clock.now = 100
+    failing = AsyncMock(side_effect=RuntimeError("Could not get MARI script from remote"))
+
+    assert (await cache.get("MARI", failing)).value == "old"
+    await wait_for_revalidation(cache)
+    assert (await cache.get("MARI", AsyncMock())).value == "old"
+
+    clock.now = 661
+    with pytest.raises(RuntimeError):
+        await cache.get("MARI", failing)
+    assert (await cache.get("MARI", AsyncMock(return_value=latest("new")))).value == "new"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("error", [KeyError("sha"), ValueError("Expecting value"), asyncio.TimeoutError()])
+async def test_stale_script_kept_when_revalidation_raises_any_error(error, caplog):
+    """
+    Test any error raised fetching the script again in the background is logged, and the stale script kept
+    :param error: The error raised by the fetch
+    :param caplog: the pytest log capture object
+    :return: None
+    """
+    clock = FakeClock()
+    cache = ScriptCache(ttl=60, stale_while_revalidate=600, clock=clock)
+    await cache.get("MARI", AsyncMock(return_value=latest("old")))
+    clock.now = 100
+
+    assert (await cache.get("MARI", AsyncMock(side_effect=error))).value == "old"
+    await wait_for_revalidation(cache)
+
+    assert "Could not revalidate the MARI script" in caplog.text
+    assert (await cache.get("MARI", AsyncMock())).value == "old"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("ttl, script", [(60, PreScript("local", sha="abc123")), (0, latest("remote"))])
+async def test_script_not_cached_when_not_latest_or_disabled(ttl, script):
+    """
+    Test a script that is not the latest is not cached, nor is any script when the ttl is 0
+    :param ttl: The ttl of the cache
+    :param script: The script fetched
+    :return: None
+    """
+    cache = ScriptCache(ttl=ttl, stale_while_revalidate=600, clock=FakeClock())
+    fetch = AsyncMock(return_value=script)
+    await cache.get("MARI", fetch)
+    await cache.get("MARI", fetch)
+    assert fetch.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_clear():
+    """
+    Test clearing the cache fetches every script again
+    :return: None
+    """
+    cache = ScriptCache(ttl=60, clock=FakeClock())
+    fetch = AsyncMock(return_value=latest("print('science')\n"))
+    await cache.get("MARI", fetch)
+    cache.clear()
+    await cache.get("MARI", fetch)
+    assert fetch.call_count == 2
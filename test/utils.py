@@ -9,7 +9,7 @@ from faker import Faker
 from faker.providers import BaseProvider
 
 from ir_api.core.model import Instrument, Run, Reduction, ReductionState, Script, Base
-from ir_api.core.repositories import ENGINE, SESSION
+from ir_api.core.repositories import ENGINE, SESSION, COUNT_CACHE
 
 random.seed(1)
 Faker.seed(1)
@@ -189,6 +189,7 @@ TEST_RUN = Run(
 
 def setup_database() -> None:
     """Setup database for e2e tests"""
+    COUNT_CACHE.clear()
     Base.metadata.drop_all(ENGINE)
     Base.metadata.create_all(ENGINE)
     with SESSION() as session:
@@ -0,0 +1,78 @@
+"""
+Measure the bytes on the wire, and the CPU cost of compressing, the response of each endpoint with each encoding, at the
+levels configured by GZIP_LEVEL, BROTLI_QUALITY and ZSTD_LEVEL. Requires a postgres database, e.g. one populated by
+db_generator.py. Run from the repository root:
+
+`python -m utils.benchmark_compression --instrument MARI --limit 100 --repeat 20`
+"""
+
+import argparse
+import time
+from typing import List
+
+from starlette.testclient import TestClient
+
+from ir_api.core.compression import ENCODINGS, compress
+from ir_api.ir_api import app
+
+
+def endpoints(instrument: str, limit: int) -> List[str]:
+    """
+    The urls of the endpoints to measure
+    :param instrument: The instrument to list the reductions and runs of
+    :param limit: The page size of the lists
+    :return: The urls
+    """
+    return [
+        f"/instrument/{instrument}/reductions?limit={limit}",
+        f"/instrument/{instrument}/reductions?limit={limit}&include_runs=true",
+        f"/instrument/{instrument}/reductions?limit={limit}&fields=id,reduction_state",
+        f"/instrument/{instrument}/runs?limit={limit}",
+        "/instruments/summary",
+    ]
+
+
+def cpu_seconds(body: bytes, encoding: str, repeat: int) -> float:
+    """
+    Time the CPU spent compressing a body
+    :param body: The body
+    :param encoding: The encoding
+    :param repeat: Number of repetitions
+    :return: The mean CPU seconds per compression
+    """
+    start = time.process_time()
+    for _ in range(repeat):
+        compress(body, encoding)
+    return (time.process_time() - start) / repeat
+
+
+def main(instrument: str, limit: int, repeat: int) -> None:
+    """
+    Print the size of each endpoint's response, and for each encoding its compressed size, the ratio, and the CPU
+    milliseconds to compress it
+    :param instrument: The instrument to list the reductions and runs of
+    :param limit: The page size of the lists
+    :param repeat: Number of repetitions of each compression
+    :return: None
+    """
+    print(f"{'url':<64} {'encoding':>8} {'bytes':>10} {'ratio':>7} {'cpu ms':>8}")
+    with TestClient(app) as client:
+        for url in endpoints(instrument, limit):
+            response = client.get(url, headers={"Accept-Encoding": "identity"})
+            response.raise_for_status()
+            body = response.content
+            print(f"{url:<64} {'identity':>8} {len(body):>10} {1:>7.2f} {0:>8.3f}")
+            for encoding in ENCODINGS:
+                size = len(compress(body, encoding))
+                ratio = len(body) / size if size else float("nan")
+                milliseconds = cpu_seconds(body, encoding, repeat) * 1000
+                print(f"{'':<64} {encoding:>8} {size:>10} {ratio:>7.2f} {milliseconds:>8.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--instrument", default="MARI")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.instrument, args.limit, args.repeat)
@@ -0,0 +1,100 @@
+"""
+Benchmark comparing concurrent request throughput when routes query through the synchronous Repo (the previous
+behaviour) and through the AsyncRepo used by the services.
+
+Requires a postgres database populated by db_generator.py. Run from the repository root:
+
+`python -m utils.benchmark_concurrent_requests --requests 200 --concurrency 50`
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List, Literal, Tuple
+
+import httpx
+from fastapi import FastAPI
+
+from ir_api.core.model import Reduction
+from ir_api.core.repositories import Repo
+from ir_api.core.responses import ReductionResponse
+from ir_api.core.specifications.reduction import ReductionSpecification
+from ir_api.ir_api import app as async_app
+
+sync_app = FastAPI()
+
+
+@sync_app.get("/healthz")
+async def get() -> Literal["ok"]:
+    """Health Check endpoint."""
+    return "ok"
+
+
+@sync_app.get("/instrument/{instrument}/reductions")
+async def get_reductions_for_instrument(instrument: str, limit: int = 0) -> List[ReductionResponse]:
+    """The reductions endpoint as it was, querying through the blocking Repo on the event loop"""
+    repo: Repo[Reduction] = Repo()
+    reductions = repo.find(ReductionSpecification().by_instrument(instrument.upper(), limit=limit))
+    return [ReductionResponse.from_reduction(r) for r in reductions]
+
+
+async def _timed_get(client: httpx.AsyncClient, url: str, semaphore: asyncio.Semaphore) -> float:
+    async with semaphore:
+        start = time.perf_counter()
+        response = await client.get(url)
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+
+async def run(app: FastAPI, url: str, requests: int, concurrency: int) -> Tuple[float, List[float], List[float]]:
+    """
+    Issue the given number of requests at the given concurrency, while probing the health check
+    :param app: The app to benchmark
+    :param url: The url to request
+    :param requests: The total number of requests
+    :param concurrency: The maximum number of in flight requests
+    :return: Tuple of elapsed wall time, request latencies, and health check latencies observed during the load
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    health_latencies: List[float] = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        load = asyncio.gather(*(_timed_get(client, url, semaphore) for _ in range(requests)))
+        start = time.perf_counter()
+        while not load.done():
+            # Timed from when the probe should have been sent, so time spent stalled behind a blocked loop counts
+            probe_due = time.perf_counter() + 0.05
+            await asyncio.sleep(0.05)
+            await client.get("/healthz")
+            health_latencies.append(time.perf_counter() - probe_due)
+        latencies = await load
+        return time.perf_counter() - start, latencies, health_latencies
+
+
+def report(name: str, requests: int, elapsed: float, latencies: List[float], health_latencies: List[float]) -> None:
+    """Print the results of a benchmark run"""
+    print(
+        f"{name:>6}: {requests / elapsed:8.1f} req/s | "
+        f"p50 {statistics.median(latencies) * 1000:8.1f}ms | "
+        f"max {max(latencies) * 1000:8.1f}ms | "
+        f"healthz max {max(health_latencies, default=0) * 1000:8.1f}ms over {len(health_latencies)} probes"
+    )
+
+
+def main() -> None:
+    """Run the benchmark for both the sync and async repositories"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--instrument", default="MARI")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    url = f"/instrument/{args.instrument}/reductions?limit={args.limit}"
+
+    for name, app in (("before", sync_app), ("after", async_app)):
+        elapsed, latencies, health_latencies = asyncio.run(run(app, url, args.requests, args.concurrency))
+        report(name, args.requests, elapsed, latencies, health_latencies)
+
+
+if __name__ == "__main__":
+    main()
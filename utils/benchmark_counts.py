@@ -0,0 +1,105 @@
+"""
+Compare the latency of exact, cached and approximate counts, and the accuracy of the approximate counts, for each of
+the count endpoints.
+
+Requires a postgres database populated by db_generator.py. Run from the repository root:
+
+`python -m utils.benchmark_counts --repeat 20`
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from functools import partial
+from typing import Any, Awaitable, Callable, List, Tuple
+
+from sqlalchemy import text
+
+from ir_api.core.repositories import AsyncRepo, COUNT_CACHE, ENGINE
+from ir_api.core.specifications.base import Specification
+from ir_api.core.specifications.reduction import ReductionSpecification
+from ir_api.core.specifications.run import RunSpecification
+
+
+async def time_call(call: Callable[[], Awaitable[int]], repeat: int, clear_cache: bool) -> Tuple[int, float]:
+    """
+    Time the median of repeated calls
+    :param call: The count to time
+    :param repeat: Number of repetitions
+    :param clear_cache: Whether to clear the count cache before each call
+    :return: The result of the call and the median latency in seconds
+    """
+    timings: List[float] = []
+    result = 0
+    for _ in range(repeat):
+        if clear_cache:
+            COUNT_CACHE.clear()
+        start = time.perf_counter()
+        result = await call()
+        timings.append(time.perf_counter() - start)
+    return result, statistics.median(timings)
+
+
+async def count(repo: AsyncRepo[Any], build: Callable[[], Specification[Any]]) -> int:
+    """Count a newly built specification"""
+    return await repo.count(build())
+
+
+async def estimate_count(repo: AsyncRepo[Any], build: Callable[[], Specification[Any]]) -> int:
+    """Estimate the count of a newly built specification"""
+    return await repo.estimate_count(build())
+
+
+def by_instrument(spec_class: Callable[[], Any], instrument: str) -> Specification[Any]:
+    """
+    Build a new by instrument specification
+    :param spec_class: The specification class
+    :param instrument: The instrument
+    :return: The specification
+    """
+    spec: Specification[Any] = spec_class().by_instrument(instrument)
+    return spec
+
+
+async def main(instruments: List[str], repeat: int) -> None:
+    """
+    Print the comparison for each count specification
+    :param instruments: Instruments to count for
+    :param repeat: Number of repetitions of each count
+    :return: None
+    """
+    repo: AsyncRepo[Any] = AsyncRepo()
+    specs: List[Tuple[str, Callable[[], Specification[Any]]]] = [
+        ("/reductions/count", ReductionSpecification().all),
+        ("/runs/count", RunSpecification().all),
+    ]
+    for instrument in instruments:
+        specs.append(
+            (f"/instrument/{instrument}/reductions/count", partial(by_instrument, ReductionSpecification, instrument))
+        )
+        specs.append((f"/instrument/{instrument}/runs/count", partial(by_instrument, RunSpecification, instrument)))
+
+    print(f"{'endpoint':<36} {'exact':>8} {'ms':>8} {'cached ms':>10} {'estimate':>9} {'ms':>8} {'error':>8}")
+    for name, build in specs:
+        exact, exact_time = await time_call(partial(count, repo, build), repeat, clear_cache=True)
+        _, cached_time = await time_call(partial(count, repo, build), repeat, clear_cache=False)
+        estimate, estimate_time = await time_call(partial(estimate_count, repo, build), repeat, clear_cache=True)
+        error = abs(estimate - exact) / exact * 100 if exact else float(estimate != 0) * 100
+        print(
+            f"{name:<36} {exact:>8} {exact_time * 1000:>8.2f} {cached_time * 1000:>10.3f} "
+            f"{estimate:>9} {estimate_time * 1000:>8.2f} {error:>7.1f}%"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--instruments", nargs="*", default=["MARI", "LET", "TEST"])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    # The estimates are only as current as the statistics
+    with ENGINE.connect() as connection:
+        connection.execute(text("ANALYZE"))
+        connection.commit()
+    asyncio.run(main(args.instruments, args.repeat))
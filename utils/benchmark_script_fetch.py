@@ -0,0 +1,74 @@
+"""
+Measure the latency of fetching the latest script of an instrument and the sha of the latest commit, in each
+SCRIPT_FETCH_MODE, from a local stand-in for GitHub that delays each response as a round trip to GitHub does. Each mode
+is measured downloading the script every time, and revalidating the script it has kept. "sha_first" makes the two
+round trips one after the other, as the script and sha were fetched before they were fetched concurrently. No network
+is needed. Run from the repository root:
+
+`python -m utils.benchmark_script_fetch --delay 0.05 --repeat 20`
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+# pylint: disable=wrong-import-order
+from ir_api.scripts import acquisition
+from ir_api.scripts.acquisition import SCRIPT_FETCH_MODES, SCRIPT_REPOSITORY
+from ir_api.scripts.github import GITHUB, GITHUB_VALIDATOR_CACHE_SIZE
+from test.scripts.github_stand_in import GitHubStandIn
+
+SHA = "0123456789abcdef0123456789abcdef01234567"
+
+
+async def mean_milliseconds(repeat: int) -> float:
+    """
+    Time fetching the latest MARI script
+    :param repeat: Number of repetitions
+    :return: The mean milliseconds per fetch
+    """
+    # pylint: disable = protected-access
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await acquisition._get_script_from_remote("MARI")
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+async def main(delay: float, repeat: int, lines: int) -> None:
+    """
+    Print, for each mode, the mean milliseconds to fetch the script and sha when the script is downloaded, and when it
+    is revalidated
+    :param delay: Seconds the stand-in waits before each response
+    :param repeat: Number of fetches measured in each mode
+    :param lines: Lines of the script
+    :return: None
+    """
+    with GitHubStandIn(delay=delay) as github:
+        script = "print('science')\n" * lines
+        for ref in ("main", SHA):
+            github.set(f"/{SCRIPT_REPOSITORY}/{ref}/MARI/reduce.py", script)
+        github.set(f"/repos/{SCRIPT_REPOSITORY}/commits/HEAD", json.dumps({"sha": SHA}))
+        acquisition.GITHUB_RAW_URL = acquisition.GITHUB_API_URL = github.url
+
+        print(f"{'mode':<12} {'downloaded ms':>14} {'revalidated ms':>15}")
+        for mode in SCRIPT_FETCH_MODES:
+            acquisition.SCRIPT_FETCH_MODE = mode
+            times = []
+            for capacity in (0, GITHUB_VALIDATOR_CACHE_SIZE):
+                GITHUB.capacity = capacity
+                GITHUB.clear()
+                # Open the connections, and keep the validators when there is capacity for them
+                await acquisition._get_script_from_remote("MARI")  # pylint: disable = protected-access
+                times.append(await mean_milliseconds(repeat))
+                await GITHUB.aclose()
+            print(f"{mode:<12} {times[0]:>14.1f} {times[1]:>15.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--lines", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main(args.delay, args.repeat, args.lines))
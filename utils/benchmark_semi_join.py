@@ -0,0 +1,175 @@
+"""
+Compare filtering reductions by their runs with a join, which selects a reduction once for each of its runs, against
+the semi-join (EXISTS) and grouped runs of ReductionSpecification, for reductions of many runs.
+
+Seeds an instrument of reductions that each span --runs runs, within a transaction that is rolled back, so the
+database is left as it was. Requires a postgres database, e.g. one populated by db_generator.py. Run from the
+repository root:
+
+`python -m utils.benchmark_semi_join --reductions 2000 --runs 12 --repeat 20`
+"""
+
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Any, List, Literal, Tuple
+
+from sqlalchemy import Connection, Select, func, insert, select, text
+
+from ir_api.core.model import Instrument, Reduction, ReductionState, Run, run_reduction_junction_table
+from ir_api.core.repositories import ENGINE
+from ir_api.core.specifications.reduction import ReductionSpecification
+
+
+def seed(connection: Connection, reductions: int, runs: int) -> int:
+    """
+    Insert an instrument of reductions that each have the given number of runs
+    :param connection: The connection, within the transaction to be rolled back
+    :param reductions: The number of reductions
+    :param runs: The number of runs of each reduction
+    :return: The id of the instrument
+    """
+    instrument_id: int = connection.execute(
+        insert(Instrument).values(instrument_name="BENCHMARK_SEMI_JOIN").returning(Instrument.id)
+    ).scalar_one()
+    start = datetime(2023, 1, 1)
+    reduction_ids = connection.execute(
+        insert(Reduction).returning(Reduction.id, sort_by_parameter_order=True),
+        [
+            {"reduction_state": ReductionState.SUCCESSFUL, "reduction_inputs": {}, "reduction_start": start}
+            for _ in range(reductions)
+        ],
+    ).scalars()
+    run_ids = connection.execute(
+        insert(Run).returning(Run.id, sort_by_parameter_order=True),
+        [
+            {
+                "filename": f"BENCHMARK{index}.nxs",
+                "experiment_number": index // runs,
+                "title": "Benchmark",
+                "users": "Benchmark",
+                "run_start": start + timedelta(minutes=index),
+                "run_end": start + timedelta(minutes=index + 1),
+                "good_frames": 1,
+                "raw_frames": 1,
+                "instrument_id": instrument_id,
+            }
+            for index in range(reductions * runs)
+        ],
+    ).scalars()
+    run_id_list = list(run_ids)
+    connection.execute(
+        insert(run_reduction_junction_table),
+        [
+            {"reduction_id": reduction_id, "run_id": run_id}
+            for index, reduction_id in enumerate(reduction_ids)
+            for run_id in run_id_list[index * runs : (index + 1) * runs]
+        ],
+    )
+    connection.execute(text("ANALYZE"))
+    return instrument_id
+
+
+def joined(instrument_id: int, order_by: Literal["id", "run_start"], limit: int) -> Select[Tuple[Reduction]]:
+    """
+    Filter the reductions by joining their runs, as the specifications did before the semi-join
+    :param instrument_id: The id of the instrument
+    :param order_by: id or run_start
+    :param limit: The page size
+    :return: The select
+    """
+    order: Any = Run.run_start if order_by == "run_start" else Reduction.id
+    return (
+        select(Reduction)
+        .join(run_reduction_junction_table)
+        .join(Run)
+        .where(Run.instrument_id == instrument_id)
+        .order_by(order.desc(), Reduction.id.desc())
+        .limit(limit)
+    )
+
+
+def joined_count(instrument_id: int) -> Select[Tuple[int]]:
+    """
+    Count the reductions of the joined runs, as the specifications did before the semi-join
+    :param instrument_id: The id of the instrument
+    :return: The count select
+    """
+    # pylint: disable = not-callable
+    return (
+        select(func.count(Reduction.id.distinct()))
+        .select_from(Reduction)
+        .join(run_reduction_junction_table)
+        .join(Run)
+        .where(Run.instrument_id == instrument_id)
+    )
+    # pylint: enable = not-callable
+
+
+def time_query(connection: Connection, query: Select[Any], repeat: int) -> Tuple[List[Any], float]:
+    """
+    Time the median of repeated executions of a query
+    :param connection: The connection
+    :param query: The query
+    :param repeat: Number of repetitions
+    :return: The rows and the median latency in seconds
+    """
+    timings: List[float] = []
+    rows: List[Any] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = list(connection.execute(query))
+        timings.append(time.perf_counter() - start)
+    return rows, statistics.median(timings)
+
+
+def build_queries(instrument_id: int, limit: int) -> List[Tuple[str, Select[Any]]]:
+    """
+    Build the join and semi-join forms of the list queries, ordered by a reduction field and a run field, and counts
+    :param instrument_id: The id of the instrument
+    :param limit: The page size of the list queries
+    :return: The name and select of each query
+    """
+    queries: List[Tuple[str, Select[Any]]] = []
+    orders: Tuple[Literal["id", "run_start"], ...] = ("id", "run_start")
+    for order_by in orders:
+        queries.append((f"join, order by {order_by}", joined(instrument_id, order_by, limit)))
+        spec = ReductionSpecification().by_instrument_id(instrument_id, order_by=order_by, limit=limit)
+        queries.append((f"semi-join, order by {order_by}", spec.value))
+    queries.append(("join, count(DISTINCT)", joined_count(instrument_id)))
+    queries.append(("semi-join, count", ReductionSpecification().by_instrument_id(instrument_id).count_value))
+    return queries
+
+
+def main(reductions: int, runs: int, limit: int, repeat: int) -> None:
+    """
+    Print the rows, distinct reductions and latency of each form of each query, and the latency per reduction
+    :param reductions: The number of reductions to seed
+    :param runs: The number of runs of each reduction
+    :param limit: The page size of the list queries
+    :param repeat: Number of repetitions of each query
+    :return: None
+    """
+    with ENGINE.connect() as connection, connection.begin() as transaction:
+        instrument_id = seed(connection, reductions, runs)
+        print(f"{reductions} reductions of {runs} runs, pages of {limit}")
+        # A page of the join holds fewer reductions, so more pages must be read for the same reductions
+        print(f"{'query':<32} {'rows':>6} {'reductions':>11} {'ms':>9} {'ms per reduction':>17}")
+        for name, query in build_queries(instrument_id, limit):
+            rows, median = time_query(connection, query, repeat)
+            # A count is one row of the number of reductions
+            distinct = rows[0][0] if "count" in name else len({row.id for row in rows})
+            per_reduction = median * 1000 / distinct if distinct else float("nan")
+            print(f"{name:<32} {len(rows):>6} {distinct:>11} {median * 1000:>9.2f} {per_reduction:>17.4f}")
+        transaction.rollback()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reductions", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=12)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.reductions, args.runs, args.limit, args.repeat)
@@ -0,0 +1,158 @@
+"""
+Microbenchmark comparing the serialization of list responses through response models, as FastAPI validates and
+serializes a returned list of models against the declared return type, and the fast path of plain dicts encoded by
+FastJSONResponse.
+
+Does not require a database, the rows are built in memory. Run from the repository root:
+
+`python -m utils.benchmark_serialization --rows 10000 --repeat 5`
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, List, Tuple
+
+from fastapi.routing import APIRoute, serialize_response
+from starlette.responses import JSONResponse
+
+from ir_api.core.model import Instrument, Reduction, ReductionState, Run, Script
+from ir_api.core.responses import FastJSONResponse, ReductionResponse, ReductionWithRunsResponse, RunResponse
+from ir_api.router import ROUTER
+
+
+def build_reductions(rows: int) -> List[Reduction]:
+    """
+    Build reductions, each with a script and a run, shaped like those of db_generator.py
+    :param rows: The number of reductions
+    :return: The reductions
+    """
+    random.seed(1)
+    instrument = Instrument(instrument_name="MARI")
+    script = Script(script="from mantid.simpleapi import *\n" * 20, sha="0" * 40)
+    reductions = []
+    for id_ in range(rows):
+        start = datetime(2023, 1, 1) + timedelta(seconds=random.randint(0, 10**7), microseconds=random.randint(0, 999))
+        run = Run(
+            filename=f"/archive/NDXMARI/Instrument/data/cycle_23_01/MARI{id_}.nxs",
+            experiment_number=random.randint(10000, 99999),
+            title="Whitebeam - vanadium - detector tests",
+            users="Wood, Guidi",
+            run_start=start,
+            run_end=start + timedelta(minutes=30),
+            good_frames=random.randint(0, 10000),
+            raw_frames=10000,
+            instrument=instrument,
+        )
+        reductions.append(
+            Reduction(
+                id=id_,
+                reduction_start=start,
+                reduction_end=start + timedelta(minutes=5),
+                reduction_state=random.choice(list(ReductionState)),
+                reduction_status_message="Reduction completed",
+                reduction_inputs={"ei": "'auto'", "sam_mass": 0.5, "runno": id_, "remove_bkg": True},
+                reduction_outputs="MAR25581.nxs",
+                script=script,
+                runs=[run],
+            )
+        )
+    return reductions
+
+
+def response_field(path: str) -> Any:
+    """
+    Get the response field FastAPI validates and serializes the return value of the endpoint against
+    :param path: The path of the endpoint
+    :return: The response field
+    """
+    return next(route.response_field for route in ROUTER.routes if isinstance(route, APIRoute) and route.path == path)
+
+
+def time_path(encode: Callable[[], bytes], repeat: int) -> Tuple[bytes, float]:
+    """
+    Time the median of repeated encodings
+    :param encode: The encoding to time
+    :param repeat: Number of repetitions
+    :return: The encoded body and the median time in seconds
+    """
+    timings = []
+    body = b""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = encode()
+        timings.append(time.perf_counter() - start)
+    return body, statistics.median(timings)
+
+
+def model_path(field: Any, build: Callable[[], List[Any]]) -> Callable[[], bytes]:
+    """
+    The path of a list endpoint returning response models
+    :param field: The response field of the endpoint
+    :param build: Builds the list of response models
+    :return: Function encoding the response body
+    """
+
+    def encode() -> bytes:
+        content = asyncio.run(serialize_response(field=field, response_content=build(), is_coroutine=True))
+        return bytes(JSONResponse(content).body)
+
+    return encode
+
+
+def fast_path(build: Callable[[], List[Any]]) -> Callable[[], bytes]:
+    """
+    The path of a list endpoint returning a FastJSONResponse of dicts
+    :param build: Builds the list of dicts
+    :return: Function encoding the response body
+    """
+    return lambda: bytes(FastJSONResponse(build()).body)
+
+
+def main() -> None:
+    """Run the benchmark for each list response"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    reductions = build_reductions(args.rows)
+    runs = [reduction.runs[0] for reduction in reductions]
+    reductions_field = response_field("/instrument/{instrument}/reductions")
+    runs_field = response_field("/instrument/{instrument}/runs")
+    cases = [
+        (
+            "reductions",
+            model_path(reductions_field, lambda: [ReductionResponse.from_reduction(r) for r in reductions]),
+            fast_path(lambda: [ReductionResponse.dict_from_reduction(r) for r in reductions]),
+        ),
+        (
+            "reductions with runs",
+            model_path(reductions_field, lambda: [ReductionWithRunsResponse.from_reduction(r) for r in reductions]),
+            fast_path(lambda: [ReductionWithRunsResponse.dict_from_reduction(r) for r in reductions]),
+        ),
+        (
+            "runs",
+            model_path(runs_field, lambda: [RunResponse.from_run(run) for run in runs]),
+            fast_path(lambda: [RunResponse.dict_from_run(run) for run in runs]),
+        ),
+    ]
+
+    print(f"{args.rows} rows, median of {args.repeat}")
+    print(f"{'response':<22} {'models ms':>10} {'fast ms':>10} {'speedup':>8} {'identical':>10}")
+    for name, model_encode, fast_encode in cases:
+        model_body, model_time = time_path(model_encode, args.repeat)
+        fast_body, fast_time = time_path(fast_encode, args.repeat)
+        assert json.loads(model_body) == json.loads(fast_body)
+        print(
+            f"{name:<22} {model_time * 1000:>10.1f} {fast_time * 1000:>10.1f} {model_time / fast_time:>7.1f}x "
+            f"{str(model_body == fast_body):>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
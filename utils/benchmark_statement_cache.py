@@ -0,0 +1,111 @@
+"""
+Measure the time to build each specification the routes build, and the time to build and compile it when its statement
+is missed in, and found in, SQLAlchemy's compiled statement cache. A found statement costs only the generation of its
+cache key. Each specification is also built with several values, and its distinct statement cache keys counted, which
+is 1 for a specification whose values are all bound parameters. No database is needed. Run from the repository root:
+
+`python -m utils.benchmark_statement_cache --repeat 2000`
+"""
+
+import argparse
+import time
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy.util import LRUCache
+
+from ir_api.core.repositories import ASYNC_ENGINE
+from ir_api.core.specifications.base import Specification
+from ir_api.core.specifications.reduction import ReductionSpecification
+from ir_api.core.specifications.run import RunSpecification
+
+# Name: builds the specification from an instrument name and a number
+SPECIFICATIONS: Dict[str, Callable[[str, int], Specification[Any]]] = {
+    "reductions by instrument": lambda instrument, number: ReductionSpecification().by_instrument(
+        instrument, limit=number
+    ),
+    "reductions by instrument, ordered by run": lambda instrument, number: ReductionSpecification().by_instrument(
+        instrument, limit=number, order_by="run_start"
+    ),
+    "reductions by instrument with runs": lambda instrument, number: ReductionSpecification()
+    .by_instrument(instrument, limit=number)
+    .with_runs(),
+    "reductions by instrument as json": lambda instrument, number: ReductionSpecification()
+    .by_instrument(instrument, limit=number)
+    .as_json(True),
+    "reduction fields by instrument": lambda instrument, number: ReductionSpecification()
+    .by_instrument(instrument, limit=number)
+    .project(["reduction_state", "id"] if number % 2 else ["id", "reduction_state"]),
+    "reduction by id": lambda _, number: ReductionSpecification().by_id(number).with_runs(),
+    "reduction versions by id": lambda _, number: ReductionSpecification().by_id(number).versions(),
+    "reductions by ids": lambda _, number: ReductionSpecification().by_ids(list(range(number))).with_runs(),
+    "reductions by experiment number": lambda _, number: ReductionSpecification().by_experiment_number(number),
+    "runs by instrument": lambda instrument, number: RunSpecification().by_instrument(instrument, limit=number),
+}
+
+VALUES = [("MARI", 10), ("LET", 25), ("MAPS", 100), ("MERLIN", 7)]
+
+
+def mean_microseconds(function: Callable[[], object], repeat: int) -> float:
+    """
+    Time a function
+    :param function: The function
+    :param repeat: Number of repetitions
+    :return: The mean microseconds per call
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def distinct_statements(build: Callable[[str, int], Specification[Any]]) -> int:
+    """
+    Count the distinct statement cache keys of a specification built with each of VALUES
+    :param build: Builds the specification
+    :return: The number of distinct keys
+    """
+    # pylint: disable = protected-access
+    keys = [build(instrument, number).value._generate_cache_key() for instrument, number in VALUES]
+    return len({key.key if key is not None else None for key in keys})
+
+
+def compile_with(build: Callable[[str, int], Specification[Any]], cache: Optional[LRUCache[Any, Any]]) -> None:
+    """
+    Build a specification and compile its statement as an execution does, looking it up in the cache
+    :param build: Builds the specification
+    :param cache: The compiled statement cache, or None to compile without one
+    :return: None
+    """
+    # pylint: disable = protected-access
+    build(*VALUES[0]).value._compile_w_cache(
+        ASYNC_ENGINE.dialect, compiled_cache=cache, column_keys=[], for_executemany=False, schema_translate_map=None
+    )
+
+
+def main(repeat: int) -> None:
+    """
+    Print, for each specification, the mean microseconds to build it, to build and compile it when its statement is
+    missed in the cache and when found in the cache, and the number of distinct statements it compiles to
+    :param repeat: Number of repetitions of each measurement
+    :return: None
+    """
+    print(f"{'specification':<44} {'build us':>9} {'miss us':>9} {'hit us':>9} {'speedup':>8} {'statements':>10}")
+    for name, build in SPECIFICATIONS.items():
+        build_time = mean_microseconds(partial(build, *VALUES[0]), repeat)
+        miss_time = mean_microseconds(partial(compile_with, build, None), repeat)
+        cache: LRUCache[Any, Any] = LRUCache(10)
+        compile_with(build, cache)
+        hit_time = mean_microseconds(partial(compile_with, build, cache), repeat)
+        speedup = miss_time / hit_time if hit_time else float("nan")
+        print(
+            f"{name:<44} {build_time:>9.1f} {miss_time:>9.1f} {hit_time:>9.1f} {speedup:>8.2f} "
+            f"{distinct_statements(build):>10}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.repeat)
@@ -0,0 +1,372 @@
+"""
+Index advisor for the specification queries. Each query the ReductionSpecification and RunSpecification methods build
+is executed as the API executes it, including the further queries relationships are loaded with, and each statement
+is run again under EXPLAIN (ANALYZE, BUFFERS). Sequential scans are flagged.
+
+By default the statements are explained with enable_seqscan off, so that the planner uses an index wherever one can
+serve the query, and a sequential scan that remains is one no index covers, whatever the size of the tables. With
+--planner-default the planner chooses freely, showing the plans it would choose against the seeded data.
+
+Indexes declared on the model but missing from the database, such as on a database created before they were declared,
+are listed with the DDL to create them, and are created with --create-missing.
+
+Seeds the database when --seed is given, otherwise requires a database populated by db_generator.py. Run from the
+repository root:
+
+`python -m utils.index_advisor --seed 10000`
+
+Exits with status 1 when a sequential scan is flagged that the case does not expect.
+"""
+
+import argparse
+import sys
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import Connection, Executable, event, inspect, text
+from sqlalchemy.schema import CreateIndex, Index
+
+from ir_api.core.model import Base, Instrument, Run
+from ir_api.core.repositories import ENGINE, SESSION
+from ir_api.core.specifications.instrument import InstrumentSpecification
+from ir_api.core.specifications.reduction import ReductionSpecification
+from ir_api.core.specifications.run import RunSpecification
+
+
+@dataclass
+class Case:
+    """A query the API makes, built from a specification"""
+
+    name: str
+    build: Callable[[], Executable]
+    # Whether the query reads every row of the table, so that a sequential scan is expected
+    full_scan: bool = False
+
+
+@dataclass
+class StatementReport:
+    """The plan of one statement a case executes"""
+
+    statement: str
+    execution_ms: float
+    shared_hit: int
+    shared_read: int
+    seq_scans: List[str]
+
+
+@dataclass
+class CaseReport:
+    """The plans of the statements a case executes"""
+
+    case: Case
+    statements: List[StatementReport] = field(default_factory=list)
+
+    @property
+    def seq_scans(self) -> List[str]:
+        """
+        :return: The relations sequentially scanned by any of the statements
+        """
+        return [scan for statement in self.statements for scan in statement.seq_scans]
+
+    @property
+    def flagged(self) -> bool:
+        """
+        :return: Whether a sequential scan was made that the case does not expect
+        """
+        return bool(self.seq_scans) and not self.case.full_scan
+
+
+def build_cases(instrument_id: int, experiment_number: int, reduction_id: int, run_id: int) -> List[Case]:
+    """
+    Build a case for each query the specifications make for the endpoints, against values present in the database
+    :param instrument_id: The id of an instrument with runs
+    :param experiment_number: An experiment number with reductions
+    :param reduction_id: A reduction id
+    :param run_id: A run id
+    :return: The cases
+    """
+
+    def reduction_by_id() -> Executable:
+        spec = ReductionSpecification()
+        spec.by_id(reduction_id)
+        return spec.with_script().with_runs().value
+
+    def reduction_by_id_as_json() -> Executable:
+        spec = ReductionSpecification()
+        spec.by_id(reduction_id)
+        return spec.as_json(include_runs=True).value
+
+    def run_by_id() -> Executable:
+        return RunSpecification().by_id(run_id).value
+
+    def reductions_by_instrument(order_by: Any) -> Executable:
+        return (
+            ReductionSpecification()
+            .by_instrument_id(instrument_id, limit=100, order_by=order_by)
+            .with_script()
+            .with_runs()
+            .value
+        )
+
+    def runs_by_instrument(order_by: Any) -> Executable:
+        return RunSpecification().by_instrument_id(instrument_id, limit=100, order_by=order_by).with_instrument().value
+
+    cases = [
+        Case("ReductionSpecification.all count", lambda: ReductionSpecification().all().count_value, full_scan=True),
+        Case("ReductionSpecification.by_id with script and runs", reduction_by_id),
+        Case("ReductionSpecification.by_id as json with runs", reduction_by_id_as_json),
+        Case(
+            "ReductionSpecification.by_instrument_id count",
+            lambda: ReductionSpecification().by_instrument_id(instrument_id).count_value,
+        ),
+        Case(
+            "ReductionSpecification.by_instrument_id fields",
+            lambda: ReductionSpecification()
+            .by_instrument_id(instrument_id, limit=100)
+            .project(["id", "reduction_state", "script"])
+            .value,
+        ),
+        Case(
+            "ReductionSpecification.by_instrument_id as json with runs",
+            lambda: ReductionSpecification()
+            .by_instrument_id(instrument_id, limit=100)
+            .as_json(include_runs=True)
+            .value,
+        ),
+        Case(
+            "ReductionSpecification.by_experiment_number",
+            lambda: ReductionSpecification().by_experiment_number(experiment_number, limit=100).with_script().value,
+        ),
+        Case(
+            "ReductionSpecification.by_experiment_number count",
+            lambda: ReductionSpecification().by_experiment_number(experiment_number).count_value,
+        ),
+        Case("RunSpecification.all count", lambda: RunSpecification().all().count_value, full_scan=True),
+        Case("InstrumentSpecification.names", lambda: InstrumentSpecification().names().value, full_scan=True),
+        Case("InstrumentSpecification.summary", lambda: InstrumentSpecification().summary().value, full_scan=True),
+        Case("RunSpecification.by_id", run_by_id),
+        Case(
+            "RunSpecification.by_instrument_id count",
+            lambda: RunSpecification().by_instrument_id(instrument_id).count_value,
+        ),
+        Case(
+            "RunSpecification.by_instrument_id fields",
+            lambda: RunSpecification()
+            .by_instrument_id(instrument_id, limit=100)
+            .project(["filename", "run_start"])
+            .value,
+        ),
+    ]
+    for order_by in ("reduction_start", "run_start", "filename"):
+        cases.append(
+            Case(
+                f"ReductionSpecification.by_instrument_id order_by={order_by} with script and runs",
+                partial(reductions_by_instrument, order_by),
+            )
+        )
+    for order_by in ("run_start", "experiment_number", "good_frames"):
+        cases.append(
+            Case(
+                f"RunSpecification.by_instrument_id order_by={order_by} with instrument",
+                partial(runs_by_instrument, order_by),
+            )
+        )
+    return cases
+
+
+@contextmanager
+def capture_statements() -> Iterator[List[Tuple[str, Any]]]:
+    """
+    Record the statements, with their parameters, executed against the database within the context
+    :return: The list the statements are recorded to
+    """
+    statements: List[Tuple[str, Any]] = []
+
+    def record(_conn: Any, _cursor: Any, statement: str, parameters: Any, *_args: Any) -> None:
+        statements.append((statement, parameters))
+
+    event.listen(ENGINE, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(ENGINE, "before_cursor_execute", record)
+
+
+def plan_seq_scans(plan: Dict[str, Any], table_rows: Dict[str, float], min_rows: int) -> List[str]:
+    """
+    Find the sequential scans of a plan and its subplans
+    :param plan: The plan node
+    :param table_rows: The number of rows of each table, from the table statistics
+    :param min_rows: Scans of tables with fewer rows are not reported
+    :return: The relations sequentially scanned, with the rows each scan returned
+    """
+    scans = []
+    if plan["Node Type"] == "Seq Scan" and table_rows.get(plan["Relation Name"], 0) >= min_rows:
+        scans.append(f"{plan['Relation Name']} ({plan.get('Actual Rows', plan['Plan Rows'])} rows)")
+    for subplan in plan.get("Plans", []):
+        scans.extend(plan_seq_scans(subplan, table_rows, min_rows))
+    return scans
+
+
+def explain(
+    connection: Connection, statement: str, parameters: Any, table_rows: Dict[str, float], min_rows: int
+) -> StatementReport:
+    """
+    Explain and analyze the statement
+    :param connection: The connection, configured for the planner
+    :param statement: The statement as sent to the database
+    :param parameters: The parameters of the statement
+    :param table_rows: The number of rows of each table, from the table statistics
+    :param min_rows: Scans of tables with fewer rows are not reported
+    :return: The report of the plan
+    """
+    result = connection.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}", parameters)
+    explained = result.scalar_one()[0]
+    plan = explained["Plan"]
+    return StatementReport(
+        statement=" ".join(statement.split()),
+        execution_ms=explained["Execution Time"],
+        shared_hit=plan.get("Shared Hit Blocks", 0),
+        shared_read=plan.get("Shared Read Blocks", 0),
+        seq_scans=plan_seq_scans(plan, table_rows, min_rows),
+    )
+
+
+def advise(cases: List[Case], planner_default: bool = False, min_rows: int = 0) -> List[CaseReport]:
+    """
+    Execute each case as the API would, then explain each statement it executed
+    :param cases: The cases
+    :param planner_default: Whether to leave sequential scans enabled
+    :param min_rows: Scans of tables with fewer rows are not reported
+    :return: The report of each case
+    """
+    with ENGINE.connect() as connection:
+        table_rows = dict(
+            connection.execute(text("SELECT relname, reltuples FROM pg_class WHERE relkind = 'r'")).tuples().all()
+        )
+    reports = []
+    for case in cases:
+        with SESSION() as session, capture_statements() as statements:
+            # Fetching the rows loads the declared relationships, with their own statements
+            session.execute(case.build()).all()
+        report = CaseReport(case)
+        with ENGINE.connect() as connection:
+            if not planner_default:
+                connection.exec_driver_sql("SET enable_seqscan = off")
+            for statement, parameters in statements:
+                report.statements.append(explain(connection, statement, parameters, table_rows, min_rows))
+            connection.rollback()
+        reports.append(report)
+    return reports
+
+
+def missing_indexes() -> List[Index]:
+    """
+    Find the indexes declared on the model that are missing from the database
+    :return: The missing indexes
+    """
+    inspector = inspect(ENGINE)
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        missing.extend(index for index in table.indexes if index.name not in existing)
+    return missing
+
+
+def seed(reductions: int) -> None:
+    """
+    Recreate the tables and seed them with generated reductions, each with a run and script
+    :param reductions: The number of reductions
+    :return: None
+    """
+    # pylint: disable=import-outside-toplevel
+    # The test data provider is only needed for seeding
+    from test.utils import IR_FAKER_PROVIDER
+
+    if "localhost" not in str(ENGINE.url):
+        sys.exit(f"Not seeding a database that is not on localhost: {ENGINE.url}")
+    Base.metadata.drop_all(ENGINE)
+    Base.metadata.create_all(ENGINE)
+    with SESSION() as session:
+        instruments = [Instrument(instrument_name=name) for name in IR_FAKER_PROVIDER.INSTRUMENTS]
+        for index in range(reductions):
+            session.add(IR_FAKER_PROVIDER.insertable_reduction(instruments[index % len(instruments)]))
+        session.commit()
+
+
+def sample_values(instrument: Optional[str]) -> Tuple[int, int, int, int]:
+    """
+    Find values present in the database to query by
+    :param instrument: The name of the instrument to query by, or None for that of the first run
+    :return: The instrument id, an experiment number, a reduction id and a run id
+    """
+    with SESSION() as session:
+        run = session.query(Run).order_by(Run.id).first()
+        if run is None:
+            sys.exit("The database has no runs, seed it with --seed")
+        instrument_id = run.instrument_id
+        if instrument is not None:
+            instrument_id = session.query(Instrument.id).filter(Instrument.instrument_name == instrument).scalar()
+            if instrument_id is None:
+                sys.exit(f"No instrument named {instrument}")
+        reduction_id = session.execute(text("SELECT min(reduction_id) FROM runs_reductions")).scalar_one()
+        return instrument_id, run.experiment_number, reduction_id, run.id
+
+
+def print_report(reports: List[CaseReport], verbose: bool) -> None:
+    """
+    Print a line per case, and the sequential scans of each statement
+    :param reports: The case reports
+    :param verbose: Whether to print every statement
+    :return: None
+    """
+    print(f"{'case':<80} {'queries':>7} {'ms':>8} {'hit':>7} {'read':>7}  seq scans")
+    for report in reports:
+        statements = report.statements
+        status = "FLAGGED " if report.flagged else ("expected " if report.seq_scans else "")
+        print(
+            f"{report.case.name:<80} {len(statements):>7} {sum(s.execution_ms for s in statements):>8.2f} "
+            f"{sum(s.shared_hit for s in statements):>7} {sum(s.shared_read for s in statements):>7}  "
+            f"{status}{', '.join(report.seq_scans)}"
+        )
+        for statement in statements:
+            if verbose:
+                print(f"    {statement.statement}")
+            elif report.flagged and statement.seq_scans:
+                print(f"    {statement.statement[:300]}")
+
+
+def main() -> None:
+    """Seed if requested, report missing indexes, then advise on each case"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0, help="Recreate the database with this many reductions")
+    parser.add_argument("--instrument", default=None)
+    parser.add_argument("--planner-default", action="store_true", help="Leave sequential scans enabled")
+    parser.add_argument("--min-rows", type=int, default=0, help="Ignore scans of tables with fewer rows")
+    parser.add_argument("--create-missing", action="store_true", help="Create declared indexes that are missing")
+    parser.add_argument("--verbose", action="store_true", help="Print every statement")
+    args = parser.parse_args()
+
+    if args.seed:
+        seed(args.seed)
+    for index in missing_indexes():
+        ddl = str(CreateIndex(index).compile(ENGINE))
+        print(f"Missing declared index: {ddl}")
+        if args.create_missing:
+            with ENGINE.begin() as connection:
+                connection.execute(CreateIndex(index))
+    with ENGINE.begin() as connection:
+        connection.execute(text("ANALYZE"))
+
+    reports = advise(
+        build_cases(*sample_values(args.instrument)), planner_default=args.planner_default, min_rows=args.min_rows
+    )
+    print_report(reports, args.verbose)
+    if any(report.flagged for report in reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
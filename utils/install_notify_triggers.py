@@ -0,0 +1,15 @@
+"""
+Install the triggers that notify the API of writes to each table in an existing database, so that the API can cache
+results until the tables they were read from are written. A database created with create_all already has them.
+Run from the repository root:
+
+`python -m utils.install_notify_triggers`
+"""
+
+from ir_api.core.model import install_write_notify_triggers
+from ir_api.core.repositories import ENGINE
+
+if __name__ == "__main__":
+    with ENGINE.begin() as connection:
+        install_write_notify_triggers(connection)
+    print("Installed the write notify triggers")